@@ -0,0 +1,324 @@
+"""
+חישוב ההתראות במעבר אחד.
+
+שאילתה אחת (alerts_sql) מחזירה את כל סוגי ההתראות - השאלות באיחור, השאלות
+שמועד החזרתן קרב, פריטים במלאי נמוך ותזכורות תחזוקה - כשהימים, רמת החומרה
+וסוג ההתראה מחושבים ב-SQL, ו-payload הוא השורה המלאה כ-JSONB באותה צורה
+שהדו"ח החזיר קודם.
+
+עם ספי ברירת המחדל התוצאה נשמרת בטבלת alerts (מיגרציה 10), וכך אייקון
+ההתראות והרשימה הם קריאה באינדקס. הטבלה מרוענת כשגרסת 'inventory' השתנתה
+(כל שינוי בפריטים או בהשאלות) או אחרי ALERTS_MAX_AGE שניות - כי איחורים
+נוצרים גם בלי שינוי בנתונים - או בעבודה מתוזמנת:
+    python alerts.py refresh
+רק בקשה אחת מרעננת בכל רגע; בקשות אחרות באותו זמן קוראות את הטבלה הקיימת
+בלי להמתין.
+"""
+
+import argparse
+import os
+
+from psycopg2.extras import Json, execute_values
+
+from database import get_db_connection, data_versions_available
+
+DEFAULT_THRESHOLDS = {
+    'days_threshold': 3,
+    'stock_threshold': 20,
+    'maintenance_days_threshold': 30
+}
+
+ALERTS_MAX_AGE = int(os.getenv('ALERTS_MAX_AGE', '300'))
+
+# שורה ב-snapshot_cache עם גרסת הנתונים והסיכום של הרענון האחרון
+ALERTS_SNAPSHOT = 'alerts'
+ALERTS_LOCK_ID = 784216
+
+# סוג ההתראה ושם הרשימה בתשובה, לפי סדר התצוגה
+ALERT_LISTS = (
+    ('overdue', 'overdue_loans'),
+    ('upcoming', 'upcoming_returns'),
+    ('low_stock', 'low_stock'),
+    ('maintenance', 'maintenance_schedules'),
+)
+
+# אנשי צוות רואים את כל ההתראות; סטודנט רואה רק את ההשאלות שלו
+STAFF_ROLES = ('admin', 'warehouse_staff')
+
+ALERT_COLUMNS = ('alert_type', 'entity_id', 'item_id', 'user_id', 'severity', 'days', 'payload')
+
+LOAN_ALERTS_SQL = """
+    SELECT 'overdue' AS alert_type, l.id AS entity_id, l.item_id, l.user_id, s.severity, d.days,
+           to_jsonb(l) || jsonb_build_object('item_name', i.name, 'category', i.category,
+                                             'days_overdue', d.days, 'severity', s.severity) AS payload,
+           1 AS type_order, l.due_date AS sort_date, NULL::TEXT AS sort_category, NULL::TEXT AS sort_name
+    FROM loans l
+    JOIN items i ON l.item_id = i.id
+    CROSS JOIN today t
+    CROSS JOIN LATERAL (SELECT t.day - l.due_date::DATE AS days) d
+    CROSS JOIN LATERAL (
+        SELECT CASE WHEN d.days >= 7 THEN 'high' WHEN d.days >= 3 THEN 'medium' ELSE 'low' END AS severity
+    ) s
+    WHERE l.return_date IS NULL AND l.due_date < t.day
+
+    UNION ALL
+
+    -- החומרה לפי הימים שעברו מתחילת החלון: ככל שנשאר פחות זמן, יותר חמור
+    SELECT 'upcoming', l.id, l.item_id, l.user_id, s.severity, d.days,
+           to_jsonb(l) || jsonb_build_object('item_name', i.name, 'category', i.category,
+                                             'days_remaining', d.days, 'severity', s.severity),
+           2, l.due_date, NULL, NULL
+    FROM loans l
+    JOIN items i ON l.item_id = i.id
+    CROSS JOIN today t
+    CROSS JOIN LATERAL (SELECT l.due_date::DATE - t.day AS days) d
+    CROSS JOIN LATERAL (
+        SELECT CASE %(days_threshold)s - d.days WHEN 0 THEN 'high' WHEN 1 THEN 'medium' ELSE 'low' END AS severity
+    ) s
+    WHERE l.return_date IS NULL
+      AND l.due_date >= t.day
+      AND l.due_date <= t.day + %(days_threshold)s
+
+    UNION ALL
+
+    SELECT 'low_stock', i.id, i.id, NULL, s.severity, NULL,
+           to_jsonb(i) || jsonb_build_object('loaned_count', p.loaned,
+                                             'available_quantity', i.quantity - p.loaned,
+                                             'stock_percent', ROUND(p.percent)::INTEGER,
+                                             'severity', s.severity),
+           3, NULL, i.category, i.name
+    FROM items i
+    LEFT JOIN item_stock st ON st.item_id = i.id
+    CROSS JOIN LATERAL (
+        SELECT COALESCE(st.loaned_quantity, 0) AS loaned,
+               (i.quantity - COALESCE(st.loaned_quantity, 0)) * 100.0 / i.quantity AS percent
+    ) p
+    CROSS JOIN LATERAL (
+        SELECT CASE WHEN p.percent <= 5 THEN 'high' WHEN p.percent <= 10 THEN 'medium' ELSE 'low' END AS severity
+    ) s
+    WHERE i.is_available = TRUE AND i.quantity > 0 AND p.percent <= %(stock_threshold)s
+"""
+
+MAINTENANCE_ALERTS_SQL = """
+    UNION ALL
+
+    SELECT 'maintenance', ms.id, i.id, NULL, s.severity, d.days,
+           to_jsonb(ms) || jsonb_build_object('item_name', i.name, 'category', i.category, 'item_id', i.id,
+                                              'days_until_due', d.days, 'severity', s.severity,
+                                              'alert_type', 'maintenance'),
+           4, ms.next_due::TIMESTAMP, NULL, NULL
+    FROM maintenance_schedules ms
+    JOIN items i ON ms.item_id = i.id
+    CROSS JOIN today t
+    CROSS JOIN LATERAL (SELECT ms.next_due::DATE - t.day AS days) d
+    CROSS JOIN LATERAL (
+        SELECT CASE WHEN d.days <= 0 THEN 'high' WHEN d.days <= 7 THEN 'medium' ELSE 'low' END AS severity
+    ) s
+    WHERE ms.next_due <= t.day + %(maintenance_days_threshold)s
+"""
+
+
+def alerts_sql(include_maintenance):
+    """השאילתה המאוחדת; טבלת התחזוקה לא נוצרת ב-init_db ולכן אופציונלית"""
+    return f"""
+        WITH today AS (
+            SELECT (CURRENT_TIMESTAMP AT TIME ZONE 'Asia/Jerusalem')::DATE AS day
+        )
+        SELECT {', '.join(ALERT_COLUMNS)}
+        FROM (
+            {LOAN_ALERTS_SQL}
+            {MAINTENANCE_ALERTS_SQL if include_maintenance else ''}
+        ) a
+        ORDER BY type_order, sort_date, sort_category, sort_name, entity_id
+    """
+
+
+def compute_alerts(cur, thresholds=None):
+    """מחשב את כל ההתראות ומחזיר שורות לפי ALERT_COLUMNS, בסדר התצוגה"""
+    params = dict(DEFAULT_THRESHOLDS, **(thresholds or {}))
+    cur.execute("SELECT to_regclass('maintenance_schedules') IS NOT NULL")
+    include_maintenance = cur.fetchone()[0]
+    cur.execute(alerts_sql(include_maintenance), params)
+    return cur.fetchall()
+
+
+def group_alerts(rows, last_updated):
+    """מקבץ את השורות לרשימות לפי סוג, עם הסיכום שהדו"ח החזיר קודם"""
+    alerts = {name: [] for _, name in ALERT_LISTS}
+    list_names = dict(ALERT_LISTS)
+    high_severity_count = 0
+    for alert_type, severity, payload in rows:
+        alerts[list_names[alert_type]].append(payload)
+        high_severity_count += severity == 'high'
+
+    alerts['summary'] = {
+        'total_alerts': len(rows),
+        'overdue_count': len(alerts['overdue_loans']),
+        'upcoming_count': len(alerts['upcoming_returns']),
+        'low_stock_count': len(alerts['low_stock']),
+        'maintenance_count': len(alerts['maintenance_schedules']),
+        'high_severity_count': high_severity_count,
+        'last_updated': last_updated.isoformat()
+    }
+    return alerts
+
+
+def summarize_counts(counts, last_updated):
+    """סיכום קומפקטי לאייקון ההתראות מתוך (סוג, חומרה, כמות)"""
+    by_type = {alert_type: {'high': 0, 'medium': 0, 'low': 0, 'total': 0} for alert_type, _ in ALERT_LISTS}
+    for alert_type, severity, count in counts:
+        by_type[alert_type][severity] += count
+        by_type[alert_type]['total'] += count
+    return {
+        'total_alerts': sum(group['total'] for group in by_type.values()),
+        'high_severity_count': sum(group['high'] for group in by_type.values()),
+        'by_type': by_type,
+        'last_updated': last_updated.isoformat()
+    }
+
+
+def _user_filter(user_id, role):
+    """None אם המשתמש רואה את כל ההתראות, אחרת מזהה המשתמש לסינון"""
+    if user_id is None or role in STAFF_ROLES:
+        return None
+    return int(user_id)
+
+
+def _precomputed_available(cur):
+    """טבלת alerts וטבלאות הגרסאות קיימות (המסד עבר את המיגרציות)"""
+    if not data_versions_available(cur):
+        return False
+    cur.execute("SELECT to_regclass('alerts') IS NOT NULL")
+    return cur.fetchone()[0]
+
+
+def _last_refresh(cur):
+    """
+    (זמן הרענון האחרון, האם הטבלה עדכנית לגרסת הנתונים ול-ALERTS_MAX_AGE);
+    (None, False) לפני הרענון הראשון
+    """
+    cur.execute("""
+        SELECT created_at::TIMESTAMPTZ,
+               version = COALESCE((SELECT version FROM data_versions WHERE name = 'inventory'), 0)
+               AND created_at > CURRENT_TIMESTAMP - make_interval(secs => %s)
+        FROM snapshot_cache
+        WHERE name = %s
+    """, (ALERTS_MAX_AGE, ALERTS_SNAPSHOT))
+    row = cur.fetchone()
+    return (row[0], row[1]) if row else (None, False)
+
+
+def refresh_alerts(cur, force=False):
+    """
+    מחשב מחדש את טבלת alerts עם ספי ברירת המחדל, אם היא לא עדכנית (או force).
+    קורא לא ממתין לרענון שכבר רץ בבקשה אחרת: הוא ממשיך עם הטבלה הקיימת, שנשארת
+    שלמה עד שהרענון האחר מסתיים. force (העבודה המתוזמנת) ממתין לו. מחזיר את
+    זמן הרענון של הטבלה שתיקרא
+    """
+    if force:
+        cur.execute("SELECT pg_advisory_xact_lock(%s)", (ALERTS_LOCK_ID,))
+    else:
+        refreshed_at, fresh = _last_refresh(cur)
+        if fresh:
+            return refreshed_at
+        cur.execute("SELECT pg_try_advisory_xact_lock(%s)", (ALERTS_LOCK_ID,))
+        if not cur.fetchone()[0]:
+            if refreshed_at is None:
+                cur.execute("SELECT CURRENT_TIMESTAMP")
+                refreshed_at = cur.fetchone()[0]
+            return refreshed_at
+        # רענון אחר יכול היה להסתיים בין הבדיקה לנעילה
+        refreshed_at, fresh = _last_refresh(cur)
+        if fresh:
+            return refreshed_at
+
+    # הגרסה נקראת לפני החישוב, כך ששינוי שמתבצע במהלכו יגרום לרענון נוסף
+    cur.execute("SELECT COALESCE((SELECT version FROM data_versions WHERE name = 'inventory'), 0)")
+    version = cur.fetchone()[0]
+    rows = compute_alerts(cur)
+
+    cur.execute("DELETE FROM alerts")
+    execute_values(cur, f"INSERT INTO alerts ({', '.join(ALERT_COLUMNS)}) VALUES %s",
+                   [row[:-1] + (Json(row[-1]),) for row in rows], page_size=1000)
+
+    cur.execute("""
+        INSERT INTO snapshot_cache (name, version, payload, created_at)
+        VALUES (%s, %s, %s, CURRENT_TIMESTAMP)
+        ON CONFLICT (name) DO UPDATE
+        SET version = EXCLUDED.version,
+            payload = EXCLUDED.payload,
+            created_at = EXCLUDED.created_at
+        RETURNING created_at::TIMESTAMPTZ
+    """, (ALERTS_SNAPSHOT, version, Json({'alert_count': len(rows)})))
+    return cur.fetchone()[0]
+
+
+def get_alerts(thresholds=None, user_id=None, role=None):
+    """
+    כל ההתראות של המשתמש, מקובצות לפי סוג. עם ספי ברירת המחדל נקראות
+    מטבלת alerts; ספים אחרים מחושבים במעבר אחד על הנתונים
+    """
+    thresholds = dict(DEFAULT_THRESHOLDS, **(thresholds or {}))
+    owner = _user_filter(user_id, role)
+
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            if thresholds == DEFAULT_THRESHOLDS and _precomputed_available(cur):
+                refreshed_at = refresh_alerts(cur)
+                cur.execute(f"""
+                    SELECT alert_type, severity, payload
+                    FROM alerts
+                    {'WHERE user_id = %(owner)s' if owner is not None else ''}
+                    ORDER BY id
+                """, {'owner': owner})
+                return group_alerts(cur.fetchall(), refreshed_at)
+
+            cur.execute("SELECT CURRENT_TIMESTAMP")
+            now = cur.fetchone()[0]
+            rows = [(row[0], row[4], row[6]) for row in compute_alerts(cur, thresholds)
+                    if owner is None or row[3] == owner]
+            return group_alerts(rows, now)
+
+
+def get_alert_summary(user_id=None, role=None):
+    """ספירת ההתראות לפי סוג וחומרה, לאייקון ההתראות בכותרת"""
+    owner = _user_filter(user_id, role)
+
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            if _precomputed_available(cur):
+                refreshed_at = refresh_alerts(cur)
+                cur.execute(f"""
+                    SELECT alert_type, severity, COUNT(*)
+                    FROM alerts
+                    {'WHERE user_id = %(owner)s' if owner is not None else ''}
+                    GROUP BY alert_type, severity
+                """, {'owner': owner})
+                return summarize_counts(cur.fetchall(), refreshed_at)
+
+            cur.execute("SELECT CURRENT_TIMESTAMP")
+            now = cur.fetchone()[0]
+            counts = {}
+            for row in compute_alerts(cur):
+                if owner is None or row[3] == owner:
+                    counts[row[0], row[4]] = counts.get((row[0], row[4]), 0) + 1
+            return summarize_counts([(*key, count) for key, count in counts.items()], now)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="רענון טבלת ההתראות")
+    parser.add_argument('command', choices=['refresh'])
+    parser.add_argument('--force', action='store_true', help="לרענן גם אם הטבלה עדכנית")
+    args = parser.parse_args()
+
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            if not _precomputed_available(cur):
+                raise SystemExit("alerts table is missing - run migrations first")
+            refresh_alerts(cur, force=args.force)
+            cur.execute("SELECT COUNT(*) FROM alerts")
+            print(f"Alerts refreshed ({cur.fetchone()[0]} alerts)")
+
+
+if __name__ == "__main__":
+    main()
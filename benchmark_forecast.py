@@ -0,0 +1,99 @@
+"""
+מדידת מנוע חיזוי הביקוש (demand_forecast.py) מול לולאת הפריטים הקודמת.
+
+הסקריפט יוצר היסטוריה סינתטית - כברירת מחדל 10,000 פריטים x 36 חודשים עם
+רמה, מגמה, עונתיות, רעש פואסוני ופריטים שנוספו באמצע התקופה - ומודד את זמן
+החיזוי של שני המימושים. בנוסף הוא מסתיר את HOLDOUT החודשים האחרונים ומשווה
+את שגיאת החיזוי (MAE) ואת אחוז הערכים בפועל שנפלו בתוך רווח הסמך.
+לא נדרש מסד נתונים.
+
+שימוש:
+    python benchmark_forecast.py [--items 10000] [--months 36] [--horizon 3]
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from demand_forecast import MIN_HISTORY_MONTHS, forecast_demand
+
+
+def synthetic_history(items, months, seed=0):
+    """מטריצת השאלות חודשיות סינתטית בגודל items x months"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(months)
+    level = rng.gamma(2.0, 2.0, size=(items, 1))
+    slope = rng.normal(0, 0.02, size=(items, 1)) * level
+    amplitude = rng.uniform(0, 0.5, size=(items, 1)) * level
+    phase = rng.uniform(0, 2 * np.pi, size=(items, 1))
+    rate = np.maximum(level + slope * t + amplitude * np.sin(2 * np.pi * t / 12 + phase), 0)
+    history = rng.poisson(rate).astype(float)
+    # רבע מהפריטים נוספו באמצע התקופה
+    added = rng.integers(0, months, size=items)
+    added[rng.random(items) < 0.75] = 0
+    history[t[None, :] < added[:, None]] = 0
+    return history
+
+
+def legacy_forecast(history, horizon):
+    """המימוש הקודם: ממוצע 3 חודשים אחרונים כפול מקדם מגמה בחזקת האופק, פריט-פריט"""
+    predictions = np.zeros((len(history), horizon))
+    for row, series in enumerate(history):
+        counts = [value for value in series if value]
+        if len(counts) < 3:
+            continue
+        if len(counts) >= 6:
+            recent_avg = sum(counts[-3:]) / 3
+            previous_avg = sum(counts[-6:-3]) / 3
+            if previous_avg > 0:
+                trend_factor = recent_avg / previous_avg
+            else:
+                trend_factor = 1.0 if recent_avg == 0 else 1.5
+        else:
+            trend_factor = 1.1
+        recent_avg = sum(counts[-3:]) / 3
+        for step in range(horizon):
+            predictions[row, step] = recent_avg * (trend_factor ** (step + 1))
+    return predictions
+
+
+def timed(function, *args, repeat=3):
+    """הזמן הטוב ביותר מתוך repeat הרצות, והתוצאה האחרונה"""
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function(*args)
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="מדידת מנוע חיזוי הביקוש")
+    parser.add_argument('--items', type=int, default=10_000)
+    parser.add_argument('--months', type=int, default=36)
+    parser.add_argument('--horizon', type=int, default=3)
+    args = parser.parse_args()
+
+    history = synthetic_history(args.items, args.months + args.horizon)
+    train, actual = history[:, :-args.horizon], history[:, -args.horizon:]
+
+    legacy_time, legacy = timed(legacy_forecast, train, args.horizon)
+    vector_time, forecast = timed(forecast_demand, train, args.horizon)
+    print(f"{args.items:,} items x {args.months} months, horizon {args.horizon}")
+    print(f"{'legacy per-item loop':30s} {legacy_time * 1000:10.1f} ms")
+    print(f"{'vectorized engine':30s} {vector_time * 1000:10.1f} ms   "
+          f"({legacy_time / vector_time:.1f}x)")
+
+    eligible = forecast.history_months >= MIN_HISTORY_MONTHS
+    legacy_mae = np.abs(legacy[eligible] - actual[eligible]).mean()
+    vector_mae = np.abs(forecast.predictions[eligible] - actual[eligible]).mean()
+    covered = ((actual >= forecast.lower) & (actual <= forecast.upper))[eligible]
+    print(f"\nholdout MAE: legacy {legacy_mae:.2f}, vectorized {vector_mae:.2f}")
+    print(f"actual values inside the 90% confidence interval: {covered.mean():.1%} "
+          f"(by month ahead: {', '.join(f'{value:.1%}' for value in covered.mean(axis=0))})")
+    print(f"largest legacy prediction: {legacy.max():,.0f} (actual max {actual.max():,.0f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""
+מדידת תוכניות שאילתה לפני ואחרי מיגרציות האינדקסים.
+
+הסקריפט יוצר סכמה נפרדת (bench_indexes) עם נתונים סינתטיים - כברירת מחדל
+מיליון השאלות - מריץ EXPLAIN ANALYZE על השאילתות החמות, מריץ את המיגרציות
+מתוך migrations.py על אותה סכמה ומודד שוב. נתוני הייצור לא נגעים.
+
+שימוש:
+    python benchmark_indexes.py [--loans 1000000] [--items 5000] [--keep]
+"""
+
+import argparse
+import os
+import time
+
+import psycopg2
+
+from migrations import run_migrations
+
+SCHEMA = 'bench_indexes'
+
+SCHEMA_SQL = """
+    CREATE TABLE items (
+        id SERIAL PRIMARY KEY,
+        name TEXT NOT NULL,
+        category TEXT NOT NULL,
+        quantity INTEGER NOT NULL,
+        available INTEGER NOT NULL,
+        notes TEXT,
+        is_available BOOLEAN DEFAULT TRUE
+    );
+    CREATE TABLE loans (
+        id SERIAL PRIMARY KEY,
+        item_id INTEGER REFERENCES items(id),
+        student_name TEXT NOT NULL,
+        student_id TEXT NOT NULL,
+        quantity INTEGER NOT NULL,
+        loan_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        due_date TIMESTAMP NOT NULL,
+        return_date TIMESTAMP,
+        status TEXT DEFAULT 'active'
+    );
+    CREATE TABLE reservations (
+        id SERIAL PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        item_id INTEGER REFERENCES items(id),
+        student_name TEXT NOT NULL,
+        student_id TEXT NOT NULL,
+        quantity INTEGER NOT NULL,
+        start_date TIMESTAMP NOT NULL,
+        end_date TIMESTAMP NOT NULL,
+        status TEXT DEFAULT 'pending'
+    );
+    CREATE TABLE maintenance_schedules (
+        id SERIAL PRIMARY KEY,
+        item_id INTEGER REFERENCES items(id),
+        maintenance_type TEXT,
+        next_due DATE NOT NULL
+    );
+"""
+
+# השאלות היסטוריות מוחזרות, ו-2% מהן עדיין פתוחות
+DATA_SQL = """
+    INSERT INTO items (name, category, quantity, available)
+    SELECT 'item ' || g, 'category ' || (g %% 40), 1 + (g %% 12), 1 + (g %% 12)
+    FROM generate_series(1, %(items)s) g;
+
+    INSERT INTO loans (item_id, student_name, student_id, quantity,
+                       loan_date, due_date, return_date, status)
+    SELECT 1 + (random() * (%(items)s - 1))::int,
+           'student ' || (g %% 3000), (100000 + g %% 3000)::text,
+           1 + (g %% 3),
+           d, d + interval '7 days',
+           CASE WHEN g %% 50 = 0 THEN NULL ELSE d + interval '6 days' END,
+           CASE WHEN g %% 50 = 0 THEN 'active' ELSE 'returned' END
+    FROM (
+        SELECT g, NOW() - (random() * interval '1500 days') AS d
+        FROM generate_series(1, %(loans)s) g
+    ) s;
+
+    INSERT INTO reservations (user_id, item_id, student_name, student_id, quantity,
+                              start_date, end_date, status)
+    SELECT 1, 1 + (random() * (%(items)s - 1))::int,
+           'student ' || (g %% 3000), (100000 + g %% 3000)::text, 1,
+           d, d + interval '3 days',
+           (ARRAY['pending', 'approved', 'rejected', 'completed'])[1 + g %% 4]
+    FROM (
+        SELECT g, NOW() - interval '700 days' + (random() * interval '730 days') AS d
+        FROM generate_series(1, %(loans)s / 5) g
+    ) s;
+
+    INSERT INTO maintenance_schedules (item_id, maintenance_type, next_due)
+    SELECT g, 'inspection', CURRENT_DATE + (random() * 365)::int - 30
+    FROM generate_series(1, %(items)s) g;
+"""
+
+QUERIES = [
+    ("inventory: open loans per item", """
+        SELECT item_id, SUM(quantity)
+        FROM loans
+        WHERE return_date IS NULL AND item_id IS NOT NULL
+        GROUP BY item_id
+    """),
+    ("update_item: active quantity of one item", """
+        SELECT COALESCE(SUM(quantity), 0)
+        FROM loans
+        WHERE item_id = 42 AND status = 'active'
+    """),
+    ("alerts: overdue loans", """
+        SELECT l.id, i.name, l.due_date
+        FROM loans l
+        JOIN items i ON l.item_id = i.id
+        WHERE l.return_date IS NULL AND l.due_date < NOW()
+        ORDER BY l.due_date ASC
+    """),
+    ("availability: overlapping reservations of one item", """
+        SELECT COALESCE(SUM(r.quantity), 0)
+        FROM reservations r
+        WHERE r.item_id = 42
+          AND r.status IN ('approved', 'pending')
+          AND r.start_date <= NOW() + interval '7 days'
+          AND r.end_date >= NOW()
+    """),
+    ("maintenance: upcoming schedules", """
+        SELECT ms.id, ms.next_due
+        FROM maintenance_schedules ms
+        WHERE ms.next_due <= CURRENT_DATE + 30
+        ORDER BY ms.next_due
+    """),
+]
+
+
+def explain(cur, sql):
+    """מחזיר את שורת התוכנית העליונה וזמן הביצוע במילישניות"""
+    cur.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + sql)
+    plan = cur.fetchone()[0][0]
+    node = plan['Plan']
+    scans = []
+
+    def collect(n):
+        if 'Relation Name' in n or 'Index Name' in n:
+            scans.append(f"{n['Node Type']}" + (f" using {n['Index Name']}" if 'Index Name' in n else f" on {n['Relation Name']}"))
+        for child in n.get('Plans', []):
+            collect(child)
+
+    collect(node)
+    return plan['Execution Time'], ', '.join(scans)
+
+
+def run_queries(cur, label):
+    results = {}
+    print(f"\n=== {label} ===")
+    for name, sql in QUERIES:
+        # הרצה ראשונה לחימום המטמון, השנייה נמדדת
+        explain(cur, sql)
+        elapsed, scans = explain(cur, sql)
+        results[name] = elapsed
+        print(f"{name:55s} {elapsed:10.2f} ms   {scans}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="מדידת תוכניות שאילתה לפני ואחרי אינדקסים")
+    parser.add_argument('--loans', type=int, default=1_000_000)
+    parser.add_argument('--items', type=int, default=5000)
+    parser.add_argument('--keep', action='store_true', help="לא למחוק את סכמת המדידה בסיום")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(os.getenv('DATABASE_URL'), options=f'-c search_path={SCHEMA}')
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+            cur.execute(f"CREATE SCHEMA {SCHEMA}")
+            cur.execute(SCHEMA_SQL)
+            started = time.perf_counter()
+            cur.execute(DATA_SQL, {'items': args.items, 'loans': args.loans})
+            cur.execute("ANALYZE")
+            conn.commit()
+            print(f"Generated {args.loans:,} loans in {time.perf_counter() - started:.1f}s")
+
+            before = run_queries(cur, "before migrations")
+            conn.commit()
+
+        run_migrations(conn)
+
+        with conn.cursor() as cur:
+            cur.execute("ANALYZE")
+            conn.commit()
+            after = run_queries(cur, "after migrations")
+            conn.commit()
+
+        print("\n=== speedup ===")
+        for name, _ in QUERIES:
+            ratio = before[name] / after[name] if after[name] else float('inf')
+            print(f"{name:55s} {ratio:8.1f}x")
+
+        if not args.keep:
+            with conn.cursor() as cur:
+                cur.execute(f"DROP SCHEMA {SCHEMA} CASCADE")
+            conn.commit()
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+מדידת סריאליזציית ה-JSON (serialization.py) מול הדרך הקודמת.
+
+הסקריפט בונה תשובת מלאי סינתטית - כברירת מחדל 10,000 פריטים עם Decimal,
+תאריכים וטקסט בעברית, כמו השורות ש-get_inventory מקבל מ-psycopg2 - ומודד:
+  - legacy: המרת Decimal ל-float לכל שדה ואז json.dumps עם DateTimeEncoder
+  - stdlib: serialization.dumps בלי orjson
+  - orjson: serialization.dumps עם orjson (אם מותקן)
+לא נדרש מסד נתונים.
+
+שימוש:
+    python benchmark_json.py [--items 10000] [--repeat 5]
+"""
+
+import argparse
+import datetime
+import json
+import time
+from decimal import Decimal
+
+import serialization
+
+
+class DateTimeEncoder(json.JSONEncoder):
+    """המקודד שהיה מועתק בין הסקריפטים"""
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        elif isinstance(o, datetime.date):
+            return o.isoformat()
+        elif isinstance(o, Decimal):
+            return float(o)
+        return super().default(o)
+
+
+def synthetic_rows(items):
+    """שורות מלאי כפי שהן מגיעות מהמסד"""
+    started = datetime.datetime(2024, 1, 1, 9, 30)
+    return [
+        {
+            'id': index,
+            'name': f"מצלמה {index}",
+            'category': f"קטגוריה {index % 40}",
+            'quantity': index % 12,
+            'loaned_quantity': index % 5,
+            'notes': "כולל סוללה נוספת ומטען",
+            'is_available': index % 7 != 0,
+            'price_per_unit': Decimal(f"{index % 900}.50"),
+            'total_price': Decimal(f"{index % 900 * 3}.50"),
+            'director': "ישראלה כהן",
+            'allowed_years': "1,2,3",
+            'created_at': started + datetime.timedelta(minutes=index),
+            'due_date': (started + datetime.timedelta(days=index % 60)).date(),
+        }
+        for index in range(items)
+    ]
+
+
+def legacy(rows):
+    """float() לכל שדה מחיר ואז json.dumps עם המקודד הישן"""
+    items = []
+    for row in rows:
+        item = dict(row)
+        item['price_per_unit'] = float(row['price_per_unit']) if row['price_per_unit'] is not None else 0.0
+        item['total_price'] = float(row['total_price']) if row['total_price'] is not None else 0.0
+        items.append(item)
+    return json.dumps({'items': items}, ensure_ascii=False, cls=DateTimeEncoder)
+
+
+def shared_stdlib(rows):
+    orjson, serialization.orjson = serialization.orjson, None
+    try:
+        return serialization.dumps({'items': rows})
+    finally:
+        serialization.orjson = orjson
+
+
+def shared(rows):
+    return serialization.dumps({'items': rows})
+
+
+def timed(function, rows, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        output = function(rows)
+        best = min(best, time.perf_counter() - started)
+    return best, output
+
+
+def main():
+    parser = argparse.ArgumentParser(description="מדידת סריאליזציית JSON")
+    parser.add_argument('--items', type=int, default=10_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rows = synthetic_rows(args.items)
+    candidates = [('legacy float() + DateTimeEncoder', legacy), ('serialization (stdlib)', shared_stdlib)]
+    if serialization.orjson is not None:
+        candidates.append(('serialization (orjson)', shared))
+    else:
+        print("orjson is not installed - measuring the stdlib fallback only")
+
+    expected = None
+    baseline = None
+    print(f"{args.items:,} inventory rows")
+    for label, function in candidates:
+        seconds, output = timed(function, rows, args.repeat)
+        baseline = baseline or seconds
+        size = len(output.encode('utf-8'))
+        print(f"{label:36s} {seconds * 1000:8.1f} ms  {size / seconds / 1e6:7.1f} MB/s  "
+              f"{args.items / seconds:12,.0f} rows/s  ({baseline / seconds:.1f}x)")
+        # אותו תוכן, בלי תלות ברווחים
+        parsed = json.loads(output)
+        if expected is None:
+            expected = parsed
+        elif parsed != expected:
+            raise SystemExit(f"{label}: output differs from the legacy encoder")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+מדידת זמן העלייה של סקריפטי ה-API (react-app/api).
+
+כל בקשה לשרת Express מריצה סקריפט Python בתהליך חדש, ולכן זמן הייבוא של
+הסקריפט משולם בכל בקשה. הסקריפט מייבא כל קובץ בתהליך נפרד עם
+python -X importtime (הייבוא לא מריץ את main, שמוגנת ב-__name__), ומדווח
+את זמן הייבוא הכולל ואת המודולים הכבדים ביותר שנטענו.
+
+הסקריפט מסתיים בקוד 1 אם סקריפט כלשהו נכשל או עבר את התקציב (ברירת מחדל
+150 מילישניות, --budget-ms 0 מבטל), והוא רץ כבדיקה עם npm test. סקריפט
+שנכשל רק כי תלות אופציונלית (OPTIONAL_MODULES) לא מותקנת מדולג ולא נכשל:
+    python benchmark_startup.py [--budget-ms 150] [--top 3] [script ...]
+"""
+
+import argparse
+import importlib.util
+import os
+import subprocess
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+API_DIR = os.path.join(PROJECT_ROOT, 'react-app', 'api')
+
+DEFAULT_BUDGET_MS = 150
+# תלויות של סקריפטי ההתחברות (auth_api, login, register, simple_login)
+# שלא מותקנות בכל סביבה
+OPTIONAL_MODULES = ('werkzeug', 'flask_login', 'jwt')
+
+
+class MissingDependency(RuntimeError):
+    """הייבוא נכשל כי תלות אופציונלית לא מותקנת"""
+
+
+def missing_optional_modules():
+    """התלויות האופציונליות שלא מותקנות בסביבה הנוכחית"""
+    return [module for module in OPTIONAL_MODULES if importlib.util.find_spec(module) is None]
+
+
+def api_scripts():
+    """שמות כל סקריפטי ה-API, בלי סיומת"""
+    return sorted(name[:-3] for name in os.listdir(API_DIR) if name.endswith('.py'))
+
+
+def measure_import(module, runs=3):
+    """
+    מייבא את module בתהליך חדש runs פעמים ומחזיר, מההרצה המהירה ביותר,
+    (זמן הייבוא הכולל במילישניות, רשימת (זמן, מודול) של המודולים שהסקריפט
+    ייבא ישירות). זורק RuntimeError אם הייבוא נכשל, ו-MissingDependency אם
+    הוא נכשל על תלות אופציונלית שחסרה
+    """
+    missing = missing_optional_modules()
+    # כמו בשרת: תיקיית ה-API ותיקיית הפרויקט בנתיב החיפוש
+    path = [API_DIR, PROJECT_ROOT, os.environ.get('PYTHONPATH')]
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, path)))
+    best = None
+    for _ in range(runs):
+        process = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                                 cwd=API_DIR, capture_output=True, text=True, env=env)
+        if process.returncode != 0:
+            error = process.stderr.strip().splitlines()[-1]
+            if any(error == f"ModuleNotFoundError: No module named '{name}'" for name in missing):
+                raise MissingDependency(error)
+            raise RuntimeError(error)
+
+        # שורות בפורמט "import time: self [us] | cumulative | imported package",
+        # כשכל רמת קינון מוסיפה שני רווחים לפני שם המודול. מודול מודפס אחרי
+        # המודולים שהוא ייבא, כך שהילדים הישירים של הסקריפט קודמים לשורה שלו
+        total, children = 0.0, []
+        for line in process.stderr.splitlines():
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            _, cumulative, name = line[len('import time:'):].split('|')
+            depth = (len(name) - len(name.lstrip()) - 1) // 2
+            if depth == 0 and name.strip() == module:
+                total = int(cumulative) / 1000
+            elif depth == 1:
+                children.append((int(cumulative) / 1000, name.strip()))
+            elif depth == 0:
+                children = []
+        if best is None or total < best[0]:
+            best = (total, children)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="מדידת זמן העלייה של סקריפטי ה-API")
+    parser.add_argument('scripts', nargs='*', help="שמות סקריפטים (ברירת מחדל: כולם)")
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS,
+                        help="תקציב זמן ייבוא לכל סקריפט; חריגה מסיימת בקוד 1 (0 מבטל)")
+    parser.add_argument('--top', type=int, default=3, help="כמה מודולים כבדים להציג לכל סקריפט")
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    failures = []
+    for script in args.scripts or api_scripts():
+        try:
+            total, modules = measure_import(script, args.runs)
+        except MissingDependency as e:
+            print(f"{script:32s} {'skipped':>10s}   {e}")
+            continue
+        except RuntimeError as e:
+            print(f"{script:32s} {'error':>10s}   {e}")
+            failures.append(script)
+            continue
+
+        heaviest = ', '.join(f"{name} {ms:.0f}" for ms, name in sorted(modules, reverse=True)[:args.top])
+        over = args.budget_ms > 0 and total > args.budget_ms
+        print(f"{script:32s} {total:8.1f} ms{'  OVER' if over else '      '}  {heaviest}")
+        if over:
+            failures.append(script)
+
+    if failures:
+        print(f"\n{len(failures)} script(s) failed or exceeded the budget: {', '.join(failures)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
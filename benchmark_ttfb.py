@@ -0,0 +1,64 @@
+"""
+מדידת זמן עד הבית הראשון (TTFB) של נתיבי ה-API בשרת Express.
+
+נתיבים עם תשובות גדולות (/api/inventory, /api/loans, /api/import/preview)
+מזרימים את הפלט של סקריפט הפייתון ישירות ללקוח, דחוס לפי Accept-Encoding
+(server.js, streamPythonScript). הסקריפט שולח כל נתיב עם כל אחת מהדחיסות
+ומדווח, מהריצה המהירה ביותר:
+  - ttfb: הזמן עד שהגיע הבית הראשון של גוף התשובה
+  - total: הזמן עד סוף התשובה
+  - wire: כמה בתים עברו ברשת (אחרי דחיסה)
+כדי להשוות לפני/אחרי מריצים אותו מול שני שרתים (למשל גרסה קודמת על פורט אחר):
+    python benchmark_ttfb.py [--url http://localhost:5000] [--repeat 5]
+                             [--encodings identity,gzip,br] [path ...]
+"""
+
+import argparse
+import http.client
+import time
+from urllib.parse import urlsplit
+
+DEFAULT_PATHS = ['/api/inventory', '/api/loans?limit=1000']
+
+
+def measure(url, path, encoding):
+    """בקשת GET אחת; מחזירה (ttfb, total, wire) בשניות ובבתים"""
+    parts = urlsplit(url)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=120)
+    try:
+        started = time.perf_counter()
+        conn.request('GET', path, headers={'Accept-Encoding': encoding})
+        response = conn.getresponse()
+        if response.status != 200:
+            raise RuntimeError(f"{path}: HTTP {response.status}")
+        # גוף דחוס לא מפוענח כאן - נמדדים הבתים שעברו ברשת
+        first = response.read(1)
+        ttfb = time.perf_counter() - started
+        wire = len(first) + len(response.read())
+        return ttfb, time.perf_counter() - started, wire
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="מדידת TTFB של נתיבי ה-API")
+    parser.add_argument('paths', nargs='*', help=f"נתיבים (ברירת מחדל: {' '.join(DEFAULT_PATHS)})")
+    parser.add_argument('--url', default='http://localhost:5000')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--encodings', default='identity,gzip,br')
+    args = parser.parse_args()
+
+    print(f"{'path':32s} {'encoding':9s} {'ttfb':>10s} {'total':>10s} {'wire':>12s}")
+    for path in args.paths or DEFAULT_PATHS:
+        for encoding in args.encodings.split(','):
+            # הבקשה הראשונה מחממת את השרת (תהליכים, מטמון) ולא נמדדת
+            measure(args.url, path, encoding)
+            runs = [measure(args.url, path, encoding) for _ in range(args.repeat)]
+            ttfb = min(run[0] for run in runs)
+            total = min(run[1] for run in runs)
+            wire = runs[-1][2]
+            print(f"{path:32s} {encoding:9s} {ttfb * 1000:7.1f} ms {total * 1000:7.1f} ms {wire:12,d}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""
+מנוע ייבוא מרוכז של פריטי מלאי מגיליון אקסל.
+
+במקום מעבר שורה-שורה וחיבור וטרנזקציה לכל פריט:
+1. prepare_items_frame - הכנת כל השורות בפעולות pandas וקטוריות:
+   הפצת קטגוריות (ffill), חילוץ כמות, איחוד הערות ובדיקת תקינות.
+2. stage_items - טעינת השורות התקינות לטבלה זמנית ב-COPY FROM STDIN.
+3. merge_staged_items - מיזוג לטבלת items בפקודה אחת. פריט שכבר קיים
+   באותה קטגוריה ובאותו שם (מפתח ייחודי, מיגרציה 8) מדולג ונספר ב-skipped.
+הכל בטרנזקציה אחת; שורות לא תקינות מדווחות עם מספר השורה באקסל
+ולא מפילות את שאר הייבוא.
+"""
+
+import io
+
+import numpy as np
+import pandas as pd
+
+from database import get_db_connection, bump_data_version, items_key_available
+
+CATEGORY_COLUMN = 'Unnamed: 0'
+NAME_COLUMN = 'פריט'
+DEFAULT_CATEGORY = 'כללי'
+SUB_ITEM_SUFFIX = ' - אביזרים'
+MAX_QUANTITY = 2 ** 31 - 1
+
+# עמודות הערות - הערך נשמר כ"עמודה: ערך"
+NOTE_COLUMNS = [
+    'הערות על הזמנה (מחסן באדום. סטודנט בכחול)',
+    'הערות על הוצאה (מחסן באדום. סטודנט בכחול)',
+    'הערות על החזרה',
+    'הזמנה',
+    'יצא',
+    'בדקתי',
+    'חזר'
+]
+
+# עמודות מידע נוסף - הכותרת כבר כוללת נקודתיים
+ADDITIONAL_INFO_COLUMNS = ['במאית: ', 'מפיקה: ', 'צלמת: ']
+
+NOTES_SEPARATOR = ' | '
+
+# העמודות שנטענות לטבלה הזמנית, עם ברירות המחדל של add_item
+STAGE_COLUMNS = ['row_number', 'name', 'category', 'quantity', 'notes']
+
+STAGE_TABLE_SQL = """
+    CREATE TEMP TABLE import_items_stage (
+        row_number INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        category TEXT NOT NULL,
+        quantity INTEGER NOT NULL,
+        notes TEXT NOT NULL
+    ) ON COMMIT DROP
+"""
+
+MERGE_SQL = """
+    INSERT INTO items (
+        name, category, quantity, available, notes,
+        ordered, checked_out, checked, returned,
+        price_per_unit, total_price
+    )
+    SELECT name, category, quantity, quantity, notes,
+           FALSE, FALSE, FALSE, FALSE, 0, 0
+    FROM import_items_stage
+    ORDER BY row_number
+    ON CONFLICT (category, name) DO NOTHING
+"""
+
+# בלי המפתח הייחודי (כפילויות שטרם מוזגו, מיגרציה 8): אותו מיזוג בלי
+# ON CONFLICT, כשהטבלה נעולה לכתיבות מקבילות
+MERGE_WITHOUT_KEY_SQL = """
+    INSERT INTO items (
+        name, category, quantity, available, notes,
+        ordered, checked_out, checked, returned,
+        price_per_unit, total_price
+    )
+    SELECT name, category, quantity, quantity, notes,
+           FALSE, FALSE, FALSE, FALSE, 0, 0
+    FROM (
+        SELECT DISTINCT ON (category, name) *
+        FROM import_items_stage
+        ORDER BY category, name, row_number
+    ) s
+    WHERE NOT EXISTS (
+        SELECT 1 FROM items i WHERE i.category = s.category AND i.name = s.name
+    )
+    ORDER BY row_number
+"""
+
+
+def _clean_text(series):
+    """ממיר עמודה לטקסט מנוקה, כשערכים חסרים הופכים למחרוזת ריקה"""
+    return series.astype('string').str.strip().fillna('')
+
+
+def _join_notes(parts):
+    """מחבר רשימת עמודות טקסט עם מפריד, ומדלג על ערכים ריקים - בלי לולאה על שורות"""
+    combined = parts[0]
+    for part in parts[1:]:
+        both = (combined != '') & (part != '')
+        combined = pd.Series(
+            np.where(both, combined + NOTES_SEPARATOR + part, combined + part),
+            index=combined.index
+        )
+    return combined
+
+
+def prepare_items_frame(df):
+    """
+    מכין את שורות הגיליון לייבוא. מחזיר (frame, errors): frame עם העמודות
+    של STAGE_COLUMNS לשורות התקינות, ו-errors - רשימת {row, name, message}.
+    מספרי השורות הם כמו באקסל (שורה 1 היא הכותרת).
+    """
+    if NAME_COLUMN not in df.columns:
+        raise ValueError(f"העמודה '{NAME_COLUMN}' לא נמצאה בקובץ")
+
+    row_numbers = pd.Series(np.arange(len(df)) + 2, index=df.index)
+
+    # הפצת קטגוריות: שורת קטגוריה חלה על כל השורות שאחריה עד הקטגוריה הבאה
+    if CATEGORY_COLUMN in df.columns:
+        markers = df[CATEGORY_COLUMN]
+        markers = markers.where(markers.map(lambda value: isinstance(value, str)))
+        markers = _clean_text(markers).replace('', np.nan)
+        current_category = markers.ffill()
+    else:
+        current_category = pd.Series(np.nan, index=df.index, dtype=object)
+
+    raw_names = df[NAME_COLUMN]
+    names_text = raw_names.astype('string').fillna('')
+    names = names_text.str.strip()
+    has_item = names != ''
+
+    # פריט משנה (מוזח בארבעה רווחים) נכנס לקטגוריית האביזרים של הקטגוריה
+    is_sub_item = raw_names.map(lambda value: isinstance(value, str)) & names_text.str.startswith('    ')
+    category = current_category.fillna(DEFAULT_CATEGORY)
+    category = category.where(~(is_sub_item & current_category.notna()),
+                              current_category + SUB_ITEM_SUFFIX)
+
+    # הכמות היא המספר הראשון בשם הפריט, ו-1 אם אין מספר
+    quantity = pd.to_numeric(names.str.extract(r'(\d+)', expand=False), errors='coerce').fillna(1)
+
+    parts = []
+    for column in NOTE_COLUMNS:
+        if column in df.columns:
+            value = _clean_text(df[column])
+            parts.append(value.where(value == '', column + ': ' + value))
+    for column in ADDITIONAL_INFO_COLUMNS:
+        if column in df.columns:
+            value = _clean_text(df[column])
+            parts.append(value.where(value == '', column + value))
+    notes = _join_notes(parts) if parts else pd.Series('', index=df.index)
+
+    frame = pd.DataFrame({
+        'row_number': row_numbers,
+        'name': names,
+        'category': category.astype(str),
+        'quantity': quantity,
+        'notes': notes.astype(str)
+    })[has_item]
+
+    # בדיקות תקינות - שורה שנכשלה מדווחת ולא נטענת. כמות שחורגת מ-INTEGER
+    # הייתה מפילה את כל פקודת ה-COPY ולכן נבדקת מראש
+    problems = pd.Series('', index=frame.index)
+    problems = problems.mask(frame['quantity'] > MAX_QUANTITY, "כמות גדולה מדי")
+    invalid = problems != ''
+
+    errors = [
+        {'row': int(row), 'name': name, 'message': message}
+        for row, name, message in zip(frame.loc[invalid, 'row_number'],
+                                      frame.loc[invalid, 'name'],
+                                      problems[invalid])
+    ]
+    frame = frame[~invalid].astype({'quantity': 'int64'})
+    return frame, errors
+
+
+def stage_items(cur, frame):
+    """טוען את השורות לטבלה זמנית ב-COPY FROM STDIN"""
+    cur.execute(STAGE_TABLE_SQL)
+    buffer = io.StringIO()
+    frame[STAGE_COLUMNS].to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+    cur.copy_expert(
+        f"COPY import_items_stage ({', '.join(STAGE_COLUMNS)}) FROM STDIN "
+        "WITH (FORMAT csv, FORCE_NOT_NULL (name, category, notes))",
+        buffer
+    )
+
+
+def merge_staged_items(cur):
+    """מוסיף את כל השורות מהטבלה הזמנית לטבלת items; מחזיר את מספר הפריטים שנוספו"""
+    if items_key_available(cur):
+        cur.execute(MERGE_SQL)
+    else:
+        cur.execute("LOCK TABLE items IN SHARE ROW EXCLUSIVE MODE")
+        cur.execute(MERGE_WITHOUT_KEY_SQL)
+    return cur.rowcount
+
+
+def bulk_import_items(df):
+    """
+    מייבא את שורות הגיליון לטבלת items בטרנזקציה אחת.
+    מחזיר מילון עם inserted, skipped (פריטים שכבר קיימים), errors (שורות
+    שנדחו) ו-total_rows.
+    """
+    frame, errors = prepare_items_frame(df)
+    inserted = 0
+    if not frame.empty:
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                stage_items(cur, frame)
+                inserted = merge_staged_items(cur)
+                bump_data_version(cur)
+            conn.commit()
+    return {
+        'inserted': inserted,
+        'skipped': len(frame) - inserted,
+        'errors': errors,
+        'total_rows': len(frame) + len(errors)
+    }
@@ -15,21 +15,11 @@ def get_equipment_status():
                 i.category,
                 i.quantity as total_quantity,
                 i.available as available_quantity,
-                COALESCE(l.loaned_quantity, 0) as loaned_quantity,
-                COALESCE(r.reserved_quantity, 0) as reserved_quantity
+                COALESCE(s.loaned_quantity, 0) as loaned_quantity,
+                COALESCE(s.reserved_quantity, 0) as reserved_quantity,
+                COALESCE(s.in_maintenance_quantity, 0) as in_maintenance_quantity
             FROM items i
-            LEFT JOIN (
-                SELECT item_id, SUM(quantity) as loaned_quantity
-                FROM loans
-                WHERE status = 'active'
-                GROUP BY item_id
-            ) l ON i.id = l.item_id
-            LEFT JOIN (
-                SELECT item_id, SUM(quantity) as reserved_quantity
-                FROM reservations
-                WHERE status = 'approved'
-                GROUP BY item_id
-            ) r ON i.id = r.item_id
+            LEFT JOIN item_stock s ON i.id = s.item_id
             ORDER BY i.category, i.name
         """, conn)
     return df
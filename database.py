@@ -1,15 +1,303 @@
 import os
 import sys
-from psycopg2.extras import RealDictCursor
+import threading
+import time
 import psycopg2
+import psycopg2.extensions
+from psycopg2.pool import PoolError
 from datetime import datetime
 
-def get_db_connection():
-    db_url = os.getenv('DATABASE_URL')
-    print(f"DEBUG: Connecting to database with URL: {db_url}", file=sys.stderr)
-    return psycopg2.connect(db_url)
+# הגדרות מאגר החיבורים (ניתנות לשינוי במשתני סביבה)
+DB_POOL_MIN = int(os.getenv('DB_POOL_MIN', '1'))
+DB_POOL_MAX = int(os.getenv('DB_POOL_MAX', '10'))
+DB_POOL_IDLE_TIMEOUT = float(os.getenv('DB_POOL_IDLE_TIMEOUT', '300'))
+DB_POOL_CHECK_INTERVAL = float(os.getenv('DB_POOL_CHECK_INTERVAL', '30'))
+DB_POOL_WAIT_TIMEOUT = float(os.getenv('DB_POOL_WAIT_TIMEOUT', '30'))
+
+
+class ConnectionPool:
+    """
+    מאגר חיבורים משותף לכל התהליך, בסגנון ThreadedConnectionPool.
+    חיבור נבדק לפני שהוא נמסר (חיבור שישב זמן רב מבצע SELECT 1),
+    וחיבורים שלא היו בשימוש מעבר ל-idle_timeout נסגרים, מעבר למינימום.
+    """
+
+    def __init__(self, dsn, minconn, maxconn, idle_timeout, check_interval, wait_timeout):
+        self.dsn = dsn
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.idle_timeout = idle_timeout
+        self.check_interval = check_interval
+        self.wait_timeout = wait_timeout
+        self._idle = []  # רשימת (חיבור, זמן שחרור אחרון)
+        self._size = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def _connect(self):
+        if not self.dsn:
+            raise Exception("DATABASE_URL environment variable not set")
+        return psycopg2.connect(self.dsn)
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _reap_idle(self):
+        """סוגר חיבורים שלא היו בשימוש זמן רב (נקרא כשהמנעול תפוס)"""
+        now = time.monotonic()
+        keep = []
+        for conn, released_at in self._idle:
+            if self._size > self.minconn and now - released_at > self.idle_timeout:
+                self._discard(conn)
+                self._size -= 1
+            else:
+                keep.append((conn, released_at))
+        self._idle = keep
+
+    def _is_healthy(self, conn, released_at):
+        if conn.closed:
+            return False
+        if time.monotonic() - released_at < self.check_interval:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def getconn(self):
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            with self._cond:
+                if self._closed:
+                    raise PoolError("connection pool is closed")
+                self._reap_idle()
+                if self._idle:
+                    conn, released_at = self._idle.pop()
+                elif self._size < self.maxconn:
+                    conn, released_at = None, None
+                    self._size += 1
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolError("timed out waiting for a database connection")
+                    self._cond.wait(remaining)
+                    continue
+
+            if conn is None:
+                try:
+                    return self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+
+            if self._is_healthy(conn, released_at):
+                return conn
+
+            # חיבור שבור - נזרק ומנסים שוב
+            self._discard(conn)
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+
+    def putconn(self, conn):
+        reusable = not conn.closed and not self._closed
+        if reusable:
+            try:
+                if conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+                conn.autocommit = False
+                conn.cursor_factory = None
+            except Exception:
+                reusable = False
+
+        with self._cond:
+            if reusable:
+                self._idle.append((conn, time.monotonic()))
+            else:
+                self._discard(conn)
+                self._size -= 1
+            self._cond.notify()
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            for conn, _ in self._idle:
+                self._discard(conn)
+            self._size -= len(self._idle)
+            self._idle = []
+            self._cond.notify_all()
+
+
+class PooledConnection:
+    """
+    עוטף חיבור מהמאגר. close() ויציאה מבלוק with מחזירים את החיבור למאגר
+    במקום לסגור אותו, כך שהקוד הקיים (with get_db_connection() as conn)
+    ממשיך לעבוד כרגיל.
+    """
+
+    def __init__(self, pool, conn):
+        object.__setattr__(self, '_pool', pool)
+        object.__setattr__(self, '_conn', conn)
+
+    def __getattr__(self, name):
+        conn = object.__getattribute__(self, '_conn')
+        if conn is None:
+            raise psycopg2.InterfaceError("connection already returned to the pool")
+        return getattr(conn, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._conn, name, value)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        conn = self._conn
+        if conn is not None and not conn.closed:
+            if exc_type is None:
+                conn.commit()
+            else:
+                conn.rollback()
+        self.close()
+        return False
+
+    def close(self):
+        conn = self._conn
+        if conn is not None:
+            object.__setattr__(self, '_conn', None)
+            self._pool.putconn(conn)
+
+    @property
+    def closed(self):
+        conn = self._conn
+        return 1 if conn is None else conn.closed
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """מחזיר את מאגר החיבורים של התהליך (נוצר בקריאה הראשונה)"""
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                _pool = ConnectionPool(
+                    os.getenv('DATABASE_URL'),
+                    DB_POOL_MIN,
+                    DB_POOL_MAX,
+                    DB_POOL_IDLE_TIMEOUT,
+                    DB_POOL_CHECK_INTERVAL,
+                    DB_POOL_WAIT_TIMEOUT
+                )
+                _pool_pid = os.getpid()
+    return _pool
+
+
+def get_db_connection(cursor_factory=None, autocommit=False):
+    """
+    מחזיר חיבור ממאגר החיבורים המשותף.
+    close() או יציאה מבלוק with מחזירים את החיבור למאגר.
+    """
+    pool = get_pool()
+    conn = pool.getconn()
+    try:
+        if cursor_factory is not None:
+            conn.cursor_factory = cursor_factory
+        if autocommit:
+            conn.autocommit = True
+    except Exception:
+        pool.putconn(conn)
+        raise
+    return PooledConnection(pool, conn)
+
+# כשהטבלאות חסרות הבדיקה חוזרת אחרי כמה שניות, ולא בכל קריאה
+DATA_VERSIONS_RECHECK_SECONDS = 30
+
+_data_versions_ready = False
+_data_versions_checked_at = None
+
+
+def data_versions_available(cur):
+    """
+    בודק שטבלאות גרסאות הנתונים והמטמון קיימות. תשובה חיובית נשמרת לכל חיי
+    התהליך; שלילית רק DATA_VERSIONS_RECHECK_SECONDS שניות, כך שתהליך שעלה
+    לפני שהטבלאות נוצרו מתחיל להשתמש בהן בלי הפעלה מחדש
+    """
+    global _data_versions_ready, _data_versions_checked_at
+    if _data_versions_ready:
+        return True
+    now = time.monotonic()
+    if (_data_versions_checked_at is not None
+            and now - _data_versions_checked_at < DATA_VERSIONS_RECHECK_SECONDS):
+        return False
+    with cur.connection.cursor(cursor_factory=psycopg2.extensions.cursor) as check:
+        check.execute("""
+            SELECT to_regclass('data_versions') IS NOT NULL
+               AND to_regclass('snapshot_cache') IS NOT NULL
+        """)
+        _data_versions_ready = check.fetchone()[0]
+    _data_versions_checked_at = now
+    return _data_versions_ready
+
+
+_data_version_requests_ready = False
+
+
+def bump_data_version(cur, name='dashboard'):
+    """
+    מקדם את מונה הגרסה של הנתונים באותה טרנזקציה של השינוי,
+    כך שתמונות מצב שמורות (למשל של הדשבורד) יחושבו מחדש.
+    אחרי מיגרציה 13 רק נרשמת בקשה, והמונה מקודם בזמן ה-COMMIT - כך שורת
+    המונה לא נשארת נעולה לאורך הטרנזקציה
+    """
+    global _data_version_requests_ready
+    if not data_versions_available(cur):
+        return
+    if not _data_version_requests_ready:
+        with cur.connection.cursor(cursor_factory=psycopg2.extensions.cursor) as check:
+            check.execute("SELECT to_regclass('data_version_requests') IS NOT NULL")
+            _data_version_requests_ready = check.fetchone()[0]
+    if _data_version_requests_ready:
+        cur.execute("INSERT INTO data_version_requests (name) VALUES (%s)", (name,))
+        return
+    cur.execute("""
+        INSERT INTO data_versions (name, version, updated_at)
+        VALUES (%s, 1, CURRENT_TIMESTAMP)
+        ON CONFLICT (name) DO UPDATE
+        SET version = data_versions.version + 1,
+            updated_at = CURRENT_TIMESTAMP
+    """, (name,))
+
+
+def items_key_available(cur):
+    """
+    בודק שהמפתח הייחודי (category, name) של items קיים. מיגרציה 8 לא בונה
+    אותו כשיש פריטים כפולים, עד שהם ממוזגים ב-dedupe_items.py
+    """
+    with cur.connection.cursor(cursor_factory=psycopg2.extensions.cursor) as check:
+        check.execute("SELECT to_regclass('items_category_name_key') IS NOT NULL")
+        return check.fetchone()[0]
+
 
 def init_db():
+    global _data_versions_checked_at
     with get_db_connection() as conn:
         with conn.cursor() as cur:
             # Create items table with all needed fields from Excel
@@ -96,8 +384,33 @@ def init_db():
                 )
             """)
             
+            # גרסאות נתונים ותמונות מצב שמורות (מטמון הדשבורד)
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS data_versions (
+                    name TEXT PRIMARY KEY,
+                    version BIGINT NOT NULL DEFAULT 0,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS snapshot_cache (
+                    name TEXT PRIMARY KEY,
+                    version BIGINT NOT NULL,
+                    payload JSONB NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            
             conn.commit()
 
+    # הטבלאות נוצרו עכשיו - בדיקה שלילית קודמת לא תקפה
+    _data_versions_checked_at = None
+
+    # אינדקסים ושינויי סכמה נוספים מנוהלים כמיגרציות גרסתיות
+    from migrations import run_migrations
+    run_migrations()
+
 def add_item(name, category, quantity, notes="", order_notes=None, ordered=False,
              checkout_notes=None, checked_out=False, checked=False,
              return_notes=None, returned=False, price_per_unit=0, total_price=0,
@@ -119,6 +432,7 @@ def add_item(name, category, quantity, notes="", order_notes=None, ordered=False
                  return_notes, returned, price_per_unit, total_price,
                  director, producer, photographer, unnnamed_11)
             )
+            bump_data_version(cur)
             conn.commit()
 
 def get_all_items():
@@ -127,18 +441,73 @@ def get_all_items():
             cur.execute("SELECT * FROM items ORDER BY category, name")
             return cur.fetchall()
 
-def create_loan(item_id, student_name, student_id, quantity, due_date, user_id=None, 
-             loan_notes=None, checkout_notes=None, return_notes=None,
-             director=None, producer=None, photographer=None,
-             price_per_unit=None, total_price=None):
+def lock_items(cur, item_ids):
+    """
+    נועל את שורות הפריטים (SELECT ... FOR UPDATE) לפי סדר מזהים עולה.
+    סדר קבוע מונע deadlock בין טרנזקציות שנועלות סלים חופפים.
+    מחזיר את קבוצת המזהים שנמצאו.
+    """
+    cur.execute(
+        "SELECT id FROM items WHERE id = ANY(%s) ORDER BY id FOR UPDATE",
+        (sorted({int(item_id) for item_id in item_ids}),)
+    )
+    return {row[0] for row in cur.fetchall()}
+
+
+def create_loans(lines, student_name, student_id, due_date, user_id=None,
+                 loan_notes=None, checkout_notes=None, return_notes=None,
+                 director=None, producer=None, photographer=None):
+    """
+    יוצר השאלה לכל שורה בסל (מילונים עם item_id, quantity ואופציונלית
+    price_per_unit, total_price ו-loan_notes) בטרנזקציה אחת.
+    שורות הפריטים ננעלות לפי סדר מזהים, כל הכמויות נבדקות ומופחתות
+    בפקודה אחת, ואם פריט כלשהו חסר - אף השאלה לא נוצרת.
+    מחזיר את רשימת מזהי ההשאלות לפי סדר השורות; ValueError אם אין מספיק מלאי.
+    """
+    if not lines:
+        raise ValueError("הסל ריק")
+    for line in lines:
+        if int(line['quantity']) <= 0:
+            raise ValueError("הכמות חייבת להיות חיובית")
+
+    # כמה שורות לאותו פריט נבדקות יחד מול הכמות הזמינה
+    requested = {}
+    for line in lines:
+        item_id = int(line['item_id'])
+        requested[item_id] = requested.get(item_id, 0) + int(line['quantity'])
+    item_ids = sorted(requested)
+
     with get_db_connection() as conn:
         with conn.cursor() as cur:
-            cur.execute(
-                """UPDATE items SET available = available - %s 
-                   WHERE id = %s AND available >= %s""",
-                (quantity, item_id, quantity)
-            )
-            if cur.rowcount > 0:
+            lock_items(cur, item_ids)
+
+            # כל הכמויות נבדקות בפקודה אחת, כשהשורות כבר נעולות
+            quantities = [requested[i] for i in item_ids]
+            cur.execute("""
+                SELECT req.item_id, i.name, i.available, req.quantity
+                FROM unnest(%s::int[], %s::int[]) AS req(item_id, quantity)
+                LEFT JOIN items i ON i.id = req.item_id
+                WHERE i.id IS NULL OR i.available < req.quantity
+                ORDER BY req.item_id
+            """, (item_ids, quantities))
+            shortages = cur.fetchall()
+            if shortages:
+                conn.rollback()
+                raise ValueError("אין מספיק מלאי: " + ", ".join(
+                    f"{name} (זמין: {available}, מבוקש: {quantity})" if name is not None
+                    else f"פריט {item_id} לא נמצא"
+                    for item_id, name, available, quantity in shortages
+                ))
+
+            cur.execute("""
+                UPDATE items i
+                SET available = i.available - req.quantity
+                FROM unnest(%s::int[], %s::int[]) AS req(item_id, quantity)
+                WHERE i.id = req.item_id
+            """, (item_ids, quantities))
+
+            loan_ids = []
+            for line in lines:
                 cur.execute(
                     """INSERT INTO loans (
                         item_id, student_name, student_id, quantity, due_date, user_id,
@@ -146,15 +515,32 @@ def create_loan(item_id, student_name, student_id, quantity, due_date, user_id=N
                         director, producer, photographer,
                         price_per_unit, total_price
                     ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING id""",
-                    (item_id, student_name, student_id, quantity, due_date, user_id,
-                     loan_notes, checkout_notes, return_notes,
+                    (int(line['item_id']), student_name, student_id, int(line['quantity']), due_date, user_id,
+                     line.get('loan_notes', loan_notes), checkout_notes, return_notes,
                      director, producer, photographer,
-                     price_per_unit, total_price)
+                     line.get('price_per_unit'), line.get('total_price'))
                 )
-                loan_id = cur.fetchone()[0]
-                conn.commit()
-                return loan_id
-    return False
+                loan_ids.append(cur.fetchone()[0])
+            bump_data_version(cur)
+            conn.commit()
+            return loan_ids
+
+
+def create_loan(item_id, student_name, student_id, quantity, due_date, user_id=None, 
+             loan_notes=None, checkout_notes=None, return_notes=None,
+             director=None, producer=None, photographer=None,
+             price_per_unit=None, total_price=None):
+    try:
+        loan_ids = create_loans(
+            [{"item_id": item_id, "quantity": quantity,
+              "price_per_unit": price_per_unit, "total_price": total_price}],
+            student_name, student_id, due_date, user_id=user_id,
+            loan_notes=loan_notes, checkout_notes=checkout_notes, return_notes=return_notes,
+            director=director, producer=producer, photographer=photographer
+        )
+    except ValueError:
+        return False
+    return loan_ids[0]
 
 def return_loan(loan_id, return_notes=None):
     with get_db_connection() as conn:
@@ -174,11 +560,15 @@ def return_loan(loan_id, return_notes=None):
                        FROM loans WHERE items.id = loans.item_id AND loans.id = %s""",
                     (loan_id,)
                 )
+                bump_data_version(cur)
                 conn.commit()
                 return True
     return False
 
 def get_loan_details(loan_id):
+    # psycopg2.extras מושך את logging; רוב הסקריפטים לא צריכים אותו
+    from psycopg2.extras import RealDictCursor
+
     with get_db_connection() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
             cur.execute("""
@@ -200,9 +590,9 @@ def update_item(item_id, name, category, quantity, notes, order_notes=None, orde
         with conn.cursor() as cur:
             # Check if quantity is less than current loans
             cur.execute("""
-                SELECT COALESCE(SUM(quantity), 0) as loaned_quantity
-                FROM loans
-                WHERE item_id = %s AND status = 'active'
+                SELECT COALESCE(
+                    (SELECT loaned_quantity FROM item_stock WHERE item_id = %s), 0
+                ) as loaned_quantity
             """, (item_id,))
             result = cur.fetchone()
             loaned_quantity = result[0] if result else 0
@@ -299,6 +689,7 @@ def update_item(item_id, name, category, quantity, notes, order_notes=None, orde
             if cur.rowcount == 0:
                 return False, "הפריט לא נמצא"
             
+            bump_data_version(cur)
             conn.commit()
             return True, "הפריט עודכן בהצלחה"
 
@@ -322,6 +713,7 @@ def delete_item(item_id):
             if cur.rowcount == 0:
                 return False, "הפריט לא נמצא"
             
+            bump_data_version(cur)
             conn.commit()
             return True, "הפריט נמחק בהצלחה"
 
@@ -333,9 +725,9 @@ def toggle_item_availability(item_id, is_available):
                 cur.execute("""
                     UPDATE items 
                     SET available = quantity - COALESCE(
-                        (SELECT SUM(quantity) 
-                         FROM loans 
-                         WHERE item_id = items.id AND status = 'active'), 0)
+                        (SELECT loaned_quantity
+                         FROM item_stock
+                         WHERE item_id = items.id), 0)
                     WHERE id = %s
                     RETURNING *
                 """, (item_id,))
@@ -351,5 +743,6 @@ def toggle_item_availability(item_id, is_available):
             if cur.rowcount == 0:
                 return False, "הפריט לא נמצא"
             
+            bump_data_version(cur)
             conn.commit()
             return True, "זמינות הפריט עודכנה בהצלחה"
\ No newline at end of file
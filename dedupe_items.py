@@ -0,0 +1,275 @@
+"""
+מיזוג מפורש של פריטים כפולים (אותם category ו-name) בטבלת items.
+
+מיגרציה 8 יוצרת מפתח ייחודי על (category, name), ואם יש כפילויות היא
+רושמת אזהרה עם רשימת הקבוצות ומדלגת על המפתח (הייבוא עובד גם בלעדיו).
+המודול הזה ממזג אותן לפי בקשה ובונה את המפתח, בטרנזקציה אחת:
+  - הפריט עם המזהה הנמוך נשאר; הכמות שלו היא סכום הכמויות בקבוצה
+  - הערות מהפריטים הכפולים מצורפות להערות שלו, ושדות ריקים בו מקבלים את
+    הערך מהכפולים
+  - כל שורה שמפנה לפריט כפול (מפתח זר ל-items או עמודת item_id, גם בלי
+    מפתח זר) מועברת לפריט הנשאר. שורה שהייתה מתנגשת במפתח ייחודי עם שורה
+    של הפריט הנשאר (למשל אותה תבנית ואותו פריט) מתמזגת אליה - הכמות שלה
+    מתווספת - ונמחקת
+  - כל שורה שנמחקת (הפריטים הכפולים והשורות המתנגשות) נשמרת כ-JSON בטבלת
+    item_merge_log, כך ששום נתון לא הולך לאיבוד
+טבלאות נגזרות (item_stock, item_search, סיכומי ההשאלות) מתעדכנות בטריגרים
+וב-CASCADE, ומחיקת הכפולים רושמת tombstone כדי שלקוחות הסנכרון יסירו אותם.
+
+שימוש:
+    python dedupe_items.py check     # קוד יציאה 1 אם נמצאו כפילויות
+    python dedupe_items.py merge     # ממזג ויוצר את items_category_name_key
+"""
+
+import argparse
+import sys
+
+from database import bump_data_version, get_db_connection
+
+# עמודות שהערכים שלהן מצטרפים ולא נדרסים
+NOTE_COLUMNS = ('notes', 'order_notes', 'checkout_notes', 'return_notes')
+# עמודות שמסוכמות על פני הקבוצה
+SUM_COLUMNS = ('quantity', 'total_price')
+# עמודות שלא מועתקות מהכפולים; available מחושב מחדש אחרי ההעברה
+SKIP_COLUMNS = ('id', 'name', 'category', 'available', 'row_version', 'updated_at')
+
+# טבלאות שמתוחזקות בטריגרים או נמחקות ב-CASCADE עם הפריט
+DERIVED_TABLES = ('item_stock', 'item_search', 'loan_stats_monthly',
+                  'loan_student_monthly', 'inventory_tombstones', 'item_merge_log')
+
+DUPLICATE_GROUPS_SQL = """
+    SELECT category, name, array_agg(id ORDER BY id) AS ids
+    FROM items
+    GROUP BY category, name
+    HAVING COUNT(*) > 1
+    ORDER BY category, name
+"""
+
+MERGE_LOG_SQL = """
+    CREATE TABLE IF NOT EXISTS item_merge_log (
+        id SERIAL PRIMARY KEY,
+        kept_item_id INTEGER NOT NULL,
+        merged_item_id INTEGER NOT NULL,
+        source_table TEXT NOT NULL,
+        row_data JSONB NOT NULL,
+        merged_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+UNIQUE_KEY_SQL = """
+    CREATE UNIQUE INDEX IF NOT EXISTS items_category_name_key
+        ON items (category, name)
+"""
+
+
+def find_duplicate_groups(cur):
+    """מחזיר רשימה של (category, name, [ids]) לכל קבוצה כפולה"""
+    cur.execute(DUPLICATE_GROUPS_SQL)
+    return cur.fetchall()
+
+
+def find_item_references(cur):
+    """
+    מחזיר רשימה של (טבלה, עמודה) לכל עמודה שמפנה לפריט: מפתחות זרים
+    (עמודה אחת) ל-items ועמודות בשם item_id, בלי הטבלאות הנגזרות
+    """
+    cur.execute("""
+        SELECT c.conrelid::regclass::text, a.attname
+        FROM pg_constraint c
+        JOIN pg_attribute a ON a.attrelid = c.conrelid AND a.attnum = c.conkey[1]
+        WHERE c.contype = 'f'
+          AND c.confrelid = 'items'::regclass
+          AND array_length(c.conkey, 1) = 1
+        UNION
+        SELECT table_name, column_name
+        FROM information_schema.columns
+        WHERE table_schema = current_schema()
+          AND column_name = 'item_id'
+          AND table_name IN (SELECT table_name FROM information_schema.tables
+                             WHERE table_schema = current_schema()
+                               AND table_type = 'BASE TABLE')
+        ORDER BY 1, 2
+    """)
+    return [(table, column) for table, column in cur.fetchall()
+            if table not in DERIVED_TABLES]
+
+
+def unique_keys(cur, table, column):
+    """מפתחות ייחודיים (רשימות עמודות) של table שכוללים את column"""
+    cur.execute("""
+        SELECT array_agg(a.attname::text ORDER BY k.ord)
+        FROM pg_index x
+        CROSS JOIN LATERAL unnest(x.indkey::int2[]) WITH ORDINALITY AS k(attnum, ord)
+        JOIN pg_attribute a ON a.attrelid = x.indrelid AND a.attnum = k.attnum
+        WHERE x.indrelid = %s::regclass
+          AND x.indisunique
+          AND x.indpred IS NULL
+          AND x.indexprs IS NULL
+        GROUP BY x.indexrelid
+    """, (table,))
+    return [key for (key,) in cur.fetchall() if column in key]
+
+
+def table_columns(cur, table):
+    """שמות העמודות של table"""
+    cur.execute("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = %s
+    """, (table,))
+    return {column for (column,) in cur.fetchall()}
+
+
+def merge_item_values(rows):
+    """
+    הערכים החדשים של הפריט הנשאר (השורה הראשונה) מתוך כל שורות הקבוצה:
+    סכום לעמודות הסכום, הערות שונות מצורפות, ושדה ריק מקבל את הערך הראשון
+    שאינו ריק מהכפולים
+    """
+    keep = rows[0]
+    values = {}
+    for column in keep:
+        if column in SKIP_COLUMNS:
+            continue
+        if column in SUM_COLUMNS:
+            values[column] = sum(row[column] or 0 for row in rows)
+        elif column in NOTE_COLUMNS:
+            notes = []
+            for row in rows:
+                note = (row[column] or '').strip()
+                if note and note not in notes:
+                    notes.append(note)
+            values[column] = '\n'.join(notes) if notes else keep[column]
+        elif keep[column] is None or keep[column] == '':
+            values[column] = next((row[column] for row in rows[1:]
+                                   if row[column] is not None and row[column] != ''),
+                                  keep[column])
+    return values
+
+
+def archive_rows(cur, table, keep_id, drop_id, where_sql, params):
+    """שומר ב-item_merge_log את השורות של table שעונות על where_sql"""
+    cur.execute(f"""
+        INSERT INTO item_merge_log (kept_item_id, merged_item_id, source_table, row_data)
+        SELECT %s, %s, %s, to_jsonb(t) FROM {table} t WHERE {where_sql}
+    """, (keep_id, drop_id, table, *params))
+
+
+def move_references(cur, references, keep_id, drop_id):
+    """
+    מעביר את כל ההפניות מ-drop_id ל-keep_id. מחזיר {טבלה: (הועברו, מוזגו)}
+    """
+    moved = {}
+    for table, column in references:
+        merged = 0
+        has_quantity = 'quantity' in table_columns(cur, table)
+        for key in unique_keys(cur, table, column):
+            # שורות של הכפול שאחרי ההעברה היו זהות במפתח לשורה של הפריט הנשאר
+            match = ''.join(f' AND k.{other} = t.{other}' for other in key if other != column)
+            conflict = (f"t.{column} = %s AND EXISTS "
+                        f"(SELECT 1 FROM {table} k WHERE k.{column} = %s{match})")
+            if has_quantity:
+                cur.execute(f"""
+                    UPDATE {table} k SET quantity = k.quantity + t.quantity
+                    FROM {table} t
+                    WHERE t.{column} = %s AND k.{column} = %s{match}
+                """, (drop_id, keep_id))
+            archive_rows(cur, table, keep_id, drop_id, conflict, (drop_id, keep_id))
+            cur.execute(f"DELETE FROM {table} t WHERE {conflict}", (drop_id, keep_id))
+            merged += cur.rowcount
+
+        cur.execute(f"UPDATE {table} SET {column} = %s WHERE {column} = %s", (keep_id, drop_id))
+        if cur.rowcount or merged:
+            moved[table] = (cur.rowcount, merged)
+    return moved
+
+
+def merge_group(cur, references, ids):
+    """ממזג קבוצה אחת לפריט ids[0]; מחזיר {טבלה: (הועברו, מוזגו)}"""
+    cur.execute("SELECT * FROM items WHERE id = ANY(%s) ORDER BY id FOR UPDATE", (ids,))
+    columns = [column.name for column in cur.description]
+    rows = [dict(zip(columns, row)) for row in cur.fetchall()]
+    keep_id = rows[0]['id']
+
+    moved = {}
+    for row in rows[1:]:
+        drop_id = row['id']
+        for table, counts in move_references(cur, references, keep_id, drop_id).items():
+            previous = moved.get(table, (0, 0))
+            moved[table] = (previous[0] + counts[0], previous[1] + counts[1])
+        archive_rows(cur, 'items', keep_id, drop_id, 't.id = %s', (drop_id,))
+        cur.execute("DELETE FROM items WHERE id = %s", (drop_id,))
+
+    values = merge_item_values(rows)
+    assignments = ', '.join(f'{column} = %s' for column in values)
+    cur.execute(f"UPDATE items SET {assignments} WHERE id = %s", (*values.values(), keep_id))
+    # הכמות הזמינה ביחס להשאלות הפתוחות שהועברו לפריט
+    cur.execute("""
+        UPDATE items i
+        SET available = GREATEST(i.quantity - COALESCE(
+            (SELECT s.loaned_quantity FROM item_stock s WHERE s.item_id = i.id), 0), 0)
+        WHERE i.id = %s
+    """, (keep_id,))
+    return moved
+
+
+def dedupe_items(merge=False, conn=None):
+    """
+    מוצא (ואם merge - ממזג) את הקבוצות הכפולות. items ננעלת לכתיבה במהלך
+    הפעולה, כך שייבוא לא יוצר כפילות חדשה באמצע, ובסוף המיזוג נבנה המפתח
+    הייחודי של מיגרציה 8. מחזיר רשימה של
+    (category, name, ids, {טבלה: (הועברו, מוזגו)})
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db_connection()
+    results = []
+    try:
+        with conn.cursor() as cur:
+            if merge:
+                cur.execute("LOCK TABLE items IN SHARE ROW EXCLUSIVE MODE")
+            groups = find_duplicate_groups(cur)
+            if merge and groups:
+                cur.execute(MERGE_LOG_SQL)
+                references = find_item_references(cur)
+                for category, name, ids in groups:
+                    results.append((category, name, ids, merge_group(cur, references, ids)))
+                bump_data_version(cur)
+            if merge:
+                # CREATE INDEX לא רץ כשיש אירועי טריגר דחויים על הטבלה
+                # (קידום מוני הגרסה, מיגרציה 13), ולכן הם מורצים קודם
+                cur.execute("SET CONSTRAINTS ALL IMMEDIATE")
+                cur.execute(UNIQUE_KEY_SQL)
+            else:
+                results = [(category, name, ids, {}) for category, name, ids in groups]
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        if own_conn:
+            conn.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="בדיקה ומיזוג של פריטים כפולים")
+    parser.add_argument('command', choices=['check', 'merge'])
+    args = parser.parse_args()
+
+    results = dedupe_items(merge=args.command == 'merge')
+    for category, name, ids, moved in results:
+        print(f"{category} / {name}: ids {', '.join(str(item_id) for item_id in ids)}")
+        for table, (count, merged) in sorted(moved.items()):
+            print(f"    {table}: {count} moved, {merged} merged")
+
+    if not results:
+        print("No duplicate items")
+    elif args.command == 'merge':
+        print(f"Merged {len(results)} group(s) and created items_category_name_key")
+    else:
+        print(f"Found {len(results)} duplicate group(s)")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
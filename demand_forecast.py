@@ -0,0 +1,175 @@
+"""
+מנוע חיזוי ביקוש וקטורי.
+
+ההיסטוריה של כל הפריטים נפרסת למטריצה צפופה של פריטים x חודשים (חודש בלי
+השאלות = 0), והמודל מותאם לכל השורות יחד: הלולאה היחידה היא על החודשים,
+וכל צעד הוא פעולת NumPy על כל הפריטים.
+
+המודל הוא החלקה מעריכית עם מגמה מרוסנת (damped Holt): המגמה דועכת לאורך
+האופק ולכן היסטוריה קצרה ורועשת לא מתפוצצת כמו הכפלה חוזרת במקדם מגמה.
+לכל פריט נבחר alpha מתוך ALPHA_GRID לפי שגיאת החיזוי צעד-אחד-קדימה, ולפריטים
+עם לפחות שתי עונות מלאות של היסטוריה מתווסף בסיס עונתי (ממוצע הסטייה לכל
+חודש בשנה). רווח הסמך מחושב משגיאות החיזוי צעד-אחד-קדימה של אותו פריט,
+מתוקנות למספר הפרמטרים שהותאמו על אותה היסטוריה (השגיאות בתוך המדגם קטנות
+מהשגיאות על חודשים עתידיים).
+
+מדידת ביצועים: python benchmark_forecast.py
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+ALPHA_GRID = (0.2, 0.4, 0.6, 0.8)
+BETA = 0.1
+PHI = 0.9
+SEASON_LENGTH = 12
+# צריך לפחות כמה חודשים מההשאלה הראשונה כדי לחזות
+MIN_HISTORY_MONTHS = 3
+# z לרווח סמך של 90%
+CONFIDENCE_Z = 1.645
+# פרמטרים שמותאמים לכל שורה (alpha והרמה ההתחלתית) - מקטינים את מספר
+# דרגות החופש של שגיאות החיזוי
+FITTED_PARAMETERS = 2
+
+Forecast = namedtuple('Forecast', ['predictions', 'lower', 'upper', 'level', 'trend', 'seasonal', 'history_months'])
+
+
+def add_months(value, months):
+    """תחילת החודש שנמצא months חודשים אחרי value"""
+    index = value.year * 12 + value.month - 1 + months
+    return value.replace(year=index // 12, month=index % 12 + 1, day=1)
+
+
+def build_demand_matrix(rows, keys, months):
+    """
+    פורס שורות (key, month, count) למטריצה len(keys) x len(months).
+    מפתחות או חודשים שלא ברשימות מושמטים
+    """
+    matrix = np.zeros((len(keys), len(months)))
+    key_index = {key: index for index, key in enumerate(keys)}
+    month_index = {month: index for index, month in enumerate(months)}
+    positions = [(key_index.get(key), month_index.get(month), count) for key, month, count in rows]
+    positions = [(k, m, c) for k, m, c in positions if k is not None and m is not None]
+    if positions:
+        k, m, c = zip(*positions)
+        np.add.at(matrix, (np.array(k), np.array(m)), np.array(c, dtype=float))
+    return matrix
+
+
+def group_rows(matrix, groups):
+    """מסכם שורות לפי קבוצה (למשל קטגוריה). מחזיר (שמות הקבוצות, מטריצה)"""
+    names, codes = np.unique(np.asarray(groups, dtype=object).astype(str), return_inverse=True)
+    grouped = np.zeros((len(names), matrix.shape[1]))
+    np.add.at(grouped, codes, matrix)
+    return list(names), grouped
+
+
+def _first_active(matrix):
+    """אינדקס החודש הראשון עם השאלות בכל שורה (מספר החודשים אם אין)"""
+    active = matrix > 0
+    return np.where(active.any(axis=1), active.argmax(axis=1), matrix.shape[1])
+
+
+def _seasonal_baseline(matrix, first, season_length):
+    """
+    סטייה עונתית לכל שורה ולכל מיקום בעונה, מחושבת על העונות המלאות האחרונות.
+    שורות עם פחות משתי עונות מלאות של היסטוריה מקבלות אפס. מחזיר (סטייה,
+    מספר העונות שממנו חושבה הסטייה לכל שורה - 0 לשורות בלי בסיס עונתי)
+    """
+    rows, months = matrix.shape
+    seasonal = np.zeros((rows, season_length))
+    cycles = months // season_length
+    if cycles < 2:
+        return seasonal, np.zeros(rows, dtype=int)
+    start = months - cycles * season_length
+    window = matrix[:, start:].reshape(rows, cycles, season_length)
+    # רק עונות שמתחילות אחרי ההשאלה הראשונה של השורה
+    valid = (start + np.arange(cycles) * season_length)[None, :] >= first[:, None]
+    used = np.maximum(valid.sum(axis=1), 1)
+    profile = (window * valid[:, :, None]).sum(axis=1) / used[:, None]
+    profile -= profile.mean(axis=1, keepdims=True)
+    # עמודה start + k נמצאת במיקום (start + k) % season_length בעונה
+    profile = np.roll(profile, start % season_length, axis=1)
+    eligible = valid.sum(axis=1) >= 2
+    seasonal[eligible] = profile[eligible]
+    return seasonal, np.where(eligible, valid.sum(axis=1), 0)
+
+
+def _smooth(series, first, alpha, beta, phi):
+    """
+    החלקה עם מגמה מרוסנת לכל השורות. alpha הוא וקטור (ערך לכל שורה).
+    מחזיר (level, trend, sse, error_count)
+    """
+    rows, months = series.shape
+    level = series[:, 0].copy()
+    trend = np.zeros(rows)
+    sse = np.zeros(rows)
+    count = np.zeros(rows)
+    for t in range(1, months):
+        y = series[:, t]
+        forecast = level + phi * trend
+        started = t > first
+        error = y - forecast
+        new_level = forecast + alpha * error
+        new_trend = phi * trend + alpha * beta * error
+        # לפני ההשאלה הראשונה הסדרה רק מתחילה מחדש מהערך הנוכחי
+        level = np.where(started, new_level, y)
+        trend = np.where(started, new_trend, 0.0)
+        sse += np.where(started, error * error, 0.0)
+        count += started
+    return level, trend, sse, count
+
+
+def forecast_demand(matrix, horizon, alpha_grid=ALPHA_GRID, beta=BETA, phi=PHI,
+                    season_length=SEASON_LENGTH, z=CONFIDENCE_Z):
+    """
+    חוזה horizon חודשים קדימה לכל שורה במטריצה (פריטים x חודשים, החודש
+    האחרון הוא החודש המלא האחרון). מחזיר Forecast עם מערכים בגודל
+    rows x horizon לחיזוי ולגבולות רווח הסמך, ו-level/trend/history_months
+    לכל שורה
+    """
+    matrix = np.asarray(matrix, dtype=float)
+    rows, months = matrix.shape
+    first = _first_active(matrix)
+    history_months = months - first
+
+    seasonal, seasons = _seasonal_baseline(matrix, first, season_length)
+    positions = np.arange(months) % season_length
+    deseasonalized = matrix - seasonal[:, positions]
+
+    # התאמה לכל ערך alpha ובחירת הטוב ביותר לכל שורה
+    best = None
+    for alpha in alpha_grid:
+        fitted = _smooth(deseasonalized, first, np.full(rows, alpha), beta, phi)
+        mse = fitted[2] / np.maximum(fitted[3], 1)
+        if best is None:
+            best = [np.full(rows, alpha), *fitted, mse]
+            continue
+        better = mse < best[5]
+        best[0] = np.where(better, alpha, best[0])
+        for index, value in enumerate((*fitted, mse), start=1):
+            best[index] = np.where(better, value, best[index])
+    alpha, level, trend, sse, count, mse = best
+
+    steps = np.arange(1, horizon + 1)
+    damping = np.cumsum(phi ** steps)
+    future_positions = (months + steps - 1) % season_length
+    predictions = level[:, None] + trend[:, None] * damping + seasonal[:, future_positions]
+    predictions = np.maximum(predictions, 0.0)
+
+    # שונות השגיאה לא מוטה: מחלקים במספר השגיאות פחות הפרמטרים שהותאמו.
+    # בסיס עונתי מ-c עונות מקטין את השגיאות בתוך המדגם פי (c-1)/c ומוסיף
+    # לחיזוי את שגיאת האומדן שלו (1/c), ולכן השונות מוכפלת ב-(c+1)/(c-1)
+    variance = sse / np.maximum(count - FITTED_PARAMETERS, 1)
+    variance *= np.where(seasons >= 2, (seasons + 1) / np.maximum(seasons - 1, 1), 1.0)
+
+    # שונות החיזוי גדלה עם האופק: 1 + sum(alpha * (1 + beta * damping_j))^2
+    sigma = np.sqrt(variance)
+    growth = (alpha[:, None] * (1 + beta * np.concatenate(([0.0], damping[:-1])))[None, :]) ** 2
+    growth[:, 0] = 0.0
+    spread = z * sigma[:, None] * np.sqrt(1 + np.cumsum(growth, axis=1))
+    lower = np.maximum(predictions - spread, 0.0)
+    upper = predictions + spread
+
+    return Forecast(predictions, lower, upper, level, trend, seasonal, history_months)
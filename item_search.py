@@ -0,0 +1,220 @@
+"""
+חיפוש פריטים בצד השרת (טבלת item_search, מיגרציה 12).
+
+לכל פריט נשמרים טקסט מנורמל של שם, קטגוריה והערות ווקטור מילים משוקלל -
+אותיות קטנות, בלי ניקוד, אותיות סופיות כרגילות ובלי גרש וגרשיים. טריגר על
+items מעדכן אותם באותה טרנזקציה. פריט תואם אם:
+  - כל מילה בחיפוש היא התחלה של מילה בפריט (אינדקס GIN על הווקטור), או
+  - כשההרחבה pg_trgm מותקנת: החיפוש הוא תת-מחרוזת של הפריט, או דומה
+    למילה בו למרות שגיאת הקלדה (אינדקס GIN עם gin_trgm_ops)
+כל התנאים נשענים על אינדקסים, והדירוג קורא את הווקטור השמור, כך שהחיפוש
+לא מנרמל מחדש את הפריטים ולא סורק את כל הקטלוג.
+
+התוצאות מדורגות - התאמה בשם לפני קטגוריה ולפני הערות (ts_rank), או לפי
+word_similarity של pg_trgm - ומחולקות לעמודים.
+
+לפני שמיגרציה 12 הורצה (אין טבלת item_search) החיפוש חוזר להתאמת תת-מחרוזת
+(ILIKE) על items, בלי נרמול ובלי אינדקס, ומדורג לפי השדה שבו נמצאה ההתאמה.
+
+שימוש משורת הפקודה:
+    python item_search.py "מצלמה קנון" [--limit 20] [--offset 0]
+"""
+
+import argparse
+
+from database import get_db_connection
+from item_stock import stock_source
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+SEARCH_QUERY = """
+    SELECT i.id, i.name, i.category, i.quantity, i.notes,
+           COALESCE(i.is_available, TRUE) AS is_available,
+           COALESCE(i.allowed_years, '1,2,3') AS allowed_years,
+           COALESCE(s.loaned_quantity, 0) AS loaned_quantity,
+           GREATEST(i.quantity - COALESCE(s.loaned_quantity, 0), 0) AS available_quantity,
+           {score} AS rank,
+           COUNT(*) OVER () AS total_count
+    FROM item_search f
+    JOIN items i ON i.id = f.item_id
+    LEFT JOIN item_stock s ON s.item_id = i.id
+    WHERE {condition} {filters}
+    ORDER BY rank DESC, i.name, i.id
+    LIMIT %s OFFSET %s
+"""
+
+# בלי item_search: התאמה בשם לפני קטגוריה ולפני הערות
+SUBSTRING_QUERY = """
+    SELECT i.id, i.name, i.category, i.quantity, i.notes,
+           COALESCE(i.is_available, TRUE) AS is_available,
+           COALESCE(i.allowed_years, '1,2,3') AS allowed_years,
+           COALESCE(s.loaned_quantity, 0) AS loaned_quantity,
+           GREATEST(i.quantity - COALESCE(s.loaned_quantity, 0), 0) AS available_quantity,
+           CASE WHEN i.name ILIKE %s THEN 1.0
+                WHEN i.category ILIKE %s THEN 0.4
+                ELSE 0.1 END AS rank,
+           COUNT(*) OVER () AS total_count
+    FROM items i
+    LEFT JOIN {stock} s ON s.item_id = i.id
+    WHERE {condition} {filters}
+    ORDER BY rank DESC, i.name, i.id
+    LIMIT %s OFFSET %s
+"""
+
+_trigram_index = None
+_search_table = False
+
+
+def has_trigram_index(cur=None):
+    """
+    האם נוצר אינדקס ה-trigram (pg_trgm היה זמין בזמן המיגרציה); נבדק פעם
+    אחת לתהליך. בלי cur נפתח חיבור לבדיקה
+    """
+    global _trigram_index
+    if _trigram_index is None:
+        if cur is None:
+            with get_db_connection() as conn:
+                with conn.cursor() as own_cur:
+                    return has_trigram_index(own_cur)
+        cur.execute("SELECT to_regclass('idx_item_search_trgm') IS NOT NULL")
+        _trigram_index = cur.fetchone()[0]
+    return _trigram_index
+
+
+def has_search_table(cur=None):
+    """
+    האם טבלת item_search קיימת (מיגרציה 12). תשובה חיובית נשמרת לתהליך,
+    ושלילית נבדקת שוב בקריאה הבאה. בלי cur נפתח חיבור לבדיקה
+    """
+    global _search_table
+    if not _search_table:
+        if cur is None:
+            with get_db_connection() as conn:
+                with conn.cursor() as own_cur:
+                    return has_search_table(own_cur)
+        cur.execute("SELECT to_regclass('item_search') IS NOT NULL")
+        _search_table = cur.fetchone()[0]
+    return _search_table
+
+
+def like_pattern(query):
+    """תבנית ILIKE לתת-מחרוזת query, כש-% ו-_ בחיפוש נשארים תווים רגילים"""
+    escaped = query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f"%{escaped}%"
+
+
+def substring_condition(query, alias='i'):
+    """תנאי WHERE על items כשאין item_search: query מופיע בשם, בקטגוריה או בהערות"""
+    pattern = like_pattern(query)
+    sql = (f"({alias}.name ILIKE %s OR {alias}.category ILIKE %s"
+           f" OR COALESCE({alias}.notes, '') ILIKE %s)")
+    return sql, [pattern, pattern, pattern]
+
+
+def search_condition(query, trigram=False, alias='f'):
+    """
+    תנאי WHERE על item_search לחיפוש query, כ-(sql, params) עם פרמטרים
+    מיקומיים (%s). הפונקציות במסד הן IMMUTABLE, כך שהחיפוש מנורמל פעם אחת
+    בתכנון השאילתה והאינדקסים משמשים כרגיל
+    """
+    sql = f"{alias}.vector @@ search_tsquery(%s)"
+    params = [query]
+    if trigram:
+        sql = (f"({sql} OR {alias}.document LIKE search_pattern(%s)"
+               f" OR search_normalize(%s) <%% {alias}.document)")
+        params += [query, query]
+    return sql, params
+
+
+def search_filter(query, trigram=False, id_column='id', indexed=True):
+    """
+    תנאי על שאילתה מטבלת items: הפריט תואם לחיפוש query, כ-(sql, params).
+    בלי indexed (has_search_table) - התאמת תת-מחרוזת על items
+    """
+    if not indexed:
+        condition, params = substring_condition(query, alias='x')
+        return f"{id_column} IN (SELECT x.id FROM items x WHERE {condition})", params
+    condition, params = search_condition(query, trigram)
+    return f"{id_column} IN (SELECT f.item_id FROM item_search f WHERE {condition})", params
+
+
+def search_score(query, trigram=False, alias='f'):
+    """ציון ההתאמה לדירוג, כ-(sql, params)"""
+    sql = f"COALESCE(ts_rank({alias}.vector, search_tsquery(%s)), 0)"
+    params = [query]
+    if trigram:
+        sql = f"GREATEST({sql}, word_similarity(search_normalize(%s), {alias}.document))"
+        params.append(query)
+    return sql, params
+
+
+def search_items(query, limit=DEFAULT_PAGE_SIZE, offset=0, category=None, available_only=False):
+    """
+    עמוד של פריטים שתואמים לחיפוש, מדורגים. מחזיר את הפריטים, את מספר
+    התוצאות הכולל ואת ה-offset של העמוד הבא (None בעמוד האחרון)
+    """
+    query = (query or '').strip()
+    limit = max(1, min(int(limit or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+    offset = max(0, int(offset or 0))
+    result = {'query': query, 'items': [], 'total': 0, 'limit': limit, 'offset': offset,
+              'next_offset': None, 'mode': None}
+    if not query:
+        return result
+
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            filters, filter_params = '', []
+            if category:
+                filters += " AND i.category = %s"
+                filter_params.append(category)
+            if available_only:
+                filters += " AND COALESCE(i.is_available, TRUE)"
+
+            indexed = has_search_table(cur)
+            if indexed:
+                trigram = has_trigram_index(cur)
+                condition, condition_params = search_condition(query, trigram)
+                score, score_params = search_score(query, trigram)
+                cur.execute(SEARCH_QUERY.format(score=score, condition=condition, filters=filters),
+                            [*score_params, *condition_params, *filter_params, limit, offset])
+            else:
+                condition, condition_params = substring_condition(query)
+                pattern = like_pattern(query)
+                cur.execute(SUBSTRING_QUERY.format(stock=stock_source(cur), condition=condition,
+                                                   filters=filters),
+                            [pattern, pattern, *condition_params, *filter_params, limit, offset])
+            columns = [column.name for column in cur.description]
+            rows = [dict(zip(columns, row)) for row in cur.fetchall()]
+        conn.rollback()
+
+    if rows:
+        result['total'] = rows[0]['total_count']
+    for row in rows:
+        del row['total_count']
+        row['rank'] = round(float(row['rank']), 4)
+    result['items'] = rows
+    if offset + len(rows) < result['total']:
+        result['next_offset'] = offset + len(rows)
+    if not indexed:
+        result['mode'] = 'substring'
+    else:
+        result['mode'] = 'trigram' if trigram else 'words'
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="חיפוש פריטים")
+    parser.add_argument('query')
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--offset', type=int, default=0)
+    args = parser.parse_args()
+
+    result = search_items(args.query, args.limit, args.offset)
+    print(f"{result['total']} result(s) ({result['mode'] if result['items'] else 'no match'})")
+    for item in result['items']:
+        print(f"{item['rank']:7.3f}  {item['id']:6d}  {item['name']}  [{item['category']}]")
+
+
+if __name__ == "__main__":
+    main()
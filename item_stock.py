@@ -0,0 +1,152 @@
+"""
+מוני מלאי מתוחזקים לכל פריט (טבלת item_stock, מיגרציה 7).
+
+loaned_quantity - השאלות שטרם הוחזרו, reserved_quantity - הזמנות מאושרות,
+in_maintenance_quantity - רשומות תחזוקה פתוחות. הטריגרים על loans,
+reservations ו-maintenance_records מעדכנים את המונים באותה טרנזקציה של
+השינוי, כך שקוראים לא צריכים לסכם את טבלאות המקור.
+
+המודול משווה את המונים לערכים שמחושבים מטבלאות המקור ומתקן סטיות
+(למשל אחרי שינוי ידני עם הטריגרים מושבתים). מיועד להרצה מתוזמנת:
+    python item_stock.py check     # קוד יציאה 1 אם נמצאה סטייה
+    python item_stock.py repair
+"""
+
+import argparse
+import sys
+
+from database import get_db_connection
+
+STOCK_COLUMNS = ('loaned_quantity', 'reserved_quantity', 'in_maintenance_quantity')
+
+EXPECTED_STOCK_SQL = """
+    SELECT i.id AS item_id,
+           COALESCE(l.quantity, 0) AS loaned_quantity,
+           COALESCE(r.quantity, 0) AS reserved_quantity,
+           {maintenance} AS in_maintenance_quantity
+    FROM items i
+    LEFT JOIN (
+        SELECT item_id, SUM(quantity) AS quantity
+        FROM loans WHERE return_date IS NULL
+        GROUP BY item_id
+    ) l ON l.item_id = i.id
+    LEFT JOIN (
+        SELECT item_id, SUM(quantity) AS quantity
+        FROM reservations WHERE status = 'approved'
+        GROUP BY item_id
+    ) r ON r.item_id = i.id
+"""
+
+MAINTENANCE_COUNT_SQL = """(
+    SELECT COUNT(*) FROM maintenance_records m
+    WHERE m.item_id = i.id AND m.end_date IS NULL
+)"""
+
+
+def expected_stock_sql(cur):
+    """שאילתת הערכים הצפויים; בלי טבלת maintenance_records התחזוקה היא 0"""
+    cur.execute("SELECT to_regclass('maintenance_records') IS NOT NULL")
+    has_maintenance = cur.fetchone()[0]
+    return EXPECTED_STOCK_SQL.format(maintenance=MAINTENANCE_COUNT_SQL if has_maintenance else '0')
+
+
+def stock_source(cur):
+    """
+    מקור המונים לשאילתות קריאה (FROM/JOIN): טבלת item_stock, ולפני שמיגרציה 7
+    הורצה - אותם ערכים מחושבים מטבלאות המקור
+    """
+    cur.execute("SELECT to_regclass('item_stock') IS NOT NULL")
+    if cur.fetchone()[0]:
+        return 'item_stock'
+    return f"({expected_stock_sql(cur)})"
+
+
+def find_stock_drift(cur):
+    """
+    מחזיר רשימה של (item_id, {עמודה: (שמור, צפוי)}) לפריטים שהמונים שלהם
+    שונים מטבלאות המקור, כולל פריטים שחסרה להם שורה ב-item_stock
+    """
+    cur.execute(f"""
+        SELECT e.item_id,
+               s.loaned_quantity, e.loaned_quantity,
+               s.reserved_quantity, e.reserved_quantity,
+               s.in_maintenance_quantity, e.in_maintenance_quantity
+        FROM ({expected_stock_sql(cur)}) e
+        LEFT JOIN item_stock s ON s.item_id = e.item_id
+        WHERE s.item_id IS NULL
+           OR (s.loaned_quantity, s.reserved_quantity, s.in_maintenance_quantity)
+              IS DISTINCT FROM
+              (e.loaned_quantity, e.reserved_quantity, e.in_maintenance_quantity)
+        ORDER BY e.item_id
+    """)
+    drift = []
+    for row in cur.fetchall():
+        item_id, values = row[0], row[1:]
+        differences = {
+            column: (values[index * 2], values[index * 2 + 1])
+            for index, column in enumerate(STOCK_COLUMNS)
+            if values[index * 2] != values[index * 2 + 1]
+        }
+        drift.append((item_id, differences))
+    return drift
+
+
+def reconcile_item_stock(repair=False, conn=None):
+    """
+    בודק (ואם repair - מתקן) את המונים מול טבלאות המקור.
+    הטבלה ננעלת לכתיבה במהלך הבדיקה, כך שטרנזקציות שמעדכנות מונים
+    ממתינות והחישוב לא מתחרה בהן. מחזיר את רשימת הסטיות שנמצאו.
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("LOCK TABLE item_stock IN SHARE ROW EXCLUSIVE MODE")
+            drift = find_stock_drift(cur)
+            if repair and drift:
+                cur.execute(f"""
+                    INSERT INTO item_stock (item_id, loaned_quantity, reserved_quantity,
+                                            in_maintenance_quantity, updated_at)
+                    SELECT e.item_id, e.loaned_quantity, e.reserved_quantity,
+                           e.in_maintenance_quantity, CURRENT_TIMESTAMP
+                    FROM ({expected_stock_sql(cur)}) e
+                    WHERE e.item_id = ANY(%s)
+                    ON CONFLICT (item_id) DO UPDATE
+                    SET loaned_quantity = EXCLUDED.loaned_quantity,
+                        reserved_quantity = EXCLUDED.reserved_quantity,
+                        in_maintenance_quantity = EXCLUDED.in_maintenance_quantity,
+                        updated_at = EXCLUDED.updated_at
+                """, ([item_id for item_id, _ in drift],))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        if own_conn:
+            conn.close()
+    return drift
+
+
+def main():
+    parser = argparse.ArgumentParser(description="בדיקה ותיקון של מוני המלאי לפי פריט")
+    parser.add_argument('command', choices=['check', 'repair'])
+    args = parser.parse_args()
+
+    drift = reconcile_item_stock(repair=args.command == 'repair')
+    for item_id, differences in drift:
+        details = ', '.join(f"{column} {stored} -> {expected}"
+                            for column, (stored, expected) in differences.items())
+        print(f"item {item_id}: {details or 'missing stock row'}")
+
+    if not drift:
+        print("Item stock is consistent")
+    elif args.command == 'repair':
+        print(f"Repaired {len(drift)} item(s)")
+    else:
+        print(f"Found drift in {len(drift)} item(s)")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
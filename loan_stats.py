@@ -0,0 +1,264 @@
+"""
+סיכום חודשי של השאלות (טבלת loan_stats_monthly, מיגרציה 9).
+
+לכל פריט וחודש השאלה: loan_count, qty, unique_students, late_returns,
+returned_count/returned_days (למשך השאלה ממוצע) ו-weekday_counts. הטריגר על
+loans מעדכן את הסיכום באותה טרנזקציה, ו-loan_student_monthly שומרת אילו
+סטודנטים השאילו כל פריט בכל חודש, לספירת סטודנטים שונים על פני תקופה.
+
+הדו"חות קוראים מהסיכום, כך שהעלות תלויה במספר החודשים והפריטים ולא במספר
+ההשאלות. תקופה שלא מתחילה ונגמרת בגבול חודש נקראת מהסיכום לחודשים המלאים
+ומטבלת loans רק לימים שבקצוות (period_params / period_stats_sql).
+
+המודול גם משווה את הסיכום לטבלת המקור ובונה אותו מחדש אם יש סטייה:
+    python loan_stats.py check     # קוד יציאה 1 אם נמצאה סטייה
+    python loan_stats.py rebuild
+"""
+
+import argparse
+import sys
+from datetime import date, datetime
+
+from database import get_db_connection
+
+STATS_COLUMNS = ('loan_count', 'qty', 'unique_students', 'late_returns',
+                 'returned_count', 'returned_days', 'weekday_counts')
+
+# השאלות לפי יום בשבוע, כמערך של 7 (ראשון עד שבת)
+WEEKDAY_COUNTS_SQL = "ARRAY[" + ", ".join(
+    f"COUNT(*) FILTER (WHERE EXTRACT(DOW FROM l.loan_date) = {day})" for day in range(7)
+) + "]::INTEGER[]"
+
+# הסיכום כפי שהוא מחושב מחדש מטבלת loans, באותם טיפוסים כמו בטבלה
+EXPECTED_STATS_SQL = f"""
+    SELECT l.item_id, i.category, date_trunc('month', l.loan_date)::DATE AS month,
+           COUNT(*)::INTEGER AS loan_count, SUM(l.quantity)::INTEGER AS qty,
+           COUNT(DISTINCT l.student_id)::INTEGER AS unique_students,
+           (COUNT(*) FILTER (WHERE l.return_date > l.due_date))::INTEGER AS late_returns,
+           COUNT(l.return_date)::INTEGER AS returned_count,
+           COALESCE(SUM(EXTRACT(EPOCH FROM (l.return_date - l.loan_date)) / 86400), 0) AS returned_days,
+           {WEEKDAY_COUNTS_SQL} AS weekday_counts
+    FROM loans l
+    JOIN items i ON i.id = l.item_id
+    WHERE l.loan_date IS NOT NULL
+    GROUP BY l.item_id, i.category, date_trunc('month', l.loan_date)
+"""
+
+# הסטודנטים לכל פריט וחודש, כפי שהם מחושבים מחדש מטבלת loans
+EXPECTED_STUDENTS_SQL = """
+    SELECT l.item_id, date_trunc('month', l.loan_date)::DATE AS month, l.student_id,
+           COUNT(*)::INTEGER AS loan_count
+    FROM loans l
+    JOIN items i ON i.id = l.item_id
+    WHERE l.loan_date IS NOT NULL AND l.student_id IS NOT NULL
+    GROUP BY 1, 2, 3
+"""
+
+# סוף פתוח לתקופה בלי תאריך סיום
+OPEN_END = datetime(9999, 12, 31)
+
+
+def _to_datetime(value):
+    """מקבל datetime, date או מחרוזת ISO ומחזיר datetime בלי אזור זמן"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    elif isinstance(value, date) and not isinstance(value, datetime):
+        value = datetime(value.year, value.month, value.day)
+    return value.replace(tzinfo=None)
+
+
+def rollup_available(cur):
+    """בודק שטבלאות הסיכום (מיגרציה 9) קיימות"""
+    cur.execute("""
+        SELECT to_regclass('loan_stats_monthly') IS NOT NULL
+           AND to_regclass('loan_student_monthly') IS NOT NULL
+    """)
+    return cur.fetchone()[0]
+
+
+def stats_source(rollup=True):
+    """
+    מקור שורות הסיכום לשאילתות (FROM): loan_stats_monthly, ובלי rollup (לפני
+    שמיגרציה 9 הורצה) - אותן שורות מחושבות מטבלת loans
+    """
+    return 'loan_stats_monthly' if rollup else f"({EXPECTED_STATS_SQL})"
+
+
+def students_source(rollup=True):
+    """כמו stats_source, לטבלת loan_student_monthly"""
+    return 'loan_student_monthly' if rollup else f"({EXPECTED_STUDENTS_SQL})"
+
+
+def month_start(value):
+    """תחילת החודש של התאריך"""
+    return datetime(value.year, value.month, 1)
+
+
+def next_month(value):
+    """תחילת החודש שאחרי החודש של התאריך"""
+    return datetime(value.year + value.month // 12, value.month % 12 + 1, 1)
+
+
+def period_params(start, end=None, name='period'):
+    """
+    פרמטרים ל-period_stats_sql ול-period_students_sql עבור התקופה [start, end]
+    (כולל הקצוות; end=None - בלי סוף). החודשים המלאים הם
+    first_full <= month < full_end, והשאר נקרא מטבלת loans
+    """
+    start = _to_datetime(start)
+    end = OPEN_END if end is None else _to_datetime(end)
+    first_full = start if start == month_start(start) else next_month(start)
+    full_end = month_start(end)
+    return {
+        f'{name}_start': start,
+        f'{name}_end': end,
+        f'{name}_first_full': first_full,
+        f'{name}_full_end': full_end
+    }
+
+
+def _edge_loans_condition(name):
+    """השאלות בתקופה שאינן בחודש מלא - הן נקראות מטבלת loans"""
+    return f"""
+        l.loan_date >= %({name}_start)s AND l.loan_date <= %({name}_end)s
+        AND (l.loan_date < %({name}_first_full)s
+             OR l.loan_date >= GREATEST(%({name}_full_end)s, %({name}_first_full)s))
+    """
+
+
+def period_stats_sql(name='period', rollup=True):
+    """
+    שורות הסיכום לתקופה (item_id, category, month, loan_count, qty,
+    late_returns, returned_count, returned_days, weekday_counts): חודשים מלאים
+    מהסיכום, והשאלות בקצוות התקופה מטבלת loans, מקובצות באותה צורה.
+    name מאפשר לשלב כמה תקופות באותה שאילתה (period_params עם אותו name),
+    ו-rollup (rollup_available) קובע מאיפה נקראים החודשים המלאים
+    """
+    return f"""
+        SELECT s.item_id, s.category, s.month, s.loan_count, s.qty, s.late_returns,
+               s.returned_count, s.returned_days, s.weekday_counts
+        FROM {stats_source(rollup)} s
+        WHERE s.month >= %({name}_first_full)s AND s.month < %({name}_full_end)s
+        UNION ALL
+        SELECT l.item_id, i.category, date_trunc('month', l.loan_date)::DATE,
+               COUNT(*)::INTEGER, SUM(l.quantity)::INTEGER,
+               (COUNT(*) FILTER (WHERE l.return_date > l.due_date))::INTEGER,
+               COUNT(l.return_date)::INTEGER,
+               COALESCE(SUM(EXTRACT(EPOCH FROM (l.return_date - l.loan_date)) / 86400), 0),
+               {WEEKDAY_COUNTS_SQL}
+        FROM loans l
+        JOIN items i ON i.id = l.item_id
+        WHERE {_edge_loans_condition(name)}
+        GROUP BY l.item_id, i.category, date_trunc('month', l.loan_date)
+    """
+
+
+def period_students_sql(name='period', rollup=True):
+    """הסטודנטים שהשאילו כל פריט בתקופה: (item_id, category, month, student_id) בלי כפילויות"""
+    return f"""
+        SELECT m.item_id, i.category, m.month, m.student_id
+        FROM {students_source(rollup)} m
+        JOIN items i ON i.id = m.item_id
+        WHERE m.month >= %({name}_first_full)s AND m.month < %({name}_full_end)s
+        UNION
+        SELECT l.item_id, i.category, date_trunc('month', l.loan_date)::DATE, l.student_id
+        FROM loans l
+        JOIN items i ON i.id = l.item_id
+        WHERE {_edge_loans_condition(name)}
+    """
+
+
+def find_stats_drift(cur):
+    """
+    מחזיר רשימה של (item_id, month, {עמודה: (שמור, צפוי)}) לחודשים שבהם
+    הסיכום שונה מטבלת loans, כולל שורות חסרות או מיותרות
+    """
+    stored = ', '.join(f"s.{column}" for column in STATS_COLUMNS)
+    expected = ', '.join(f"e.{column}" for column in STATS_COLUMNS)
+    cur.execute(f"""
+        SELECT COALESCE(e.item_id, s.item_id), COALESCE(e.month, s.month),
+               {', '.join(f's.{c}, e.{c}' for c in STATS_COLUMNS)}
+        FROM ({EXPECTED_STATS_SQL}) e
+        FULL JOIN loan_stats_monthly s ON s.item_id = e.item_id AND s.month = e.month
+        WHERE ({stored}) IS DISTINCT FROM ({expected})
+        ORDER BY 1, 2
+    """)
+    drift = []
+    for row in cur.fetchall():
+        item_id, month, values = row[0], row[1], row[2:]
+        differences = {
+            column: (values[index * 2], values[index * 2 + 1])
+            for index, column in enumerate(STATS_COLUMNS)
+            if values[index * 2] != values[index * 2 + 1]
+        }
+        drift.append((item_id, month, differences))
+    return drift
+
+
+def rebuild_loan_stats(cur):
+    """בונה מחדש את שתי טבלאות הסיכום מטבלת loans"""
+    cur.execute("DELETE FROM loan_student_monthly")
+    cur.execute("DELETE FROM loan_stats_monthly")
+    cur.execute(f"""
+        INSERT INTO loan_student_monthly (item_id, month, student_id, loan_count)
+        SELECT item_id, month, student_id, loan_count
+        FROM ({EXPECTED_STUDENTS_SQL}) e
+    """)
+    cur.execute(f"""
+        INSERT INTO loan_stats_monthly (
+            item_id, category, month, loan_count, qty, unique_students,
+            late_returns, returned_count, returned_days, weekday_counts
+        )
+        SELECT item_id, category, month, loan_count, qty, unique_students,
+               late_returns, returned_count, returned_days, weekday_counts
+        FROM ({EXPECTED_STATS_SQL}) e
+    """)
+
+
+def reconcile_loan_stats(rebuild=False, conn=None):
+    """
+    בודק (ואם rebuild - בונה מחדש) את הסיכום מול טבלת loans. טבלת loans
+    ננעלת לכתיבה במהלך הבדיקה, כך שהשאלות חדשות ממתינות והחישוב לא מתחרה
+    בטריגרים. מחזיר את רשימת הסטיות שנמצאו.
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("LOCK TABLE loans IN SHARE MODE")
+            drift = find_stats_drift(cur)
+            if rebuild and drift:
+                rebuild_loan_stats(cur)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        if own_conn:
+            conn.close()
+    return drift
+
+
+def main():
+    parser = argparse.ArgumentParser(description="בדיקה ובנייה מחדש של הסיכום החודשי של ההשאלות")
+    parser.add_argument('command', choices=['check', 'rebuild'])
+    args = parser.parse_args()
+
+    drift = reconcile_loan_stats(rebuild=args.command == 'rebuild')
+    for item_id, month, differences in drift:
+        details = ', '.join(f"{column} {stored} -> {expected}"
+                            for column, (stored, expected) in differences.items())
+        print(f"item {item_id} {month}: {details}")
+
+    if not drift:
+        print("Loan stats are consistent")
+    elif args.command == 'rebuild':
+        print(f"Rebuilt loan stats ({len(drift)} month(s) differed)")
+    else:
+        print(f"Found drift in {len(drift)} item month(s)")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -8,7 +8,8 @@ from components.statistics import show_statistics
 from components.equipment_tracking import show_equipment_tracking
 from components.reservations import show_reservations_page, show_reservation_management
 from excel_handler import import_excel, export_to_excel
-from utils import set_page_config, get_overdue_loans
+from utils import get_overdue_loans
+from ui_utils import set_page_config
 from auth import init_auth, show_login_page, show_registration_page, logout
 import os
 import base64
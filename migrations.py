@@ -0,0 +1,993 @@
+"""
+מנגנון מיגרציות גרסתי למסד הנתונים.
+
+כל מיגרציה מוגדרת ברשימה MIGRATIONS עם מספר גרסה, שם ו-SQL. מיגרציה שהורצה
+נרשמת בטבלת schema_migrations ולא תורץ שוב, וכל מיגרציה רצה בטרנזקציה משלה.
+נעילת advisory מונעת הרצה כפולה כששני תהליכים מנסים להריץ מיגרציות במקביל.
+
+שימוש משורת הפקודה:
+    python migrations.py status
+    python migrations.py migrate [--target VERSION]
+    python migrations.py init      # גם הטבלאות הבסיסיות (init_db), למסד חדש
+"""
+
+import argparse
+import sys
+
+from database import get_db_connection
+
+# מזהה קבוע לנעילת ה-advisory של מנגנון המיגרציות
+MIGRATIONS_LOCK_ID = 727_100_001
+
+MIGRATIONS = [
+    (1, 'loans_hot_path_indexes', """
+        -- השאלות פתוחות לפי פריט (מלאי, דשבורד, התראות)
+        CREATE INDEX IF NOT EXISTS idx_loans_open_item
+            ON loans (item_id) INCLUDE (quantity)
+            WHERE return_date IS NULL;
+
+        -- השאלות פעילות לפי פריט (עדכון פריט, זמינות, מעקב ציוד)
+        CREATE INDEX IF NOT EXISTS idx_loans_active_item
+            ON loans (item_id) INCLUDE (quantity)
+            WHERE status = 'active';
+
+        -- השאלות באיחור ומועדי החזרה קרובים
+        CREATE INDEX IF NOT EXISTS idx_loans_open_due_date
+            ON loans (due_date)
+            WHERE return_date IS NULL;
+
+        -- מפתח זר לפריט (הצטרפות לפריטים, בדיקת מחיקה)
+        CREATE INDEX IF NOT EXISTS idx_loans_item_id
+            ON loans (item_id);
+
+        -- סריקות טווח תאריכים בניתוחים
+        CREATE INDEX IF NOT EXISTS idx_loans_loan_date
+            ON loans (loan_date);
+    """),
+    (2, 'reservations_availability_indexes', """
+        -- בדיקת זמינות: פריט, סטטוס וטווח תאריכים
+        CREATE INDEX IF NOT EXISTS idx_reservations_item_status_dates
+            ON reservations (item_id, status, start_date, end_date);
+
+        -- הזמנות קרובות בדשבורד
+        CREATE INDEX IF NOT EXISTS idx_reservations_start_date
+            ON reservations (start_date);
+    """),
+    (3, 'maintenance_schedules_next_due_index', """
+        -- טבלת התחזוקה לא נוצרת ב-init_db ולכן ייתכן שאינה קיימת; אם כך,
+        -- מיגרציה 14 יוצרת אותה ואת האינדקס
+        DO $$
+        BEGIN
+            IF to_regclass('maintenance_schedules') IS NOT NULL THEN
+                CREATE INDEX IF NOT EXISTS idx_maintenance_schedules_next_due
+                    ON maintenance_schedules (next_due);
+            END IF;
+        END
+        $$;
+    """),
+    (4, 'reservations_period_gist_index', """
+        -- אינדקס טווחים לבדיקת חפיפה (&&) של הזמנות פעילות.
+        -- עם btree_gist האינדקס כולל גם את item_id; בלעדיו - רק את הטווח
+        DO $$
+        BEGIN
+            BEGIN
+                CREATE EXTENSION IF NOT EXISTS btree_gist;
+            EXCEPTION WHEN OTHERS THEN
+                RAISE NOTICE 'btree_gist is not available: %', SQLERRM;
+            END;
+
+            IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'btree_gist') THEN
+                CREATE INDEX IF NOT EXISTS idx_reservations_item_period
+                    ON reservations USING gist (
+                        item_id,
+                        tsrange(start_date, GREATEST(start_date, end_date), '[]')
+                    )
+                    WHERE status IN ('approved', 'pending');
+            ELSE
+                CREATE INDEX IF NOT EXISTS idx_reservations_item_period
+                    ON reservations USING gist (
+                        tsrange(start_date, GREATEST(start_date, end_date), '[]')
+                    )
+                    WHERE status IN ('approved', 'pending');
+            END IF;
+        END
+        $$;
+    """),
+    (5, 'loans_listing_keyset_index', """
+        -- דפדוף keyset ברשימת ההשאלות: פתוחות לפני מוחזרות, לפי מועד החזרה
+        CREATE INDEX IF NOT EXISTS idx_loans_listing
+            ON loans ((return_date IS NOT NULL), due_date, id);
+
+        -- סינון רשימת ההשאלות לפי סטודנט
+        CREATE INDEX IF NOT EXISTS idx_loans_student_id
+            ON loans (student_id);
+    """),
+    (6, 'inventory_row_versions', """
+        -- גרסת שינוי לכל שורה בפריטים ובהשאלות, לעדכון מלאי מצטבר.
+        -- כל השורות שטרנזקציה משנה מקבלות את אותה גרסה, מהמונה 'inventory'
+        -- בטבלת data_versions. נעילת שורת המונה נשמרת עד סוף הטרנזקציה,
+        -- ולכן הגרסאות מתחייבות לפי הסדר ולקוח שקרא גרסה V לא יחמיץ שינוי
+        -- עם גרסה נמוכה ממנה.
+        CREATE TABLE IF NOT EXISTS data_versions (
+            name TEXT PRIMARY KEY,
+            version BIGINT NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+
+        ALTER TABLE items ADD COLUMN IF NOT EXISTS row_version BIGINT NOT NULL DEFAULT 0;
+        ALTER TABLE items ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+        ALTER TABLE loans ADD COLUMN IF NOT EXISTS row_version BIGINT NOT NULL DEFAULT 0;
+        ALTER TABLE loans ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+
+        -- פריטים שנמחקו, כדי שלקוח מצטבר ידע להסיר אותם
+        CREATE TABLE IF NOT EXISTS inventory_tombstones (
+            item_id INTEGER PRIMARY KEY,
+            row_version BIGINT NOT NULL,
+            deleted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_items_row_version ON items (row_version);
+        CREATE INDEX IF NOT EXISTS idx_inventory_tombstones_row_version
+            ON inventory_tombstones (row_version);
+
+        CREATE OR REPLACE FUNCTION inventory_txn_version() RETURNS BIGINT AS $$
+        DECLARE
+            current_version TEXT := current_setting('inventory.txn_version', true);
+            new_version BIGINT;
+        BEGIN
+            IF current_version IS NOT NULL AND current_version <> '' THEN
+                RETURN current_version::BIGINT;
+            END IF;
+            INSERT INTO data_versions (name, version, updated_at)
+            VALUES ('inventory', 1, CURRENT_TIMESTAMP)
+            ON CONFLICT (name) DO UPDATE
+            SET version = data_versions.version + 1,
+                updated_at = CURRENT_TIMESTAMP
+            RETURNING version INTO new_version;
+            -- is_local: הערך מתאפס בסוף הטרנזקציה
+            PERFORM set_config('inventory.txn_version', new_version::TEXT, true);
+            RETURN new_version;
+        END
+        $$ LANGUAGE plpgsql;
+
+        CREATE OR REPLACE FUNCTION stamp_row_version() RETURNS TRIGGER AS $$
+        BEGIN
+            NEW.row_version := inventory_txn_version();
+            NEW.updated_at := CURRENT_TIMESTAMP;
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql;
+
+        -- שינוי בהשאלה משנה את הכמות המושאלת של הפריט, ולכן מסמן גם אותו
+        CREATE OR REPLACE FUNCTION touch_loan_item() RETURNS TRIGGER AS $$
+        DECLARE
+            txn_version BIGINT := inventory_txn_version();
+        BEGIN
+            UPDATE items SET updated_at = CURRENT_TIMESTAMP
+            WHERE row_version <> txn_version
+              AND id IN (
+                  CASE WHEN TG_OP <> 'DELETE' THEN NEW.item_id END,
+                  CASE WHEN TG_OP <> 'INSERT' THEN OLD.item_id END
+              );
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+
+        CREATE OR REPLACE FUNCTION record_item_tombstone() RETURNS TRIGGER AS $$
+        BEGIN
+            INSERT INTO inventory_tombstones (item_id, row_version)
+            VALUES (OLD.id, inventory_txn_version())
+            ON CONFLICT (item_id) DO UPDATE
+            SET row_version = EXCLUDED.row_version,
+                deleted_at = CURRENT_TIMESTAMP;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS items_row_version ON items;
+        CREATE TRIGGER items_row_version
+            BEFORE INSERT OR UPDATE ON items
+            FOR EACH ROW EXECUTE FUNCTION stamp_row_version();
+
+        DROP TRIGGER IF EXISTS items_tombstone ON items;
+        CREATE TRIGGER items_tombstone
+            AFTER DELETE ON items
+            FOR EACH ROW EXECUTE FUNCTION record_item_tombstone();
+
+        DROP TRIGGER IF EXISTS loans_row_version ON loans;
+        CREATE TRIGGER loans_row_version
+            BEFORE INSERT OR UPDATE ON loans
+            FOR EACH ROW EXECUTE FUNCTION stamp_row_version();
+
+        DROP TRIGGER IF EXISTS loans_touch_item ON loans;
+        CREATE TRIGGER loans_touch_item
+            AFTER INSERT OR UPDATE OR DELETE ON loans
+            FOR EACH ROW EXECUTE FUNCTION touch_loan_item();
+    """),
+    (7, 'item_stock_counters', """
+        -- מונים מתוחזקים לכל פריט, במקום SUM על השאלות/הזמנות בכל קריאה.
+        -- הטריגרים מעדכנים אותם באותה טרנזקציה של השינוי, ו-item_stock.py
+        -- משווה אותם לטבלאות המקור ומתקן סטיות
+        CREATE TABLE IF NOT EXISTS item_stock (
+            item_id INTEGER PRIMARY KEY REFERENCES items(id) ON DELETE CASCADE,
+            loaned_quantity INTEGER NOT NULL DEFAULT 0,
+            reserved_quantity INTEGER NOT NULL DEFAULT 0,
+            in_maintenance_quantity INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+
+        CREATE OR REPLACE FUNCTION adjust_item_stock(
+            stock_item_id INTEGER, loaned_delta INTEGER,
+            reserved_delta INTEGER, maintenance_delta INTEGER
+        ) RETURNS VOID AS $$
+        BEGIN
+            IF stock_item_id IS NULL
+               OR (loaned_delta = 0 AND reserved_delta = 0 AND maintenance_delta = 0) THEN
+                RETURN;
+            END IF;
+            INSERT INTO item_stock (item_id, loaned_quantity, reserved_quantity,
+                                    in_maintenance_quantity, updated_at)
+            VALUES (stock_item_id, loaned_delta, reserved_delta, maintenance_delta, CURRENT_TIMESTAMP)
+            ON CONFLICT (item_id) DO UPDATE
+            SET loaned_quantity = item_stock.loaned_quantity + EXCLUDED.loaned_quantity,
+                reserved_quantity = item_stock.reserved_quantity + EXCLUDED.reserved_quantity,
+                in_maintenance_quantity = item_stock.in_maintenance_quantity + EXCLUDED.in_maintenance_quantity,
+                updated_at = CURRENT_TIMESTAMP;
+        END
+        $$ LANGUAGE plpgsql;
+
+        CREATE OR REPLACE FUNCTION create_item_stock() RETURNS TRIGGER AS $$
+        BEGIN
+            INSERT INTO item_stock (item_id) VALUES (NEW.id) ON CONFLICT DO NOTHING;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+
+        -- השאלה נספרת כל עוד לא הוחזרה
+        CREATE OR REPLACE FUNCTION loans_item_stock() RETURNS TRIGGER AS $$
+        BEGIN
+            IF TG_OP <> 'INSERT' AND OLD.return_date IS NULL THEN
+                PERFORM adjust_item_stock(OLD.item_id, -OLD.quantity, 0, 0);
+            END IF;
+            IF TG_OP <> 'DELETE' AND NEW.return_date IS NULL THEN
+                PERFORM adjust_item_stock(NEW.item_id, NEW.quantity, 0, 0);
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+
+        -- הזמנה נספרת כשהיא מאושרת
+        CREATE OR REPLACE FUNCTION reservations_item_stock() RETURNS TRIGGER AS $$
+        BEGIN
+            IF TG_OP <> 'INSERT' AND OLD.status = 'approved' THEN
+                PERFORM adjust_item_stock(OLD.item_id, 0, -OLD.quantity, 0);
+            END IF;
+            IF TG_OP <> 'DELETE' AND NEW.status = 'approved' THEN
+                PERFORM adjust_item_stock(NEW.item_id, 0, NEW.quantity, 0);
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+
+        -- רשומת תחזוקה פתוחה (בלי תאריך סיום) מוציאה יחידה אחת מהשימוש
+        CREATE OR REPLACE FUNCTION maintenance_item_stock() RETURNS TRIGGER AS $$
+        BEGIN
+            IF TG_OP <> 'INSERT' AND OLD.end_date IS NULL THEN
+                PERFORM adjust_item_stock(OLD.item_id, 0, 0, -1);
+            END IF;
+            IF TG_OP <> 'DELETE' AND NEW.end_date IS NULL THEN
+                PERFORM adjust_item_stock(NEW.item_id, 0, 0, 1);
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS items_create_stock ON items;
+        CREATE TRIGGER items_create_stock
+            AFTER INSERT ON items
+            FOR EACH ROW EXECUTE FUNCTION create_item_stock();
+
+        DROP TRIGGER IF EXISTS loans_item_stock ON loans;
+        CREATE TRIGGER loans_item_stock
+            AFTER INSERT OR DELETE OR UPDATE OF item_id, quantity, return_date ON loans
+            FOR EACH ROW EXECUTE FUNCTION loans_item_stock();
+
+        DROP TRIGGER IF EXISTS reservations_item_stock ON reservations;
+        CREATE TRIGGER reservations_item_stock
+            AFTER INSERT OR DELETE OR UPDATE OF item_id, quantity, status ON reservations
+            FOR EACH ROW EXECUTE FUNCTION reservations_item_stock();
+
+        -- טבלאות התחזוקה לא נוצרות ב-init_db ולכן ייתכן שאינן קיימות; אם כך,
+        -- מיגרציה 15 יוצרת את maintenance_records ומתקינה את הטריגר
+        DO $$
+        BEGIN
+            IF to_regclass('maintenance_records') IS NOT NULL THEN
+                DROP TRIGGER IF EXISTS maintenance_item_stock ON maintenance_records;
+                CREATE TRIGGER maintenance_item_stock
+                    AFTER INSERT OR DELETE OR UPDATE OF item_id, end_date ON maintenance_records
+                    FOR EACH ROW EXECUTE FUNCTION maintenance_item_stock();
+            END IF;
+        END
+        $$;
+
+        -- מילוי ראשוני מהטבלאות הקיימות
+        INSERT INTO item_stock (item_id, loaned_quantity, reserved_quantity, in_maintenance_quantity)
+        SELECT i.id, 0, 0, 0 FROM items i
+        ON CONFLICT DO NOTHING;
+
+        UPDATE item_stock s
+        SET loaned_quantity = COALESCE(l.quantity, 0)
+        FROM items i
+        LEFT JOIN (
+            SELECT item_id, SUM(quantity) AS quantity
+            FROM loans WHERE return_date IS NULL
+            GROUP BY item_id
+        ) l ON l.item_id = i.id
+        WHERE s.item_id = i.id;
+
+        UPDATE item_stock s
+        SET reserved_quantity = COALESCE(r.quantity, 0)
+        FROM items i
+        LEFT JOIN (
+            SELECT item_id, SUM(quantity) AS quantity
+            FROM reservations WHERE status = 'approved'
+            GROUP BY item_id
+        ) r ON r.item_id = i.id
+        WHERE s.item_id = i.id;
+
+        DO $$
+        BEGIN
+            IF to_regclass('maintenance_records') IS NOT NULL THEN
+                UPDATE item_stock s
+                SET in_maintenance_quantity = (
+                    SELECT COUNT(*) FROM maintenance_records m
+                    WHERE m.item_id = s.item_id AND m.end_date IS NULL
+                );
+            END IF;
+        END
+        $$;
+    """),
+    (8, 'items_category_name_unique', """
+        -- מפתח ייחודי (category, name) לייבוא ב-INSERT ... ON CONFLICT.
+        -- ייבואים חוזרים יצרו כפילויות. המיגרציה לא ממזגת אותן בעצמה ולא
+        -- עוצרת את עליית האפליקציה: אם נמצאו קבוצות כפולות היא מדווחת עליהן
+        -- באזהרה ולא בונה את המפתח. הייבוא עובד גם בלעדיו (בלי ON CONFLICT),
+        -- והמיזוג נעשה במפורש עם dedupe_items.py, שבונה את המפתח בסופו
+        DO $$
+        DECLARE
+            group_count INTEGER;
+            report TEXT;
+        BEGIN
+            SELECT COUNT(*),
+                   string_agg(format('%s / %s: ids %s', category, name, ids), chr(10)
+                              ORDER BY category, name)
+            INTO group_count, report
+            FROM (
+                SELECT category, name, string_agg(id::text, ', ' ORDER BY id) AS ids
+                FROM items
+                GROUP BY category, name
+                HAVING COUNT(*) > 1
+            ) d;
+
+            IF group_count > 0 THEN
+                -- הדוח בגוף ההודעה, כי רק היא נרשמת ביומן של run_migrations
+                RAISE WARNING '% duplicate (category, name) group(s) in items, '
+                              'items_category_name_key was not created. Review them with '
+                              '"python dedupe_items.py check" and merge with '
+                              '"python dedupe_items.py merge", which also creates the key:%',
+                              group_count, chr(10) || report;
+            ELSE
+                CREATE UNIQUE INDEX IF NOT EXISTS items_category_name_key
+                    ON items (category, name);
+            END IF;
+        END
+        $$;
+    """),
+    (9, 'loan_stats_monthly_rollup', """
+        -- סיכום חודשי של השאלות לפי פריט, במקום סריקה של כל טבלת loans בכל
+        -- דו"ח. השורות מתעדכנות בטריגרים באותה טרנזקציה של השינוי בהשאלה,
+        -- ו-loan_stats.py משווה אותן לטבלת המקור ובונה מחדש במקרה של סטייה.
+        -- החודש הוא חודש תאריך ההשאלה
+        CREATE TABLE IF NOT EXISTS loan_stats_monthly (
+            item_id INTEGER NOT NULL REFERENCES items(id) ON DELETE CASCADE,
+            category TEXT,
+            month DATE NOT NULL,
+            loan_count INTEGER NOT NULL DEFAULT 0,
+            qty INTEGER NOT NULL DEFAULT 0,
+            unique_students INTEGER NOT NULL DEFAULT 0,
+            late_returns INTEGER NOT NULL DEFAULT 0,
+            -- לחישוב משך השאלה ממוצע: סכום הימים של השאלות שהוחזרו ומספרן
+            returned_count INTEGER NOT NULL DEFAULT 0,
+            returned_days NUMERIC NOT NULL DEFAULT 0,
+            -- השאלות לפי יום בשבוע (1 = ראשון)
+            weekday_counts INTEGER[] NOT NULL DEFAULT '{0,0,0,0,0,0,0}',
+            PRIMARY KEY (item_id, month)
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_loan_stats_monthly_month
+            ON loan_stats_monthly (month);
+        CREATE INDEX IF NOT EXISTS idx_loan_stats_monthly_category_month
+            ON loan_stats_monthly (category, month);
+
+        -- כמה השאלות יש לכל סטודנט בכל פריט וחודש; ממנה נגזר unique_students,
+        -- וספירת סטודנטים שונים על פני כמה פריטים או חודשים נעשית עליה
+        CREATE TABLE IF NOT EXISTS loan_student_monthly (
+            item_id INTEGER NOT NULL REFERENCES items(id) ON DELETE CASCADE,
+            month DATE NOT NULL,
+            student_id TEXT NOT NULL,
+            loan_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (item_id, month, student_id)
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_loan_student_monthly_month
+            ON loan_student_monthly (month);
+
+        -- מוסיף (sign = 1) או מוריד (sign = -1) השאלה אחת מהסיכום
+        CREATE OR REPLACE FUNCTION apply_loan_stats(
+            stats_item_id INTEGER, stats_student_id TEXT, stats_quantity INTEGER,
+            stats_loan_date TIMESTAMP, stats_due_date TIMESTAMP,
+            stats_return_date TIMESTAMP, sign INTEGER
+        ) RETURNS VOID AS $$
+        DECLARE
+            stats_month DATE;
+            weekday INTEGER;
+            student_loans INTEGER;
+            student_delta INTEGER := 0;
+            is_returned INTEGER;
+        BEGIN
+            IF stats_item_id IS NULL OR stats_loan_date IS NULL THEN
+                RETURN;
+            END IF;
+            stats_month := date_trunc('month', stats_loan_date)::DATE;
+            weekday := EXTRACT(DOW FROM stats_loan_date)::INTEGER + 1;
+            is_returned := CASE WHEN stats_return_date IS NOT NULL THEN 1 ELSE 0 END;
+
+            IF stats_student_id IS NOT NULL THEN
+                INSERT INTO loan_student_monthly (item_id, month, student_id, loan_count)
+                VALUES (stats_item_id, stats_month, stats_student_id, sign)
+                ON CONFLICT (item_id, month, student_id) DO UPDATE
+                SET loan_count = loan_student_monthly.loan_count + sign
+                RETURNING loan_count INTO student_loans;
+
+                IF sign > 0 AND student_loans = 1 THEN
+                    student_delta := 1;
+                ELSIF sign < 0 AND student_loans = 0 THEN
+                    student_delta := -1;
+                    DELETE FROM loan_student_monthly
+                    WHERE item_id = stats_item_id AND month = stats_month
+                      AND student_id = stats_student_id;
+                END IF;
+            END IF;
+
+            INSERT INTO loan_stats_monthly AS s (
+                item_id, category, month, loan_count, qty, unique_students,
+                late_returns, returned_count, returned_days, weekday_counts
+            )
+            SELECT stats_item_id, i.category, stats_month, sign,
+                   sign * stats_quantity, student_delta,
+                   sign * (CASE WHEN stats_return_date > stats_due_date THEN 1 ELSE 0 END),
+                   sign * is_returned,
+                   sign * is_returned * COALESCE(
+                       EXTRACT(EPOCH FROM (stats_return_date - stats_loan_date)) / 86400, 0),
+                   (SELECT array_agg(CASE WHEN d = weekday THEN sign ELSE 0 END ORDER BY d)
+                    FROM generate_series(1, 7) d)
+            FROM items i WHERE i.id = stats_item_id
+            ON CONFLICT (item_id, month) DO UPDATE
+            SET loan_count = s.loan_count + EXCLUDED.loan_count,
+                qty = s.qty + EXCLUDED.qty,
+                unique_students = s.unique_students + EXCLUDED.unique_students,
+                late_returns = s.late_returns + EXCLUDED.late_returns,
+                returned_count = s.returned_count + EXCLUDED.returned_count,
+                returned_days = s.returned_days + EXCLUDED.returned_days,
+                weekday_counts[weekday] = s.weekday_counts[weekday] + sign;
+
+            DELETE FROM loan_stats_monthly
+            WHERE item_id = stats_item_id AND month = stats_month AND loan_count = 0;
+        END
+        $$ LANGUAGE plpgsql;
+
+        CREATE OR REPLACE FUNCTION loans_loan_stats() RETURNS TRIGGER AS $$
+        BEGIN
+            IF TG_OP <> 'INSERT' THEN
+                PERFORM apply_loan_stats(OLD.item_id, OLD.student_id, OLD.quantity,
+                                         OLD.loan_date, OLD.due_date, OLD.return_date, -1);
+            END IF;
+            IF TG_OP <> 'DELETE' THEN
+                PERFORM apply_loan_stats(NEW.item_id, NEW.student_id, NEW.quantity,
+                                         NEW.loan_date, NEW.due_date, NEW.return_date, 1);
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+
+        -- הקטגוריה בסיכום היא של הפריט, ומתעדכנת כשהפריט עובר קטגוריה
+        CREATE OR REPLACE FUNCTION items_loan_stats_category() RETURNS TRIGGER AS $$
+        BEGIN
+            UPDATE loan_stats_monthly SET category = NEW.category
+            WHERE item_id = NEW.id;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS loans_loan_stats ON loans;
+        CREATE TRIGGER loans_loan_stats
+            AFTER INSERT OR DELETE OR UPDATE OF item_id, student_id, quantity,
+                loan_date, due_date, return_date ON loans
+            FOR EACH ROW EXECUTE FUNCTION loans_loan_stats();
+
+        DROP TRIGGER IF EXISTS items_loan_stats_category ON items;
+        CREATE TRIGGER items_loan_stats_category
+            AFTER UPDATE OF category ON items
+            FOR EACH ROW WHEN (OLD.category IS DISTINCT FROM NEW.category)
+            EXECUTE FUNCTION items_loan_stats_category();
+
+        -- מילוי ראשוני מההשאלות הקיימות
+        DELETE FROM loan_student_monthly;
+        DELETE FROM loan_stats_monthly;
+
+        INSERT INTO loan_student_monthly (item_id, month, student_id, loan_count)
+        SELECT l.item_id, date_trunc('month', l.loan_date)::DATE, l.student_id, COUNT(*)
+        FROM loans l
+        JOIN items i ON i.id = l.item_id
+        WHERE l.loan_date IS NOT NULL AND l.student_id IS NOT NULL
+        GROUP BY 1, 2, 3;
+
+        INSERT INTO loan_stats_monthly (
+            item_id, category, month, loan_count, qty, unique_students,
+            late_returns, returned_count, returned_days, weekday_counts
+        )
+        SELECT l.item_id, i.category, date_trunc('month', l.loan_date)::DATE,
+               COUNT(*), SUM(l.quantity), COUNT(DISTINCT l.student_id),
+               COUNT(*) FILTER (WHERE l.return_date > l.due_date),
+               COUNT(l.return_date),
+               COALESCE(SUM(EXTRACT(EPOCH FROM (l.return_date - l.loan_date)) / 86400), 0),
+               ARRAY[
+                   COUNT(*) FILTER (WHERE EXTRACT(DOW FROM l.loan_date) = 0),
+                   COUNT(*) FILTER (WHERE EXTRACT(DOW FROM l.loan_date) = 1),
+                   COUNT(*) FILTER (WHERE EXTRACT(DOW FROM l.loan_date) = 2),
+                   COUNT(*) FILTER (WHERE EXTRACT(DOW FROM l.loan_date) = 3),
+                   COUNT(*) FILTER (WHERE EXTRACT(DOW FROM l.loan_date) = 4),
+                   COUNT(*) FILTER (WHERE EXTRACT(DOW FROM l.loan_date) = 5),
+                   COUNT(*) FILTER (WHERE EXTRACT(DOW FROM l.loan_date) = 6)
+               ]::INTEGER[]
+        FROM loans l
+        JOIN items i ON i.id = l.item_id
+        WHERE l.loan_date IS NOT NULL
+        GROUP BY l.item_id, i.category, date_trunc('month', l.loan_date);
+    """),
+    (10, 'precomputed_alerts', """
+        -- התראות מחושבות מראש (alerts.py). כל רענון מחליף את כל השורות,
+        -- והשורות נשמרות בסדר התצוגה (לפי id). user_id הוא בעל ההשאלה,
+        -- כך שהתראות של סטודנט נקראות באינדקס
+        CREATE TABLE IF NOT EXISTS alerts (
+            id BIGSERIAL PRIMARY KEY,
+            alert_type TEXT NOT NULL,
+            entity_id INTEGER NOT NULL,
+            item_id INTEGER,
+            user_id INTEGER,
+            severity TEXT NOT NULL,
+            days INTEGER,
+            payload JSONB NOT NULL,
+            computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_alerts_user_id ON alerts (user_id);
+        CREATE INDEX IF NOT EXISTS idx_alerts_type_severity ON alerts (alert_type, severity);
+    """),
+    (11, 'email_outbox', """
+        -- תור הודעות הדוא"ל (send_email_notification.py): כל הודעה נשמרת כאן
+        -- לפני השליחה, עם מצב המסירה, מספר הניסיונות ומועד הניסיון הבא
+        CREATE TABLE IF NOT EXISTS email_outbox (
+            id BIGSERIAL PRIMARY KEY,
+            alert_type TEXT NOT NULL,
+            recipient TEXT NOT NULL,
+            subject TEXT NOT NULL,
+            html_body TEXT NOT NULL,
+            text_body TEXT,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            next_attempt_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            sent_at TIMESTAMP
+        );
+
+        -- הודעות שממתינות לשליחה או לניסיון חוזר
+        CREATE INDEX IF NOT EXISTS idx_email_outbox_due
+            ON email_outbox (next_attempt_at) WHERE status <> 'sent';
+    """),
+    (12, 'item_search', r"""
+        -- חיפוש פריטים (item_search.py). הטקסט מנורמל: אותיות קטנות, בלי ניקוד
+        -- וטעמים, אותיות סופיות כרגילות (ך->כ וכו'), מקף עברי, טאב ושורה חדשה
+        -- כרווח ובלי גרש, גרשיים ומרכאות - כך ש"שָׁלוֹם" ו"שלום", "צ׳ק" ו"צק" זהים.
+        -- הפונקציה רצה בכל כתיבה של פריט ובכל חיפוש, ולכן translate ולא ביטויים
+        -- רגולריים ככל האפשר
+        CREATE OR REPLACE FUNCTION search_normalize(value TEXT) RETURNS TEXT
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $fn$
+            SELECT btrim(translate(
+                regexp_replace(lower(COALESCE(value, '')),
+                               U&'[\0591-\05BD\05BF\05C1\05C2\05C4\05C5\05C7]', '', 'g'),
+                U&'\05DA\05DD\05DF\05E3\05E5\05BE\0009\000A\000D\05F3\05F4''"',
+                U&'\05DB\05DE\05E0\05E4\05E6    '
+            ))
+        $fn$;
+
+        -- המסמך שעליו מחפשים: שם, קטגוריה והערות של פריט
+        CREATE OR REPLACE FUNCTION item_search_document(name TEXT, category TEXT, notes TEXT)
+        RETURNS TEXT LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $fn$
+            SELECT search_normalize(concat_ws(' ', name, category, notes))
+        $fn$;
+
+        -- וקטור המילים לדירוג: מילה בשם שווה יותר ממילה בקטגוריה, וזו יותר מבהערות
+        CREATE OR REPLACE FUNCTION item_search_vector(name TEXT, category TEXT, notes TEXT)
+        RETURNS tsvector LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $fn$
+            SELECT setweight(to_tsvector('simple'::regconfig, search_normalize(name)), 'A')
+                || setweight(to_tsvector('simple'::regconfig, search_normalize(category)), 'B')
+                || setweight(to_tsvector('simple'::regconfig, search_normalize(notes)), 'C')
+        $fn$;
+
+        -- שאילתת מילים: כל מילה בחיפוש כהתחלת מילה בפריט ("מצל קנ" -> מצל:* & קנ:*).
+        -- חיפוש בלי אותיות או ספרות מחזיר NULL, שלא תואם אף פריט
+        CREATE OR REPLACE FUNCTION search_tsquery(value TEXT) RETURNS tsquery
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $fn$
+            SELECT to_tsquery('simple'::regconfig, string_agg(word || ':*', ' & '))
+            FROM regexp_split_to_table(regexp_replace(search_normalize(value), '[^[:alnum:]]+', ' ', 'g'), ' ') AS word
+            WHERE word <> ''
+        $fn$;
+
+        -- תבנית LIKE לתת-מחרוזת, עם escape לתווים המיוחדים
+        CREATE OR REPLACE FUNCTION search_pattern(value TEXT) RETURNS TEXT
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $fn$
+            SELECT '%' || regexp_replace(search_normalize(value), '([\\%_])', '\\\1', 'g') || '%'
+        $fn$;
+
+        -- הטקסט המנורמל והווקטור של כל פריט נשמרים בטבלה נפרדת, כך שהנרמול רץ
+        -- רק כשפריט משתנה ולא על כל פריט שמדורג בחיפוש. הטריגר מעדכן אותה
+        -- באותה טרנזקציה של השינוי, כמו item_stock
+        CREATE TABLE IF NOT EXISTS item_search (
+            item_id INTEGER PRIMARY KEY REFERENCES items(id) ON DELETE CASCADE,
+            document TEXT NOT NULL,
+            vector TSVECTOR NOT NULL
+        );
+
+        CREATE OR REPLACE FUNCTION items_search_document() RETURNS TRIGGER AS $$
+        BEGIN
+            INSERT INTO item_search (item_id, document, vector)
+            VALUES (NEW.id,
+                    item_search_document(NEW.name, NEW.category, NEW.notes),
+                    item_search_vector(NEW.name, NEW.category, NEW.notes))
+            ON CONFLICT (item_id) DO UPDATE
+            SET document = EXCLUDED.document,
+                vector = EXCLUDED.vector;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS items_search_document ON items;
+        CREATE TRIGGER items_search_document
+            AFTER INSERT OR UPDATE OF name, category, notes ON items
+            FOR EACH ROW EXECUTE FUNCTION items_search_document();
+
+        -- מילוי ראשוני מהפריטים הקיימים
+        INSERT INTO item_search (item_id, document, vector)
+        SELECT id, item_search_document(name, category, notes), item_search_vector(name, category, notes)
+        FROM items
+        ON CONFLICT (item_id) DO UPDATE
+        SET document = EXCLUDED.document,
+            vector = EXCLUDED.vector;
+
+        -- חיפוש מילים (גם התחלות מילים) - בלי תלות בהרחבות
+        CREATE INDEX IF NOT EXISTS idx_item_search_vector
+            ON item_search USING gin (vector);
+
+        -- חיפוש תת-מחרוזות ושגיאות הקלדה, כשההרחבה pg_trgm זמינה
+        DO $$
+        BEGIN
+            BEGIN
+                CREATE EXTENSION IF NOT EXISTS pg_trgm;
+            EXCEPTION WHEN OTHERS THEN
+                RAISE NOTICE 'pg_trgm is not available: %', SQLERRM;
+            END;
+
+            IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm') THEN
+                CREATE INDEX IF NOT EXISTS idx_item_search_trgm
+                    ON item_search USING gin (document gin_trgm_ops);
+            END IF;
+        END
+        $$;
+    """),
+    (13, 'commit_time_data_versions', """
+        -- גרסאות בלי מונה משותף שננעל באמצע הטרנזקציה (מחליף את מנגנון
+        -- מיגרציה 6, שבו כל כתיבה לפריטים או להשאלות נעלה את שורת המונה
+        -- 'inventory' עד סוף הטרנזקציה - כל הכותבים רצו בזה אחר זה, והנעילה
+        -- נלקחה בסדר שונה מנעילות הפריטים):
+        -- - שורות מסומנות במזהה הטרנזקציה (pg_current_xact_id), בלי נעילה.
+        --   לקוח מצטבר מקבל כגרסה את ה-xmin של תמונת המצב - כל טרנזקציה
+        --   עם מזהה נמוך ממנו כבר הסתיימה - ובבקשה הבאה מקבל את השורות
+        --   שהגרסה שלהן אינה נמוכה ממנו (get_inventory.py)
+        -- - מוני data_versions (למטמוני snapshot_cache) מקודמים רק בזמן
+        --   ה-COMMIT, בטריגר דחוי ולפי סדר שמות קבוע. הבקשה לקידום נרשמת
+        --   בטרנזקציה (request_data_version, או שורה ב-data_version_requests
+        --   מ-bump_data_version בפייתון) בלי לגעת בשורת המונה
+        CREATE OR REPLACE FUNCTION inventory_txn_version() RETURNS BIGINT AS $$
+            SELECT pg_current_xact_id()::TEXT::BIGINT
+        $$ LANGUAGE sql VOLATILE;
+
+        CREATE OR REPLACE FUNCTION request_data_version(version_name TEXT) RETURNS VOID AS $$
+        DECLARE
+            pending TEXT := COALESCE(current_setting('data_versions.pending', true), '');
+        BEGIN
+            IF position(',' || version_name || ',' IN pending) = 0 THEN
+                PERFORM set_config('data_versions.pending',
+                                   COALESCE(NULLIF(pending, ''), ',') || version_name || ',', true);
+            END IF;
+        END
+        $$ LANGUAGE plpgsql;
+
+        CREATE TABLE IF NOT EXISTS data_version_requests (
+            name TEXT NOT NULL,
+            xid XID8 NOT NULL DEFAULT pg_current_xact_id()
+        );
+
+        -- רץ בזמן ה-COMMIT לכל שורה ששונתה; רק הקריאה הראשונה בטרנזקציה
+        -- מקדמת את המונים, כי עד אז כל הבקשות כבר נרשמו
+        CREATE OR REPLACE FUNCTION flush_data_versions() RETURNS TRIGGER AS $$
+        DECLARE
+            names TEXT[];
+        BEGIN
+            IF current_setting('data_versions.flushed', true) = 'true' THEN
+                RETURN NULL;
+            END IF;
+            PERFORM set_config('data_versions.flushed', 'true', true);
+
+            WITH requested AS (
+                DELETE FROM data_version_requests
+                WHERE xid = pg_current_xact_id()
+                RETURNING name
+            )
+            SELECT array_agg(DISTINCT name ORDER BY name) INTO names
+            FROM (
+                SELECT name FROM requested
+                UNION ALL
+                SELECT unnest(string_to_array(
+                    trim(BOTH ',' FROM COALESCE(current_setting('data_versions.pending', true), '')), ','))
+            ) n
+            WHERE name <> '';
+
+            IF names IS NOT NULL THEN
+                INSERT INTO data_versions (name, version, updated_at)
+                SELECT name, 1, CURRENT_TIMESTAMP FROM unnest(names) AS name
+                ORDER BY name
+                ON CONFLICT (name) DO UPDATE
+                SET version = data_versions.version + 1,
+                    updated_at = CURRENT_TIMESTAMP;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+
+        CREATE OR REPLACE FUNCTION stamp_row_version() RETURNS TRIGGER AS $$
+        BEGIN
+            NEW.row_version := inventory_txn_version();
+            NEW.updated_at := CURRENT_TIMESTAMP;
+            PERFORM request_data_version('inventory');
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql;
+
+        CREATE OR REPLACE FUNCTION record_item_tombstone() RETURNS TRIGGER AS $$
+        BEGIN
+            INSERT INTO inventory_tombstones (item_id, row_version)
+            VALUES (OLD.id, inventory_txn_version())
+            ON CONFLICT (item_id) DO UPDATE
+            SET row_version = EXCLUDED.row_version,
+                deleted_at = CURRENT_TIMESTAMP;
+            PERFORM request_data_version('inventory');
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS items_flush_data_versions ON items;
+        CREATE CONSTRAINT TRIGGER items_flush_data_versions
+            AFTER INSERT OR UPDATE OR DELETE ON items
+            DEFERRABLE INITIALLY DEFERRED
+            FOR EACH ROW EXECUTE FUNCTION flush_data_versions();
+
+        DROP TRIGGER IF EXISTS loans_flush_data_versions ON loans;
+        CREATE CONSTRAINT TRIGGER loans_flush_data_versions
+            AFTER INSERT OR UPDATE OR DELETE ON loans
+            DEFERRABLE INITIALLY DEFERRED
+            FOR EACH ROW EXECUTE FUNCTION flush_data_versions();
+
+        DROP TRIGGER IF EXISTS data_version_requests_flush ON data_version_requests;
+        CREATE CONSTRAINT TRIGGER data_version_requests_flush
+            AFTER INSERT ON data_version_requests
+            DEFERRABLE INITIALLY DEFERRED
+            FOR EACH ROW EXECUTE FUNCTION flush_data_versions();
+
+        -- גרסאות מהמונה הישן שגבוהות ממזהה הטרנזקציה הנוכחי (למשל במסד
+        -- ששוחזר) היו מסתירות שינויים חדשים; הטריגר מסמן אותן מחדש
+        UPDATE items SET row_version = 0 WHERE row_version > inventory_txn_version();
+        UPDATE loans SET row_version = 0 WHERE row_version > inventory_txn_version();
+        UPDATE inventory_tombstones SET row_version = inventory_txn_version()
+        WHERE row_version > inventory_txn_version();
+    """),
+    (14, 'maintenance_schedules_table', """
+        -- מיגרציה 3 נרשמה כמורצת גם כשטבלת התזכורות לא הייתה קיימת, ואף
+        -- קוד לא יוצר אותה (maintenance.py רק כותב אליה). הטבלה נוצרת כאן,
+        -- עם העמודות ש-maintenance.py משתמש בהן, ואחריה האינדקס של מיגרציה 3
+        CREATE TABLE IF NOT EXISTS maintenance_schedules (
+            id SERIAL PRIMARY KEY,
+            item_id INTEGER NOT NULL REFERENCES items(id) ON DELETE CASCADE,
+            maintenance_type TEXT NOT NULL,
+            frequency_days INTEGER,
+            last_performed DATE,
+            next_due DATE NOT NULL,
+            description TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            created_by INTEGER
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_maintenance_schedules_item
+            ON maintenance_schedules (item_id, maintenance_type);
+
+        CREATE INDEX IF NOT EXISTS idx_maintenance_schedules_next_due
+            ON maintenance_schedules (next_due);
+    """),
+    (15, 'maintenance_records_item_stock', """
+        -- מיגרציה 7 מתקינה את הטריגר של in_maintenance_quantity רק אם טבלת
+        -- רשומות התחזוקה קיימת, ואף קוד לא יוצר אותה (maintenance.py רק כותב
+        -- אליה). הטבלה נוצרת כאן, הטריגר מותקן, והמונה מחושב מחדש מהרשומות
+        -- הפתוחות. CREATE TRIGGER נועל את הטבלה לכתיבה עד סוף המיגרציה, כך
+        -- שאף רשומה לא מתווספת בין ההתקנה לחישוב
+        CREATE TABLE IF NOT EXISTS maintenance_records (
+            id SERIAL PRIMARY KEY,
+            item_id INTEGER NOT NULL REFERENCES items(id) ON DELETE CASCADE,
+            maintenance_type TEXT NOT NULL,
+            description TEXT,
+            start_date DATE NOT NULL DEFAULT CURRENT_DATE,
+            end_date DATE,
+            performed_by TEXT,
+            cost NUMERIC DEFAULT 0,
+            receipt_url TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            created_by INTEGER,
+            notes TEXT
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_maintenance_records_item
+            ON maintenance_records (item_id, start_date);
+
+        DROP TRIGGER IF EXISTS maintenance_item_stock ON maintenance_records;
+        CREATE TRIGGER maintenance_item_stock
+            AFTER INSERT OR DELETE OR UPDATE OF item_id, end_date ON maintenance_records
+            FOR EACH ROW EXECUTE FUNCTION maintenance_item_stock();
+
+        UPDATE item_stock s
+        SET in_maintenance_quantity = COALESCE(m.open_count, 0)
+        FROM items i
+        LEFT JOIN (
+            SELECT item_id, COUNT(*) AS open_count
+            FROM maintenance_records WHERE end_date IS NULL
+            GROUP BY item_id
+        ) m ON m.item_id = i.id
+        WHERE s.item_id = i.id
+          AND s.in_maintenance_quantity <> COALESCE(m.open_count, 0);
+    """),
+]
+
+
+def ensure_migrations_table(cur):
+    """יוצר את טבלת המעקב אחרי מיגרציות אם אינה קיימת"""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def get_applied_versions(cur):
+    """מחזיר את קבוצת הגרסאות שכבר הורצו"""
+    cur.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cur.fetchall()}
+
+
+def run_migrations(conn=None, target=None):
+    """
+    מריץ את כל המיגרציות שטרם הורצו, עד לגרסה target (כולל) אם הוגדרה.
+    מחזיר את רשימת הגרסאות שהורצו בקריאה זו.
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db_connection()
+
+    applied_now = []
+    try:
+        conn.autocommit = False
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATIONS_LOCK_ID,))
+            try:
+                ensure_migrations_table(cur)
+                conn.commit()
+                applied = get_applied_versions(cur)
+                conn.commit()
+
+                for version, name, sql in sorted(MIGRATIONS):
+                    if target is not None and version > target:
+                        break
+                    if version in applied:
+                        continue
+                    try:
+                        del conn.notices[:]
+                        cur.execute(sql)
+                        # אזהרות של המיגרציה (למשל דוח כפילויות) נרשמות ביומן
+                        for notice in conn.notices:
+                            if notice.startswith('WARNING'):
+                                print(notice.rstrip(), file=sys.stderr)
+                        cur.execute(
+                            "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                            (version, name)
+                        )
+                        conn.commit()
+                    except Exception:
+                        conn.rollback()
+                        raise
+                    applied_now.append(version)
+                    print(f"Applied migration {version:04d}_{name}", file=sys.stderr)
+            finally:
+                cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATIONS_LOCK_ID,))
+                conn.commit()
+    finally:
+        if own_conn:
+            conn.close()
+
+    return applied_now
+
+
+def migration_status(conn=None):
+    """מחזיר רשימה של (גרסה, שם, האם הורצה)"""
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            ensure_migrations_table(cur)
+            applied = get_applied_versions(cur)
+        conn.commit()
+    finally:
+        if own_conn:
+            conn.close()
+    return [(version, name, version in applied) for version, name, _ in sorted(MIGRATIONS)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ניהול מיגרציות של מסד הנתונים")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('status', help="הצגת מצב המיגרציות")
+    migrate_parser = subparsers.add_parser('migrate', help="הרצת מיגרציות שטרם הורצו")
+    migrate_parser.add_argument('--target', type=int, default=None,
+                                help="הרצה עד לגרסה זו (כולל)")
+    subparsers.add_parser('init', help="יצירת הטבלאות הבסיסיות והרצת כל המיגרציות")
+    args = parser.parse_args()
+
+    if args.command == 'status':
+        for version, name, is_applied in migration_status():
+            mark = 'applied' if is_applied else 'pending'
+            print(f"{version:04d}_{name}: {mark}")
+    elif args.command == 'migrate':
+        applied = run_migrations(target=args.target)
+        if applied:
+            print(f"Applied {len(applied)} migration(s): {', '.join(str(v) for v in applied)}")
+        else:
+            print("Database is up to date")
+    elif args.command == 'init':
+        from database import init_db
+        init_db()
+        print("Database is ready")
+
+
+if __name__ == "__main__":
+    main()
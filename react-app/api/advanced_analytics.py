@@ -1,16 +1,18 @@
 """
 מודול לניתוח נתונים מתקדם, מגמות שימוש והמלצות רכש חכמות.
 כולל פונקציות לחיזוי ביקוש, ניתוח מגמות והמלצות רכש אוטומטיות.
+
+הנתונים נקראים מהסיכום החודשי loan_stats_monthly (loan_stats.py) ולא
+מסריקה של טבלת loans, כך שעלות הדו"חות תלויה במספר החודשים והפריטים.
+לפני שמיגרציה 9 הורצה אותן שורות מחושבות מטבלת loans (rollup_available).
 """
 
 import os
 import sys
 import json
 import datetime
-import time
-import pytz
-import pandas as pd
-import numpy as np
+import hashlib
+from psycopg2.extras import Json
 
 # הוספת תיקיית השורש לpath כדי לאפשר import של מודולים אחרים
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -18,7 +20,12 @@ parent_dir = os.path.dirname(os.path.dirname(current_dir))
 sys.path.append(parent_dir)
 
 # חיבור למסד הנתונים
+# numpy ומנוע החיזוי (demand_forecast) מיובאים בתוך הפונקציות שמשתמשות בהם,
+# כדי שסקריפטים שמייבאים את המודול לדו"חות אחרים לא ישלמו על טעינתם
 import database
+from item_stock import stock_source
+from loan_stats import (month_start, period_params, period_stats_sql, period_students_sql,
+                        rollup_available, stats_source)
 from utils import get_israel_time
 
 def get_db_connection():
@@ -36,35 +43,35 @@ def analyze_usage_trends(params=None):
     months_back = int(params.get('months_back', 12))
     conn = get_db_connection()
     cur = conn.cursor()
+    rollup = rollup_available(cur)
     
     # תאריך לפני X חודשים
     cutoff_date = get_israel_time() - datetime.timedelta(days=30 * months_back)
     cutoff_date_str = cutoff_date.strftime('%Y-%m-%d')
     
+    period = period_params(cutoff_date_str)
+    
     # ניתוח לפי קטגוריה
-    cur.execute("""
-        SELECT i.category, COUNT(l.id) as loan_count
-        FROM loans l
-        JOIN items i ON l.item_id = i.id
-        WHERE l.loan_date >= %s
-        GROUP BY i.category
+    cur.execute(f"""
+        SELECT p.category, SUM(p.loan_count) as loan_count
+        FROM ({period_stats_sql(rollup=rollup)}) p
+        GROUP BY p.category
         ORDER BY loan_count DESC
-    """, (cutoff_date_str,))
+    """, period)
     
     usage_by_category = {}
     for row in cur.fetchall():
         usage_by_category[row[0]] = row[1]
     
     # פריטים פופולריים ביותר
-    cur.execute("""
-        SELECT i.id, i.name, i.category, COUNT(l.id) as loan_count
-        FROM loans l
-        JOIN items i ON l.item_id = i.id
-        WHERE l.loan_date >= %s
+    cur.execute(f"""
+        SELECT i.id, i.name, i.category, SUM(p.loan_count) as loan_count
+        FROM ({period_stats_sql(rollup=rollup)}) p
+        JOIN items i ON p.item_id = i.id
         GROUP BY i.id, i.name, i.category
         ORDER BY loan_count DESC
         LIMIT 10
-    """, (cutoff_date_str,))
+    """, period)
     
     most_popular_items = []
     for row in cur.fetchall():
@@ -76,16 +83,15 @@ def analyze_usage_trends(params=None):
         })
     
     # פריטים פחות פופולריים
-    cur.execute("""
-        SELECT i.id, i.name, i.category, COUNT(l.id) as loan_count
-        FROM loans l
-        JOIN items i ON l.item_id = i.id
-        WHERE l.loan_date >= %s
+    cur.execute(f"""
+        SELECT i.id, i.name, i.category, SUM(p.loan_count) as loan_count
+        FROM ({period_stats_sql(rollup=rollup)}) p
+        JOIN items i ON p.item_id = i.id
         GROUP BY i.id, i.name, i.category
-        HAVING COUNT(l.id) > 0
+        HAVING SUM(p.loan_count) > 0
         ORDER BY loan_count ASC
         LIMIT 10
-    """, (cutoff_date_str,))
+    """, period)
     
     least_popular_items = []
     for row in cur.fetchall():
@@ -102,15 +108,22 @@ def analyze_usage_trends(params=None):
     mid_cutoff_date = get_israel_time() - datetime.timedelta(days=30 * half_period)
     mid_cutoff_date_str = mid_cutoff_date.strftime('%Y-%m-%d')
     
-    cur.execute("""
-        SELECT i.category,
-            SUM(CASE WHEN l.loan_date < %s THEN 1 ELSE 0 END) as early_period,
-            SUM(CASE WHEN l.loan_date >= %s THEN 1 ELSE 0 END) as later_period
-        FROM loans l
-        JOIN items i ON l.item_id = i.id
-        WHERE l.loan_date >= %s
-        GROUP BY i.category
-    """, (mid_cutoff_date_str, mid_cutoff_date_str, cutoff_date_str))
+    # תקופה מוקדמת: מה-cutoff ועד לפני ה-mid_cutoff; מאוחרת: מה-mid_cutoff והלאה
+    early_end = datetime.datetime.fromisoformat(mid_cutoff_date_str) - datetime.timedelta(microseconds=1)
+    cur.execute(f"""
+        SELECT COALESCE(e.category, l.category),
+            COALESCE(e.loan_count, 0) as early_period,
+            COALESCE(l.loan_count, 0) as later_period
+        FROM (
+            SELECT p.category, SUM(p.loan_count) as loan_count
+            FROM ({period_stats_sql('early', rollup)}) p GROUP BY p.category
+        ) e
+        FULL OUTER JOIN (
+            SELECT p.category, SUM(p.loan_count) as loan_count
+            FROM ({period_stats_sql('later', rollup)}) p GROUP BY p.category
+        ) l ON l.category = e.category
+    """, {**period_params(cutoff_date_str, early_end, 'early'),
+          **period_params(mid_cutoff_date_str, name='later')})
     
     trend_by_category = {}
     for row in cur.fetchall():
@@ -138,321 +151,298 @@ def analyze_usage_trends(params=None):
     
     return result
 
+# ברירת המחדל של אורך ההיסטוריה לחיזוי, בחודשים
+DEFAULT_HISTORY_MONTHS = 24
+
+# סף זמינות (באחוזים) לכל קטגוריה, שמתחתיו ממליצים על רכש
+DEFAULT_THRESHOLD_PERCENTS = {
+    'מצלמה': 50,  # צריך לפחות 50% זמינות בקטגוריה זו
+    'תאורה': 30,
+    'סאונד': 40,
+    'עדשות': 25,
+    'default': 20  # ברירת מחדל לשאר הקטגוריות
+}
+
+# המלצות הרכש נשמרות ב-snapshot_cache לפי גרסת 'inventory' (מתקדמת בכל
+# שינוי בפריטים או בהשאלות), ובכל מקרה מחושבות מחדש אחרי TTL שניות. כל
+# כתיבה מוחקת את השורות שפג תוקפן
+RECOMMENDATIONS_SNAPSHOT = 'purchase_recommendations'
+RECOMMENDATIONS_TTL = int(os.getenv('PURCHASE_RECOMMENDATIONS_TTL', '3600'))
+
+
+def load_demand_snapshot(cur, history_months):
+    """
+    תמונת מצב משותפת לחיזוי ולהמלצות הרכש, בשתי שאילתות: הפריטים עם
+    המלאי שלהם (item_stock) כמערכים, ומטריצת ההשאלות פריטים x חודשים מהסיכום
+    החודשי. ההיסטוריה מסתיימת בחודש המלא האחרון; החודש הנוכחי הוא הראשון בחיזוי
+    """
+    import numpy as np
+    from demand_forecast import add_months, build_demand_matrix
+
+    current_month = month_start(get_israel_time())
+    months = [add_months(current_month, offset).date() for offset in range(-history_months, 0)]
+    
+    cur.execute(f"""
+        SELECT i.id, i.name, i.category, COALESCE(i.quantity, 0),
+               COALESCE(s.loaned_quantity, 0), COALESCE(i.price_per_unit, 0)
+        FROM items i
+        LEFT JOIN {stock_source(cur)} s ON s.item_id = i.id
+        ORDER BY i.id
+    """)
+    items = cur.fetchall()
+    columns = list(zip(*items)) if items else [()] * 6
+    
+    cur.execute(f"""
+        SELECT item_id, month, SUM(loan_count)
+        FROM {stats_source(rollup_available(cur))} s
+        WHERE month >= %s AND month < %s
+        GROUP BY item_id, month
+    """, (months[0], current_month))
+    
+    return {
+        'current_month': current_month,
+        'ids': list(columns[0]),
+        'names': list(columns[1]),
+        'categories': list(columns[2]),
+        'quantity': np.array(columns[3], dtype=float),
+        'loaned': np.array(columns[4], dtype=float),
+        'price': np.array(columns[5], dtype=float),
+        'history': build_demand_matrix(cur.fetchall(), columns[0], months)
+    }
+
+
+def forecast_rows(history, months_ahead):
+    """
+    חיזוי לכל השורות של מטריצת היסטוריה. מחזיר (forecast, eligible,
+    recent_avg, trend_factor); eligible מסמן שורות עם לפחות
+    MIN_HISTORY_MONTHS חודשי היסטוריה
+    """
+    import numpy as np
+    from demand_forecast import MIN_HISTORY_MONTHS, PHI, forecast_demand
+
+    forecast = forecast_demand(history, months_ahead)
+    eligible = forecast.history_months >= MIN_HISTORY_MONTHS
+    recent_avg = history[:, -3:].mean(axis=1)
+    # היחס בין החיזוי לחודש הבא לרמה הנוכחית, במקום מקדם המגמה הקודם
+    trend_factor = np.divide(forecast.level + forecast.trend * PHI, forecast.level,
+                             out=np.ones(len(history)), where=forecast.level > 0)
+    return forecast, eligible, recent_avg, trend_factor
+
+
 def predict_future_demand(params=None):
     """
-    חיזוי ביקוש עתידי לפריטים בהתבסס על נתוני העבר
-    מודל פשוט מבוסס על ממוצע נע ומגמות
+    חיזוי ביקוש עתידי לפריטים ולקטגוריות בהתבסס על נתוני העבר.
+    ההיסטוריה של כל הפריטים נפרסת למטריצה פריטים x חודשים והחיזוי מחושב
+    לכולם יחד (demand_forecast.py), כולל רווח סמך לכל חודש
     """
+    import numpy as np
+    from demand_forecast import MIN_HISTORY_MONTHS, add_months, group_rows
+
     if params is None:
         params = {}
     
     months_ahead = int(params.get('months_ahead', 3))
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    # ניתוח היסטוריה של 12 חודשים אחורה
-    twelve_months_ago = get_israel_time() - datetime.timedelta(days=365)
-    twelve_months_ago_str = twelve_months_ago.strftime('%Y-%m-%d')
-    
-    # ניתוח לפי חודשים
-    cur.execute("""
-        SELECT 
-            i.id, 
-            i.name, 
-            i.category,
-            date_trunc('month', l.loan_date) as month,
-            COUNT(l.id) as loan_count
-        FROM loans l
-        JOIN items i ON l.item_id = i.id
-        WHERE l.loan_date >= %s
-        GROUP BY i.id, i.name, i.category, date_trunc('month', l.loan_date)
-        ORDER BY i.id, month
-    """, (twelve_months_ago_str,))
-    
-    # עיבוד הנתונים לפי פריט
-    monthly_data = {}
-    for row in cur.fetchall():
-        item_id, item_name, category, month, count = row
-        if item_id not in monthly_data:
-            monthly_data[item_id] = {
-                'id': item_id,
-                'name': item_name,
-                'category': category,
-                'months': {}
+    history_months = max(int(params.get('history_months', DEFAULT_HISTORY_MONTHS)), MIN_HISTORY_MONTHS)
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            snapshot = load_demand_snapshot(cur, history_months)
+    
+    future_months = [add_months(snapshot['current_month'], offset).strftime('%Y-%m')
+                     for offset in range(months_ahead)]
+    
+    def predictions_list(forecast, row):
+        return [
+            {
+                'month': month,
+                'predicted_count': round(float(forecast.predictions[row, step]), 1),
+                'lower': round(float(forecast.lower[row, step]), 1),
+                'upper': round(float(forecast.upper[row, step]), 1)
             }
-        month_str = month.strftime('%Y-%m')
-        monthly_data[item_id]['months'][month_str] = count
-    
-    # חיזוי ביקוש עתידי בהתבסס על מגמות עבר
-    predicted_demand = []
-    for item_id, data in monthly_data.items():
-        if len(data['months']) < 3:  # צריך לפחות 3 חודשים למגמה משמעותית
-            continue
-        
-        # המרה לרשימה מסודרת לפי תאריך
-        months_list = sorted(data['months'].keys())
-        counts_list = [data['months'][m] for m in months_list]
-        
-        # חישוב מקדם מגמה פשוט
-        if len(counts_list) >= 6:
-            # השוואה בין ממוצע 3 חודשים אחרונים ל-3 חודשים שלפניהם
-            recent_avg = sum(counts_list[-3:]) / 3
-            previous_avg = sum(counts_list[-6:-3]) / 3
-            
-            if previous_avg > 0:
-                trend_factor = recent_avg / previous_avg
-            else:
-                trend_factor = 1.0 if recent_avg == 0 else 1.5
-        else:
-            # שימוש במקדם מגמה בסיסי
-            trend_factor = 1.1
-        
-        # חיזוי לפי ממוצע תקופה אחרונה + מקדם מגמה
-        recent_avg = sum(counts_list[-3:]) / 3 if len(counts_list) >= 3 else sum(counts_list) / len(counts_list)
-        
-        # חיזוי לתקופה עתידית
-        predictions = []
-        for i in range(1, months_ahead + 1):
-            predicted_count = recent_avg * (trend_factor ** i)
-            
-            # חישוב תאריך עתידי
-            last_date = datetime.datetime.strptime(months_list[-1], '%Y-%m')
-            future_date = last_date + datetime.timedelta(days=30 * i)
-            future_month = future_date.strftime('%Y-%m')
-            
-            predictions.append({
-                'month': future_month,
-                'predicted_count': round(predicted_count, 1)
-            })
-        
-        predicted_demand.append({
-            'id': data['id'],
-            'name': data['name'],
-            'category': data['category'],
-            'current_avg_monthly': round(recent_avg, 1),
-            'trend_factor': round(trend_factor, 2),
-            'predictions': predictions
-        })
-    
-    # חיזוי לפי קטגוריות
-    cur.execute("""
-        SELECT 
-            i.category,
-            date_trunc('month', l.loan_date) as month,
-            COUNT(l.id) as loan_count
-        FROM loans l
-        JOIN items i ON l.item_id = i.id
-        WHERE l.loan_date >= %s
-        GROUP BY i.category, date_trunc('month', l.loan_date)
-        ORDER BY i.category, month
-    """, (twelve_months_ago_str,))
-    
-    # עיבוד הנתונים לפי קטגוריה
-    monthly_cat_data = {}
-    for row in cur.fetchall():
-        category, month, count = row
-        if category not in monthly_cat_data:
-            monthly_cat_data[category] = {'months': {}}
-        month_str = month.strftime('%Y-%m')
-        monthly_cat_data[category]['months'][month_str] = count
+            for step, month in enumerate(future_months)
+        ]
+    
+    # חיזוי לפי פריטים
+    forecast, eligible, recent_avg, trend_factor = forecast_rows(snapshot['history'], months_ahead)
+    predicted_demand = [
+        {
+            'id': snapshot['ids'][row],
+            'name': snapshot['names'][row],
+            'category': snapshot['categories'][row],
+            'current_avg_monthly': round(float(recent_avg[row]), 1),
+            'trend_factor': round(float(trend_factor[row]), 2),
+            'predictions': predictions_list(forecast, row)
+        }
+        for row in np.flatnonzero(eligible)
+    ]
     
-    # חיזוי לפי קטגוריה
+    # חיזוי לפי קטגוריות - סכום שורות הפריטים בכל קטגוריה
+    categories, category_history = group_rows(snapshot['history'], snapshot['categories'])
+    forecast, eligible, recent_avg, trend_factor = forecast_rows(category_history, months_ahead)
     predicted_categories = {}
-    for category, data in monthly_cat_data.items():
-        if len(data['months']) < 3:  # צריך לפחות 3 חודשים למגמה משמעותית
-            continue
-        
-        # המרה לרשימה מסודרת לפי תאריך
-        months_list = sorted(data['months'].keys())
-        counts_list = [data['months'][m] for m in months_list]
-        
-        # חישוב מקדם מגמה פשוט
-        if len(counts_list) >= 6:
-            # השוואה בין ממוצע 3 חודשים אחרונים ל-3 חודשים שלפניהם
-            recent_avg = sum(counts_list[-3:]) / 3
-            previous_avg = sum(counts_list[-6:-3]) / 3
-            
-            if previous_avg > 0:
-                trend_factor = recent_avg / previous_avg
-            else:
-                trend_factor = 1.0 if recent_avg == 0 else 1.5
-        else:
-            # שימוש במקדם מגמה בסיסי
-            trend_factor = 1.1
-        
-        # חיזוי לפי ממוצע תקופה אחרונה + מקדם מגמה
-        recent_avg = sum(counts_list[-3:]) / 3 if len(counts_list) >= 3 else sum(counts_list) / len(counts_list)
-        
-        # חיזוי לתקופה עתידית
-        predictions = []
-        for i in range(1, months_ahead + 1):
-            predicted_count = recent_avg * (trend_factor ** i)
-            
-            # חישוב תאריך עתידי
-            last_date = datetime.datetime.strptime(months_list[-1], '%Y-%m')
-            future_date = last_date + datetime.timedelta(days=30 * i)
-            future_month = future_date.strftime('%Y-%m')
-            
-            predictions.append({
-                'month': future_month,
-                'predicted_count': round(predicted_count, 1),
-                'current_avg_monthly': round(recent_avg, 1),
-                'trend_factor': round(trend_factor, 2)
-            })
-        
-        predicted_categories[category] = predictions
-    
-    conn.close()
+    for row in np.flatnonzero(eligible):
+        predicted_categories[categories[row]] = [
+            dict(prediction,
+                 current_avg_monthly=round(float(recent_avg[row]), 1),
+                 trend_factor=round(float(trend_factor[row]), 2))
+            for prediction in predictions_list(forecast, row)
+        ]
     
     result = {
         'predicted_demand': predicted_demand,
         'predicted_categories': predicted_categories,
         'time_period': {
-            'months_ahead': months_ahead
+            'months_ahead': months_ahead,
+            'history_months': history_months
         }
     }
     
     return result
 
-def generate_purchase_recommendations(params=None):
+def compute_purchase_recommendations(snapshot, threshold_percents, months_ahead):
     """
-    יצירת המלצות לרכש פריטים חדשים בהתבסס על:
-    1. ביקוש צפוי
-    2. זמינות נוכחית
-    3. היסטוריית מחירים
+    מחשב את המלצות הרכש מתמונת המצב כפעולות על מערכים: זמינות וניצולת לכל
+    פריט, הביקוש המקסימלי הצפוי באופק, המחסור (ביקוש צפוי פחות זמין) והכמות
+    המומלצת לרכישה
     """
-    if params is None:
-        params = {}
-    
-    # המלצות מותאמות פר קטגוריה
-    threshold_percents = params.get('threshold_percents', {
-        'מצלמה': 50,  # צריך לפחות 50% זמינות בקטגוריה זו
-        'תאורה': 30,
-        'סאונד': 40,
-        'עדשות': 25,
-        'default': 20  # ברירת מחדל לשאר הקטגוריות
-    })
-    
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    # ביקוש עתידי
-    future_demand = predict_future_demand(params)
-    predicted_items = {item['id']: item for item in future_demand['predicted_demand']}
-    
-    # בדיקת מצב נוכחי של המלאי
-    cur.execute("""
-        SELECT 
-            id, name, category, quantity, 
-            (quantity - COALESCE((
-                SELECT SUM(l.quantity) 
-                FROM loans l 
-                WHERE l.item_id = items.id AND l.return_date IS NULL
-            ), 0)) as available_quantity,
-            price_per_unit
-        FROM items
-    """)
-    
-    inventory_status = {}
-    for row in cur.fetchall():
-        item_id, name, category, total_qty, available_qty, price = row
-        inventory_status[item_id] = {
-            'id': item_id,
-            'name': name,
-            'category': category,
-            'total_quantity': total_qty,
-            'available_quantity': available_qty,
-            'price_per_unit': price if price is not None else 0
-        }
-    
-    # המלצות רכש
+    import numpy as np
+
+    quantity, loaned, price = snapshot['quantity'], snapshot['loaned'], snapshot['price']
+    categories = snapshot['categories']
+    available = quantity - loaned
+    
+    # אחוז זמינות וניצולת; פריט בלי כמות נחשב 0% זמין
+    has_quantity = quantity > 0
+    availability_percent = np.divide(available * 100, quantity, out=np.zeros(len(quantity)), where=has_quantity)
+    utilization_percent = np.divide(loaned * 100, quantity, out=np.zeros(len(quantity)), where=has_quantity)
+    threshold = np.array([threshold_percents.get(category, threshold_percents['default'])
+                          for category in categories], dtype=float)
+    
+    forecast, has_forecast, _, _ = forecast_rows(snapshot['history'], months_ahead)
+    predicted_max = np.round(forecast.predictions, 1).max(axis=1) if months_ahead else np.zeros(len(quantity))
+    shortfall = predicted_max - available
+    
+    below_threshold = availability_percent < threshold
+    critical = availability_percent < threshold / 2
+    # עם חיזוי: להשלים את המחסור הצפוי; בלי חיזוי רק במצב קריטי: להשלים את המושאל
+    with_forecast = below_threshold & has_forecast
+    without_forecast = critical & ~has_forecast
+    recommended = np.where(with_forecast,
+                           np.maximum(1, np.trunc(shortfall)),
+                           np.maximum(1, quantity - available))
+    total_cost = np.round(recommended * price, 2)
+    high_urgency = with_forecast & critical
+    
+    selected = np.flatnonzero(with_forecast | without_forecast)
     recommendations = []
-    
-    for item_id, status in inventory_status.items():
-        # קביעת סף התראה לפי קטגוריה
-        category = status['category']
-        threshold_percent = threshold_percents.get(category, threshold_percents['default'])
-        
-        # חישוב אחוז זמינות נוכחי
-        if status['total_quantity'] > 0:
-            availability_percent = (status['available_quantity'] / status['total_quantity']) * 100
-        else:
-            availability_percent = 0
-        
-        # בדיקה האם זמינות נמוכה מהסף
-        if availability_percent < threshold_percent:
-            # בדיקה אם יש חיזוי ביקוש עתידי
-            future_status = predicted_items.get(item_id)
-            
-            if future_status:
-                # חישוב כמות מומלצת לרכישה
-                predicted_max = max([p['predicted_count'] for p in future_status['predictions']])
-                recommended_quantity = max(1, int(predicted_max - status['available_quantity']))
-                
-                if recommended_quantity > 0:
-                    recommendations.append({
-                        'id': item_id,
-                        'name': status['name'],
-                        'category': status['category'],
-                        'current_quantity': status['total_quantity'],
-                        'available_quantity': status['available_quantity'],
-                        'availability_percent': round(availability_percent, 1),
-                        'predicted_demand': round(predicted_max, 1),
-                        'recommended_quantity': recommended_quantity,
-                        'price_per_unit': status['price_per_unit'],
-                        'total_cost': round(recommended_quantity * status['price_per_unit'], 2),
-                        'urgency': 'high' if availability_percent < (threshold_percent / 2) else 'medium'
-                    })
-            else:
-                # אם אין חיזוי אבל זמינות נמוכה מאוד, עדיין ממליץ
-                if availability_percent < (threshold_percent / 2):
-                    recommendations.append({
-                        'id': item_id,
-                        'name': status['name'],
-                        'category': status['category'],
-                        'current_quantity': status['total_quantity'],
-                        'available_quantity': status['available_quantity'],
-                        'availability_percent': round(availability_percent, 1),
-                        'recommended_quantity': max(1, status['total_quantity'] - status['available_quantity']),
-                        'price_per_unit': status['price_per_unit'],
-                        'total_cost': round(max(1, status['total_quantity'] - status['available_quantity']) * status['price_per_unit'], 2),
-                        'urgency': 'medium'
-                    })
+    for row in selected:
+        recommendation = {
+            'id': snapshot['ids'][row],
+            'name': snapshot['names'][row],
+            'category': categories[row],
+            'current_quantity': int(quantity[row]),
+            'available_quantity': int(available[row]),
+            'availability_percent': round(float(availability_percent[row]), 1),
+            'utilization_percent': round(float(utilization_percent[row]), 1),
+            'recommended_quantity': int(recommended[row]),
+            'price_per_unit': float(price[row]),
+            'total_cost': float(total_cost[row]),
+            'urgency': 'high' if high_urgency[row] else 'medium'
+        }
+        if with_forecast[row]:
+            recommendation['predicted_demand'] = round(float(predicted_max[row]), 1)
+            recommendation['shortfall'] = round(float(shortfall[row]), 1)
+        recommendations.append(recommendation)
     
     # מיון לפי דחיפות וקטגוריה
     recommendations.sort(key=lambda x: (0 if x['urgency'] == 'high' else 1, x['category']))
     
-    # סיכום לפי קטגוריה
-    category_summary = []
-    category_totals = {}
-    
-    for rec in recommendations:
-        cat = rec['category']
-        if cat not in category_totals:
-            category_totals[cat] = {
-                'category': cat,
-                'item_count': 0,
-                'total_cost': 0,
-                'high_urgency_count': 0
-            }
-        
-        category_totals[cat]['item_count'] += 1
-        category_totals[cat]['total_cost'] += rec['total_cost']
-        if rec['urgency'] == 'high':
-            category_totals[cat]['high_urgency_count'] += 1
-    
-    for cat, summary in category_totals.items():
-        category_summary.append(summary)
+    # סיכום לפי קטגוריה, בסדר הופעת הקטגוריות בהמלצות הממוינות
+    order = list(dict.fromkeys(recommendation['category'] for recommendation in recommendations))
+    position = {category: index for index, category in enumerate(order)}
+    codes = np.array([position[categories[row]] for row in selected], dtype=int)
+    item_count = np.bincount(codes, minlength=len(order))
+    cost = np.bincount(codes, weights=total_cost[selected], minlength=len(order))
+    high_count = np.bincount(codes, weights=high_urgency[selected], minlength=len(order))
+    category_summary = [
+        {
+            'category': category,
+            'item_count': int(item_count[index]),
+            'total_cost': round(float(cost[index]), 2),
+            'high_urgency_count': int(high_count[index])
+        }
+        for index, category in enumerate(order)
+    ]
     
     # מיון לפי דחיפות (כמות פריטים דחופים)
     category_summary.sort(key=lambda x: x['high_urgency_count'], reverse=True)
     
-    conn.close()
-    
-    result = {
+    return {
         'recommendations': recommendations,
         'category_summary': category_summary
     }
+
+
+def generate_purchase_recommendations(params=None):
+    """
+    יצירת המלצות לרכש פריטים חדשים בהתבסס על:
+    1. ביקוש צפוי
+    2. זמינות נוכחית
+    3. היסטוריית מחירים
+    התוצאה נשמרת ב-snapshot_cache לפי גרסת המלאי, הפרמטרים והחודש הנוכחי
+    """
+    from demand_forecast import MIN_HISTORY_MONTHS
+
+    if params is None:
+        params = {}
+    
+    # המלצות מותאמות פר קטגוריה
+    threshold_percents = params.get('threshold_percents', DEFAULT_THRESHOLD_PERCENTS)
+    months_ahead = int(params.get('months_ahead', 3))
+    history_months = max(int(params.get('history_months', DEFAULT_HISTORY_MONTHS)), MIN_HISTORY_MONTHS)
+    
+    # מפתח המטמון: הפרמטרים והחודש שממנו מתחיל החיזוי
+    cache_key = json.dumps([threshold_percents, months_ahead, history_months,
+                            month_start(get_israel_time()).strftime('%Y-%m')],
+                           sort_keys=True, ensure_ascii=False)
+    snapshot_name = f"{RECOMMENDATIONS_SNAPSHOT}:{hashlib.sha1(cache_key.encode('utf-8')).hexdigest()}"
+    
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            use_cache = database.data_versions_available(cur)
+            if use_cache:
+                cur.execute("""
+                    SELECT COALESCE((SELECT version FROM data_versions WHERE name = 'inventory'), 0),
+                           (SELECT payload FROM snapshot_cache
+                            WHERE name = %s
+                              AND version = COALESCE((SELECT version FROM data_versions WHERE name = 'inventory'), 0)
+                              AND created_at > CURRENT_TIMESTAMP - make_interval(secs => %s))
+                """, (snapshot_name, RECOMMENDATIONS_TTL))
+                version, cached = cur.fetchone()
+                if cached is not None:
+                    return cached
+            
+            # הגרסה נקראה לפני החישוב, כך ששינוי שמתבצע במהלכו יפסול את התוצאה
+            snapshot = load_demand_snapshot(cur, history_months)
+            result = compute_purchase_recommendations(snapshot, threshold_percents, months_ahead)
+            
+            if use_cache:
+                cur.execute("""
+                    INSERT INTO snapshot_cache (name, version, payload, created_at)
+                    VALUES (%s, %s, %s, CURRENT_TIMESTAMP)
+                    ON CONFLICT (name) DO UPDATE
+                    SET version = EXCLUDED.version,
+                        payload = EXCLUDED.payload,
+                        created_at = EXCLUDED.created_at
+                """, (snapshot_name, version, Json(result)))
+                # שורות של פרמטרים או חודשים אחרים שכבר לא תקפות נמחקות, כך
+                # שבטבלה נשארות רק תוצאות שעוד יכולות לשמש
+                cur.execute("""
+                    DELETE FROM snapshot_cache
+                    WHERE name LIKE %s
+                      AND name <> %s
+                      AND (version <> %s
+                           OR created_at <= CURRENT_TIMESTAMP - make_interval(secs => %s))
+                """, (f"{RECOMMENDATIONS_SNAPSHOT}:%", snapshot_name, version, RECOMMENDATIONS_TTL))
     
     return result
 
@@ -483,21 +473,23 @@ def comparative_periods_analysis(params=None):
     
     conn = get_db_connection()
     cur = conn.cursor()
+    rollup = rollup_available(cur)
+    
+    periods = {**period_params(period1_start, period1_end, 'period1'),
+               **period_params(period2_start, period2_end, 'period2')}
     
     # השוואת הלוואות פריטים בין התקופות
-    cur.execute("""
+    cur.execute(f"""
         WITH period1 AS (
-            SELECT i.id, i.name, i.category, COUNT(l.id) as loan_count, SUM(l.quantity) as total_qty
-            FROM loans l
-            JOIN items i ON l.item_id = i.id
-            WHERE l.loan_date BETWEEN %s AND %s
+            SELECT i.id, i.name, i.category, SUM(p.loan_count) as loan_count, SUM(p.qty) as total_qty
+            FROM ({period_stats_sql('period1', rollup)}) p
+            JOIN items i ON p.item_id = i.id
             GROUP BY i.id, i.name, i.category
         ), 
         period2 AS (
-            SELECT i.id, i.name, i.category, COUNT(l.id) as loan_count, SUM(l.quantity) as total_qty
-            FROM loans l
-            JOIN items i ON l.item_id = i.id
-            WHERE l.loan_date BETWEEN %s AND %s
+            SELECT i.id, i.name, i.category, SUM(p.loan_count) as loan_count, SUM(p.qty) as total_qty
+            FROM ({period_stats_sql('period2', rollup)}) p
+            JOIN items i ON p.item_id = i.id
             GROUP BY i.id, i.name, i.category
         )
         SELECT 
@@ -513,7 +505,7 @@ def comparative_periods_analysis(params=None):
         ORDER BY 
             COALESCE(p2.loan_count, 0) - COALESCE(p1.loan_count, 0) DESC,
             COALESCE(p2.loan_count, 0) DESC
-    """, (period1_start, period1_end, period2_start, period2_end))
+    """, periods)
     
     item_comparison = []
     for row in cur.fetchall():
@@ -545,22 +537,29 @@ def comparative_periods_analysis(params=None):
         })
     
     # השוואת קטגוריות בין התקופות
-    cur.execute("""
+    # סטודנטים שונים נספרים מרשימת הסטודנטים לפריט וחודש, ולא מסכום unique_students
+    cur.execute(f"""
         WITH period1 AS (
-            SELECT i.category, COUNT(l.id) as loan_count, SUM(l.quantity) as total_qty,
-                COUNT(DISTINCT l.student_id) as unique_students
-            FROM loans l
-            JOIN items i ON l.item_id = i.id
-            WHERE l.loan_date BETWEEN %s AND %s
-            GROUP BY i.category
+            SELECT p.category, p.loan_count, p.total_qty, COALESCE(st.unique_students, 0) as unique_students
+            FROM (
+                SELECT category, SUM(loan_count) as loan_count, SUM(qty) as total_qty
+                FROM ({period_stats_sql('period1', rollup)}) p1 GROUP BY category
+            ) p
+            LEFT JOIN (
+                SELECT category, COUNT(DISTINCT student_id) as unique_students
+                FROM ({period_students_sql('period1', rollup)}) s1 GROUP BY category
+            ) st ON st.category = p.category
         ), 
         period2 AS (
-            SELECT i.category, COUNT(l.id) as loan_count, SUM(l.quantity) as total_qty,
-                COUNT(DISTINCT l.student_id) as unique_students
-            FROM loans l
-            JOIN items i ON l.item_id = i.id
-            WHERE l.loan_date BETWEEN %s AND %s
-            GROUP BY i.category
+            SELECT p.category, p.loan_count, p.total_qty, COALESCE(st.unique_students, 0) as unique_students
+            FROM (
+                SELECT category, SUM(loan_count) as loan_count, SUM(qty) as total_qty
+                FROM ({period_stats_sql('period2', rollup)}) p2 GROUP BY category
+            ) p
+            LEFT JOIN (
+                SELECT category, COUNT(DISTINCT student_id) as unique_students
+                FROM ({period_students_sql('period2', rollup)}) s2 GROUP BY category
+            ) st ON st.category = p.category
         )
         SELECT 
             COALESCE(p1.category, p2.category) as category,
@@ -575,7 +574,7 @@ def comparative_periods_analysis(params=None):
         ORDER BY 
             COALESCE(p2.loan_count, 0) - COALESCE(p1.loan_count, 0) DESC,
             COALESCE(p2.loan_count, 0) DESC
-    """, (period1_start, period1_end, period2_start, period2_end))
+    """, periods)
     
     category_comparison = []
     for row in cur.fetchall():
@@ -614,14 +613,14 @@ def comparative_periods_analysis(params=None):
         })
     
     # סיכום כללי
-    cur.execute("""
-        SELECT COUNT(*) FROM loans WHERE loan_date BETWEEN %s AND %s
-    """, (period1_start, period1_end))
+    cur.execute(f"""
+        SELECT COALESCE(SUM(p.loan_count), 0) FROM ({period_stats_sql('period1', rollup)}) p
+    """, periods)
     period1_total_loans = cur.fetchone()[0]
     
-    cur.execute("""
-        SELECT COUNT(*) FROM loans WHERE loan_date BETWEEN %s AND %s
-    """, (period2_start, period2_end))
+    cur.execute(f"""
+        SELECT COALESCE(SUM(p.loan_count), 0) FROM ({period_stats_sql('period2', rollup)}) p
+    """, periods)
     period2_total_loans = cur.fetchone()[0]
     
     conn.close()
@@ -0,0 +1,211 @@
+"""
+מנוע זמינות להזמנות ציוד.
+
+הזמינות של פריט בחלון זמן היא הכמות הכוללת פחות השיא של הזמנות חופפות
+בו-זמנית (ולא סכום כל ההזמנות בחלון - שתי הזמנות שאינן חופפות זו לזו
+לא תופסות את אותן יחידות). השיא מחושב ב-SQL בשיטת sweep-line: כל הזמנה
+חופפת הופכת לאירוע +כמות בתחילתה ו--כמות בסופה, וסכום מצטבר לפי זמן
+נותן את התפוסה בכל רגע.
+
+החיפוש אחר הזמנות חופפות משתמש באופרטור && על tsrange, שנתמך באינדקס
+GiST (מיגרציה 4). ההזמנות כוללות את שני קצות הטווח, כמו בבדיקה הקודמת.
+
+check_availability_batch עונה על מספר כלשהו של זוגות (פריט, חלון זמן)
+בשאילתה אחת. peak_usage ו-blocked_intervals מבצעים את אותו sweep-line
+בפייתון, על רשימת טווחים שכבר נשלפה (למשל עבור ערכת ציוד שלמה).
+"""
+
+import os
+import sys
+from datetime import datetime, time, timedelta
+
+# הוספת תיקיית הפרויקט הראשית לנתיב החיפוש
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from database import get_db_connection
+
+# הביטוי חייב להיות זהה לזה שבאינדקס idx_reservations_item_period
+RESERVATION_PERIOD_SQL = "tsrange(r.start_date, GREATEST(r.start_date, r.end_date), '[]')"
+
+BATCH_AVAILABILITY_QUERY = f"""
+    WITH req AS (
+        SELECT *
+        FROM unnest(%(req_ids)s::int[], %(item_ids)s::int[],
+                    %(starts)s::timestamp[], %(ends)s::timestamp[])
+             AS t(req_id, item_id, start_date, end_date)
+    ),
+    overlapping AS (
+        SELECT req.req_id, r.quantity,
+               GREATEST(r.start_date, req.start_date) AS from_ts,
+               LEAST(GREATEST(r.start_date, r.end_date), req.end_date) AS to_ts
+        FROM req
+        JOIN reservations r
+          ON r.item_id = req.item_id
+         AND r.status IN ('approved', 'pending')
+         AND {RESERVATION_PERIOD_SQL} && tsrange(req.start_date, req.end_date, '[]')
+    ),
+    events AS (
+        -- באותו רגע, תחילת הזמנה נספרת לפני סיום של אחרת (הקצוות כלולים)
+        SELECT req_id, from_ts AS ts, 0 AS kind, quantity AS delta FROM overlapping
+        UNION ALL
+        SELECT req_id, to_ts AS ts, 1 AS kind, -quantity AS delta FROM overlapping
+    ),
+    levels AS (
+        SELECT req_id,
+               SUM(delta) OVER (
+                   PARTITION BY req_id ORDER BY ts, kind
+                   ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW
+               ) AS level
+        FROM events
+    ),
+    peaks AS (
+        SELECT req_id, MAX(level) AS peak
+        FROM levels
+        GROUP BY req_id
+    )
+    SELECT req.req_id, req.item_id, i.id IS NOT NULL AS found,
+           i.name, i.category, i.quantity, COALESCE(p.peak, 0) AS peak_reserved
+    FROM req
+    LEFT JOIN items i ON i.id = req.item_id AND i.is_available = TRUE
+    LEFT JOIN peaks p ON p.req_id = req.req_id
+    ORDER BY req.req_id
+"""
+
+
+def check_availability_batch(cur, requests):
+    """
+    בודק זמינות עבור רשימת בקשות, כל אחת מילון עם
+    item_id, start_date, end_date ו-quantity (ברירת מחדל 1).
+    מחזיר רשימה באותו סדר; פריט שלא נמצא או שאינו זמין מסומן found=False.
+    """
+    if not requests:
+        return []
+
+    for req in requests:
+        if req['end_date'] < req['start_date']:
+            raise ValueError("תאריך הסיום חייב להיות אחרי תאריך ההתחלה")
+
+    cur.execute(BATCH_AVAILABILITY_QUERY, {
+        "req_ids": list(range(len(requests))),
+        "item_ids": [int(req['item_id']) for req in requests],
+        "starts": [req['start_date'] for req in requests],
+        "ends": [req['end_date'] for req in requests]
+    })
+
+    results = []
+    for row in cur.fetchall():
+        req_id, item_id, found, name, category, total_quantity, peak_reserved = row
+        req = requests[req_id]
+        quantity = int(req.get('quantity') or 1)
+        result = {
+            "item_id": item_id,
+            "start_date": req['start_date'],
+            "end_date": req['end_date'],
+            "quantity": quantity,
+            "found": found
+        }
+        if found:
+            available_quantity = total_quantity - peak_reserved
+            result.update({
+                "name": name,
+                "category": category,
+                "total_quantity": total_quantity,
+                "peak_reserved": peak_reserved,
+                "available_quantity": available_quantity,
+                "is_available": available_quantity >= quantity
+            })
+        else:
+            result["is_available"] = False
+        results.append(result)
+    return results
+
+
+def check_availability(cur, item_id, start_date, end_date, quantity=1):
+    """בודק זמינות של פריט בודד; מחזיר None אם הפריט לא נמצא"""
+    result = check_availability_batch(cur, [{
+        "item_id": item_id,
+        "start_date": start_date,
+        "end_date": end_date,
+        "quantity": quantity
+    }])[0]
+    return result if result["found"] else None
+
+
+def get_overlapping_reservations(cur, item_id, start_date, end_date):
+    """מחזיר את ההזמנות הפעילות של הפריט שחופפות לחלון הזמן"""
+    cur.execute(f"""
+        SELECT r.id, r.start_date, r.end_date, r.quantity, r.student_name, r.status
+        FROM reservations r
+        WHERE r.item_id = %s
+        AND r.status IN ('approved', 'pending')
+        AND {RESERVATION_PERIOD_SQL} && tsrange(%s, %s, '[]')
+        ORDER BY r.start_date
+    """, (item_id, start_date, end_date))
+    return cur.fetchall()
+
+
+def _sweep(intervals):
+    """
+    ממיין את הטווחים (התחלה, סוף, כמות) לאירועים ומחזיר (זמן, סוג, רמה)
+    אחרי כל אירוע. באותו רגע תחילה קודמת לסיום, כי הקצוות כלולים.
+    """
+    events = []
+    for start, end, quantity in intervals:
+        events.append((start, 0, quantity))
+        events.append((max(start, end), 1, -quantity))
+    events.sort(key=lambda event: (event[0], event[1]))
+
+    level = 0
+    for ts, kind, delta in events:
+        level += delta
+        yield ts, kind, level
+
+
+def peak_usage(intervals, start, end):
+    """שיא הכמות התפוסה בו-זמנית בחלון [start, end]"""
+    clipped = [
+        (max(s, start), min(max(s, e), end), q)
+        for s, e, q in intervals
+        if s <= end and max(s, e) >= start
+    ]
+    return max((level for _, _, level in _sweep(clipped)), default=0)
+
+
+def blocked_intervals(intervals, threshold):
+    """
+    מחזיר את הטווחים (סגורים) שבהם התפוסה גבוהה מ-threshold,
+    כלומר אין מספיק יחידות פנויות
+    """
+    blocked = []
+    blocked_from = None
+    for ts, kind, level in _sweep(intervals):
+        if blocked_from is None and level > threshold:
+            blocked_from = ts
+        elif blocked_from is not None and level <= threshold:
+            blocked.append((blocked_from, ts))
+            blocked_from = None
+    return blocked
+
+
+def first_free_window(blocked, search_from, search_until, duration):
+    """
+    מוצא את החלון הראשון באורך duration, החל מ-search_from, שאינו חופף
+    לאף טווח חסום. הזמנות הן ברזולוציה של ימים, ולכן מועמד חדש מתחיל
+    בחצות שאחרי סוף הטווח החוסם. מחזיר None אם אין חלון עד search_until.
+    """
+    candidate = search_from
+    for blocked_from, blocked_until in sorted(blocked):
+        if blocked_from > candidate + duration:
+            break
+        if blocked_until >= candidate:
+            candidate = datetime.combine(blocked_until.date() + timedelta(days=1), time())
+    if candidate + duration > search_until:
+        return None
+    return candidate
+
+
+def get_availability(requests):
+    """עטיפה שפותחת חיבור ומריצה check_availability_batch"""
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            return check_availability_batch(cur, requests)
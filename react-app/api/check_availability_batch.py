@@ -0,0 +1,46 @@
+"""
+סקריפט זה בודק זמינות של מספר פריטים וחלונות זמן בקריאה אחת.
+משמש את ה-API של React לבדיקת זמינות של סל ציוד לפני יצירת הזמנות.
+
+קלט: {"requests": [{"item_id": 1, "start_date": "2025-01-01", "end_date": "2025-01-03", "quantity": 2}, ...]}
+"""
+
+import json
+import sys
+from datetime import datetime
+from availability import get_availability
+
+def main():
+    """פונקציה ראשית שבודקת זמינות עבור רשימת בקשות בפורמט JSON"""
+    try:
+        # קריאת פרמטרים מ-stdin בפורמט JSON
+        input_data = json.loads(sys.stdin.read())
+        raw_requests = input_data.get('requests') or []
+
+        requests = []
+        for req in raw_requests:
+            if not all([req.get('item_id'), req.get('start_date'), req.get('end_date')]):
+                raise ValueError("חסרים פרמטרים נדרשים: item_id, start_date, end_date")
+            requests.append({
+                "item_id": req['item_id'],
+                "start_date": datetime.strptime(req['start_date'], "%Y-%m-%d"),
+                "end_date": datetime.strptime(req['end_date'], "%Y-%m-%d"),
+                "quantity": req.get('quantity', 1)
+            })
+
+        results = get_availability(requests)
+        for result in results:
+            result["start_date"] = result["start_date"].strftime("%Y-%m-%d")
+            result["end_date"] = result["end_date"].strftime("%Y-%m-%d")
+
+        print(json.dumps({
+            "success": True,
+            "results": results,
+            "all_available": all(result["is_available"] for result in results)
+        }, ensure_ascii=False))
+    except Exception as e:
+        print(json.dumps({"success": False, "message": str(e)}, ensure_ascii=False))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
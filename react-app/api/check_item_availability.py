@@ -7,52 +7,27 @@ import json
 import sys
 from datetime import datetime
 import traceback
+import os
+
+# הוספת תיקיית הפרויקט הראשית לנתיב החיפוש
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
 from database import get_db_connection
+from availability import check_availability, get_overlapping_reservations
 
 def check_item_availability(item_id, start_date, end_date, quantity=1):
     """פונקציה שבודקת את זמינות הפריט בטווח התאריכים המבוקש"""
     try:
         with get_db_connection() as conn:
             with conn.cursor() as cur:
-                # בדיקת זמינות הפריט
-                cur.execute("""
-                    SELECT i.id, i.name, i.category, i.quantity,
-                        i.quantity - COALESCE(
-                            (SELECT SUM(r.quantity)
-                             FROM reservations r
-                             WHERE r.item_id = i.id
-                             AND r.status IN ('approved', 'pending')
-                             AND (
-                                 (r.start_date <= %s AND r.end_date >= %s)
-                                 OR (r.start_date <= %s AND r.end_date >= %s)
-                                 OR (r.start_date >= %s AND r.end_date <= %s)
-                             )), 0) as available_quantity
-                    FROM items i
-                    WHERE i.id = %s AND i.is_available = true
-                """, (end_date, start_date, end_date, start_date, start_date, end_date, item_id))
-                
-                row = cur.fetchone()
-                if not row:
+                # בדיקת זמינות הפריט - לפי שיא ההזמנות החופפות בו-זמנית
+                availability = check_availability(cur, item_id, start_date, end_date, quantity)
+                if availability is None:
                     return {"success": False, "message": "פריט לא נמצא"}
                 
-                item_id, name, category, total_quantity, available_quantity = row
-                
                 # מידע נוסף על הזמנות קיימות לפריט זה בטווח התאריכים
-                cur.execute("""
-                    SELECT r.id, r.start_date, r.end_date, r.quantity, r.student_name, r.status
-                    FROM reservations r
-                    WHERE r.item_id = %s
-                    AND r.status IN ('approved', 'pending')
-                    AND (
-                        (r.start_date <= %s AND r.end_date >= %s)
-                        OR (r.start_date <= %s AND r.end_date >= %s)
-                        OR (r.start_date >= %s AND r.end_date <= %s)
-                    )
-                    ORDER BY r.start_date
-                """, (item_id, end_date, start_date, end_date, start_date, start_date, end_date))
-                
                 existing_reservations = []
-                for res_row in cur.fetchall():
+                for res_row in get_overlapping_reservations(cur, item_id, start_date, end_date):
                     res_id, res_start, res_end, res_quantity, res_student, res_status = res_row
                     existing_reservations.append({
                         "id": res_id,
@@ -64,16 +39,17 @@ def check_item_availability(item_id, start_date, end_date, quantity=1):
                     })
                 
                 # החזרת תוצאה
-                is_available = available_quantity >= quantity
+                is_available = availability["is_available"]
                 
                 return {
                     "success": True,
                     "item": {
-                        "id": item_id,
-                        "name": name,
-                        "category": category,
-                        "total_quantity": total_quantity,
-                        "available_quantity": available_quantity
+                        "id": availability["item_id"],
+                        "name": availability["name"],
+                        "category": availability["category"],
+                        "total_quantity": availability["total_quantity"],
+                        "available_quantity": availability["available_quantity"],
+                        "peak_reserved": availability["peak_reserved"]
                     },
                     "is_available": is_available,
                     "existing_reservations": existing_reservations,
@@ -0,0 +1,232 @@
+"""
+סקריפט זה בודק זמינות של מערך הזמנות (ערכת ציוד) שלם בטווח תאריכים.
+משמש את ה-API של React לבדיקת זמינות ערכה בקריאה אחת, במקום בדיקה נפרדת לכל פריט.
+
+הפריטים של הערכה נלקחים מ-template_combinations.item_names ומותאמים לפריטי
+המלאי לפי שם. לתבנית יכולים להיות כמה הרכבים חלופיים (combination_name), וכל
+הרכב הוא ערכה שלמה בפני עצמו - הכמויות שלהם לא מצטרפות. שאילתה אחת שולפת את
+כל הפריטים של כל ההרכבים, ההשאלות הפתוחות וההזמנות הפעילות שלהם בטווח
+החיפוש, והזמינות מחושבת מהן בפייתון לכל הרכב:
+- לכל פריט: שיא התפוסה בחלון המבוקש (הזמנות + השאלות שטרם הוחזרו)
+- להרכב כולו: האם כל הפריטים זמינים, והחלון הראשון שבו כולם פנויים
+בלי combination_name מוחזרים כל ההרכבים (combinations), והשדות הראשיים הם של
+ההרכב הטוב ביותר - זמין בתאריכים המבוקשים, או עם החלון הפנוי המוקדם ביותר.
+
+קלט: {"template_id": "...", "start_date": "YYYY-MM-DD", "end_date": "YYYY-MM-DD",
+       "combination_name": "..." (רשות), "search_days": 60 (רשות)}
+"""
+
+import json
+import sys
+import os
+from datetime import datetime, timedelta
+
+# הוספת תיקיית הפרויקט הראשית לנתיב החיפוש
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from database import get_db_connection
+from utils import get_israel_time
+from availability import RESERVATION_PERIOD_SQL, peak_usage, blocked_intervals, first_free_window
+
+DEFAULT_SEARCH_DAYS = 60
+
+TEMPLATE_USAGE_QUERY = f"""
+    WITH needs AS (
+        SELECT tc.combination_name, item_name AS name, COUNT(*) AS needed
+        FROM template_combinations tc
+        CROSS JOIN LATERAL unnest(tc.item_names) AS item_name
+        WHERE tc.template_id = %(template_id)s
+          AND tc.is_active = TRUE
+          AND (%(combination_name)s::text IS NULL OR tc.combination_name = %(combination_name)s)
+        GROUP BY tc.combination_name, item_name
+    ),
+    -- שורה אחת לכל שם פריט, עם הכמות הנדרשת בכל הרכב, כך שהשימוש בפריט
+    -- נשלף פעם אחת גם כשהוא מופיע בכמה הרכבים
+    kit AS (
+        SELECT name,
+               array_agg(combination_name ORDER BY combination_name) AS combinations,
+               array_agg(needed ORDER BY combination_name) AS needed
+        FROM needs
+        GROUP BY name
+    ),
+    kit_items AS (
+        SELECT kit.name, kit.combinations, kit.needed, i.id, i.category, i.quantity
+        FROM kit
+        LEFT JOIN items i ON i.name = kit.name AND i.is_available = TRUE
+    )
+    SELECT ki.name, ki.combinations, ki.needed, ki.id, ki.category, ki.quantity,
+           usage.start_ts, usage.end_ts, usage.quantity
+    FROM kit_items ki
+    LEFT JOIN LATERAL (
+        SELECT r.start_date AS start_ts,
+               GREATEST(r.start_date, r.end_date) AS end_ts,
+               r.quantity
+        FROM reservations r
+        WHERE r.item_id = ki.id
+          AND r.status IN ('approved', 'pending')
+          AND {RESERVATION_PERIOD_SQL} && tsrange(%(search_from)s, %(search_until)s, '[]')
+        UNION ALL
+        -- השאלה שטרם הוחזרה תופסת יחידות עד מועד ההחזרה, או עד עכשיו אם באיחור
+        SELECT l.loan_date AS start_ts,
+               GREATEST(l.loan_date, l.due_date, %(now)s) AS end_ts,
+               l.quantity
+        FROM loans l
+        WHERE l.item_id = ki.id
+          AND l.return_date IS NULL
+          AND l.loan_date <= %(search_until)s
+          AND GREATEST(l.due_date, %(now)s) >= %(search_from)s
+    ) usage ON TRUE
+    ORDER BY ki.name, ki.id
+"""
+
+
+def combination_availability(pools, needs, start_date, end_date, search_until, duration):
+    """
+    זמינות של הרכב אחד: needs הוא {שם פריט: כמות נדרשת}, pools הם מאגרי
+    המלאי לפי שם. מחזיר את הפריטים, האם ההרכב זמין ואת תחילת החלון הפנוי הראשון
+    """
+    items = []
+    kit_blocked = []
+    for name, needed in needs.items():
+        pool = pools[name]
+        total_quantity = pool["total_quantity"]
+        available_quantity = total_quantity - pool["peak_in_use"]
+        items.append({
+            "name": name,
+            "item_ids": sorted(pool["item_ids"]),
+            "category": pool["category"],
+            "found": bool(pool["item_ids"]),
+            "needed": needed,
+            "total_quantity": total_quantity,
+            "peak_in_use": pool["peak_in_use"],
+            "available_quantity": available_quantity,
+            "is_available": available_quantity >= needed
+        })
+
+        threshold = total_quantity - needed
+        if threshold < 0:
+            kit_blocked.append((start_date, search_until))
+        else:
+            kit_blocked.extend(blocked_intervals(pool["usage"], threshold))
+
+    kit_available = all(item["is_available"] for item in items)
+    first_start = first_free_window(kit_blocked, start_date, search_until, duration)
+    return items, kit_available, first_start
+
+
+def check_template_availability(template_id, start_date, end_date,
+                                combination_name=None, search_days=DEFAULT_SEARCH_DAYS):
+    """בודק זמינות של כל פריטי הערכה ושל כל הרכב שלה"""
+    if end_date < start_date:
+        raise ValueError("תאריך הסיום חייב להיות אחרי תאריך ההתחלה")
+
+    duration = end_date - start_date
+    search_until = start_date + timedelta(days=search_days) + duration
+    now = get_israel_time().replace(tzinfo=None)
+
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(TEMPLATE_USAGE_QUERY, {
+                "template_id": template_id,
+                "combination_name": combination_name,
+                "search_from": start_date,
+                "search_until": search_until,
+                "now": now
+            })
+            rows = cur.fetchall()
+
+    if not rows:
+        return {"success": False, "message": "מערך ההזמנות לא נמצא או שאין בו פריטים"}
+
+    # קיבוץ לפי שם פריט - כמה פריטי מלאי באותו שם נחשבים מאגר אחד,
+    # והכמות הנדרשת נשמרת לכל הרכב בנפרד
+    pools = {}
+    combinations = {}
+    for name, names, needed, item_id, category, quantity, start_ts, end_ts, used in rows:
+        pool = pools.get(name)
+        if pool is None:
+            pool = pools[name] = {
+                "item_ids": set(), "category": category, "total_quantity": 0, "usage": []
+            }
+            for combination, count in zip(names, needed):
+                combinations.setdefault(combination, {})[name] = count
+        if item_id is not None and item_id not in pool["item_ids"]:
+            pool["item_ids"].add(item_id)
+            pool["total_quantity"] += quantity
+        if start_ts is not None:
+            pool["usage"].append((start_ts, end_ts, used))
+
+    for pool in pools.values():
+        pool["peak_in_use"] = peak_usage(pool["usage"], start_date, end_date)
+
+    results = []
+    for name in sorted(combinations, key=lambda value: (value is None, value or '')):
+        items, kit_available, first_start = combination_availability(
+            pools, combinations[name], start_date, end_date, search_until, duration)
+        results.append({
+            "combination_name": name,
+            "kit_available": kit_available,
+            "items": items,
+            "first_available_window": {
+                "start_date": first_start.strftime("%Y-%m-%d"),
+                "end_date": (first_start + duration).strftime("%Y-%m-%d")
+            } if first_start else None
+        })
+
+    # ההרכב המומלץ: זמין עכשיו, אחרת זה שמתפנה ראשון
+    best = min(results, key=lambda result: (
+        not result["kit_available"],
+        result["first_available_window"] is None,
+        (result["first_available_window"] or {}).get("start_date", '')
+    ))
+    kit_available = best["kit_available"]
+    if not kit_available:
+        message = "חלק מפריטי המערך אינם זמינים בתאריכים המבוקשים"
+    elif len(results) > 1:
+        message = f"כל פריטי המערך זמינים בתאריכים המבוקשים בהרכב {best['combination_name']}"
+    else:
+        message = "כל פריטי המערך זמינים בתאריכים המבוקשים"
+
+    return {
+        "success": True,
+        "template_id": template_id,
+        "combination_name": best["combination_name"],
+        "start_date": start_date.strftime("%Y-%m-%d"),
+        "end_date": end_date.strftime("%Y-%m-%d"),
+        "kit_available": kit_available,
+        "items": best["items"],
+        "first_available_window": best["first_available_window"],
+        "combinations": results,
+        "search_days": search_days,
+        "message": message
+    }
+
+
+def main():
+    """פונקציה ראשית שבודקת זמינות מערך הזמנות מפרמטרים בפורמט JSON"""
+    try:
+        # קריאת פרמטרים מ-stdin בפורמט JSON
+        input_data = json.loads(sys.stdin.read())
+
+        template_id = input_data.get('template_id')
+        start_date_str = input_data.get('start_date')
+        end_date_str = input_data.get('end_date')
+
+        if not all([template_id, start_date_str, end_date_str]):
+            raise ValueError("חסרים פרמטרים נדרשים: template_id, start_date, end_date")
+
+        result = check_template_availability(
+            template_id,
+            datetime.strptime(start_date_str, "%Y-%m-%d"),
+            datetime.strptime(end_date_str, "%Y-%m-%d"),
+            combination_name=input_data.get('combination_name'),
+            search_days=int(input_data.get('search_days', DEFAULT_SEARCH_DAYS))
+        )
+
+        print(json.dumps(result, ensure_ascii=False))
+    except Exception as e:
+        print(json.dumps({"success": False, "message": str(e)}, ensure_ascii=False))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
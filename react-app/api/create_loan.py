@@ -1,6 +1,9 @@
 """
 סקריפט זה יוצר השאלה חדשה מנתונים שהתקבלו כ-JSON.
 משמש את ה-API של React ליצירת השאלות חדשות.
+
+אם הקלט כולל רשימת items (סל של {item_id, quantity, ...}), כל ההשאלות
+נוצרות בטרנזקציה אחת - או שכולן נוצרות או שאף אחת לא.
 """
 
 import sys
@@ -12,7 +15,7 @@ from datetime import datetime
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
 # ייבוא פונקציות מבסיס הנתונים
-from database import create_loan
+from database import create_loan, create_loans
 
 def main():
     """פונקציה ראשית שיוצרת השאלה חדשה מקלט JSON"""
@@ -21,6 +24,7 @@ def main():
         input_data = json.loads(sys.stdin.read())
         
         # חילוץ שדות חובה
+        cart = input_data.get('items')
         item_id = input_data.get('item_id')
         student_name = input_data.get('student_name')
         student_id = input_data.get('student_id')
@@ -28,7 +32,12 @@ def main():
         due_date_str = input_data.get('due_date')
         
         # בדיקות תקינות בסיסיות
-        if not all([item_id, student_name, student_id, quantity, due_date_str]):
+        if cart is not None:
+            if not all([student_name, student_id, due_date_str]):
+                raise ValueError("חסרים שדות חובה: שם סטודנט, ת.ז. סטודנט ותאריך החזרה הם שדות חובה")
+            if not cart or not all(line.get('item_id') and line.get('quantity') for line in cart):
+                raise ValueError("כל שורה בסל חייבת לכלול מזהה פריט וכמות")
+        elif not all([item_id, student_name, student_id, quantity, due_date_str]):
             raise ValueError("חסרים שדות חובה: מזהה פריט, שם סטודנט, ת.ז. סטודנט, כמות ותאריך החזרה הם שדות חובה")
         
         # המרת תאריך החזרה מתבנית ISO לאובייקט תאריך
@@ -44,6 +53,27 @@ def main():
         price_per_unit = input_data.get('price_per_unit')
         total_price = input_data.get('total_price')
         
+        # סל של כמה פריטים - השאלה אטומית אחת
+        if cart is not None:
+            loan_ids = create_loans(
+                cart,
+                student_name=student_name,
+                student_id=student_id,
+                due_date=due_date,
+                user_id=user_id,
+                loan_notes=loan_notes,
+                checkout_notes=checkout_notes,
+                director=director,
+                producer=producer,
+                photographer=photographer
+            )
+            print(json.dumps({
+                'success': True,
+                'loan_ids': loan_ids,
+                'message': f"{len(loan_ids)} השאלות נוצרו בהצלחה"
+            }, ensure_ascii=False))
+            return
+        
         # יצירת השאלה חדשה
         loan_id = create_loan(
             item_id=item_id,
@@ -61,6 +91,9 @@ def main():
             total_price=total_price
         )
         
+        if not loan_id:
+            raise ValueError("אין מספיק פריטים זמינים להשאלה")
+        
         # החזרת תוצאה חיובית
         response = {
             'success': True,
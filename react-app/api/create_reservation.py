@@ -1,77 +1,135 @@
 """
 סקריפט זה יוצר הזמנה חדשה מנתונים שהתקבלו כ-JSON.
 משמש את ה-API של React ליצירת הזמנות חדשות.
+
+אם הקלט כולל רשימת items (סל של {item_id, quantity, start_date, end_date}),
+כל ההזמנות נוצרות בטרנזקציה אחת - או שכולן נוצרות או שאף אחת לא.
 """
 
 import json
 import sys
 from datetime import datetime
 import traceback
-from database import get_db_connection
+import os
+
+# הוספת תיקיית הפרויקט הראשית לנתיב החיפוש
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from database import get_db_connection, bump_data_version, lock_items
+from availability import check_availability_batch
+
+def create_reservations(lines, student_name, student_id, user_id, notes=""):
+    """
+    יוצר הזמנה לכל שורה בסל (מילונים עם item_id, quantity, start_date,
+    end_date ואופציונלית notes) בטרנזקציה אחת.
+
+    שורות הפריטים ננעלות לפי סדר מזהים, כך שהזמנות מקבילות לאותו פריט
+    ממתינות זו לזו. ההזמנות נוספות ואז הזמינות נבדקת לכל הסל בשאילתה אחת -
+    הבדיקה כוללת את ההזמנות החדשות עצמן, כך ששתי שורות חופפות לאותו פריט
+    נספרות יחד. אם שורה כלשהי חורגת מהמלאי, כל הסל מבוטל.
+    ValueError אם הסל ריק או שכמות בשורה כלשהי אינה חיובית.
+    """
+    if not lines:
+        raise ValueError("הסל ריק")
+    for line in lines:
+        if int(line['quantity']) <= 0:
+            raise ValueError("הכמות חייבת להיות חיובית")
 
-def create_reservation(item_id, student_name, student_id, quantity, start_date, end_date, user_id, notes=""):
-    """פונקציה שיוצרת הזמנה חדשה ומחזירה את תוצאת הפעולה"""
     try:
         with get_db_connection() as conn:
             with conn.cursor() as cur:
-                # בדיקת זמינות הפריט בתאריכים המבוקשים
-                cur.execute("""
-                    SELECT i.quantity - COALESCE(
-                        (SELECT SUM(r.quantity)
-                         FROM reservations r
-                         WHERE r.item_id = i.id
-                         AND r.status IN ('approved', 'pending')
-                         AND (
-                             (r.start_date <= %s AND r.end_date >= %s)
-                             OR (r.start_date <= %s AND r.end_date >= %s)
-                             OR (r.start_date >= %s AND r.end_date <= %s)
-                         )), 0) as available_quantity
-                    FROM items i
-                    WHERE i.id = %s AND i.is_available = true
-                """, (end_date, start_date, end_date, start_date, start_date, end_date, item_id))
-                
-                result = cur.fetchone()
-                available = result[0] if result else 0
-                
-                if available < quantity:
+                found = lock_items(cur, [line['item_id'] for line in lines])
+                missing = [line['item_id'] for line in lines if int(line['item_id']) not in found]
+                if missing:
+                    conn.rollback()
                     return {
-                        "success": False, 
-                        "message": f"אין מספיק פריטים זמינים בתאריכים המבוקשים. כמות זמינה: {available}"
+                        "success": False,
+                        "message": f"פריטים לא נמצאו: {', '.join(str(item_id) for item_id in missing)}"
                     }
-                
-                # יצירת ההזמנה
-                cur.execute("""
-                    INSERT INTO reservations 
-                    (user_id, item_id, student_name, student_id, quantity, start_date, end_date, notes, status, created_at)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, 'pending', NOW())
-                    RETURNING id
-                """, (user_id, item_id, student_name, student_id, quantity, start_date, end_date, notes))
-                
-                result = cur.fetchone()
-                reservation_id = result[0] if result else None
-                if not reservation_id:
+
+                reservation_ids = []
+                for line in lines:
+                    cur.execute("""
+                        INSERT INTO reservations 
+                        (user_id, item_id, student_name, student_id, quantity, start_date, end_date, notes, status, created_at)
+                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, 'pending', NOW())
+                        RETURNING id
+                    """, (user_id, line['item_id'], student_name, student_id, line['quantity'],
+                          line['start_date'], line['end_date'], line.get('notes', notes)))
+                    reservation_ids.append(cur.fetchone()[0])
+
+                # בדיקת זמינות הפריטים בתאריכים המבוקשים, כולל ההזמנות החדשות
+                results = check_availability_batch(cur, lines)
+                shortages = [
+                    result for result in results
+                    if not result["found"] or result["available_quantity"] < 0
+                ]
+                if shortages:
+                    conn.rollback()
                     return {
                         "success": False,
-                        "message": "שגיאה ביצירת ההזמנה"
+                        "message": "אין מספיק פריטים זמינים בתאריכים המבוקשים. " + ", ".join(
+                            f"{result['name']}: כמות זמינה {max(result['available_quantity'] + result['quantity'], 0)}"
+                            if result["found"] else f"פריט {result['item_id']} אינו זמין להזמנה"
+                            for result in shortages
+                        ),
+                        "unavailable_item_ids": [result["item_id"] for result in shortages]
                     }
-                
+
+                bump_data_version(cur)
                 conn.commit()
                 return {
                     "success": True, 
-                    "message": "ההזמנה נוצרה בהצלחה",
-                    "reservation_id": reservation_id
+                    "message": "ההזמנה נוצרה בהצלחה" if len(lines) == 1 else f"{len(lines)} הזמנות נוצרו בהצלחה",
+                    "reservation_ids": reservation_ids
                 }
     except Exception as e:
         print(f"Error creating reservation: {e}", file=sys.stderr)
         traceback.print_exc(file=sys.stderr)
         raise
 
+def create_reservation(item_id, student_name, student_id, quantity, start_date, end_date, user_id, notes=""):
+    """פונקציה שיוצרת הזמנה חדשה ומחזירה את תוצאת הפעולה"""
+    result = create_reservations([{
+        "item_id": item_id,
+        "quantity": int(quantity),
+        "start_date": start_date,
+        "end_date": end_date
+    }], student_name, student_id, user_id, notes)
+    if result["success"]:
+        result["reservation_id"] = result.pop("reservation_ids")[0]
+    return result
+
 def main():
     """פונקציה ראשית שיוצרת הזמנה חדשה מקלט JSON"""
     try:
         # קריאת פרמטרים מ-stdin בפורמט JSON
         input_data = json.loads(sys.stdin.read())
         
+        # סל של כמה פריטים - הזמנה אטומית אחת
+        cart = input_data.get('items')
+        if cart is not None:
+            student_name = input_data.get('student_name')
+            student_id = input_data.get('student_id')
+            user_id = input_data.get('user_id')
+            if not all([student_name, student_id, user_id]):
+                raise ValueError("חסרים הפרמטרים הבאים: student_name, student_id, user_id")
+            lines = []
+            for line in cart:
+                if not all([line.get('item_id'), line.get('quantity'), line.get('start_date'), line.get('end_date')]):
+                    raise ValueError("כל שורה בסל חייבת לכלול item_id, quantity, start_date, end_date")
+                lines.append({
+                    "item_id": line['item_id'],
+                    "quantity": int(line['quantity']),
+                    "start_date": datetime.strptime(line['start_date'], "%Y-%m-%d"),
+                    "end_date": datetime.strptime(line['end_date'], "%Y-%m-%d"),
+                    "notes": line.get('notes', input_data.get('notes', ''))
+                })
+            if not lines:
+                raise ValueError("הסל ריק")
+            print(json.dumps(create_reservations(lines, student_name, student_id, user_id)))
+            return
+        
         # חילוץ פרמטרים
         item_id = input_data.get('item_id')
         student_name = input_data.get('student_name')
@@ -4,19 +4,26 @@
 גרסה משופרת עם תמיכה במיפוי גמיש של עמודות אקסל לשדות בסיס הנתונים.
 """
 
+import datetime
 import json
-import sys
 import os
+import stat
+import sys
+import time
+import hashlib
 import tempfile
-from datetime import datetime
-import pandas as pd
-import numpy as np
 
 # הוסף את תיקיית השורש של הפרויקט ל-path כדי שנוכל לייבא את database.py
 project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 sys.path.append(project_root)
 
-from database import get_db_connection, add_item
+from database import get_db_connection, add_item, bump_data_version, items_key_available
+# ייצוא המלאי משותף עם export_excel.py (בזרימה, לקובץ זמני ייחודי)
+from export_excel import export_inventory_to_excel
+from serialization import dumps
+
+# pandas מיובא בתוך הפונקציות שצריכות אותו: תצוגה מקדימה של קובץ חדש
+# נקראת בזרימה ב-openpyxl ולא צריכה לשלם על טעינת pandas
 
 # מיפוי ברירת מחדל של שמות עמודות אקסל לשדות DB
 DEFAULT_EXCEL_MAPPING = {
@@ -40,46 +47,249 @@ DEFAULT_EXCEL_MAPPING = {
 # טבלת המרה לערכים בוליאניים
 BOOLEAN_TRUE_VALUES = ['true', 'yes', 'כן', '1', 'נכון', 'true', '+', 'v', '✓']
 
+# מספר השורות בתצוגה מקדימה
+PREVIEW_ROWS = 100
+
+# מטמון דיסק לקבצים שנותחו, לפי hash של תוכן הקובץ. התיקייה פרטית לתהליך
+# (0700, בתיקיית הנתונים של האפליקציה ולא ב-/tmp המשותף), והגיליון נשמר
+# כ-JSON ולא ב-pickle, כך שקובץ מטמון לא יכול להריץ קוד
+APP_DATA_DIR = os.getenv('APP_DATA_DIR', os.path.join(project_root, 'data'))
+EXCEL_CACHE_DIR = os.getenv('EXCEL_CACHE_DIR', os.path.join(APP_DATA_DIR, 'excel_preview_cache'))
+EXCEL_CACHE_TTL = int(os.getenv('EXCEL_CACHE_TTL', '86400'))
+
+def file_sha256(file_path):
+    """מחשב hash של תוכן הקובץ בקריאה בבלוקים"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def cache_path(file_hash, kind):
+    """נתיב קובץ המטמון מסוג מסוים (preview / frame) עבור hash"""
+    return os.path.join(EXCEL_CACHE_DIR, f"{file_hash}.{kind}")
+
+def cache_dir_ready():
+    """
+    יוצר את תיקיית המטמון בהרשאות 0700. תיקייה שאינה שייכת למשתמש של
+    התהליך (או קישור סימבולי) לא משמשת למטמון - מחזיר False
+    """
+    try:
+        os.makedirs(EXCEL_CACHE_DIR, mode=0o700, exist_ok=True)
+        info = os.lstat(EXCEL_CACHE_DIR)
+        if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid():
+            print(f"תיקיית מטמון האקסל אינה פרטית, המטמון מושבת: {EXCEL_CACHE_DIR}", file=sys.stderr)
+            return False
+        if stat.S_IMODE(info.st_mode) != 0o700:
+            os.chmod(EXCEL_CACHE_DIR, 0o700)
+        return True
+    except OSError as e:
+        print(f"לא ניתן ליצור את תיקיית מטמון האקסל: {e}", file=sys.stderr)
+        return False
+
+def prune_cache():
+    """מוחק קבצי מטמון שעברו את זמן התפוגה"""
+    now = time.time()
+    for name in os.listdir(EXCEL_CACHE_DIR):
+        path = os.path.join(EXCEL_CACHE_DIR, name)
+        try:
+            if now - os.path.getmtime(path) > EXCEL_CACHE_TTL:
+                os.remove(path)
+        except OSError:
+            pass
+
+def write_cache(path, write):
+    """
+    כותב קובץ מטמון דרך קובץ זמני, כך שקורא מקביל לא יראה קובץ חלקי.
+    בלי תיקיית מטמון פרטית write רץ בכל זאת (על os.devnull) ולא נשמר כלום
+    """
+    if not cache_dir_ready():
+        write(os.devnull)
+        return
+    prune_cache()
+    fd, temp_path = tempfile.mkstemp(dir=EXCEL_CACHE_DIR, suffix='.tmp')
+    os.close(fd)
+    try:
+        write(temp_path)
+        os.replace(temp_path, path)
+    except Exception:
+        os.remove(temp_path)
+        raise
+
+def read_cache(path):
+    """האם אפשר לקרוא את קובץ המטמון (קיים, בתיקייה הפרטית)"""
+    return cache_dir_ready() and os.path.exists(path)
+
+def write_json(path, data):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+
+# ===== שמירת הגיליון: JSON Lines - שורת עמודות, ואחריה שורה לכל שורת גיליון =====
+
+def encode_cell(value):
+    """ערך תא שאינו JSON: תאריכים מסומנים לפי סוג, ו-numpy מומר לערך Python"""
+    if isinstance(value, datetime.datetime):
+        return {'$datetime': value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {'$date': value.isoformat()}
+    if isinstance(value, datetime.time):
+        return {'$time': value.isoformat()}
+    if isinstance(value, datetime.timedelta):
+        return {'$seconds': value.total_seconds()}
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+CELL_DECODERS = {
+    '$datetime': datetime.datetime.fromisoformat,
+    '$date': datetime.date.fromisoformat,
+    '$time': datetime.time.fromisoformat,
+    '$seconds': lambda seconds: datetime.timedelta(seconds=seconds),
+}
+
+def decode_cell(obj):
+    if len(obj) == 1:
+        key, value = next(iter(obj.items()))
+        if key in CELL_DECODERS:
+            return CELL_DECODERS[key](value)
+    return obj
+
+def write_frame(path, columns, rows):
+    """כותב את הגיליון לקובץ: NaN/NaT נשמרים כ-null"""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(json.dumps({'columns': [str(col) for col in columns]}, ensure_ascii=False) + '\n')
+        for row in rows:
+            cells = [None if val is None or val != val else val for val in row]
+            f.write(json.dumps(cells, ensure_ascii=False, default=encode_cell) + '\n')
+
+def read_frame(path):
+    """קורא גיליון שנשמר ב-write_frame ל-DataFrame"""
+    import pandas as pd
+
+    with open(path, encoding='utf-8') as f:
+        columns = json.loads(f.readline())['columns']
+        rows = [json.loads(line, object_hook=decode_cell) for line in f]
+    return pd.DataFrame(rows, columns=columns)
+
+def load_sheet(file_path, file_hash=None):
+    """
+    מחזיר את הגיליון כ-DataFrame. הגיליון נשמר במטמון לפי hash בקריאה
+    הראשונה (בדיקת הייבוא), כך שהייבוא בפועל לא מנתח את הקובץ שוב
+    """
+    file_hash = file_hash or file_sha256(file_path)
+    path = cache_path(file_hash, 'frame.jsonl')
+    if read_cache(path):
+        try:
+            return read_frame(path)
+        except Exception as e:
+            print(f"מטמון אקסל פגום, מנתח מחדש: {e}", file=sys.stderr)
+
+    import pandas as pd
+
+    df = pd.read_excel(file_path, engine='openpyxl')
+    # שמות עמודות כמחרוזות, כמו אחרי קריאה מהמטמון וכמו שהמיפוי מגיע ב-JSON
+    df.columns = [str(col) for col in df.columns]
+    write_cache(path, lambda temp_path: write_frame(temp_path, df.columns,
+                                                   df.itertuples(index=False, name=None)))
+    return df
+
+def format_preview_value(val):
+    """ממיר ערך תא למחרוזת לתצוגה מקדימה"""
+    # NaN ו-NaT הם הערכים היחידים שאינם שווים לעצמם; כך אין צורך ב-pandas
+    # בתצוגה המקדימה בזרימה
+    if val is None or val != val:
+        return ""
+    elif isinstance(val, (int, float)):
+        if val == int(val):  # בדיקה אם המספר שלם
+            return str(int(val))
+        return str(val)
+    return str(val)
+
+def header_names(header_row):
+    """שמות עמודות כמו ב-pandas: תא ריק הופך ל-'Unnamed: N' ושם כפול מקבל סיומת .1"""
+    columns = []
+    seen = {}
+    for index, value in enumerate(header_row):
+        name = f"Unnamed: {index}" if value is None or value == '' else value
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        columns.append(name)
+    return columns
+
+def stream_sheet(file_path, limit=PREVIEW_ROWS):
+    """
+    קורא בזרימה ב-openpyxl במצב read-only רק את הכותרת ואת limit השורות
+    הראשונות לתצוגה המקדימה - הזמן והזיכרון לא תלויים בגודל הקובץ. שורות
+    ריקות בסוף הגיליון נחתכות (כמו ב-pandas), וריקות באמצע נשמרות כדי
+    שמספרי השורות יתאימו לאקסל. אם הגיליון נגמר בתוך החלון מספר השורות
+    מדויק; אחרת הוא הערכה לפי ממדי הגיליון (ws.max_row).
+    מחזיר (columns, data, total_rows, total_rows_estimated)
+    """
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        rows = sheet.iter_rows(values_only=True)
+        header = next(rows, ())
+        # עמודות ריקות בסוף הכותרת לא נחשבות
+        while header and header[-1] is None:
+            header = header[:-1]
+        columns = [str(col) for col in header_names(header)]
+        width = len(columns)
+
+        data = []
+        blank = (None,) * width
+        pending_blanks = 0
+        for row in rows:
+            values = tuple(row[:width]) + (None,) * (width - len(row))
+            if values == blank:
+                pending_blanks += 1
+                continue
+            for values in [blank] * pending_blanks + [values]:
+                if len(data) == limit:
+                    break
+                data.append({col: format_preview_value(val) for col, val in zip(columns, values)})
+            pending_blanks = 0
+            if len(data) == limit:
+                # החלון מלא; את שאר הגיליון קורא הייבוא (load_sheet)
+                return columns, data, max((sheet.max_row or 0) - 1, len(data)), True
+        return columns, data, len(data), False
+    finally:
+        workbook.close()
+
 def preview_excel(file_path):
-    """קורא את הקובץ אקסל ומחזיר תצוגה מקדימה של הנתונים"""
+    """
+    מחזיר תצוגה מקדימה של הנתונים. אם הקובץ כבר נותח (לפי hash) התצוגה
+    נלקחת מהמטמון; אחרת נקראות בזרימה רק השורות של התצוגה. הגיליון המלא
+    נקרא ונשמר במטמון רק בשלב הייבוא הראשון (load_sheet), ולא לפני התשובה.
+    """
     try:
-        # נסה לקרוא את הקובץ
-        df = pd.read_excel(file_path, engine='openpyxl')
-        
-        # מקבל את שמות העמודות
-        columns = df.columns.tolist()
+        file_hash = file_sha256(file_path)
+        preview_path = cache_path(file_hash, 'preview.json')
+        if read_cache(preview_path):
+            with open(preview_path, encoding='utf-8') as f:
+                return json.load(f)
+
+        columns, data, total_rows, estimated = stream_sheet(file_path)
         
         # ניחוש מיפוי עמודות אוטומטי
         suggested_mapping = guess_column_mapping(columns)
         
-        # מקבל את כל הנתונים לתצוגה מקדימה
-        data = []
-        for idx, row in df.iterrows():
-            # מגביל ל-100 שורות ראשונות לתצוגה מקדימה
-            if idx >= 100:
-                break
-                
-            row_dict = {}
-            for col in columns:
-                val = row[col]
-                if pd.isna(val) or val is None:
-                    row_dict[col] = ""
-                elif isinstance(val, (int, float)):
-                    if val == int(val):  # בדיקה אם המספר שלם
-                        row_dict[col] = str(int(val))
-                    else:
-                        row_dict[col] = str(val)
-                else:
-                    row_dict[col] = str(val)
-            data.append(row_dict)
-        
-        return {
+        result = {
             "success": True,
             "columns": columns,
             "data": data,
-            "total_rows": len(df),
+            "total_rows": total_rows,
+            "total_rows_estimated": estimated,
+            "file_hash": file_hash,
             "suggested_mapping": suggested_mapping
         }
+        write_cache(preview_path, lambda path: write_json(path, result))
+        return result
     except Exception as e:
         print(f"שגיאה בקריאת קובץ האקסל: {str(e)}", file=sys.stderr)
         return {"error": str(e)}
@@ -130,11 +340,18 @@ def guess_column_mapping(columns):
     
     return suggested_mapping
 
-def format_value_for_database(value, db_field):
-    """מעבד ערך לפורמט המתאים לשמירה בבסיס הנתונים לפי סוג השדה"""
+def format_value_for_database(value, db_field, errors=None):
+    """
+    מעבד ערך לפורמט המתאים לשמירה בבסיס הנתונים לפי סוג השדה. ערך שלא ניתן
+    להמיר (מחיר או כמות שאינם מספר) מקבל ברירת מחדל, ושם השדה נוסף ל-errors
+    """
+    import pandas as pd
+
     if pd.isna(value) or value is None:
         # ערכי ברירת מחדל לפי סוג השדה
-        if db_field in ['ordered', 'checked_out', 'checked', 'returned']:
+        if db_field == 'is_available':
+            return True
+        elif db_field in ['ordered', 'checked_out', 'checked', 'returned']:
             return False
         elif db_field in ['price_per_unit', 'total_price', 'quantity']:
             return 0
@@ -142,7 +359,7 @@ def format_value_for_database(value, db_field):
             return None
     
     # טיפול בטיפוסי נתונים שונים
-    if db_field in ['ordered', 'checked_out', 'checked', 'returned']:
+    if db_field in ['ordered', 'checked_out', 'checked', 'returned', 'is_available']:
         # המרה לערך בוליאני
         if isinstance(value, bool):
             return value
@@ -160,6 +377,8 @@ def format_value_for_database(value, db_field):
                 value = value.replace('₪', '').replace('$', '').replace(',', '').strip()
             return float(value) if value is not None else 0.0
         except:
+            if errors is not None:
+                errors.append(db_field)
             return 0.0
     elif db_field == 'quantity':
         # המרת כמות למספר שלם
@@ -169,112 +388,263 @@ def format_value_for_database(value, db_field):
             num_value = float(value)
             return int(num_value) if num_value.is_integer() else int(num_value)
         except:
+            if errors is not None:
+                errors.append(db_field)
             return 1
     else:
         # טקסט רגיל
         return str(value) if value is not None else ""
 
-def import_excel_to_database(file_path, column_mapping):
-    """מייבא את נתוני האקסל לבסיס הנתונים לפי מיפוי העמודות"""
+# שדות items שניתן למפות מעמודות האקסל
+IMPORT_FIELDS = [
+    'name', 'category', 'quantity', 'notes', 'is_available', 'category_original',
+    'order_notes', 'ordered', 'checked_out', 'checked', 'checkout_notes',
+    'returned', 'return_notes', 'price_per_unit', 'total_price', 'unnnamed_11',
+    'director', 'producer', 'photographer'
+]
+
+# פריט מזוהה לפי קטגוריה ושם (אינדקס ייחודי, מיגרציה 8, כשאין כפילויות)
+IMPORT_KEY = ['category', 'name']
+
+# מספר שורות בכל פקודת INSERT לטבלת השלב
+IMPORT_PAGE_SIZE = 1000
+
+# ברירות מחדל לפריט חדש כשהשדה לא ממופה
+IMPORT_DEFAULTS = {'category': 'כללי', 'quantity': 1, 'is_available': True}
+
+# מספר הדוגמאות בדוח השינויים
+DIFF_SAMPLE_SIZE = 20
+
+def build_import_rows(df, db_field_to_column, fields):
+    """
+    ממיר את שורות הגיליון לשורות לטבלת השלב, לפי סדר fields.
+    שורה בלי שם מדולגת; שורה שחוזרת על אותו מפתח דורסת את הקודמת
+    (כמו בייבוא שורה-שורה, שבו השורה המאוחרת עדכנה את הקודמת).
+    מחזיר (rows, duplicates, row_errors) - row_errors הם תאים שלא ניתן היה
+    להמיר (מספר שורה באקסל, שדה וערך)
+    """
+    import pandas as pd
+
+    columns = [db_field_to_column.get(field) for field in fields]
+    rows = {}
+    duplicates = 0
+    row_errors = []
+    for row_number, values in enumerate(df[list(dict.fromkeys(c for c in columns if c))].to_dict('records'), start=2):
+        name_value = values[db_field_to_column['name']]
+        if pd.isna(name_value) or str(name_value).strip() == "":
+            continue  # דילוג על שורות ללא שם פריט
+
+        item_data = {}
+        for field, column in zip(fields, columns):
+            if field == 'name':
+                item_data[field] = str(name_value).strip()
+            elif column is None:
+                item_data[field] = IMPORT_DEFAULTS[field]
+            else:
+                failed = []
+                item_data[field] = format_value_for_database(values[column], field, failed)
+                if failed:
+                    row_errors.append({'row': row_number, 'field': field, 'value': str(values[column])})
+
+        # וידוא שיש קטגוריה
+        if not item_data['category']:
+            item_data['category'] = IMPORT_DEFAULTS['category']
+        if item_data['quantity'] is None:
+            item_data['quantity'] = IMPORT_DEFAULTS['quantity']
+
+        key = (item_data['category'], item_data['name'])
+        if key in rows:
+            duplicates += 1
+            del rows[key]
+        rows[key] = (row_number, *(item_data[field] for field in fields))
+    return list(rows.values()), duplicates, row_errors
+
+def stage_import_rows(cursor, fields, rows):
+    """טוען את השורות לטבלה זמנית עם אותם טיפוסים כמו items, ב-execute_values בקבוצות"""
+    from psycopg2.extras import execute_values
+
+    column_list = ', '.join(fields)
+    cursor.execute(f"""
+        CREATE TEMP TABLE import_upsert_stage ON COMMIT DROP AS
+        SELECT 0 AS row_number, {column_list} FROM items WITH NO DATA
+    """)
+    execute_values(
+        cursor,
+        f"INSERT INTO import_upsert_stage (row_number, {column_list}) VALUES %s",
+        rows,
+        page_size=IMPORT_PAGE_SIZE
+    )
+
+def diff_staged_items(cursor, update_fields):
+    """
+    משווה את טבלת השלב לפריטים הקיימים: כמה יתווספו, יתעדכנו או לא ישתנו,
+    ודוגמאות לשינויים עם שמות השדות שמשתנים
+    """
+    key_join = ' AND '.join(f"i.{field} = s.{field}" for field in IMPORT_KEY)
+    if update_fields:
+        changed = (f"({', '.join('i.' + f for f in update_fields)}) IS DISTINCT FROM "
+                   f"({', '.join('s.' + f for f in update_fields)})")
+        changed_fields = "ARRAY_REMOVE(ARRAY[" + ', '.join(
+            f"CASE WHEN i.{f} IS DISTINCT FROM s.{f} THEN '{f}' END" for f in update_fields
+        ) + "], NULL)"
+    else:
+        changed, changed_fields = "FALSE", "ARRAY[]::TEXT[]"
+
+    cursor.execute(f"""
+        WITH diff AS (
+            SELECT s.row_number, s.category, s.name,
+                   CASE WHEN i.id IS NULL THEN 'insert'
+                        WHEN {changed} THEN 'update'
+                        ELSE 'unchanged' END AS action,
+                   CASE WHEN i.id IS NULL THEN ARRAY[]::TEXT[] ELSE {changed_fields} END AS changed_fields
+            FROM import_upsert_stage s
+            LEFT JOIN items i ON {key_join}
+        )
+        SELECT action, COUNT(*),
+               (ARRAY_AGG(json_build_object('row', row_number, 'category', category,
+                                            'name', name, 'changed_fields', changed_fields)
+                          ORDER BY row_number))[1:%s]
+        FROM diff
+        GROUP BY action
+    """, (DIFF_SAMPLE_SIZE,))
+
+    diff = {'insert': 0, 'update': 0, 'unchanged': 0}
+    samples = []
+    for action, count, sample in cursor.fetchall():
+        diff[action] = count
+        if action != 'unchanged':
+            samples.extend(dict(entry, action=action) for entry in sample)
+    samples.sort(key=lambda entry: entry['row'])
+    return diff, samples[:DIFF_SAMPLE_SIZE]
+
+def upsert_staged_items(cursor, fields, update_fields):
+    """
+    מיזוג טבלת השלב ל-items בפקודה אחת. פריט קיים מתעדכן רק אם משהו השתנה,
+    כך ששורות זהות לא מקבלות גרסה חדשה. הכמות הזמינה נשמרת ביחס להשאלות
+    הפתוחות (ההפרש בין הכמות לזמינות לא משתנה). מחזיר את מספר הפריטים
+    שנוספו או עודכנו
+    """
+    column_list = ', '.join(fields)
+    assignments = [f"{field} = EXCLUDED.{field}" for field in update_fields]
+    if 'quantity' in update_fields:
+        assignments.append("available = GREATEST(items.available + EXCLUDED.quantity - items.quantity, 0)")
+
+    if not items_key_available(cursor):
+        return upsert_staged_items_without_key(cursor, fields, update_fields)
+
+    if update_fields:
+        conflict_action = f"""DO UPDATE SET {', '.join(assignments)}
+            WHERE ({', '.join('items.' + f for f in update_fields)})
+                  IS DISTINCT FROM ({', '.join('EXCLUDED.' + f for f in update_fields)})"""
+    else:
+        conflict_action = "DO NOTHING"
+
+    cursor.execute(f"""
+        INSERT INTO items ({column_list}, available)
+        SELECT {column_list}, quantity FROM import_upsert_stage
+        ORDER BY row_number
+        ON CONFLICT ({', '.join(IMPORT_KEY)}) {conflict_action}
+    """)
+    return cursor.rowcount
+
+def upsert_staged_items_without_key(cursor, fields, update_fields):
+    """
+    אותו מיזוג כמו upsert_staged_items, בלי ON CONFLICT, כשהמפתח הייחודי
+    עוד לא קיים (פריטים כפולים שטרם מוזגו, מיגרציה 8). הטבלה נעולה לכתיבות
+    מקבילות, כך ששני ייבואים לא מוסיפים את אותו פריט. מחזיר את מספר
+    הפריטים שנוספו או עודכנו
+    """
+    column_list = ', '.join(fields)
+    key_join = ' AND '.join(f"i.{field} = s.{field}" for field in IMPORT_KEY)
+    cursor.execute("LOCK TABLE items IN SHARE ROW EXCLUSIVE MODE")
+
+    changed = 0
+    if update_fields:
+        assignments = [f"{field} = s.{field}" for field in update_fields]
+        if 'quantity' in update_fields:
+            assignments.append("available = GREATEST(i.available + s.quantity - i.quantity, 0)")
+        cursor.execute(f"""
+            UPDATE items i SET {', '.join(assignments)}
+            FROM import_upsert_stage s
+            WHERE {key_join}
+              AND ({', '.join('i.' + f for f in update_fields)})
+                  IS DISTINCT FROM ({', '.join('s.' + f for f in update_fields)})
+        """)
+        changed = cursor.rowcount
+
+    cursor.execute(f"""
+        INSERT INTO items ({column_list}, available)
+        SELECT {column_list}, quantity FROM import_upsert_stage s
+        WHERE NOT EXISTS (SELECT 1 FROM items i WHERE {key_join})
+        ORDER BY row_number
+    """)
+    return changed + cursor.rowcount
+
+def import_excel_to_database(file_path, column_mapping, dry_run=False):
+    """
+    מייבא את נתוני האקסל לבסיס הנתונים לפי מיפוי העמודות.
+    השורות נטענות לטבלת שלב ומתמזגות ל-items ב-INSERT ... ON CONFLICT אחד
+    על המפתח (category, name). עם dry_run מוחזר רק דוח השינויים, בלי לכתוב.
+    """
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # קורא את הקובץ
-        df = pd.read_excel(file_path, engine='openpyxl')
+        # קורא את הקובץ (מהמטמון אם כבר נותח)
+        df = load_sheet(file_path)
         
         # יצירת מיפוי הפוך - משדות DB לעמודות האקסל
-        db_field_to_column = {field: col for col, field in column_mapping.items()}
+        db_field_to_column = {field: col for col, field in column_mapping.items() if field}
         
         # בדיקה שיש עמודה שממופה לשם פריט
         if 'name' not in db_field_to_column:
             return {"error": "חסר מיפוי לשדה שם הפריט (name). אנא בחר עמודה שמכילה את שמות הפריטים."}
-        
-        name_column = db_field_to_column['name']
-        
-        # עיבוד נתונים - עובר על כל שורה ומייבא/מעדכן בבסיס הנתונים
-        items_added = 0
-        items_updated = 0
-        errors = []
-        
-        for idx, row in df.iterrows():
-            try:
-                # בדיקת תקינות שם פריט (חובה)
-                name_value = row[name_column] if not pd.isna(row[name_column]) else None
-                if name_value is None or str(name_value).strip() == "":
-                    continue  # דילוג על שורות ללא שם פריט
-                
-                # המרת שם פריט לטקסט
-                name = str(name_value).strip()
-                
-                # איסוף כל הנתונים מהשורה לפי המיפוי
-                item_data = {'name': name}
-                
-                # מילוי שדות נוספים לפי המיפוי
-                for db_field, excel_col in db_field_to_column.items():
-                    if db_field == 'name':
-                        continue  # כבר טיפלנו בשדה name
-                    
-                    # טיפול בהמרת ערכים לפורמט המתאים
-                    raw_value = row[excel_col] if excel_col in row else None
-                    item_data[db_field] = format_value_for_database(raw_value, db_field)
-                
-                # וידוא שיש קטגוריה
-                if 'category' not in item_data or not item_data['category']:
-                    item_data['category'] = 'כללי'  # קטגוריה ברירת מחדל
-                
-                # וידוא שיש כמות
-                if 'quantity' not in item_data or item_data['quantity'] is None:
-                    item_data['quantity'] = 1  # כמות ברירת מחדל
-                
-                # סימון כל פריט חדש כזמין
-                if 'is_available' not in item_data:
-                    item_data['is_available'] = True
-                
-                # הכנת שדות להוספה/עדכון
-                fields = list(item_data.keys())
-                values = [item_data[field] for field in fields]
-                
-                # בדיקה אם הפריט כבר קיים
-                cursor.execute(
-                    "SELECT id FROM items WHERE name = %s",
-                    (name,)
-                )
-                existing_item = cursor.fetchone()
-                
-                if existing_item:
-                    # עדכון פריט קיים
-                    set_clause = ", ".join([f"{field} = %s" for field in fields])
-                    update_query = f"UPDATE items SET {set_clause} WHERE id = %s"
-                    cursor.execute(update_query, values + [existing_item[0]])
-                    items_updated += 1
+
+        warnings = []
+        unknown = [field for field in db_field_to_column if field not in IMPORT_FIELDS]
+        if unknown:
+            warnings.append(f"שדות לא מוכרים לא יובאו: {', '.join(unknown)}")
+        missing = [col for field, col in db_field_to_column.items()
+                   if field in IMPORT_FIELDS and col not in df.columns]
+        if missing:
+            return {"error": f"עמודות לא נמצאו בקובץ: {', '.join(map(str, missing))}"}
+
+        # שדות ממופים מתעדכנים גם בפריט קיים; ברירות המחדל חלות רק על פריט חדש
+        fields = [field for field in IMPORT_FIELDS
+                  if field in db_field_to_column or field in IMPORT_DEFAULTS]
+        update_fields = [field for field in fields
+                         if field in db_field_to_column and field not in IMPORT_KEY]
+
+        rows, duplicates, row_errors = build_import_rows(df, db_field_to_column, fields)
+        if duplicates:
+            warnings.append(f"{duplicates} שורות חוזרות על פריט קיים בקובץ - נשמרה השורה האחרונה")
+
+        diff, samples = {'insert': 0, 'update': 0, 'unchanged': 0}, []
+        if rows:
+            with get_db_connection() as conn:
+                with conn.cursor() as cursor:
+                    stage_import_rows(cursor, fields, rows)
+                    diff, samples = diff_staged_items(cursor, update_fields)
+                    # מטמוני הדשבורד מתעדכנים רק כשהייבוא שינה פריטים
+                    if not dry_run and upsert_staged_items(cursor, fields, update_fields):
+                        bump_data_version(cursor)
+                if dry_run:
+                    conn.rollback()
                 else:
-                    # הוספת פריט חדש
-                    placeholders = ", ".join(["%s"] * len(fields))
-                    insert_query = f"INSERT INTO items ({', '.join(fields)}) VALUES ({placeholders})"
-                    cursor.execute(insert_query, values)
-                    items_added += 1
-                
-            except Exception as row_error:
-                # תיעוד שגיאה בשורה ספציפית
-                error_msg = f"שגיאה בשורה {idx+1}: {str(row_error)}"
-                print(error_msg, file=sys.stderr)
-                errors.append(error_msg)
-                continue  # המשך לשורה הבאה
-        
-        conn.commit()
-        conn.close()
+                    conn.commit()
         
         result = {
             "success": True,
-            "items_added": items_added,
-            "items_updated": items_updated,
-            "total_processed": items_added + items_updated
+            "dry_run": dry_run,
+            "items_added": diff['insert'],
+            "items_updated": diff['update'],
+            "items_unchanged": diff['unchanged'],
+            "total_processed": diff['insert'] + diff['update'] + diff['unchanged'],
+            "changes": samples,
+            # תאים שלא ניתן היה להמיר ויובאו עם ערך ברירת מחדל
+            "error_count": len(row_errors),
+            "errors": row_errors[:DIFF_SAMPLE_SIZE]
         }
         
-        if errors:
-            result["warnings"] = errors[:10]  # החזרת עד 10 שגיאות ראשונות
-            result["error_count"] = len(errors)
+        if warnings:
+            result["warnings"] = warnings
         
         return result
     except Exception as e:
@@ -283,6 +653,8 @@ def import_excel_to_database(file_path, column_mapping):
 
 def create_excel_template():
     """יוצר קובץ תבנית לייבוא נתונים"""
+    import pandas as pd
+
     try:
         # יצירת DataFrame עם כל העמודות הנדרשות
         columns = [
@@ -334,142 +706,6 @@ def create_excel_template():
         print(f"שגיאה ביצירת תבנית אקסל: {str(e)}", file=sys.stderr)
         return {"error": str(e)}
 
-def export_inventory_to_excel(filters=None):
-    """מייצא את רשימת המלאי לקובץ אקסל"""
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # בסיס השאילתה
-        query = "SELECT * FROM items"
-        params = []
-        
-        # הוספת פילטרים אם הוגדרו
-        if filters:
-            clauses = []
-            
-            if 'onlyAvailable' in filters and filters['onlyAvailable']:
-                clauses.append("is_available = true")
-            
-            if 'hasQuantity' in filters and filters['hasQuantity']:
-                clauses.append("quantity > 0")
-            
-            if 'ordered' in filters and filters['ordered'] is not None:
-                clauses.append("ordered = %s")
-                params.append(filters['ordered'])
-            
-            if 'checkedOut' in filters and filters['checkedOut'] is not None:
-                clauses.append("checked_out = %s")
-                params.append(filters['checkedOut'])
-            
-            if 'checked' in filters and filters['checked'] is not None:
-                clauses.append("checked = %s")
-                params.append(filters['checked'])
-            
-            if 'returned' in filters and filters['returned'] is not None:
-                clauses.append("returned = %s")
-                params.append(filters['returned'])
-            
-            if 'categories' in filters and filters['categories']:
-                placeholders = ', '.join(['%s'] * len(filters['categories']))
-                clauses.append(f"category IN ({placeholders})")
-                params.extend(filters['categories'])
-            
-            if 'searchQuery' in filters and filters['searchQuery']:
-                search_term = f"%{filters['searchQuery']}%"
-                clauses.append("(name ILIKE %s OR category ILIKE %s OR notes ILIKE %s)")
-                params.extend([search_term, search_term, search_term])
-            
-            if clauses:
-                query += " WHERE " + " AND ".join(clauses)
-        
-        # הוספת סדר מיון
-        if filters and 'orderBy' in filters and 'order' in filters:
-            order_by = filters['orderBy']
-            order = filters['order'].upper()
-            
-            # וידוא תקינות שדה המיון והכיוון
-            valid_fields = ['name', 'category', 'quantity', 'price_per_unit', 'total_price']
-            valid_orders = ['ASC', 'DESC']
-            
-            if order_by in valid_fields and order in valid_orders:
-                query += f" ORDER BY {order_by} {order}"
-        else:
-            # מיון ברירת מחדל
-            query += " ORDER BY category ASC, name ASC"
-        
-        # ביצוע השאילתה
-        cursor.execute(query, params)
-        items = cursor.fetchall()
-        
-        # קבלת שמות העמודות
-        cursor.execute("SELECT column_name FROM information_schema.columns WHERE table_name = 'items' ORDER BY ordinal_position")
-        columns = [row[0] for row in cursor.fetchall()]
-        
-        conn.close()
-        
-        # המרת הנתונים ל-DataFrame
-        data = []
-        for item in items:
-            item_dict = {}
-            for i, col in enumerate(columns):
-                item_dict[col] = item[i]
-            data.append(item_dict)
-        
-        df = pd.DataFrame(data)
-        
-        # מיפוי שמות העמודות לעברית
-        hebrew_columns = {
-            'id': 'מזהה',
-            'name': 'פריט',
-            'category': 'קטגוריה',
-            'quantity': 'כמות',
-            'notes': 'הערות',
-            'category_original': 'קטגוריה מקורית',
-            'order_notes': 'הערות על הזמנה',
-            'ordered': 'הוזמן',
-            'checked_out': 'יצא',
-            'checked': 'נבדק',
-            'checkout_notes': 'הערות על הוצאה',
-            'returned': 'חזר',
-            'return_notes': 'הערות על החזרה',
-            'price_per_unit': 'מחיר ליחידה',
-            'total_price': 'מחיר כולל',
-            'unnnamed_11': 'שדה נוסף',
-            'director': 'במאית',
-            'producer': 'מפיקה',
-            'photographer': 'צלמת',
-            'is_available': 'זמין',
-            'available_quantity': 'כמות זמינה',
-            'loaned_quantity': 'כמות מושאלת',
-            'created_at': 'נוצר בתאריך',
-            'updated_at': 'עודכן בתאריך'
-        }
-        
-        # שינוי שמות העמודות
-        df.rename(columns=lambda x: hebrew_columns.get(x, x), inplace=True)
-        
-        # המרת ערכים בוליאניים לכן/לא
-        boolean_columns = ['הוזמן', 'יצא', 'נבדק', 'חזר', 'זמין']
-        for col in boolean_columns:
-            if col in df.columns:
-                df[col] = df[col].apply(lambda x: 'כן' if x else 'לא')
-        
-        # הוספת תאריך ושעה לשם הקובץ
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        
-        # שמירת הקובץ בתיקייה זמנית
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx')
-        temp_file.close()
-        
-        # שמירת הקובץ
-        df.to_excel(temp_file.name, index=False, engine='openpyxl')
-        
-        return {"file_path": temp_file.name}
-    except Exception as e:
-        print(f"שגיאה בייצוא נתוני מלאי לאקסל: {str(e)}", file=sys.stderr)
-        return {"error": str(e)}
-
 def main():
     """פונקציה ראשית"""
     # קריאת נתוני קלט JSON
@@ -481,7 +717,7 @@ def main():
     # טיפול בפעולות שלא דורשות קובץ קלט (כמו יצירת תבנית)
     if action == 'export':
         filters = input_data.get('filters')
-        result = export_inventory_to_excel(filters)
+        result = export_inventory_to_excel(filters, input_data.get('format') or 'xlsx')
         print(json.dumps(result))
         return
     elif action == 'template':
@@ -495,11 +731,12 @@ def main():
         return
     
     if action == 'preview':
+        # תצוגה מקדימה של קובץ גדול - עברית כ-UTF-8 ולא כרצפי \u, כדי שהפלט יהיה קטן פי כמה
         result = preview_excel(file_path)
-        print(json.dumps(result))
+        print(dumps(result))
     elif action == 'import':
         column_mapping = input_data.get('mapping', {})
-        result = import_excel_to_database(file_path, column_mapping)
+        result = import_excel_to_database(file_path, column_mapping, bool(input_data.get('dry_run')))
         print(json.dumps(result))
     else:
         print(json.dumps({"error": f"פעולה לא מוכרת: {action}"}))
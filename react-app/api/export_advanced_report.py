@@ -7,7 +7,6 @@ import sys
 import json
 import datetime
 import traceback
-import pandas as pd
 import io
 import tempfile
 import base64
@@ -25,16 +24,14 @@ from advanced_analytics import (
     comparative_periods_analysis,
     export_advanced_report
 )
+from report_cache import cached_report
+from serialization import dumps
 
-class DateTimeEncoder(json.JSONEncoder):
-    """מחלקה להמרת אובייקטי תאריך ל-JSON"""
-    def default(self, o):
-        if isinstance(o, (datetime.datetime, datetime.date)):
-            return o.isoformat()
-        return super().default(o)
 
 def create_excel_report(report_type, data):
     """יצירת קובץ אקסל מנתוני הדו"ח"""
+    import pandas as pd
+
     output = io.BytesIO()
     
     with pd.ExcelWriter(output, engine='openpyxl') as writer:
@@ -119,6 +116,8 @@ def create_excel_report(report_type, data):
 
 def create_csv_report(report_type, data):
     """יצירת קובץ CSV מנתוני הדו"ח"""
+    import pandas as pd
+
     if report_type == 'usage_trends' and data.get('most_popular_items'):
         return pd.DataFrame(data['most_popular_items']).to_csv(index=False)
     
@@ -149,11 +148,13 @@ def main():
                 'success': False,
                 'error': 'לא סופק סוג דו"ח (report_type)'
             }
-            print(json.dumps(result, cls=DateTimeEncoder))
+            print(dumps(result))
             return
         
-        # הפקת הדו"ח המבוקש
-        report_data = export_advanced_report(report_type, params)
+        # הפקת הדו"ח המבוקש, או קריאתו מהמטמון אם הנתונים לא השתנו
+        report_data, _ = cached_report(
+            report_type, params, lambda: export_advanced_report(report_type, params)
+        )
         
         # החזרת הדו"ח בפורמט המבוקש
         if format == 'json':
@@ -164,7 +165,7 @@ def main():
                 'format': 'json',
                 'generated_at': datetime.datetime.now().isoformat()
             }
-            print(json.dumps(result, cls=DateTimeEncoder))
+            print(dumps(result))
             
         elif format == 'excel':
             excel_data = create_excel_report(report_type, report_data)
@@ -178,7 +179,7 @@ def main():
                 'data': encoded_excel,
                 'generated_at': datetime.datetime.now().isoformat()
             }
-            print(json.dumps(result, cls=DateTimeEncoder))
+            print(dumps(result))
             
         elif format == 'csv':
             csv_data = create_csv_report(report_type, report_data)
@@ -192,22 +193,22 @@ def main():
                 'data': encoded_csv,
                 'generated_at': datetime.datetime.now().isoformat()
             }
-            print(json.dumps(result, cls=DateTimeEncoder))
+            print(dumps(result))
         
         else:
             result = {
                 'success': False,
                 'error': f'פורמט לא נתמך: {format}'
             }
-            print(json.dumps(result, cls=DateTimeEncoder))
+            print(dumps(result))
         
     except Exception as e:
         error_details = traceback.format_exc()
-        print(json.dumps({
+        print(dumps({
             'success': False,
             'error': f'שגיאה בייצוא הדו"ח: {str(e)}',
             'details': error_details
-        }, cls=DateTimeEncoder))
+        }))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,159 +1,179 @@
 """
-סקריפט זה מייצא נתונים מבסיס הנתונים לקובץ אקסל.
+סקריפט זה מייצא נתונים מבסיס הנתונים לקובץ אקסל או CSV.
 מאפשר סינון הנתונים לפי קריטריונים שונים.
+
+הייצוא עובר דרך streaming_export: השורות נקראות מ-cursor בצד השרת ונכתבות
+בזרימה לקובץ זמני ייחודי, כך שגם היסטוריית ההשאלות המלאה לא נטענת לזיכרון.
+
+קלט: {"filters": {...}, "format": "xlsx"|"csv"} לייצוא המלאי,
+{"loans": true, "format": ...} להיסטוריית ההשאלות, או {"template": true}.
 """
 
 import json
 import sys
 import os
 import tempfile
-from datetime import datetime
-import pandas as pd
 
 # הוסף את תיקיית השורש של הפרויקט ל-path כדי שנוכל לייבא את database.py
 project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 sys.path.append(project_root)
 
-from database import get_db_connection
+from item_search import has_search_table, has_trigram_index, search_filter
+from streaming_export import ExportSheet, export_sheets, yes_no
 
-def export_inventory_to_excel(filters=None):
-    """מייצא את רשימת המלאי לקובץ אקסל"""
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # בסיס השאילתה
-        query = "SELECT * FROM items"
-        params = []
-        
-        # הוספת פילטרים אם הוגדרו
-        if filters:
-            clauses = []
-            
-            if 'onlyAvailable' in filters and filters['onlyAvailable']:
-                clauses.append("is_available = true")
-            
-            if 'hasQuantity' in filters and filters['hasQuantity']:
-                clauses.append("quantity > 0")
-            
-            if 'ordered' in filters and filters['ordered'] is not None:
-                clauses.append("ordered = %s")
-                params.append(filters['ordered'])
-            
-            if 'checkedOut' in filters and filters['checkedOut'] is not None:
-                clauses.append("checked_out = %s")
-                params.append(filters['checkedOut'])
-            
-            if 'checked' in filters and filters['checked'] is not None:
-                clauses.append("checked = %s")
-                params.append(filters['checked'])
-            
-            if 'returned' in filters and filters['returned'] is not None:
-                clauses.append("returned = %s")
-                params.append(filters['returned'])
-            
-            if 'categories' in filters and filters['categories']:
-                placeholders = ', '.join(['%s'] * len(filters['categories']))
-                clauses.append(f"category IN ({placeholders})")
-                params.extend(filters['categories'])
-            
-            if 'searchQuery' in filters and filters['searchQuery']:
-                search_term = f"%{filters['searchQuery']}%"
-                clauses.append("(name ILIKE %s OR category ILIKE %s OR notes ILIKE %s)")
-                params.extend([search_term, search_term, search_term])
-            
-            if clauses:
-                query += " WHERE " + " AND ".join(clauses)
-        
-        # הוספת סדר מיון
-        if filters and 'orderBy' in filters and 'order' in filters:
-            order_by = filters['orderBy']
-            order = filters['order'].upper()
-            
-            # וידוא תקינות שדה המיון והכיוון
-            valid_fields = ['name', 'category', 'quantity', 'price_per_unit', 'total_price']
-            valid_orders = ['ASC', 'DESC']
-            
-            if order_by in valid_fields and order in valid_orders:
-                query += f" ORDER BY {order_by} {order}"
-        else:
-            # מיון ברירת מחדל
-            query += " ORDER BY category ASC, name ASC"
-        
-        # ביצוע השאילתה
-        cursor.execute(query, params)
-        items = cursor.fetchall()
-        
-        # קבלת שמות העמודות
-        cursor.execute("SELECT column_name FROM information_schema.columns WHERE table_name = 'items' ORDER BY ordinal_position")
-        columns = [row[0] for row in cursor.fetchall()]
-        
-        conn.close()
-        
-        # המרת הנתונים ל-DataFrame
-        data = []
-        for item in items:
-            item_dict = {}
-            for i, col in enumerate(columns):
-                item_dict[col] = item[i]
-            data.append(item_dict)
-        
-        df = pd.DataFrame(data)
-        
-        # מיפוי שמות העמודות לעברית
-        hebrew_columns = {
-            'id': 'מזהה',
-            'name': 'פריט',
-            'category': 'קטגוריה',
-            'quantity': 'כמות',
-            'notes': 'הערות',
-            'category_original': 'קטגוריה מקורית',
-            'order_notes': 'הערות על הזמנה',
-            'ordered': 'הוזמן',
-            'checked_out': 'יצא',
-            'checked': 'נבדק',
-            'checkout_notes': 'הערות על הוצאה',
-            'returned': 'חזר',
-            'return_notes': 'הערות על החזרה',
-            'price_per_unit': 'מחיר ליחידה',
-            'total_price': 'מחיר כולל',
-            'unnnamed_11': 'שדה נוסף',
-            'director': 'במאית',
-            'producer': 'מפיקה',
-            'photographer': 'צלמת',
-            'is_available': 'זמין',
-            'available_quantity': 'כמות זמינה',
-            'loaned_quantity': 'כמות מושאלת',
-            'created_at': 'נוצר בתאריך',
-            'updated_at': 'עודכן בתאריך'
-        }
-        
-        # שינוי שמות העמודות
-        df.rename(columns=lambda x: hebrew_columns.get(x, x), inplace=True)
-        
-        # המרת ערכים בוליאניים לכן/לא
-        boolean_columns = ['הוזמן', 'יצא', 'נבדק', 'חזר', 'זמין']
-        for col in boolean_columns:
-            if col in df.columns:
-                df[col] = df[col].apply(lambda x: 'כן' if x else 'לא')
-        
-        # הוספת תאריך ושעה לשם הקובץ
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        
-        # שמירת הקובץ בתיקייה זמנית
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx')
-        temp_file.close()
+# מיפוי שמות העמודות לעברית
+INVENTORY_HEADERS = {
+    'id': 'מזהה',
+    'name': 'פריט',
+    'category': 'קטגוריה',
+    'quantity': 'כמות',
+    'notes': 'הערות',
+    'category_original': 'קטגוריה מקורית',
+    'order_notes': 'הערות על הזמנה',
+    'ordered': 'הוזמן',
+    'checked_out': 'יצא',
+    'checked': 'נבדק',
+    'checkout_notes': 'הערות על הוצאה',
+    'returned': 'חזר',
+    'return_notes': 'הערות על החזרה',
+    'price_per_unit': 'מחיר ליחידה',
+    'total_price': 'מחיר כולל',
+    'unnnamed_11': 'שדה נוסף',
+    'director': 'במאית',
+    'producer': 'מפיקה',
+    'photographer': 'צלמת',
+    'is_available': 'זמין',
+    'available_quantity': 'כמות זמינה',
+    'loaned_quantity': 'כמות מושאלת',
+    'created_at': 'נוצר בתאריך',
+    'updated_at': 'עודכן בתאריך'
+}
+
+# ערכים בוליאניים מיוצאים כ"כן"/"לא"
+INVENTORY_CONVERTERS = {
+    column: yes_no for column in ['ordered', 'checked_out', 'checked', 'returned', 'is_available']
+}
+
+LOANS_HISTORY_QUERY = """
+    SELECT l.id, i.name AS item_name, i.category, l.student_name, l.student_id,
+           l.quantity, l.loan_date, l.due_date, l.return_date,
+           l.checkout_notes, l.return_notes
+    FROM loans l
+    JOIN items i ON l.item_id = i.id
+    ORDER BY l.loan_date, l.id
+"""
+
+LOANS_HISTORY_HEADERS = {
+    'id': 'מזהה השאלה',
+    'item_name': 'פריט',
+    'category': 'קטגוריה',
+    'student_name': 'שם סטודנט',
+    'student_id': 'ת.ז. סטודנט',
+    'quantity': 'כמות',
+    'loan_date': 'תאריך השאלה',
+    'due_date': 'תאריך החזרה נדרש',
+    'return_date': 'תאריך החזרה',
+    'checkout_notes': 'הערות בהשאלה',
+    'return_notes': 'הערות בהחזרה'
+}
+
+# העמודות של הפריט שמיוצאות; עמודות פנימיות (row_version ו-updated_at של
+# מיגרציה 6) לא נכנסות לקובץ
+INVENTORY_COLUMNS = (
+    'id', 'name', 'category', 'quantity', 'available', 'notes', 'is_available',
+    'category_original', 'order_notes', 'ordered', 'checked_out', 'checked',
+    'checkout_notes', 'returned', 'return_notes', 'price_per_unit', 'total_price',
+    'unnnamed_11', 'director', 'producer', 'photographer'
+)
+
+def build_inventory_query(filters=None):
+    """בונה את שאילתת ייצוא המלאי והפרמטרים שלה לפי הפילטרים"""
+    # בסיס השאילתה
+    query = f"SELECT {', '.join(INVENTORY_COLUMNS)} FROM items"
+    params = []
+    
+    # הוספת פילטרים אם הוגדרו
+    if filters:
+        clauses = []
+        
+        if 'onlyAvailable' in filters and filters['onlyAvailable']:
+            clauses.append("is_available = true")
+        
+        if 'hasQuantity' in filters and filters['hasQuantity']:
+            clauses.append("quantity > 0")
+        
+        if 'ordered' in filters and filters['ordered'] is not None:
+            clauses.append("ordered = %s")
+            params.append(filters['ordered'])
+        
+        if 'checkedOut' in filters and filters['checkedOut'] is not None:
+            clauses.append("checked_out = %s")
+            params.append(filters['checkedOut'])
+        
+        if 'checked' in filters and filters['checked'] is not None:
+            clauses.append("checked = %s")
+            params.append(filters['checked'])
+        
+        if 'returned' in filters and filters['returned'] is not None:
+            clauses.append("returned = %s")
+            params.append(filters['returned'])
+        
+        if 'categories' in filters and filters['categories']:
+            placeholders = ', '.join(['%s'] * len(filters['categories']))
+            clauses.append(f"category IN ({placeholders})")
+            params.extend(filters['categories'])
+        
+        # אותו חיפוש כמו ב-search_items, על האינדקסים של item_search
+        if 'searchQuery' in filters and filters['searchQuery']:
+            clause, search_params = search_filter(filters['searchQuery'], has_trigram_index(),
+                                                  indexed=has_search_table())
+            clauses.append(clause)
+            params.extend(search_params)
+        
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+    
+    # הוספת סדר מיון
+    if filters and 'orderBy' in filters and 'order' in filters:
+        order_by = filters['orderBy']
+        order = filters['order'].upper()
         
-        # שמירת הקובץ
-        df.to_excel(temp_file.name, index=False, engine='openpyxl')
+        # וידוא תקינות שדה המיון והכיוון
+        valid_fields = ['name', 'category', 'quantity', 'price_per_unit', 'total_price']
+        valid_orders = ['ASC', 'DESC']
         
-        return {"file_path": temp_file.name}
+        if order_by in valid_fields and order in valid_orders:
+            query += f" ORDER BY {order_by} {order}"
+    else:
+        # מיון ברירת מחדל
+        query += " ORDER BY category ASC, name ASC"
+
+    return query, params
+
+def export_inventory_to_excel(filters=None, file_format='xlsx'):
+    """מייצא את רשימת המלאי לקובץ אקסל (או CSV)"""
+    try:
+        query, params = build_inventory_query(filters)
+        sheet = ExportSheet('מלאי', query, params, INVENTORY_HEADERS, INVENTORY_CONVERTERS)
+        return {"file_path": export_sheets([sheet], file_format, prefix='inventory_export_')}
     except Exception as e:
         print(f"שגיאה בייצוא נתוני מלאי לאקסל: {str(e)}", file=sys.stderr)
         return {"error": str(e)}
 
+def export_loans_history(file_format='xlsx'):
+    """מייצא את כל היסטוריית ההשאלות, בזרימה"""
+    try:
+        sheet = ExportSheet('היסטוריית השאלות', LOANS_HISTORY_QUERY, None, LOANS_HISTORY_HEADERS)
+        return {"file_path": export_sheets([sheet], file_format, prefix='loans_export_')}
+    except Exception as e:
+        print(f"שגיאה בייצוא היסטוריית ההשאלות: {str(e)}", file=sys.stderr)
+        return {"error": str(e)}
+
 def create_excel_template():
     """יוצר קובץ תבנית לייבוא נתונים"""
+    # pandas נדרש רק לתבנית; הייצוא עצמו עובר דרך streaming_export
+    import pandas as pd
+
     try:
         # יצירת DataFrame עם כל העמודות הנדרשות
         columns = [
@@ -210,13 +230,17 @@ def main():
     # קריאת נתוני קלט JSON
     input_data = json.loads(sys.stdin.read() or "{}")
     
-    # בדיקה אם מדובר ביצירת תבנית או ייצוא רגיל
+    file_format = input_data.get('format') or 'xlsx'
+    
+    # בדיקה אם מדובר ביצירת תבנית, היסטוריית השאלות או ייצוא רגיל
     if input_data.get('template'):
         result = create_excel_template()
+    elif input_data.get('loans'):
+        result = export_loans_history(file_format)
     else:
         # ייצוא רגיל (עם פילטרים אופציונליים)
         filters = input_data.get('filters')
-        result = export_inventory_to_excel(filters)
+        result = export_inventory_to_excel(filters, file_format)
     
     print(json.dumps(result))
 
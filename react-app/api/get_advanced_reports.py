@@ -21,13 +21,8 @@ from advanced_analytics import (
     comparative_periods_analysis,
     export_advanced_report
 )
-
-class DateTimeEncoder(json.JSONEncoder):
-    """מחלקה להמרת אובייקטי תאריך ל-JSON"""
-    def default(self, o):
-        if isinstance(o, (datetime.datetime, datetime.date)):
-            return o.isoformat()
-        return super().default(o)
+from report_cache import cached_report
+from serialization import dumps
 
 def main():
     """פונקציה ראשית שמחזירה דו"חות מתקדמים בהתאם לבקשת המשתמש"""
@@ -45,26 +40,29 @@ def main():
                 'error': 'לא סופק סוג דו"ח (report_type)'
             }
         else:
-            # הפקת הדו"ח המבוקש
-            report_data = export_advanced_report(report_type, params)
+            # הפקת הדו"ח המבוקש, או קריאתו מהמטמון אם הנתונים לא השתנו
+            report_data, cached = cached_report(
+                report_type, params, lambda: export_advanced_report(report_type, params)
+            )
             
             result = {
                 'success': True,
                 'report_type': report_type,
                 'data': report_data,
+                'cached': cached,
                 'generated_at': datetime.datetime.now().isoformat()
             }
         
         # החזרת התוצאה ב-JSON
-        print(json.dumps(result, cls=DateTimeEncoder))
+        print(dumps(result))
         
     except Exception as e:
         error_details = traceback.format_exc()
-        print(json.dumps({
+        print(dumps({
             'success': False,
             'error': f'שגיאה בהפקת הדו"ח: {str(e)}',
             'details': error_details
-        }, cls=DateTimeEncoder))
+        }))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,5 +1,8 @@
 """
 סקריפט זה מחזיר ניתוח של השאלות לפי קטגוריות ציוד.
+ההשאלות נספרות מהסיכום החודשי loan_stats_monthly (loan_stats.py); רק
+ההשאלות הפתוחות נקראות מטבלת loans, כי משך ההשאלה שלהן עדיין גדל.
+לפני שמיגרציה 9 הורצה הסיכום מחושב מטבלת loans.
 """
 
 import json
@@ -11,23 +14,47 @@ project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(_
 sys.path.append(project_root)
 
 from database import get_db_connection
+from loan_stats import rollup_available, stats_source, students_source
 
 def get_category_analysis():
     """מחזיר נתונים על השימוש בציוד לפי קטגוריות"""
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
+        rollup = rollup_available(cursor)
         
-        # שאילתה לקבלת נתוני השימוש לפי קטגוריות
-        cursor.execute("""
+        # שאילתה לקבלת נתוני השימוש לפי קטגוריות. משך ממוצע: ימי ההשאלות
+        # שהוחזרו מהסיכום, ועוד ההשאלות הפתוחות עד עכשיו
+        cursor.execute(f"""
             SELECT 
-                i.category,
-                COUNT(l.id) AS loan_count,
-                COUNT(DISTINCT student_id) AS unique_students,
-                COALESCE(AVG(EXTRACT(EPOCH FROM (COALESCE(l.return_date, CURRENT_TIMESTAMP) - l.checkout_date)) / 86400), 0) AS avg_loan_days
-            FROM items i
-            LEFT JOIN loans l ON i.id = l.item_id
-            GROUP BY i.category
+                c.category,
+                COALESCE(s.loan_count, 0) AS loan_count,
+                COALESCE(st.unique_students, 0) AS unique_students,
+                COALESCE(
+                    (COALESCE(s.returned_days, 0) + COALESCE(o.open_days, 0))
+                    / NULLIF(COALESCE(s.returned_count, 0) + COALESCE(o.open_count, 0), 0),
+                    0) AS avg_loan_days
+            FROM (SELECT DISTINCT category FROM items) c
+            LEFT JOIN (
+                SELECT category, SUM(loan_count) AS loan_count,
+                       SUM(returned_count) AS returned_count, SUM(returned_days) AS returned_days
+                FROM {stats_source(rollup)} s
+                GROUP BY category
+            ) s ON s.category = c.category
+            LEFT JOIN (
+                SELECT i.category, COUNT(DISTINCT m.student_id) AS unique_students
+                FROM {students_source(rollup)} m
+                JOIN items i ON i.id = m.item_id
+                GROUP BY i.category
+            ) st ON st.category = c.category
+            LEFT JOIN (
+                SELECT i.category, COUNT(*) AS open_count,
+                       SUM(EXTRACT(EPOCH FROM (CURRENT_TIMESTAMP - l.loan_date)) / 86400) AS open_days
+                FROM loans l
+                JOIN items i ON i.id = l.item_id
+                WHERE l.return_date IS NULL AND l.loan_date IS NOT NULL
+                GROUP BY i.category
+            ) o ON o.category = c.category
             ORDER BY loan_count DESC
         """)
         
@@ -37,7 +64,7 @@ def get_category_analysis():
                 'category': row[0] or 'ללא קטגוריה',
                 'loan_count': row[1],
                 'unique_students': row[2],
-                'avg_loan_days': round(row[3], 1) if row[3] is not None else 0
+                'avg_loan_days': round(float(row[3]), 1) if row[3] is not None else 0
             })
         
         # מקבל את כמות הפריטים בכל קטגוריה
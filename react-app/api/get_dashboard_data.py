@@ -1,6 +1,9 @@
 """
 גרסה מותנה של get_dashboard_data עם ביצועים משופרים.
-מבצע את כל השאילתות בחיבור אחד למניעת timeout.
+כל נתוני הדשבורד מחושבים בשאילתה אחת (CTE + json_agg), והתוצאה נשמרת
+כתמונת מצב בטבלת snapshot_cache לפי גרסת הנתונים. תמונת המצב מחושבת מחדש
+רק כשהגרסה מתקדמת (השאלה, החזרה, עדכון/מחיקת פריט, שינוי הזמנה) או כשעבר
+DASHBOARD_SNAPSHOT_TTL שניות, כדי שהשאלות שעבר מועדן יופיעו גם ללא שינוי.
 """
 import json
 import datetime
@@ -10,192 +13,170 @@ import sys
 # הוספת נתיב לספריית האב כדי לאפשר ייבוא מודולים
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
-from database import get_db_connection
+from psycopg2.extras import Json
+from database import get_db_connection, data_versions_available
 from utils import get_israel_time
 
+SNAPSHOT_NAME = 'dashboard'
+SNAPSHOT_TTL = int(os.getenv('DASHBOARD_SNAPSHOT_TTL', '300'))
+
+DASHBOARD_QUERY = """
+    WITH overview AS (
+        SELECT COUNT(*) AS total_items,
+               SUM(quantity) AS total_quantity,
+               COUNT(DISTINCT category) AS category_count,
+               SUM(CASE WHEN is_available = TRUE THEN quantity ELSE 0 END) AS available_items,
+               SUM(CASE WHEN is_available = FALSE THEN quantity ELSE 0 END) AS unavailable_items
+        FROM items
+    ),
+    categories AS (
+        SELECT category AS name,
+               COUNT(*) AS item_count,
+               SUM(quantity) AS total_quantity,
+               SUM(available) AS available_quantity
+        FROM items
+        GROUP BY category
+    ),
+    open_loans AS (
+        SELECT l.id, l.student_name, l.student_id, i.name AS item_name,
+               l.quantity, l.due_date, l.loan_date
+        FROM loans l
+        JOIN items i ON l.item_id = i.id
+        WHERE l.return_date IS NULL
+    ),
+    active_loans AS (
+        SELECT * FROM open_loans
+        ORDER BY loan_date DESC
+        LIMIT 10
+    ),
+    overdue_loans AS (
+        SELECT * FROM open_loans
+        WHERE due_date < %(now)s
+    ),
+    upcoming_reservations AS (
+        SELECT r.id, r.student_name, r.student_id, i.name AS item_name,
+               r.quantity, r.start_date, r.end_date, r.status
+        FROM reservations r
+        JOIN items i ON r.item_id = i.id
+        WHERE r.start_date BETWEEN %(now)s AND %(week_ahead)s
+    ),
+    popular_items AS (
+        SELECT i.id, i.name, i.category, COUNT(l.id) AS loan_count
+        FROM items i
+        LEFT JOIN loans l ON i.id = l.item_id
+        GROUP BY i.id, i.name, i.category
+        ORDER BY loan_count DESC
+        LIMIT 10
+    ),
+    low_stock_items AS (
+        SELECT i.id, i.name, i.category,
+               i.quantity AS total_quantity,
+               i.available AS available_quantity,
+               CASE WHEN i.quantity > 0 THEN (i.available::float / i.quantity * 100) ELSE 0 END AS percent_available
+        FROM items i
+        WHERE i.quantity > 0 AND (i.available::float / i.quantity * 100) < 20
+        ORDER BY percent_available ASC
+        LIMIT 10
+    )
+    SELECT
+        COALESCE((SELECT version FROM data_versions WHERE name = %(name)s), 0) AS version,
+        json_build_object(
+            'inventory_summary', json_build_object(
+                'overview', json_build_object(
+                    'total_items', COALESCE(o.total_items, 0),
+                    'total_quantity', COALESCE(o.total_quantity, 0),
+                    'category_count', COALESCE(o.category_count, 0),
+                    'loaned_items', (SELECT COUNT(*) FROM open_loans)
+                ),
+                'availability', json_build_object(
+                    'available', COALESCE(o.available_items, 0),
+                    'unavailable', COALESCE(o.unavailable_items, 0)
+                ),
+                'categories', COALESCE((
+                    SELECT json_agg(c ORDER BY c.total_quantity DESC) FROM categories c
+                ), '[]'::json)
+            ),
+            'active_loans', COALESCE((
+                SELECT json_agg(a ORDER BY a.loan_date DESC) FROM active_loans a
+            ), '[]'::json),
+            'upcoming_reservations', COALESCE((
+                SELECT json_agg(u ORDER BY u.start_date ASC) FROM upcoming_reservations u
+            ), '[]'::json),
+            'overdue_loans', COALESCE((
+                SELECT json_agg(d ORDER BY d.due_date ASC) FROM overdue_loans d
+            ), '[]'::json),
+            'popular_items', COALESCE((
+                SELECT json_agg(p ORDER BY p.loan_count DESC) FROM popular_items p
+            ), '[]'::json),
+            'low_stock_items', COALESCE((
+                SELECT json_agg(s ORDER BY s.percent_available ASC) FROM low_stock_items s
+            ), '[]'::json)
+        ) AS payload
+    FROM overview o
+"""
+
+# בלי טבלת data_versions (מסד שלא עבר init_db) הגרסה תמיד 0
+DASHBOARD_QUERY_NO_VERSIONS = DASHBOARD_QUERY.replace(
+    "COALESCE((SELECT version FROM data_versions WHERE name = %(name)s), 0)", "0"
+)
+
+
+def load_dashboard_snapshot(cursor):
+    """מחזיר את תמונת המצב השמורה אם היא תואמת לגרסת הנתונים הנוכחית"""
+    cursor.execute("""
+        SELECT s.payload
+        FROM snapshot_cache s
+        WHERE s.name = %s
+          AND s.version = COALESCE((SELECT version FROM data_versions WHERE name = %s), 0)
+          AND s.created_at > CURRENT_TIMESTAMP - make_interval(secs => %s)
+    """, (SNAPSHOT_NAME, SNAPSHOT_NAME, SNAPSHOT_TTL))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def save_dashboard_snapshot(cursor, version, payload):
+    """שומר את תמונת המצב יחד עם הגרסה שממנה חושבה"""
+    cursor.execute("""
+        INSERT INTO snapshot_cache (name, version, payload, created_at)
+        VALUES (%s, %s, %s, CURRENT_TIMESTAMP)
+        ON CONFLICT (name) DO UPDATE
+        SET version = EXCLUDED.version,
+            payload = EXCLUDED.payload,
+            created_at = EXCLUDED.created_at
+    """, (SNAPSHOT_NAME, version, Json(payload)))
+
 
 def get_all_dashboard_data():
     """מחזיר את כל נתוני הדשבורד בשאילתה אחת מותאמת"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    try:
-        # נתוני מלאי כללי
-        cursor.execute("""
-            SELECT COUNT(*) AS total_items,
-                   SUM(quantity) AS total_quantity,
-                   COUNT(DISTINCT category) AS category_count,
-                   SUM(CASE WHEN is_available = TRUE THEN quantity ELSE 0 END) AS available_items,
-                   SUM(CASE WHEN is_available = FALSE THEN quantity ELSE 0 END) AS unavailable_items
-            FROM items
-        """)
-        overview_data = cursor.fetchone()
-        if overview_data is None:
-            overview_data = (0, 0, 0, 0, 0)
-        
-        # נתונים לפי קטגוריה
-        cursor.execute("""
-            SELECT category, 
-                   COUNT(*) AS item_count, 
-                   SUM(quantity) AS total_quantity,
-                   SUM(available) AS available_quantity
-            FROM items
-            GROUP BY category
-            ORDER BY total_quantity DESC
-        """)
-        categories = []
-        for row in cursor.fetchall():
-            categories.append({
-                "name": row[0],
-                "item_count": row[1],
-                "total_quantity": row[2],
-                "available_quantity": row[3]
-            })
-        
-        # מספר השאלות פעילות
-        cursor.execute("""
-            SELECT COUNT(*) AS total_loans
-            FROM loans
-            WHERE return_date IS NULL
-        """)
-        loaned_items_result = cursor.fetchone()
-        loaned_items = loaned_items_result[0] if loaned_items_result and loaned_items_result[0] else 0
-        
-        # השאלות פעילות (רק 10 האחרונות)
-        cursor.execute("""
-            SELECT l.id, l.student_name, l.student_id, i.name AS item_name, 
-                   l.quantity, l.due_date, l.loan_date
-            FROM loans l
-            JOIN items i ON l.item_id = i.id
-            WHERE l.return_date IS NULL
-            ORDER BY l.loan_date DESC
-            LIMIT 10
-        """)
-        active_loans = []
-        for row in cursor.fetchall():
-            active_loans.append({
-                "id": row[0],
-                "student_name": row[1],
-                "student_id": row[2],
-                "item_name": row[3],
-                "quantity": row[4],
-                "due_date": row[5].isoformat() if row[5] else None,
-                "loan_date": row[6].isoformat() if row[6] else None
-            })
-        
-        # השאלות באיחור
-        current_time = get_israel_time()
-        cursor.execute("""
-            SELECT l.id, l.student_name, l.student_id, i.name AS item_name, 
-                   l.quantity, l.due_date, l.loan_date
-            FROM loans l
-            JOIN items i ON l.item_id = i.id
-            WHERE l.return_date IS NULL AND l.due_date < %s
-            ORDER BY l.due_date ASC
-        """, (current_time,))
-        overdue_loans = []
-        for row in cursor.fetchall():
-            overdue_loans.append({
-                "id": row[0],
-                "student_name": row[1],
-                "student_id": row[2],
-                "item_name": row[3],
-                "quantity": row[4],
-                "due_date": row[5].isoformat() if row[5] else None,
-                "loan_date": row[6].isoformat() if row[6] else None
-            })
-        
-        # הזמנות קרובות (7 הימים הקרובים)
-        future_date = current_time + datetime.timedelta(days=7)
-        cursor.execute("""
-            SELECT r.id, r.student_name, r.student_id, i.name AS item_name, 
-                   r.quantity, r.start_date, r.end_date, r.status
-            FROM reservations r
-            JOIN items i ON r.item_id = i.id
-            WHERE r.start_date BETWEEN %s AND %s
-            ORDER BY r.start_date ASC
-        """, (current_time, future_date))
-        upcoming_reservations = []
-        for row in cursor.fetchall():
-            upcoming_reservations.append({
-                "id": row[0],
-                "student_name": row[1],
-                "student_id": row[2],
-                "item_name": row[3],
-                "quantity": row[4],
-                "start_date": row[5].isoformat() if row[5] else None,
-                "end_date": row[6].isoformat() if row[6] else None,
-                "status": row[7]
-            })
-        
-        # פריטים פופולריים (הכי מושאלים)
-        cursor.execute("""
-            SELECT i.id, i.name, i.category, COUNT(l.id) AS loan_count
-            FROM items i
-            LEFT JOIN loans l ON i.id = l.item_id
-            GROUP BY i.id, i.name, i.category
-            ORDER BY loan_count DESC
-            LIMIT 10
-        """)
-        popular_items = []
-        for row in cursor.fetchall():
-            popular_items.append({
-                "id": row[0],
-                "name": row[1],
-                "category": row[2],
-                "loan_count": row[3]
-            })
-        
-        # פריטים עם מלאי נמוך
-        cursor.execute("""
-            SELECT i.id, i.name, i.category, i.quantity, i.available,
-                   CASE WHEN i.quantity > 0 THEN (i.available::float / i.quantity * 100) ELSE 0 END AS percent_available
-            FROM items i
-            WHERE i.quantity > 0 AND (i.available::float / i.quantity * 100) < 20
-            ORDER BY percent_available ASC
-            LIMIT 10
-        """)
-        low_stock_items = []
-        for row in cursor.fetchall():
-            low_stock_items.append({
-                "id": row[0],
-                "name": row[1],
-                "category": row[2],
-                "total_quantity": row[3],
-                "available_quantity": row[4],
-                "percent_available": row[5]
-            })
-        
-        # הכנת התוצאה הסופית
-        dashboard_data = {
-            "inventory_summary": {
-                "overview": {
-                    "total_items": overview_data[0] if overview_data[0] else 0,
-                    "total_quantity": overview_data[1] if overview_data[1] else 0,
-                    "category_count": overview_data[2] if overview_data[2] else 0,
-                    "loaned_items": loaned_items
-                },
-                "availability": {
-                    "available": overview_data[3] if overview_data[3] else 0,
-                    "unavailable": overview_data[4] if overview_data[4] else 0
-                },
-                "categories": categories
-            },
-            "active_loans": active_loans,
-            "upcoming_reservations": upcoming_reservations,
-            "overdue_loans": overdue_loans,
-            "popular_items": popular_items,
-            "low_stock_items": low_stock_items
-        }
-        
-        return dashboard_data
-        
-    except Exception as e:
-        print(f"DEBUG: Database error: {e}", file=sys.stderr)
-        raise e
-    finally:
-        cursor.close()
-        conn.close()
+    current_time = get_israel_time()
+    params = {
+        "now": current_time,
+        "week_ahead": current_time + datetime.timedelta(days=7),
+        "name": SNAPSHOT_NAME
+    }
+
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            try:
+                use_cache = data_versions_available(cursor)
+                if use_cache:
+                    snapshot = load_dashboard_snapshot(cursor)
+                    if snapshot is not None:
+                        return snapshot
+
+                # הגרסה נקראת באותה שאילתה כמו הנתונים, כך ששינוי שמתבצע
+                # במהלך החישוב יגרום לתמונת המצב להיפסל בקריאה הבאה
+                cursor.execute(DASHBOARD_QUERY if use_cache else DASHBOARD_QUERY_NO_VERSIONS, params)
+                version, dashboard_data = cursor.fetchone()
+
+                if use_cache:
+                    save_dashboard_snapshot(cursor, version, dashboard_data)
+
+                return dashboard_data
+
+            except Exception as e:
+                print(f"DEBUG: Database error: {e}", file=sys.stderr)
+                raise e
 
 
 def main():
@@ -208,4 +189,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
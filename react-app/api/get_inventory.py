@@ -1,126 +1,236 @@
 """
-סקריפט זה מחזיר את כל פריטי המלאי כ-JSON.
+סקריפט זה מחזיר את פריטי המלאי כ-JSON.
 משמש את ה-API של React לקבלת נתוני מלאי.
+
+כל שינוי בפריט או בהשאלה מסמן את הפריט במזהה הטרנזקציה (row_version,
+מיגרציות 6 ו-13), וכך לקוח שסוקר את המלאי לא צריך להוריד את כל הקטלוג בכל פעם:
+- version: ה-xmin של תמונת המצב - כל טרנזקציה עם מזהה נמוך ממנו כבר הסתיימה,
+  ולכן שינוי שהלקוח עוד לא ראה יקבל גרסה שאינה נמוכה ממנו
+- etag: אם המלאי לא השתנה מאז ה-ETag של הלקוח מוחזר not_modified בלבד
+- since_version: מוחזרים רק פריטים שגרסתם אינה נמוכה ממנה (ייתכן שחלקם כבר
+  נשלחו), ומזהי פריטים שנמחקו
+בלי פרמטרים (קלט ריק) מוחזרת רשימת כל הפריטים, כמו קודם. לפני שהמיגרציות
+הורצו (אין row_version או item_stock) מוחזרת תמיד רשימה מלאה, והכמות
+המושאלת מחושבת מטבלת loans.
+
+עם "meta": true השורה הראשונה בפלט היא {"etag", "version", "not_modified"},
+ואחריה גוף התשובה כפי שנשלח ללקוח (רשימת הפריטים, או המעטפת כשיש
+since_version). כך שרת Express קורא רק את השורה הראשונה לכותרות ומזרים את
+השאר ללקוח בלי לפענח את הרשימה.
+
+קלט (רשות): {"since_version": 123, "etag": "W/\"inventory-123\"", "envelope": true, "meta": true}
 """
 
 import sys
 import json
 import os
-import psycopg2
 import psycopg2.extras
 
-def get_direct_db_connection():
-    """יוצר חיבור ישיר למסד הנתונים"""
-    db_url = os.getenv('DATABASE_URL')
-    print(f"DEBUG: Connecting directly to database with URL: {db_url}", file=sys.stderr)
-    return psycopg2.connect(db_url)
+# הוספת תיקיית הפרויקט הראשית לנתיב החיפוש
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from database import get_db_connection
+from item_stock import stock_source
+from serialization import dumps
+
+ITEM_COLUMNS = '''
+    i.id, i.name, i.category, i.quantity, i.available, i.notes,
+    COALESCE(i.is_available, TRUE) as is_available,
+    i.category_original, i.order_notes, i.ordered, i.checked_out,
+    i.checked, i.checkout_notes, i.returned, i.return_notes,
+    i.price_per_unit, i.total_price, i.unnnamed_11,
+    i.director, i.producer, i.photographer,
+    COALESCE(i.allowed_years, '1,2,3') as allowed_years,
+    COALESCE(s.loaned_quantity, 0) as loaned_quantity
+'''
+
+# הכמות המושאלת נקראת ממוני item_stock (מיגרציה 7)
+ITEMS_QUERY = f'''
+    SELECT {ITEM_COLUMNS}
+    FROM items i
+    LEFT JOIN item_stock s ON s.item_id = i.id
+    WHERE i.row_version >= %(since_version)s
+    ORDER BY i.category, i.name
+'''
+
+# גרסאות לפי מזהה טרנזקציה (מיגרציה 13) ומוני item_stock
+VERSIONED_CHECK_QUERY = '''
+    SELECT to_regclass('data_version_requests') IS NOT NULL
+       AND to_regclass('item_stock') IS NOT NULL
+'''
+
+# לפני המיגרציות: כל הפריטים, עם המונים מחושבים מטבלאות המקור
+UNVERSIONED_ITEMS_QUERY = '''
+    SELECT {columns}
+    FROM items i
+    LEFT JOIN {stock} s ON s.item_id = i.id
+    ORDER BY i.category, i.name
+'''
+
+UNVERSIONED_ETAG = 'W/"inventory-unversioned"'
+
+VERSION_QUERY = '''
+    SELECT pg_snapshot_xmin(pg_current_snapshot())::TEXT::BIGINT,
+           GREATEST((SELECT COALESCE(MAX(row_version), 0) FROM items),
+                    (SELECT COALESCE(MAX(row_version), 0) FROM inventory_tombstones))
+'''
+
+# השורות שסומנו בטרנזקציות שאולי עוד רצות בזמן הקריאה הקודמת
+RECENT_ROWS_QUERY = '''
+    SELECT md5(COALESCE(string_agg(kind || id || ':' || row_version, ',' ORDER BY kind, id), ''))
+    FROM (
+        SELECT 'i' AS kind, id, row_version FROM items WHERE row_version >= %(xmin)s
+        UNION ALL
+        SELECT 't', item_id, row_version FROM inventory_tombstones WHERE row_version >= %(xmin)s
+    ) recent
+'''
+
+TOMBSTONES_QUERY = '''
+    SELECT item_id FROM inventory_tombstones
+    WHERE row_version >= %(since_version)s
+    ORDER BY item_id
+'''
+
+
+def make_etag(token):
+    """ETag חלש למצב המלאי"""
+    return f'W/"inventory-{token}"'
+
+
+def inventory_etag(cursor, xmin, max_version):
+    """
+    ETag למצב המלאי בתמונת המצב הנוכחית. כשכל הטרנזקציות עד הגרסה הגבוהה
+    הסתיימו, כל שינוי עתידי יקבל גרסה גבוהה ממנה, והיא לבדה מספיקה. אחרת
+    טרנזקציה עם מזהה נמוך שעוד רצה יכולה להתחייב בלי להעלות את המקסימום,
+    ולכן נכנסות לתג גם השורות שגרסתן אינה נמוכה מה-xmin
+    """
+    if xmin > max_version:
+        return make_etag(max_version)
+    cursor.execute(RECENT_ROWS_QUERY, {'xmin': xmin})
+    return make_etag(f'{max_version}.{xmin}.{cursor.fetchone()[0][:12]}')
+
+
+def item_to_json(item):
+    """המרת שורת פריט לפורמט JSON המתאים לריאקט"""
+    total_quantity = item['quantity']
+    loaned_quantity = item['loaned_quantity']
+    return {
+        'id': item['id'],
+        'name': item['name'],
+        'category': item['category'],
+        'quantity': total_quantity,
+        'available_quantity': max(0, total_quantity - loaned_quantity),
+        'loaned_quantity': loaned_quantity,
+        'notes': item['notes'] or '',
+        'is_available': item['is_available'],
+        'category_original': item['category_original'] or '',
+        'order_notes': item['order_notes'] or '',
+        'ordered': item['ordered'] if item['ordered'] is not None else False,
+        'checked_out': item['checked_out'] if item['checked_out'] is not None else False,
+        'checked': item['checked'] if item['checked'] is not None else False,
+        'checkout_notes': item['checkout_notes'] or '',
+        'returned': item['returned'] if item['returned'] is not None else False,
+        'return_notes': item['return_notes'] or '',
+        # Decimal מומר למספר בסריאליזציה (serialization.dumps), לא שדה-שדה
+        'price_per_unit': item['price_per_unit'] if item['price_per_unit'] is not None else 0.0,
+        'total_price': item['total_price'] if item['total_price'] is not None else 0.0,
+        'unnnamed_11': item['unnnamed_11'] or '',
+        'director': item['director'] or '',
+        'producer': item['producer'] or '',
+        'photographer': item['photographer'] if item['photographer'] is not None else '',
+        'allowed_years': item['allowed_years'] or "1,2,3",
+        'available': item['available'] if item['available'] is not None else total_quantity
+    }
+
+
+def get_inventory(since_version=None, etag=None):
+    """
+    מחזיר מעטפת עם גרסת המלאי: not_modified, או הפריטים שהשתנו מאז
+    since_version (full=False) או את כל הפריטים (full=True).
+    """
+    with get_db_connection(cursor_factory=psycopg2.extras.DictCursor) as conn:
+        # כל השאילתות רואות את אותה תמונת מצב, כך שהגרסה תואמת לשורות
+        conn.set_session(isolation_level='REPEATABLE READ', readonly=True)
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(VERSIONED_CHECK_QUERY)
+                if not cursor.fetchone()[0]:
+                    cursor.execute(UNVERSIONED_ITEMS_QUERY.format(columns=ITEM_COLUMNS,
+                                                                  stock=stock_source(cursor)))
+                    return {'version': 0, 'etag': UNVERSIONED_ETAG, 'not_modified': False,
+                            'full': True, 'items': [item_to_json(item) for item in cursor.fetchall()],
+                            'deleted_ids': []}
+
+                cursor.execute(VERSION_QUERY)
+                version, max_version = cursor.fetchone()
+                response = {'version': version,
+                            'etag': inventory_etag(cursor, version, max_version)}
+
+                if etag == response['etag']:
+                    response['not_modified'] = True
+                    return response
+
+                # גרסה מהעתיד (למשל אחרי שחזור המסד) - הלקוח מקבל רשימה מלאה
+                incremental = since_version is not None and since_version <= version
+                params = {'since_version': since_version if incremental else -1}
+                cursor.execute(ITEMS_QUERY, params)
+                items = [item_to_json(item) for item in cursor.fetchall()]
+
+                deleted_ids = []
+                if incremental:
+                    cursor.execute(TOMBSTONES_QUERY, params)
+                    deleted_ids = [row[0] for row in cursor.fetchall()]
+                    if not items and not deleted_ids:
+                        response['not_modified'] = True
+                        return response
+        finally:
+            conn.rollback()
+            conn.set_session(isolation_level='DEFAULT', readonly='DEFAULT')
+
+    response.update({
+        'not_modified': False,
+        'full': not incremental,
+        'items': items,
+        'deleted_ids': deleted_ids
+    })
+    return response
+
 
 def main():
-    """פונקציה ראשית שמחזירה את כל פריטי המלאי כ-JSON"""
-    conn = None  # הגדרה מוקדמת של משתנים
-    cursor = None  # שימוש בשם אחר כדי למנוע התנגשות 
-    items = []
-    loaned_quantities = {}
-    
-    # Debugging - Check items in database
+    """פונקציה ראשית שמחזירה את פריטי המלאי כ-JSON"""
     try:
-        conn = get_direct_db_connection()
-        cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        cursor.execute("SELECT COUNT(*) FROM items")
-        result = cursor.fetchone()
-        item_count = result[0] if result else 0
-        print(f"DEBUG: Items count in database: {item_count}", file=sys.stderr)
-        
-        if item_count > 0:
-            cursor.execute("SELECT id, name FROM items LIMIT 3")
-            for row in cursor.fetchall():
-                print(f"DEBUG: Sample item - ID: {row['id']}, Name: {row['name']}", file=sys.stderr)
-        
-            # שליפת כל פריטי המלאי עם כל העמודות כולל הרשאות
-            cursor.execute('''
-                SELECT id, name, category, quantity, available, notes, 
-                       COALESCE(is_available, TRUE) as is_available,
-                       category_original, order_notes, ordered, checked_out, 
-                       checked, checkout_notes, returned, return_notes, 
-                       price_per_unit, total_price, unnnamed_11, 
-                       director, producer, photographer,
-                       COALESCE(allowed_years, '1,2,3') as allowed_years
-                FROM items 
-                ORDER BY category, name
-            ''')
-            
-            items = cursor.fetchall()
-            
-            # שליפת כמויות פריטים שמושאלים כרגע
-            cursor.execute('''
-                SELECT item_id, SUM(quantity) as loaned_quantity
-                FROM loans
-                WHERE return_date IS NULL
-                AND item_id IS NOT NULL
-                GROUP BY item_id
-            ''')
-            
-            loaned_quantities = {row['item_id']: row['loaned_quantity'] for row in cursor.fetchall()}
-            
-            # סגירת החיבור לבסיס הנתונים
-            cursor.close()
-            conn.close()
-            cursor = None
-            conn = None
-            
-            # המרת התוצאה לפורמט JSON
-            items_json = []
-            for item in items:
-                item_id = item['id']
-                total_quantity = item['quantity']
-                loaned_quantity = loaned_quantities.get(item_id, 0)
-                available_quantity = max(0, total_quantity - loaned_quantity)
-                
-                available_from_db = item['available'] if item['available'] is not None else total_quantity
-                
-                item_dict = {
-                    'id': item_id,
-                    'name': item['name'],
-                    'category': item['category'],
-                    'quantity': total_quantity,
-                    'available_quantity': available_quantity,
-                    'loaned_quantity': loaned_quantity,
-                    'notes': item['notes'] or '',
-                    'is_available': item['is_available'],
-                    'category_original': item['category_original'] or '',
-                    'order_notes': item['order_notes'] or '',
-                    'ordered': item['ordered'] if item['ordered'] is not None else False,
-                    'checked_out': item['checked_out'] if item['checked_out'] is not None else False,
-                    'checked': item['checked'] if item['checked'] is not None else False,
-                    'checkout_notes': item['checkout_notes'] or '',
-                    'returned': item['returned'] if item['returned'] is not None else False,
-                    'return_notes': item['return_notes'] or '',
-                    'price_per_unit': float(item['price_per_unit']) if item['price_per_unit'] is not None else 0.0,
-                    'total_price': float(item['total_price']) if item['total_price'] is not None else 0.0,
-                    'unnnamed_11': item['unnnamed_11'] or '',
-                    'director': item['director'] or '',
-                    'producer': item['producer'] or '',
-                    'photographer': item['photographer'] if item['photographer'] is not None else '',
-                    'allowed_years': item['allowed_years'] or "1,2,3",
-                    'available': available_from_db
-                }
-                items_json.append(item_dict)
-            
-            # החזרת התוצאה כ-JSON
-            print(json.dumps(items_json, ensure_ascii=False))
+        # קריאת פרמטרים מ-stdin בפורמט JSON (רשות)
+        raw_input = sys.stdin.read()
+        input_data = json.loads(raw_input) if raw_input.strip() else {}
+
+        since_version = input_data.get('since_version')
+        since_version = int(since_version) if since_version not in (None, '') else None
+        response = get_inventory(since_version, input_data.get('etag'))
+
+        if input_data.get('meta'):
+            # הגוף מוכן לפני ההדפסה, כך ששגיאה לא משאירה שורת מטא בלי גוף
+            meta = dumps({key: response[key] for key in ('etag', 'version', 'not_modified')})
+            body = None
+            if not response['not_modified']:
+                body = dumps(response['items'] if since_version is None else response)
+            print(meta)
+            if body is not None:
+                print(body)
+        # בלי בקשה למעטפת מוחזרת רשימת הפריטים בלבד, כמו קודם
+        elif input_data.get('envelope') or since_version is not None or input_data.get('etag'):
+            print(dumps(response))
         else:
-            # No items found
-            print("[]")
-            
+            print(dumps(response['items']))
+
     except Exception as e:
         # במקרה של שגיאה, החזרת הודעת שגיאה מפורטת
         import traceback
         error_details = traceback.format_exc()
-        
+
         # הדפסה לצורך דיבוג
         print("Error: " + str(e), file=sys.stderr)
         print(error_details, file=sys.stderr)
-        
+
         error_response = {
             'error': True,
             'message': str(e),
@@ -1,12 +1,25 @@
 """
-סקריפט זה מחזיר את כל ההשאלות כ-JSON.
+סקריפט זה מחזיר את ההשאלות כ-JSON, בעמודים.
 משמש את ה-API של React לקבלת נתוני השאלות.
+
+ההשאלות ממוינות כמו קודם - פתוחות לפני מוחזרות, ואז לפי תאריך החזרה
+מתוכנן - ומחולקות לעמודים בשיטת keyset: העמוד הבא מתחיל אחרי הסמן
+(after_returned, after_due_date, after_id) של השורה האחרונה בעמוד הקודם,
+כך שכל עמוד נשלף מהאינדקס idx_loans_listing בזמן קבוע, בלי OFFSET.
+
+קלט (הכל רשות):
+    status: active / overdue / returned
+    student_id, category, item_id
+    from_date, to_date: טווח תאריכי השאלה (YYYY-MM-DD, כולל)
+    after_returned, after_due_date, after_id: הסמן מהעמוד הקודם (next_cursor)
+    limit: גודל עמוד (ברירת מחדל 100, מקסימום 1000)
+    fields: רשימת שדות להחזרה (או מחרוזת מופרדת בפסיקים); ברירת מחדל - כל השדות
 """
 
 import sys
 import json
 import os
-from datetime import datetime
+from datetime import datetime, timedelta
 
 # הוספת תיקיית הפרויקט הראשית לנתיב החיפוש כדי לייבא מודולים
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
@@ -14,68 +27,173 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(
 # ייבוא פונקציות מבסיס הנתונים
 from database import get_db_connection
 
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# שדה בתשובה -> ביטוי SQL. שדות שלא התבקשו לא נשלפים כלל
+FIELD_COLUMNS = {
+    'id': 'l.id',                               # מזהה השאלה
+    'item_id': 'l.item_id',                     # מזהה פריט
+    'item_name': 'i.name',                      # שם פריט
+    'category': 'i.category',                   # קטגוריה
+    'student_name': 'l.student_name',           # שם סטודנט
+    'student_id': 'l.student_id',               # ת.ז. סטודנט
+    'quantity': 'l.quantity',                   # כמות
+    'checkout_date': 'l.loan_date',             # תאריך השאלה
+    'due_date': 'l.due_date',                   # תאריך החזרה מתוכנן
+    'return_date': 'l.return_date',             # תאריך החזרה בפועל
+    'user_id': 'l.user_id',                     # מזהה המשתמש שרשם את ההשאלה
+    'checkout_notes': 'l.checkout_notes',       # הערות בעת השאלה
+    'loan_notes': 'l.loan_notes',               # הערות כלליות להשאלה
+    'return_notes': 'l.return_notes',           # הערות בעת החזרה
+    'director': 'l.director',                   # במאי
+    'producer': 'l.producer',                   # מפיק
+    'photographer': 'l.photographer',           # צלם
+    'price_per_unit': 'l.price_per_unit',       # מחיר ליחידה
+    'total_price': 'l.total_price',             # מחיר כולל
+}
+
+# שדות שתמיד נשלפים - לחישוב הסטטוס ולבניית הסמן
+KEY_COLUMNS = ['l.id', 'l.due_date', 'l.return_date']
+
+DATE_FIELDS = {'checkout_date', 'due_date', 'return_date'}
+
+
+def parse_fields(fields):
+    """מחזיר את רשימת השדות המבוקשים, כולל status, לפי הסדר ב-FIELD_COLUMNS"""
+    if not fields:
+        return list(FIELD_COLUMNS) + ['status']
+    if isinstance(fields, str):
+        fields = [field.strip() for field in fields.split(',')]
+    unknown = [field for field in fields if field not in FIELD_COLUMNS and field != 'status']
+    if unknown:
+        raise ValueError(f"שדות לא מוכרים: {', '.join(unknown)}")
+    return [field for field in list(FIELD_COLUMNS) + ['status'] if field in fields]
+
+
+def build_query(params, fields):
+    """בונה את שאילתת העמוד ואת הפרמטרים שלה"""
+    conditions = []
+    values = {}
+    now = datetime.now()
+
+    status = params.get('status')
+    if status == 'returned':
+        conditions.append("l.return_date IS NOT NULL")
+    elif status == 'active':
+        conditions.append("l.return_date IS NULL AND l.due_date >= %(now)s")
+    elif status == 'overdue':
+        conditions.append("l.return_date IS NULL AND l.due_date < %(now)s")
+    elif status not in (None, '', 'all'):
+        raise ValueError(f"סטטוס לא מוכר: {status}")
+    values['now'] = now
+
+    if params.get('student_id'):
+        conditions.append("l.student_id = %(student_id)s")
+        values['student_id'] = str(params['student_id'])
+    if params.get('item_id'):
+        conditions.append("l.item_id = %(item_id)s")
+        values['item_id'] = int(params['item_id'])
+    if params.get('category'):
+        conditions.append("i.category = %(category)s")
+        values['category'] = params['category']
+    if params.get('from_date'):
+        conditions.append("l.loan_date >= %(from_date)s")
+        values['from_date'] = datetime.strptime(params['from_date'], '%Y-%m-%d')
+    if params.get('to_date'):
+        conditions.append("l.loan_date < %(to_date)s")
+        values['to_date'] = datetime.strptime(params['to_date'], '%Y-%m-%d') + timedelta(days=1)
+
+    # סמן keyset - ממשיכים אחרי השורה האחרונה של העמוד הקודם
+    if params.get('after_id') and params.get('after_due_date'):
+        after_returned = str(params.get('after_returned', 'false')).lower() in ('true', '1')
+        conditions.append(
+            "(l.return_date IS NOT NULL, l.due_date, l.id) > "
+            "(%(after_returned)s, %(after_due_date)s, %(after_id)s)"
+        )
+        values['after_returned'] = after_returned
+        values['after_due_date'] = datetime.fromisoformat(params['after_due_date'])
+        values['after_id'] = int(params['after_id'])
+
+    limit = min(int(params.get('limit') or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE)
+    # שורה אחת נוספת מגלה אם יש עמוד הבא
+    values['limit'] = limit + 1
+
+    columns = KEY_COLUMNS + [FIELD_COLUMNS[field] for field in fields if field in FIELD_COLUMNS]
+    where = "WHERE " + " AND ".join(conditions) if conditions else ""
+    query = f"""
+        SELECT {', '.join(columns)}
+        FROM loans l
+        JOIN items i ON l.item_id = i.id
+        {where}
+        ORDER BY l.return_date IS NOT NULL, l.due_date, l.id
+        LIMIT %(limit)s
+    """
+    return query, values, limit, now
+
+
+def format_value(field, value):
+    """ממיר ערך מהמסד לערך שניתן להמיר ל-JSON"""
+    if value is None:
+        return None
+    if field in DATE_FIELDS:
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    if field in ('price_per_unit', 'total_price'):
+        return float(value)
+    return value
+
+
+def get_loans(params):
+    """מחזיר עמוד אחד של השאלות לפי המסננים והסמן"""
+    fields = parse_fields(params.get('fields'))
+    query, values, limit, now = build_query(params, fields)
+    selected = [field for field in fields if field in FIELD_COLUMNS]
+
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(query, values)
+            rows = cur.fetchall()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    loans = []
+    for row in rows:
+        _, due_date, return_date = row[:len(KEY_COLUMNS)]
+        record = dict(zip(selected, row[len(KEY_COLUMNS):]))
+        loan = {field: format_value(field, record[field]) for field in selected}
+        if 'status' in fields:
+            # חישוב סטטוס ההשאלה
+            loan['status'] = 'returned' if return_date else ('overdue' if due_date < now else 'active')
+        loans.append(loan)
+
+    next_cursor = None
+    if has_more:
+        loan_id, due_date, return_date = rows[-1][:len(KEY_COLUMNS)]
+        next_cursor = {
+            'after_returned': return_date is not None,
+            'after_due_date': due_date.isoformat(sep=' '),
+            'after_id': loan_id
+        }
+
+    return {
+        'data': loans,
+        'has_more': has_more,
+        'next_cursor': next_cursor,
+        'limit': limit
+    }
+
+
 def main():
-    """פונקציה ראשית שמחזירה את כל ההשאלות כ-JSON"""
+    """פונקציה ראשית שמחזירה עמוד של השאלות כ-JSON"""
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        # שליפת כל ההשאלות עם פרטי הפריטים
-        cur.execute('''
-            SELECT 
-                l.id, i.name, i.category, l.student_name, l.student_id, l.quantity,
-                l.checkout_date, l.due_date, l.return_date, l.user_id, 
-                l.checkout_notes, l.loan_notes, l.return_notes,
-                l.director, l.producer, l.photographer, l.price_per_unit, l.total_price
-            FROM loans l
-            JOIN items i ON l.item_id = i.id
-            ORDER BY 
-                CASE WHEN l.return_date IS NULL THEN 0 ELSE 1 END,
-                l.due_date ASC
-        ''')
-        
-        loans = cur.fetchall()
-        cur.close()
-        conn.close()
-        
-        # המרת התוצאה לפורמט JSON המתאים לריאקט
-        loans_json = []
-        for loan in loans:
-            # המרת תאריכים לפורמט מתאים
-            checkout_date = loan[6].strftime('%Y-%m-%d %H:%M:%S') if loan[6] else None
-            due_date = loan[7].strftime('%Y-%m-%d %H:%M:%S') if loan[7] else None
-            return_date = loan[8].strftime('%Y-%m-%d %H:%M:%S') if loan[8] else None
-            
-            # חישוב סטטוס ההשאלה
-            status = 'returned' if loan[8] else ('overdue' if loan[7] < datetime.now() else 'active')
-            
-            # המרה לדיקט
-            loan_dict = {
-                'id': loan[0],                  # מזהה השאלה
-                'item_name': loan[1],           # שם פריט
-                'category': loan[2],            # קטגוריה
-                'student_name': loan[3],        # שם סטודנט
-                'student_id': loan[4],          # ת.ז. סטודנט
-                'quantity': loan[5],            # כמות
-                'checkout_date': checkout_date, # תאריך השאלה
-                'due_date': due_date,           # תאריך החזרה מתוכנן
-                'return_date': return_date,     # תאריך החזרה בפועל
-                'user_id': loan[9],             # מזהה המשתמש שרשם את ההשאלה
-                'checkout_notes': loan[10],     # הערות בעת השאלה
-                'loan_notes': loan[11],         # הערות כלליות להשאלה
-                'return_notes': loan[12],       # הערות בעת החזרה
-                'status': status,               # סטטוס: מוחזר/פעיל/באיחור
-                'director': loan[13],           # במאי
-                'producer': loan[14],           # מפיק
-                'photographer': loan[15],       # צלם
-                'price_per_unit': loan[16],     # מחיר ליחידה
-                'total_price': loan[17]         # מחיר כולל
-            }
-            loans_json.append(loan_dict)
-        
+        # קריאת פרמטרים מ-stdin בפורמט JSON (רשות)
+        raw_input = sys.stdin.read()
+        params = json.loads(raw_input) if raw_input.strip() else {}
+
         # החזרת התוצאה כ-JSON
-        print(json.dumps(loans_json, ensure_ascii=False))
-        
+        print(json.dumps(get_loans(params), ensure_ascii=False))
+
     except Exception as e:
         # במקרה של שגיאה, החזרת הודעת שגיאה
         error_response = {
@@ -86,4 +204,4 @@ def main():
         sys.exit(1)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
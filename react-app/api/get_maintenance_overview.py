@@ -2,13 +2,16 @@
 סקריפט זה מחזיר סקירה כללית של מצב התחזוקה במערכת.
 מספק נתונים סטטיסטיים ורשימת פריטים בתחזוקה.
 """
+import os
 import sys
 import json
 import traceback
-from datetime import datetime, date
 
 # הוספת תיקיית האב לנתיב החיפוש כדי לייבא מודולים מהתיקייה הראשית
 sys.path.append('.')
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from serialization import dumps
 
 # לוגים לבדיקה
 print("DEBUG: Starting maintenance overview script", file=sys.stderr)
@@ -24,13 +27,6 @@ except ImportError:
         print("DEBUG: Failed to import get_maintenance_overview", file=sys.stderr)
         sys.exit(1)
 
-# עוזר להמיר אובייקטי תאריך לייצוג מחרוזת ב-JSON
-class DateTimeEncoder(json.JSONEncoder):
-    def default(self, o):
-        if isinstance(o, (datetime, date)):
-            return o.isoformat()
-        return super().default(o)
-
 def main():
     """פונקציה ראשית שמחזירה סקירה של מצב התחזוקה במערכת"""
     try:
@@ -47,7 +43,7 @@ def main():
             }
         
         # החזרת התוצאה כ-JSON - חשוב להשתמש ב-ensure_ascii=False כדי לתמוך בעברית
-        print(json.dumps(overview_data, ensure_ascii=False, cls=DateTimeEncoder))
+        print(dumps(overview_data))
         
     except Exception as e:
         error_details = traceback.format_exc()
@@ -1,5 +1,7 @@
 """
 סקריפט זה מחזיר סטטיסטיקות על מגמות חודשיות בהשאלות.
+הנתונים נקראים מהסיכום החודשי loan_stats_monthly (loan_stats.py), ולפני
+שמיגרציה 9 הורצה - מטבלת loans.
 """
 
 import json
@@ -12,24 +14,37 @@ project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(_
 sys.path.append(project_root)
 
 from database import get_db_connection
+from loan_stats import period_params, period_stats_sql, period_students_sql, rollup_available
 
 def get_monthly_trends():
     """מחזיר נתונים על מגמות חודשיות בהשאלות"""
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
+        rollup = rollup_available(cursor)
+        
+        # השנה האחרונה
+        now = datetime.now()
+        period = period_params(now - timedelta(days=365), now)
         
         # מקבל את 12 החודשים האחרונים
-        cursor.execute("""
+        cursor.execute(f"""
             SELECT 
-                DATE_TRUNC('month', checkout_date) AS month,
-                COUNT(*) AS loans_count,
-                COUNT(DISTINCT student_id) AS unique_students
-            FROM loans
-            WHERE checkout_date >= NOW() - INTERVAL '1 year'
-            GROUP BY month
-            ORDER BY month ASC
-        """)
+                m.month,
+                m.loans_count,
+                COALESCE(s.unique_students, 0) AS unique_students
+            FROM (
+                SELECT month, SUM(loan_count) AS loans_count
+                FROM ({period_stats_sql(rollup=rollup)}) p
+                GROUP BY month
+            ) m
+            LEFT JOIN (
+                SELECT month, COUNT(DISTINCT student_id) AS unique_students
+                FROM ({period_students_sql(rollup=rollup)}) st
+                GROUP BY month
+            ) s ON s.month = m.month
+            ORDER BY m.month ASC
+        """, period)
         
         monthly_data = []
         for row in cursor.fetchall():
@@ -60,16 +75,17 @@ def get_monthly_trends():
             # מיון לפי תאריך
             monthly_data.sort(key=lambda x: x['month'])
         
-        # מקבל מידע על השאלות לפי ימים בשבוע
-        cursor.execute("""
+        # מקבל מידע על השאלות לפי ימים בשבוע (weekday_counts בסיכום, 1 = ראשון)
+        cursor.execute(f"""
             SELECT 
-                EXTRACT(DOW FROM checkout_date) AS day_of_week,
-                COUNT(*) AS loans_count
-            FROM loans
-            WHERE checkout_date >= NOW() - INTERVAL '1 year'
-            GROUP BY day_of_week
-            ORDER BY day_of_week ASC
-        """)
+                d.day - 1 AS day_of_week,
+                SUM(d.loans_count) AS loans_count
+            FROM ({period_stats_sql(rollup=rollup)}) p
+            CROSS JOIN LATERAL unnest(p.weekday_counts) WITH ORDINALITY AS d(loans_count, day)
+            GROUP BY d.day
+            HAVING SUM(d.loans_count) > 0
+            ORDER BY d.day ASC
+        """, period)
         
         weekday_data = []
         for row in cursor.fetchall():
@@ -0,0 +1,21 @@
+"""
+סקריפט זה מחזיר את מוני מטמון הדו"חות המתקדמים (report_cache.py):
+hit/miss/eviction לכל סוג דו"ח, יחס הפגיעות וגודל המטמון, לצורכי ניטור.
+"""
+
+import json
+import sys
+import os
+
+# הוסף את תיקיית השורש של הפרויקט ל-path כדי שנוכל לייבא את report_cache.py
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(project_root)
+
+from report_cache import cache_stats
+
+def main():
+    """פונקציה ראשית"""
+    print(json.dumps(cache_stats(), ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
@@ -7,14 +7,11 @@
 import sys
 import os
 import json
-import psycopg2
 
-def get_db_connection():
-    """יוצר חיבור למסד הנתונים"""
-    database_url = os.environ.get('DATABASE_URL')
-    if not database_url:
-        raise Exception("DATABASE_URL environment variable not set")
-    return psycopg2.connect(database_url)
+# הוספת תיקיית הפרויקט הראשית לנתיב החיפוש
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from database import get_db_connection
 
 def main():
     """פונקציה ראשית שמחזירה את כל הסטודנטים כ-JSON"""
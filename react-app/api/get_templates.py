@@ -6,18 +6,17 @@ API לקבלת מערכי הזמנות עבור אשף ההזמנות.
 import json
 import sys
 import os
-import psycopg2
 from psycopg2.extras import RealDictCursor
 
+# הוספת תיקיית הפרויקט הראשית לנתיב החיפוש
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import database
+
 def get_db_connection():
     """יוצר חיבור למסד הנתונים"""
     try:
-        database_url = os.environ.get('DATABASE_URL')
-        if not database_url:
-            raise Exception("DATABASE_URL environment variable not set")
-        
-        conn = psycopg2.connect(database_url, cursor_factory=RealDictCursor)
-        return conn
+        return database.get_db_connection(cursor_factory=RealDictCursor)
     except Exception as e:
         print(f"Error connecting to database: {e}", file=sys.stderr)
         return None
@@ -8,15 +8,12 @@ import sys
 import os
 from datetime import datetime
 import traceback
-import psycopg2
 
 # הוספת נתיב לתיקייה הראשית
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
-def get_db_connection():
-    """יוצר חיבור למסד הנתונים"""
-    DATABASE_URL = os.environ.get('DATABASE_URL')
-    return psycopg2.connect(DATABASE_URL)
+from database import get_db_connection
 
 def get_user_reservations(user_id):
     """פונקציה שמחזירה את כל ההזמנות של משתמש מסוים"""
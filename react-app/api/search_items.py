@@ -0,0 +1,43 @@
+"""
+סקריפט זה מחפש פריטים במלאי ומחזיר עמוד של תוצאות מדורגות כ-JSON.
+משמש את ה-API של React לחיפוש בצד השרת, במקום סינון של כל רשימת המלאי
+בדפדפן. החיפוש עצמו ב-item_search.py, על האינדקסים של מיגרציה 12.
+
+קלט: {"q": "מצלמה", "limit": 50, "offset": 0, "category": "...", "available_only": false}
+פלט: {"query", "items": [...], "total", "limit", "offset", "next_offset", "mode"}
+"""
+
+import sys
+import json
+import os
+
+# הוספת תיקיית הפרויקט הראשית לנתיב החיפוש
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from item_search import search_items
+from serialization import dumps
+
+
+def main():
+    """פונקציה ראשית שמחזירה את תוצאות החיפוש כ-JSON"""
+    try:
+        raw_input = sys.stdin.read()
+        input_data = json.loads(raw_input) if raw_input.strip() else {}
+
+        available_only = input_data.get('available_only')
+        result = search_items(
+            input_data.get('q'),
+            limit=input_data.get('limit'),
+            offset=input_data.get('offset'),
+            category=input_data.get('category') or None,
+            available_only=available_only in (True, 'true', '1')
+        )
+        print(dumps(result))
+
+    except Exception as e:
+        print("Error: " + str(e), file=sys.stderr)
+        print(json.dumps({'error': True, 'message': str(e)}, ensure_ascii=False))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,314 +1,579 @@
 """
 סקריפט זה מאפשר שליחת התראות בדואר אלקטרוני עבור השאלות באיחור או פריטים שהמלאי שלהם נמוך
+
+ההודעות נשלחות במנות: כל הודעה נרשמת קודם בטבלת email_outbox (מיגרציה 11),
+ואז כל ההודעות הממתינות נשלחות בחיבור SMTP אחד (STARTTLS וכניסה פעם אחת),
+בקצב של עד EMAIL_SEND_RATE הודעות בשנייה. הודעה שנכשלה נשארת בתור ומנוסה
+שוב בהמשך, עד EMAIL_MAX_ATTEMPTS ניסיונות. התבניות מהודרות פעם אחת לכל סוג.
+
+קלט (JSON כפרמטר ראשון, או ב-stdin):
+    {"alert_type": ..., "data": {...}, "email": ...}        הודעה אחת
+    {"alerts": [{"alert_type": ..., "data": ..., "email": ...}, ...]}
+    {"retry": true}                                          שליחת הודעות שממתינות לניסיון חוזר
+
+לבדיקה מקומית אפשר להריץ שרת SMTP לדיבוג על הפורט ברירת המחדל:
+    python -m aiosmtpd -n -l localhost:1025
 """
 
 import sys
 import json
 import datetime
+import html
 import os
 import smtplib
-import pytz
+import time
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
+from functools import lru_cache
+from string import Template
+
+import pytz
+
+# הוספת תיקיית הפרויקט הראשית לנתיב החיפוש
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from psycopg2.extras import execute_values
+
+from database import get_db_connection
+
+# הודעות שנשלפות מהתור בכל סבב, וכמה ניסיונות לכל הודעה לפני שמוותרים
+EMAIL_BATCH_SIZE = int(os.environ.get('EMAIL_BATCH_SIZE', 200))
+EMAIL_MAX_ATTEMPTS = int(os.environ.get('EMAIL_MAX_ATTEMPTS', 5))
+# ניסיון חוזר אחרי EMAIL_RETRY_DELAY שניות, ומוכפל בכל כישלון
+EMAIL_RETRY_DELAY = int(os.environ.get('EMAIL_RETRY_DELAY', 60))
+# הודעה שנלקחה לשליחה ולא עודכנה (התהליך נפל) חוזרת לתור אחרי זמן זה
+EMAIL_SENDING_TIMEOUT = int(os.environ.get('EMAIL_SENDING_TIMEOUT', 600))
 
 def get_israel_time():
     """מחזיר את השעה הנוכחית בישראל"""
     israel_tz = pytz.timezone('Asia/Jerusalem')
     return datetime.datetime.now(israel_tz)
 
+def get_email_settings():
+    """הגדרות שרת הדואר מהסביבה"""
+    # בסביבת הפיתוח נשתמש ב-dummy server כדי לא לשלוח אימיילים אמיתיים
+    return {
+        'host': os.environ.get('EMAIL_HOST', 'localhost'),
+        'port': int(os.environ.get('EMAIL_PORT', 1025)),  # 1025 is the default port for the dummy SMTP server
+        'user': os.environ.get('EMAIL_HOST_USER', ''),
+        'password': os.environ.get('EMAIL_HOST_PASSWORD', ''),
+        'use_tls': os.environ.get('EMAIL_USE_TLS', 'False').lower() == 'true',
+        'from_email': os.environ.get('DEFAULT_FROM_EMAIL', 'notifications@cinema-equipment.example.com'),
+        # 0 = ללא הגבלת קצב
+        'rate': float(os.environ.get('EMAIL_SEND_RATE', 10)),
+        # שרתים רבים מגבילים את מספר ההודעות בחיבור אחד
+        'max_per_connection': int(os.environ.get('EMAIL_MAX_PER_CONNECTION', 100)),
+    }
+
+def build_message(recipient_email, subject, html_content, text_content=None, from_email=None):
+    """בונה הודעת דוא"ל עם חלק טקסטואלי (אופציונלי) וחלק HTML"""
+    msg = MIMEMultipart('alternative')
+    msg['Subject'] = subject
+    msg['From'] = from_email or get_email_settings()['from_email']
+    msg['To'] = recipient_email
+
+    # הוספת תוכן טקסטואלי (אופציונלי)
+    if text_content:
+        msg.attach(MIMEText(text_content, 'plain', 'utf-8'))
+
+    # הוספת תוכן HTML
+    msg.attach(MIMEText(html_content, 'html', 'utf-8'))
+    return msg
+
+class SMTPSession:
+    """
+    חיבור SMTP אחד לכל המנה: החיבור, STARTTLS והכניסה מתבצעים בהודעה
+    הראשונה, והחיבור נפתח מחדש אחרי max_per_connection הודעות או אם השרת
+    ניתק אותו. send ממתין בין הודעות כדי לא לעבור את הקצב המוגדר.
+    """
+
+    def __init__(self, settings=None):
+        self.settings = settings or get_email_settings()
+        self.server = None
+        self.sent_on_connection = 0
+        self.last_send = 0.0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def connect(self):
+        self.close()
+        settings = self.settings
+        self.server = smtplib.SMTP(settings['host'], settings['port'], timeout=30)
+        if settings['use_tls']:
+            self.server.starttls()
+        if settings['user'] and settings['password']:
+            self.server.login(settings['user'], settings['password'])
+        self.sent_on_connection = 0
+
+    def close(self):
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except smtplib.SMTPException:
+                self.server.close()
+            except OSError:
+                pass
+            self.server = None
+
+    def _throttle(self):
+        rate = self.settings['rate']
+        if rate > 0:
+            wait = self.last_send + 1.0 / rate - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+        self.last_send = time.monotonic()
+
+    def send(self, msg):
+        """שולח הודעה; שגיאה של הנמען או ההודעה נזרקת, ניתוק מטופל בחיבור מחדש"""
+        if self.server is None or self.sent_on_connection >= self.settings['max_per_connection']:
+            self.connect()
+        self._throttle()
+        try:
+            self.server.send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            self.connect()
+            self.server.send_message(msg)
+        self.sent_on_connection += 1
+
 def send_email(recipient_email, subject, html_content, text_content=None):
     """
-    שולח אימייל באמצעות SMTP
-    
+    שולח אימייל בודד באמצעות SMTP, בלי תור
+
     Parameters:
     recipient_email (str): כתובת המייל של הנמען
     subject (str): נושא ההודעה
     html_content (str): תוכן HTML של ההודעה
     text_content (str, optional): תוכן טקסטואלי של ההודעה (למקרה שלא ניתן להציג HTML)
-    
+
     Returns:
     bool: האם ההודעה נשלחה בהצלחה
     """
-    # הגדרות השרת - בסביבת הפיתוח נשתמש ב-dummy server כדי לא לשלוח אימיילים אמיתיים
-    EMAIL_HOST = os.environ.get('EMAIL_HOST', 'localhost')
-    EMAIL_PORT = int(os.environ.get('EMAIL_PORT', 1025))  # 1025 is the default port for the dummy SMTP server
-    EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER', '')
-    EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD', '')
-    EMAIL_USE_TLS = os.environ.get('EMAIL_USE_TLS', 'False').lower() == 'true'
-    DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'notifications@cinema-equipment.example.com')
-    
-    # יצירת הודעת דוא"ל
-    msg = MIMEMultipart('alternative')
-    msg['Subject'] = subject
-    msg['From'] = DEFAULT_FROM_EMAIL
-    msg['To'] = recipient_email
-    
-    # הוספת תוכן טקסטואלי (אופציונלי)
-    if text_content:
-        msg.attach(MIMEText(text_content, 'plain', 'utf-8'))
-    
-    # הוספת תוכן HTML
-    msg.attach(MIMEText(html_content, 'html', 'utf-8'))
-    
     try:
-        # פתיחת חיבור ושליחת ההודעה
-        with smtplib.SMTP(EMAIL_HOST, EMAIL_PORT) as server:
-            if EMAIL_USE_TLS:
-                server.starttls()
-            
-            if EMAIL_HOST_USER and EMAIL_HOST_PASSWORD:
-                server.login(EMAIL_HOST_USER, EMAIL_HOST_PASSWORD)
-            
-            server.send_message(msg)
+        with SMTPSession() as session:
+            session.send(build_message(recipient_email, subject, html_content, text_content))
         return True
     except Exception as e:
-        print(f"Error sending email: {e}")
+        print(f"Error sending email: {e}", file=sys.stderr)
         return False
 
-def create_overdue_loan_email(loan_data):
-    """
-    יוצר תבנית אימייל עבור השאלה באיחור
-    
-    Parameters:
-    loan_data (dict): נתוני ההשאלה באיחור
-    
-    Returns:
-    tuple: (נושא האימייל, תוכן HTML, תוכן טקסטואלי)
-    """
-    student_name = loan_data.get('student_name', '')
-    item_name = loan_data.get('item_name', '')
-    days_overdue = loan_data.get('days_overdue', 0)
-    due_date = loan_data.get('due_date', '')
-    
-    if isinstance(due_date, datetime.date):
-        due_date = due_date.strftime('%d/%m/%Y')
-    
-    subject = f"תזכורת: איחור בהחזרת הציוד {item_name}"
-    
-    html_content = f"""
+# תבניות לכל סוג התראה: נושא, HTML וטקסט. הערכים מוצבים ב-string.Template
+# (ב-HTML אחרי escape), כך שכל תבנית מהודרת פעם אחת ומשמשת לכל ההודעות מאותו סוג
+EMAIL_TEMPLATES = {
+    'overdue': (
+        "תזכורת: איחור בהחזרת הציוד ${item_name}",
+        """
     <div dir="rtl" style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto; padding: 20px; border: 1px solid #ddd; border-radius: 5px;">
         <h2 style="color: #d32f2f; text-align: center; margin-bottom: 20px;">תזכורת: איחור בהחזרת ציוד</h2>
-        
-        <p style="margin-bottom: 15px;">שלום {student_name},</p>
-        
+
+        <p style="margin-bottom: 15px;">שלום ${student_name},</p>
+
         <p style="margin-bottom: 15px;">אנו מבקשים להזכיר כי חלף מועד החזרת הציוד שהושאל לך:</p>
-        
+
         <div style="background-color: #f5f5f5; padding: 15px; border-radius: 5px; margin-bottom: 20px;">
-            <p><strong>פריט:</strong> {item_name}</p>
-            <p><strong>תאריך החזרה מתוכנן:</strong> {due_date}</p>
-            <p><strong>ימי איחור:</strong> <span style="color: #d32f2f; font-weight: bold;">{days_overdue} ימים</span></p>
+            <p><strong>פריט:</strong> ${item_name}</p>
+            <p><strong>תאריך החזרה מתוכנן:</strong> ${due_date}</p>
+            <p><strong>ימי איחור:</strong> <span style="color: #d32f2f; font-weight: bold;">${days_overdue} ימים</span></p>
         </div>
-        
+
         <p style="margin-bottom: 15px;">נודה לך על החזרת הציוד בהקדם האפשרי למחסן הציוד.</p>
-        
+
         <p style="margin-bottom: 15px;">במקרה של שאלות או בעיות, אנא צור קשר עם צוות ניהול הציוד.</p>
-        
+
         <p style="margin-top: 30px; color: #666; font-size: 12px; text-align: center;">
             הודעה זו נשלחה באופן אוטומטי ממערכת ניהול ציוד קולנוע<br>
             נא לא להשיב להודעה זו
         </p>
     </div>
-    """
-    
-    text_content = f"""
+    """,
+        """
     תזכורת: איחור בהחזרת ציוד
-    
-    שלום {student_name},
-    
+
+    שלום ${student_name},
+
     אנו מבקשים להזכיר כי חלף מועד החזרת הציוד שהושאל לך:
-    
-    פריט: {item_name}
-    תאריך החזרה מתוכנן: {due_date}
-    ימי איחור: {days_overdue} ימים
-    
+
+    פריט: ${item_name}
+    תאריך החזרה מתוכנן: ${due_date}
+    ימי איחור: ${days_overdue} ימים
+
     נודה לך על החזרת הציוד בהקדם האפשרי למחסן הציוד.
-    
+
     במקרה של שאלות או בעיות, אנא צור קשר עם צוות ניהול הציוד.
-    
+
     הודעה זו נשלחה באופן אוטומטי ממערכת ניהול ציוד קולנוע
     נא לא להשיב להודעה זו
     """
-    
-    return subject, html_content, text_content
-
-def create_upcoming_return_email(loan_data):
-    """
-    יוצר תבנית אימייל עבור השאלה שמועד החזרתה קרב
-    
-    Parameters:
-    loan_data (dict): נתוני ההשאלה שמועד החזרתה קרב
-    
-    Returns:
-    tuple: (נושא האימייל, תוכן HTML, תוכן טקסטואלי)
-    """
-    student_name = loan_data.get('student_name', '')
-    item_name = loan_data.get('item_name', '')
-    days_remaining = loan_data.get('days_remaining', 0)
-    due_date = loan_data.get('due_date', '')
-    
-    if isinstance(due_date, datetime.date):
-        due_date = due_date.strftime('%d/%m/%Y')
-    
-    subject = f"תזכורת: מועד החזרת הציוד {item_name} מתקרב"
-    
-    html_content = f"""
+    ),
+    'upcoming': (
+        "תזכורת: מועד החזרת הציוד ${item_name} מתקרב",
+        """
     <div dir="rtl" style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto; padding: 20px; border: 1px solid #ddd; border-radius: 5px;">
         <h2 style="color: #1976d2; text-align: center; margin-bottom: 20px;">תזכורת: מועד החזרת ציוד מתקרב</h2>
-        
-        <p style="margin-bottom: 15px;">שלום {student_name},</p>
-        
+
+        <p style="margin-bottom: 15px;">שלום ${student_name},</p>
+
         <p style="margin-bottom: 15px;">אנו מבקשים להזכיר כי מועד החזרת הציוד שהושאל לך מתקרב:</p>
-        
+
         <div style="background-color: #f5f5f5; padding: 15px; border-radius: 5px; margin-bottom: 20px;">
-            <p><strong>פריט:</strong> {item_name}</p>
-            <p><strong>תאריך החזרה מתוכנן:</strong> {due_date}</p>
-            <p><strong>ימים שנותרו:</strong> <span style="color: #1976d2; font-weight: bold;">{days_remaining} ימים</span></p>
+            <p><strong>פריט:</strong> ${item_name}</p>
+            <p><strong>תאריך החזרה מתוכנן:</strong> ${due_date}</p>
+            <p><strong>ימים שנותרו:</strong> <span style="color: #1976d2; font-weight: bold;">${days_remaining} ימים</span></p>
         </div>
-        
+
         <p style="margin-bottom: 15px;">אנא הכן את הציוד להחזרה ביום המיועד.</p>
-        
+
         <p style="margin-bottom: 15px;">במקרה של צורך בהארכת תקופת ההשאלה, אנא צור קשר עם צוות ניהול הציוד בהקדם האפשרי.</p>
-        
+
         <p style="margin-top: 30px; color: #666; font-size: 12px; text-align: center;">
             הודעה זו נשלחה באופן אוטומטי ממערכת ניהול ציוד קולנוע<br>
             נא לא להשיב להודעה זו
         </p>
     </div>
-    """
-    
-    text_content = f"""
+    """,
+        """
     תזכורת: מועד החזרת ציוד מתקרב
-    
-    שלום {student_name},
-    
+
+    שלום ${student_name},
+
     אנו מבקשים להזכיר כי מועד החזרת הציוד שהושאל לך מתקרב:
-    
-    פריט: {item_name}
-    תאריך החזרה מתוכנן: {due_date}
-    ימים שנותרו: {days_remaining} ימים
-    
+
+    פריט: ${item_name}
+    תאריך החזרה מתוכנן: ${due_date}
+    ימים שנותרו: ${days_remaining} ימים
+
     אנא הכן את הציוד להחזרה ביום המיועד.
-    
+
     במקרה של צורך בהארכת תקופת ההשאלה, אנא צור קשר עם צוות ניהול הציוד בהקדם האפשרי.
-    
+
     הודעה זו נשלחה באופן אוטומטי ממערכת ניהול ציוד קולנוע
     נא לא להשיב להודעה זו
     """
-    
-    return subject, html_content, text_content
-
-def create_low_stock_email(item_data):
-    """
-    יוצר תבנית אימייל עבור פריט שכמותו במלאי נמוכה
-    
-    Parameters:
-    item_data (dict): נתוני הפריט שכמותו במלאי נמוכה
-    
-    Returns:
-    tuple: (נושא האימייל, תוכן HTML, תוכן טקסטואלי)
-    """
-    item_name = item_data.get('name', '')
-    category = item_data.get('category', '')
-    available_quantity = item_data.get('available_quantity', 0)
-    total_quantity = item_data.get('quantity', 0)
-    stock_percent = item_data.get('stock_percent', 0)
-    
-    subject = f"התראה: מלאי נמוך - {item_name}"
-    
-    html_content = f"""
+    ),
+    'low_stock': (
+        "התראה: מלאי נמוך - ${item_name}",
+        """
     <div dir="rtl" style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto; padding: 20px; border: 1px solid #ddd; border-radius: 5px;">
         <h2 style="color: #ff9800; text-align: center; margin-bottom: 20px;">התראה: מלאי נמוך</h2>
-        
+
         <p style="margin-bottom: 15px;">שלום,</p>
-        
+
         <p style="margin-bottom: 15px;">אנו מתריעים כי כמות המלאי של פריט הציוד הבא נמוכה:</p>
-        
+
         <div style="background-color: #f5f5f5; padding: 15px; border-radius: 5px; margin-bottom: 20px;">
-            <p><strong>פריט:</strong> {item_name}</p>
-            <p><strong>קטגוריה:</strong> {category}</p>
-            <p><strong>כמות זמינה:</strong> <span style="color: #ff9800; font-weight: bold;">{available_quantity} מתוך {total_quantity}</span></p>
-            <p><strong>אחוז במלאי:</strong> <span style="color: #ff9800; font-weight: bold;">{stock_percent}%</span></p>
+            <p><strong>פריט:</strong> ${item_name}</p>
+            <p><strong>קטגוריה:</strong> ${category}</p>
+            <p><strong>כמות זמינה:</strong> <span style="color: #ff9800; font-weight: bold;">${available_quantity} מתוך ${total_quantity}</span></p>
+            <p><strong>אחוז במלאי:</strong> <span style="color: #ff9800; font-weight: bold;">${stock_percent}%</span></p>
         </div>
-        
+
         <p style="margin-bottom: 15px;">מומלץ לבדוק את מצב הפריט ולשקול הזמנה נוספת או תיקון במידת הצורך.</p>
-        
+
         <p style="margin-top: 30px; color: #666; font-size: 12px; text-align: center;">
             הודעה זו נשלחה באופן אוטומטי ממערכת ניהול ציוד קולנוע<br>
             נא לא להשיב להודעה זו
         </p>
     </div>
-    """
-    
-    text_content = f"""
+    """,
+        """
     התראה: מלאי נמוך
-    
+
     שלום,
-    
+
     אנו מתריעים כי כמות המלאי של פריט הציוד הבא נמוכה:
-    
-    פריט: {item_name}
-    קטגוריה: {category}
-    כמות זמינה: {available_quantity} מתוך {total_quantity}
-    אחוז במלאי: {stock_percent}%
-    
+
+    פריט: ${item_name}
+    קטגוריה: ${category}
+    כמות זמינה: ${available_quantity} מתוך ${total_quantity}
+    אחוז במלאי: ${stock_percent}%
+
     מומלץ לבדוק את מצב הפריט ולשקול הזמנה נוספת או תיקון במידת הצורך.
-    
+
     הודעה זו נשלחה באופן אוטומטי ממערכת ניהול ציוד קולנוע
     נא לא להשיב להודעה זו
     """
-    
-    return subject, html_content, text_content
+    ),
+}
+
+def format_due_date(due_date):
+    """תאריך ההחזרה כ-dd/mm/yyyy, גם כשהגיע כמחרוזת ISO מדו"ח ההתראות"""
+    if isinstance(due_date, str):
+        try:
+            due_date = datetime.datetime.fromisoformat(due_date)
+        except ValueError:
+            return due_date
+    if isinstance(due_date, datetime.date):
+        return due_date.strftime('%d/%m/%Y')
+    return due_date
+
+def template_fields(alert_type, data):
+    """הערכים להצבה בתבנית מתוך נתוני ההתראה"""
+    if alert_type == 'low_stock':
+        return {
+            'item_name': data.get('name', ''),
+            'category': data.get('category', ''),
+            'available_quantity': data.get('available_quantity', 0),
+            'total_quantity': data.get('quantity', 0),
+            'stock_percent': data.get('stock_percent', 0),
+        }
+    return {
+        'student_name': data.get('student_name', ''),
+        'item_name': data.get('item_name', ''),
+        'due_date': format_due_date(data.get('due_date', '')),
+        'days_overdue': data.get('days_overdue', 0),
+        'days_remaining': data.get('days_remaining', 0),
+    }
+
+@lru_cache(maxsize=None)
+def compiled_templates(alert_type):
+    """התבניות של סוג ההתראה כ-Template, פעם אחת לתהליך"""
+    if alert_type not in EMAIL_TEMPLATES:
+        raise ValueError(f"סוג התראה לא נתמך: {alert_type}")
+    return tuple(Template(template) for template in EMAIL_TEMPLATES[alert_type])
+
+def render_email(alert_type, data):
+    """
+    מחזיר (נושא האימייל, תוכן HTML, תוכן טקסטואלי) להתראה.
+    זורק ValueError לסוג התראה לא נתמך
+    """
+    subject, html_template, text_template = compiled_templates(alert_type)
+    fields = {key: '' if value is None else str(value) for key, value in template_fields(alert_type, data).items()}
+    escaped = {key: html.escape(value) for key, value in fields.items()}
+    return (subject.substitute(fields),
+            html_template.substitute(escaped),
+            text_template.substitute(fields))
+
+def create_overdue_loan_email(loan_data):
+    """יוצר תבנית אימייל עבור השאלה באיחור"""
+    return render_email('overdue', loan_data)
+
+def create_upcoming_return_email(loan_data):
+    """יוצר תבנית אימייל עבור השאלה שמועד החזרתה קרב"""
+    return render_email('upcoming', loan_data)
+
+def create_low_stock_email(item_data):
+    """יוצר תבנית אימייל עבור פריט שכמותו במלאי נמוכה"""
+    return render_email('low_stock', item_data)
+
+def outbox_available(cur):
+    """בודק שטבלת התור (מיגרציה 11) קיימת"""
+    cur.execute("SELECT to_regclass('email_outbox') IS NOT NULL")
+    return cur.fetchone()[0]
+
+def render_alerts(alerts):
+    """
+    מרנדר את ההתראות. alerts היא רשימה של {"alert_type", "data", "email"}.
+    מחזיר (שורות (alert_type, נמען, נושא, html, טקסט), שגיאות) - התראה עם
+    סוג לא נתמך או בלי נמען לא מרונדרת ומדווחת בשגיאות
+    """
+    rows, errors = [], []
+    for index, alert in enumerate(alerts):
+        alert_type, data, recipient = alert.get('alert_type'), alert.get('data'), alert.get('email')
+        if not alert_type or not data or not recipient:
+            errors.append({'index': index, 'message': "חסרים פרמטרים: alert_type, data, email"})
+            continue
+        try:
+            subject, html_content, text_content = render_email(alert_type, data)
+        except ValueError as e:
+            errors.append({'index': index, 'message': str(e)})
+            continue
+        rows.append((alert_type, recipient, subject, html_content, text_content))
+    return rows, errors
+
+def enqueue_alert_emails(cur, alerts):
+    """
+    מרנדר את ההתראות ורושם אותן בתור. מחזיר (מזהי ההודעות, שגיאות)
+    """
+    rows, errors = render_alerts(alerts)
+    if not rows:
+        return [], errors
+    ids = execute_values(cur, """
+        INSERT INTO email_outbox (alert_type, recipient, subject, html_body, text_body)
+        VALUES %s
+        RETURNING id
+    """, rows, page_size=500, fetch=True)
+    return [row[0] for row in ids], errors
+
+def claim_outbox(conn, ids=None, done=(), limit=EMAIL_BATCH_SIZE):
+    """
+    לוקח לשליחה הודעות שזמנן הגיע (או את ids, בלי done שכבר נוסו בסבב הזה)
+    ומסמן אותן 'sending', בטרנזקציה נפרדת, כך ששני שולחים במקביל לא לוקחים
+    את אותה הודעה
+    """
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            UPDATE email_outbox o
+            SET status = 'sending',
+                attempts = o.attempts + 1,
+                next_attempt_at = CURRENT_TIMESTAMP + make_interval(secs => %(timeout)s)
+            WHERE o.id IN (
+                SELECT id FROM email_outbox
+                WHERE status IN ('pending', 'sending')
+                  AND next_attempt_at <= CURRENT_TIMESTAMP
+                  AND NOT id = ANY(%(done)s)
+                  {'AND id = ANY(%(ids)s)' if ids is not None else ''}
+                ORDER BY id
+                LIMIT %(limit)s
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING o.id, o.recipient, o.subject, o.html_body, o.text_body, o.attempts
+        """, {'timeout': EMAIL_SENDING_TIMEOUT, 'ids': ids, 'done': list(done), 'limit': limit})
+        claimed = sorted(cur.fetchall())
+    conn.commit()
+    return claimed
+
+def record_results(conn, results):
+    """שומר את תוצאות השליחה: (id, attempts, שגיאה או None)"""
+    if not results:
+        return
+    with conn.cursor() as cur:
+        execute_values(cur, """
+            UPDATE email_outbox o
+            SET status = CASE WHEN r.error IS NULL THEN 'sent'
+                              WHEN r.attempts >= %s THEN 'failed'
+                              ELSE 'pending' END,
+                last_error = r.error,
+                sent_at = CASE WHEN r.error IS NULL THEN CURRENT_TIMESTAMP END,
+                next_attempt_at = CASE WHEN r.error IS NULL THEN NULL
+                                       ELSE CURRENT_TIMESTAMP + make_interval(secs => %s * power(2, r.attempts - 1))
+                                  END
+            FROM (VALUES %%s) AS r (id, attempts, error)
+            WHERE o.id = r.id
+        """ % (EMAIL_MAX_ATTEMPTS, EMAIL_RETRY_DELAY), results,
+            template="(%s::BIGINT, %s::INTEGER, %s::TEXT)", page_size=500)
+    conn.commit()
+
+def dispatch_outbox(ids=None, settings=None):
+    """
+    שולח את ההודעות הממתינות (או רק את ids) בחיבור SMTP אחד, במנות של
+    EMAIL_BATCH_SIZE. מחזיר {"sent", "failed", "errors"}
+    """
+    settings = settings or get_email_settings()
+    summary = {'sent': 0, 'failed': 0, 'errors': []}
+    done = set()
+
+    # בלי טבלת התור אין הודעות שממתינות לניסיון חוזר
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            if not outbox_available(cur):
+                return summary
+
+    with get_db_connection() as conn, SMTPSession(settings) as session:
+        while True:
+            # הודעה שנכשלה בסבב הזה תנוסה שוב רק בהרצה הבאה
+            claimed = claim_outbox(conn, ids, done)
+            if not claimed:
+                break
+            results = []
+            for message_id, recipient, subject, html_body, text_body, attempts in claimed:
+                done.add(message_id)
+                try:
+                    session.send(build_message(recipient, subject, html_body, text_body, settings['from_email']))
+                    results.append((message_id, attempts, None))
+                    summary['sent'] += 1
+                except (smtplib.SMTPException, OSError) as e:
+                    # החיבור ייפתח מחדש בהודעה הבאה
+                    if not isinstance(e, (smtplib.SMTPRecipientsRefused, smtplib.SMTPDataError)):
+                        session.close()
+                    results.append((message_id, attempts, str(e) or type(e).__name__))
+                    summary['failed'] += 1
+                    summary['errors'].append({'id': message_id, 'email': recipient, 'message': str(e)})
+            record_results(conn, results)
+    return summary
+
+def send_alert_emails_directly(alerts, settings=None):
+    """
+    שולח את ההתראות בחיבור SMTP אחד בלי לרשום אותן בתור - כשטבלת email_outbox
+    עוד לא קיימת. הודעה שנכשלה לא נשמרת לניסיון חוזר
+    """
+    settings = settings or get_email_settings()
+    rows, errors = render_alerts(alerts)
+    summary = {'sent': 0, 'failed': 0, 'errors': errors, 'queued': 0}
+    if not rows:
+        return summary
+    with SMTPSession(settings) as session:
+        for alert_type, recipient, subject, html_body, text_body in rows:
+            try:
+                session.send(build_message(recipient, subject, html_body, text_body, settings['from_email']))
+                summary['sent'] += 1
+            except (smtplib.SMTPException, OSError) as e:
+                if not isinstance(e, (smtplib.SMTPRecipientsRefused, smtplib.SMTPDataError)):
+                    session.close()
+                summary['failed'] += 1
+                summary['errors'].append({'email': recipient, 'message': str(e)})
+    return summary
+
+def send_alert_emails(alerts):
+    """רושם את ההתראות בתור ושולח אותן בחיבור אחד"""
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            if not outbox_available(cur):
+                return send_alert_emails_directly(alerts)
+            ids, errors = enqueue_alert_emails(cur, alerts)
+
+    summary = dispatch_outbox(ids) if ids else {'sent': 0, 'failed': 0, 'errors': []}
+    summary['queued'] = len(ids)
+    summary['errors'] = errors + summary['errors']
+    return summary
 
 def main():
     """פונקציה ראשית"""
     try:
-        # קבלת נתונים מהקלט
-        if len(sys.argv) > 1:
-            input_data = json.loads(sys.argv[1])
-            alert_type = input_data.get('alert_type')
-            data = input_data.get('data')
-            recipient_email = input_data.get('email')
-            
-            if not alert_type or not data or not recipient_email:
-                print(json.dumps({
-                    "success": False,
-                    "message": "חסרים פרמטרים: alert_type, data, email"
-                }))
-                return
-            
-            # בחירת סוג האימייל בהתאם לסוג ההתראה
-            if alert_type == 'overdue':
-                subject, html_content, text_content = create_overdue_loan_email(data)
-            elif alert_type == 'upcoming':
-                subject, html_content, text_content = create_upcoming_return_email(data)
-            elif alert_type == 'low_stock':
-                subject, html_content, text_content = create_low_stock_email(data)
-            else:
-                print(json.dumps({
-                    "success": False,
-                    "message": f"סוג התראה לא נתמך: {alert_type}"
-                }))
-                return
-            
-            # שליחת האימייל
-            success = send_email(recipient_email, subject, html_content, text_content)
-            
-            if success:
-                print(json.dumps({
-                    "success": True,
-                    "message": f"האימייל נשלח בהצלחה לכתובת {recipient_email}"
-                }))
-            else:
-                print(json.dumps({
-                    "success": False,
-                    "message": "שגיאה בשליחת האימייל"
-                }))
-        else:
+        # קבלת נתונים מהקלט - פרמטר ראשון, או stdin למנות גדולות
+        raw_input = sys.argv[1] if len(sys.argv) > 1 else sys.stdin.read()
+        if not raw_input.strip():
             print(json.dumps({
                 "success": False,
                 "message": "לא התקבלו נתונים בקלט"
             }))
-    
+            return
+
+        input_data = json.loads(raw_input)
+
+        if input_data.get('retry'):
+            summary = dispatch_outbox()
+            print(json.dumps(dict(summary, success=summary['failed'] == 0,
+                                  message=f"נשלחו {summary['sent']} הודעות מהתור"), ensure_ascii=False))
+            return
+
+        if 'alerts' in input_data:
+            summary = send_alert_emails(input_data.get('alerts') or [])
+            print(json.dumps(dict(summary, success=summary['sent'] > 0 and not summary['errors'],
+                                  message=f"נשלחו {summary['sent']} מתוך {len(input_data['alerts'])} הודעות"),
+                             ensure_ascii=False))
+            return
+
+        # הודעה אחת (הממשק הקודם)
+        alert_type = input_data.get('alert_type')
+        recipient_email = input_data.get('email')
+        if not alert_type or not input_data.get('data') or not recipient_email:
+            print(json.dumps({
+                "success": False,
+                "message": "חסרים פרמטרים: alert_type, data, email"
+            }))
+            return
+        if alert_type not in EMAIL_TEMPLATES:
+            print(json.dumps({
+                "success": False,
+                "message": f"סוג התראה לא נתמך: {alert_type}"
+            }))
+            return
+
+        summary = send_alert_emails([input_data])
+        if summary['sent']:
+            print(json.dumps({
+                "success": True,
+                "message": f"האימייל נשלח בהצלחה לכתובת {recipient_email}"
+            }))
+        else:
+            print(json.dumps({
+                "success": False,
+                "message": "שגיאה בשליחת האימייל - ההודעה נשמרה בתור לניסיון חוזר"
+            }))
+
     except Exception as e:
         print(json.dumps({
             "success": False,
@@ -316,4 +581,4 @@ def main():
         }))
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -6,18 +6,12 @@
 import sys
 import os
 import json
-from datetime import datetime, date
+from datetime import datetime
 
 # הוספת תיקיית האב לנתיב החיפוש כדי לייבא מודולים מהתיקייה הראשית
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 import maintenance
-
-# עוזר להמיר אובייקטי תאריך לייצוג מחרוזת ב-JSON
-class DateTimeEncoder(json.JSONEncoder):
-    def default(self, o):
-        if isinstance(o, (datetime, date)):
-            return o.isoformat()
-        return super().default(o)
+from serialization import dumps
 
 # עוזר להמיר מחרוזות תאריך לאובייקטי תאריך
 def parse_date(date_str):
@@ -237,7 +231,7 @@ def main():
             raise ValueError(f"פעולה לא מוכרת: {action}")
             
         # החזרת התוצאה כ-JSON
-        print(json.dumps(result, ensure_ascii=False, cls=DateTimeEncoder))
+        print(dumps(result))
             
     except ValueError as e:
         # שגיאות תקינות קלט
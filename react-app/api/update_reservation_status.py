@@ -6,7 +6,7 @@
 import json
 import sys
 import traceback
-from database import get_db_connection
+from database import get_db_connection, bump_data_version
 
 def update_reservation_status(reservation_id, status):
     """פונקציה המשנה את סטטוס ההזמנה"""
@@ -28,6 +28,7 @@ def update_reservation_status(reservation_id, status):
                 if cur.rowcount == 0:
                     return {"success": False, "message": "הזמנה לא נמצאה"}
                 
+                bump_data_version(cur)
                 conn.commit()
                 return {"success": True, "message": "סטטוס ההזמנה עודכן בהצלחה"}
     except Exception as e:
@@ -6,7 +6,6 @@
 import sys
 import os
 import json
-import datetime
 import logging
 import psycopg2
 from psycopg2.extras import RealDictCursor
@@ -18,14 +17,7 @@ sys.path.append(parent_dir)
 
 # ייבוא פונקציית חיבור למסד הנתונים
 from database import get_db_connection
-
-# קידוד JSON לאובייקטי תאריך
-class DateTimeEncoder(json.JSONEncoder):
-    """מחלקה להמרת אובייקטי תאריך ל-JSON"""
-    def default(self, o):
-        if isinstance(o, (datetime.datetime, datetime.date)):
-            return o.isoformat()
-        return super(DateTimeEncoder, self).default(o)
+from serialization import dumps
 
 def get_all_users():
     """מחזיר רשימה של כל המשתמשים במערכת"""
@@ -500,7 +492,7 @@ def main():
             result = {'success': False, 'message': f'Unknown action: {action}'}
         
         # החזרת תוצאה כ-JSON
-        print(json.dumps(result, cls=DateTimeEncoder))
+        print(dumps(result))
         
     except Exception as e:
         error_result = {'success': False, 'message': str(e)}
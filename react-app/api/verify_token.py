@@ -7,30 +7,15 @@ Verifies user tokens and returns user data
 import json
 import sys
 import os
-import psycopg2
-from urllib.parse import urlparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+import database
 
 def get_db_connection():
     """Create database connection"""
     try:
-        # Get database URL from environment
-        database_url = os.environ.get('DATABASE_URL')
-        if not database_url:
-            raise Exception("DATABASE_URL environment variable not set")
-        
-        # Parse the database URL
-        parsed = urlparse(database_url)
-        
-        # Create connection
-        conn = psycopg2.connect(
-            host=parsed.hostname,
-            port=parsed.port,
-            database=parsed.path[1:],  # Remove leading slash
-            user=parsed.username,
-            password=parsed.password,
-            sslmode='require'
-        )
-        return conn
+        # Shared pooled connection from database.py
+        return database.get_db_connection()
     except Exception as e:
         print(f"Database connection error: {e}", file=sys.stderr)
         return None
@@ -0,0 +1,405 @@
+"""
+אפליקציית WSGI אחת לכל סקריפטי ה-API של פייתון.
+
+במקום מאגר תהליכים שכל אחד מהם מריץ בקשה אחת בכל פעם (python_worker.py),
+תהליך אחד מחזיק את כל הסקריפטים של react-app/api כנתיבים, ומשרת אותם
+בתהליכונים (threads) שחולקים:
+  - מאגר חיבורים אחד למסד הנתונים (database.get_pool)
+  - סריאליזציית JSON אחת לתשובות (serialization.py)
+  - שכבת אימות אחת (AuthMiddleware) שמזהה את המשתמש מכותרת Authorization
+
+הסקריפטים עצמם לא משתנים: כל סקריפט נרשם כנתיב POST /scripts/<name>, ו-main()
+שלו רץ עם stdin/stdout/stderr/argv של הבקשה. ההחלפה נעשית לכל תהליכון בנפרד
+(RequestStream, RequestArgv), כך שבקשות במקביל לא מערבבות פלט.
+    בקשה:  {"args": [...], "input": "..."}
+    תשובה: {"code": 0, "stdout": "...", "stderr": "..."}
+עם "raw": true בבקשה גוף התשובה הוא ה-stdout של הסקריפט עצמו, בלי מעטפת,
+ו-Node מעביר אותו ללקוח כמו שהוא (server.js, streamPythonScript). סקריפט
+שנכשל מחזיר 500 עם {"message": stderr}.
+
+השרת המובנה תומך ב-HTTP/1.1 keep-alive, כך ש-Node שולח את כל הבקשות על גבי
+מספר קטן של חיבורים קבועים. אפשר גם להריץ את app בכל שרת WSGI אחר.
+    python react-app/server/api_app.py [--host 127.0.0.1] [--port 8001]
+ובשרת Express: PYTHON_APP_URL=http://127.0.0.1:8001
+"""
+
+import argparse
+import io
+import json
+import os
+import re
+import sys
+import threading
+import time
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# python_worker מגדיר את נתיבי החיפוש של הסקריפטים ואת טעינת המודולים
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from python_worker import API_DIR, _exit_code, load_handler
+
+from database import get_db_connection
+from serialization import dumps_bytes
+
+# כמה זמן (בשניות) משתמש שזוהה מטוקן נשמר בזיכרון לפני בדיקה חוזרת במסד
+AUTH_CACHE_TTL = float(os.getenv('API_AUTH_CACHE_TTL', '60'))
+
+HTTP_STATUS = {
+    200: '200 OK',
+    400: '400 Bad Request',
+    401: '401 Unauthorized',
+    404: '404 Not Found',
+    405: '405 Method Not Allowed',
+    500: '500 Internal Server Error',
+}
+
+
+# ===== הפניית stdin/stdout/argv לכל תהליכון =====
+
+_request = threading.local()
+
+
+class RequestStream:
+    """
+    עומד במקום sys.stdin/stdout/stderr ומפנה כל פעולה לזרם של הבקשה
+    שרצה בתהליכון הנוכחי, או לזרם המקורי מחוץ לבקשה
+    """
+
+    def __init__(self, name, default):
+        self._name = name
+        self._default = default
+
+    def _target(self):
+        return getattr(_request, self._name, None) or self._default
+
+    def __getattr__(self, attr):
+        return getattr(self._target(), attr)
+
+    def __iter__(self):
+        return iter(self._target())
+
+
+class RequestArgv(list):
+    """sys.argv של הבקשה בתהליכון הנוכחי"""
+
+    def _target(self):
+        return getattr(_request, 'argv', None) or list(list.__iter__(self))
+
+    def __getitem__(self, index):
+        return self._target()[index]
+
+    def __len__(self):
+        return len(self._target())
+
+    def __iter__(self):
+        return iter(self._target())
+
+    def __repr__(self):
+        return repr(self._target())
+
+
+def install_request_streams():
+    """מחליף את sys.stdin/stdout/stderr/argv פעם אחת לכל התהליך"""
+    if not isinstance(sys.stdout, RequestStream):
+        sys.stdin = RequestStream('stdin', sys.stdin)
+        sys.stdout = RequestStream('stdout', sys.stdout)
+        sys.stderr = RequestStream('stderr', sys.stderr)
+        sys.argv = RequestArgv(sys.argv)
+
+
+_load_lock = threading.Lock()
+
+
+def run_script(script_path, args, input_text):
+    """מריץ את main() של הסקריפט עם הקלט והפלט של הבקשה הנוכחית"""
+    stdout, stderr = io.StringIO(), io.StringIO()
+    _request.stdin = io.StringIO(input_text)
+    _request.stdout, _request.stderr = stdout, stderr
+    _request.argv = [script_path] + [str(arg) for arg in args]
+    code = 0
+    try:
+        with _load_lock:
+            handler = load_handler(script_path)
+        handler.main()
+    except SystemExit as e:
+        code = _exit_code(e)
+    except Exception:
+        traceback.print_exc()
+        code = 1
+    finally:
+        del _request.stdin, _request.stdout, _request.stderr, _request.argv
+    return {'code': code, 'stdout': stdout.getvalue(), 'stderr': stderr.getvalue()}
+
+
+# ===== ניתוב =====
+
+class Request:
+    """הבקשה כפי שהיא מגיעה ל-handler: environ, פרמטרי הנתיב, גוף JSON והמשתמש"""
+
+    def __init__(self, environ, params):
+        self.environ = environ
+        self.params = params
+        self.user = environ.get('api.user')
+        self._body = None
+
+    def json(self):
+        if self._body is None:
+            length = int(self.environ.get('CONTENT_LENGTH') or 0)
+            raw = self.environ['wsgi.input'].read(length) if length else b''
+            self._body = json.loads(raw.decode('utf-8')) if raw.strip() else {}
+        return self._body
+
+
+class Router:
+    """טבלת נתיבים: (method, תבנית עם <param>) -> handler(request) שמחזיר (status, payload)"""
+
+    def __init__(self):
+        self.routes = []
+
+    def add(self, method, pattern, handler, auth=False):
+        regex = re.compile('^' + re.sub(r'<(\w+)>', r'(?P<\1>[^/]+)', pattern) + '$')
+        self.routes.append((method, pattern, regex, handler, auth))
+
+    def route(self, method, pattern, auth=False):
+        def register(handler):
+            self.add(method, pattern, handler, auth)
+            return handler
+        return register
+
+    def __call__(self, environ, start_response):
+        method, path = environ['REQUEST_METHOD'], environ.get('PATH_INFO') or '/'
+        allowed = False
+        for route_method, _, regex, handler, auth in self.routes:
+            match = regex.match(path)
+            if not match:
+                continue
+            if route_method != method:
+                allowed = True
+                continue
+            if auth and environ.get('api.user') is None:
+                return respond(start_response, 401, {'success': False, 'message': 'לא התקבל טוקן הרשאה'})
+            try:
+                status, payload = handler(Request(environ, match.groupdict()))
+            except ValueError as e:
+                status, payload = 400, {'success': False, 'message': f'בקשה לא תקינה: {e}'}
+            except Exception as e:
+                traceback.print_exc()
+                status, payload = 500, {'success': False, 'message': str(e)}
+            return respond(start_response, status, payload)
+        if allowed:
+            return respond(start_response, 405, {'success': False, 'message': 'Method not allowed'})
+        return respond(start_response, 404, {'success': False, 'message': f'Unknown route: {path}'})
+
+
+def respond(start_response, status, payload):
+    # bytes הם JSON מוכן (פלט גולמי של סקריפט) ונשלחים כמו שהם
+    body = payload if isinstance(payload, bytes) else dumps_bytes(payload)
+    start_response(HTTP_STATUS.get(status, f'{status} Status'), [
+        ('Content-Type', 'application/json; charset=utf-8'),
+        ('Content-Length', str(len(body)))
+    ])
+    return [body]
+
+
+# ===== אימות =====
+
+class AuthMiddleware:
+    """
+    מזהה את המשתמש מ-Authorization: Bearer <token> פעם אחת לכל בקשה ושומר
+    אותו ב-environ['api.user']. הטוקן הוא מזהה המשתמש שמחזיר login.py; משתמש
+    שזוהה נשמר בזיכרון AUTH_CACHE_TTL שניות. טוקן לא תקין מחזיר 401, ובקשה
+    בלי טוקן ממשיכה כאנונימית (נתיבים עם auth=True דוחים אותה)
+    """
+
+    def __init__(self, app, ttl=AUTH_CACHE_TTL):
+        self.app = app
+        self.ttl = ttl
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def lookup(self, token):
+        if not token.isdigit():
+            return None
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT id, username, role, email, full_name, study_year, branch, status
+                    FROM users
+                    WHERE id = %s AND status = 'active'
+                """, (int(token),))
+                row = cur.fetchone()
+        if row is None:
+            return None
+        columns = ('id', 'username', 'role', 'email', 'full_name', 'study_year', 'branch', 'status')
+        return dict(zip(columns, row))
+
+    def resolve(self, token):
+        now = time.monotonic()
+        with self._lock:
+            cached = self._cache.get(token)
+        if cached and cached[0] > now:
+            return cached[1]
+        user = self.lookup(token)
+        with self._lock:
+            if user is None:
+                self._cache.pop(token, None)
+            else:
+                self._cache[token] = (now + self.ttl, user)
+        return user
+
+    def __call__(self, environ, start_response):
+        header = environ.get('HTTP_AUTHORIZATION', '')
+        if header.startswith('Bearer '):
+            user = self.resolve(header[len('Bearer '):].strip())
+            if user is None:
+                return respond(start_response, 401, {'success': False, 'message': 'טוקן לא תקין או פג תוקף'})
+            environ['api.user'] = user
+        return self.app(environ, start_response)
+
+
+# ===== הנתיבים =====
+
+def api_scripts():
+    """שם -> נתיב מלא לכל סקריפט API שיש לו main()"""
+    scripts = {}
+    for filename in sorted(os.listdir(API_DIR)):
+        if not filename.endswith('.py'):
+            continue
+        path = os.path.join(API_DIR, filename)
+        with open(path, encoding='utf-8') as f:
+            if re.search(r'^def main\(', f.read(), re.MULTILINE):
+                scripts[filename[:-3]] = path
+    return scripts
+
+
+def script_route(script_path):
+    def handler(request):
+        body = request.json()
+        result = run_script(script_path, body.get('args') or [], body.get('input') or '')
+        if not body.get('raw'):
+            return 200, result
+        if result['code'] != 0:
+            return 500, {'success': False, 'code': result['code'],
+                         'message': result['stderr'] or 'Python script error'}
+        if result['stderr']:
+            print(result['stderr'], file=sys.__stderr__)
+        return 200, result['stdout'].encode('utf-8')
+    return handler
+
+
+def create_app():
+    """בונה את האפליקציה: נתיב לכל סקריפט, בריאות ו-/auth/me, עטופים באימות"""
+    install_request_streams()
+    router = Router()
+    scripts = api_scripts()
+    for name, path in scripts.items():
+        router.add('POST', f'/scripts/{name}', script_route(path))
+
+    @router.route('GET', '/health')
+    def health(request):
+        return 200, {'status': 'healthy', 'scripts': len(scripts)}
+
+    @router.route('GET', '/routes')
+    def routes(request):
+        return 200, [{'method': method, 'path': pattern, 'auth': auth}
+                     for method, pattern, _, _, auth in router.routes]
+
+    @router.route('GET', '/auth/me', auth=True)
+    def me(request):
+        return 200, {'success': True, 'user': request.user}
+
+    return AuthMiddleware(router)
+
+
+# ===== שרת HTTP/1.1 עם keep-alive =====
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    """מריץ את אפליקציית ה-WSGI לכל בקשה ומשאיר את החיבור פתוח לבקשה הבאה"""
+
+    protocol_version = 'HTTP/1.1'
+    app = None
+
+    def handle_one_request(self):
+        try:
+            self.raw_requestline = self.rfile.readline(65537)
+            if not self.raw_requestline:
+                self.close_connection = True
+                return
+            if not self.parse_request():
+                return
+            self.run_wsgi()
+            self.wfile.flush()
+        except (ConnectionResetError, BrokenPipeError):
+            self.close_connection = True
+
+    def run_wsgi(self):
+        path, _, query = self.path.partition('?')
+        # הגוף נקרא במלואו גם אם הנתיב לא משתמש בו, כדי שהחיבור יישאר מסונכרן
+        length = int(self.headers.get('Content-Length') or 0)
+        request_body = self.rfile.read(length) if length else b''
+        environ = {
+            'REQUEST_METHOD': self.command,
+            'PATH_INFO': path,
+            'QUERY_STRING': query,
+            'CONTENT_TYPE': self.headers.get('Content-Type', ''),
+            'CONTENT_LENGTH': str(length),
+            'SERVER_NAME': self.server.server_name,
+            'SERVER_PORT': str(self.server.server_port),
+            'SERVER_PROTOCOL': self.request_version,
+            'REMOTE_ADDR': self.client_address[0],
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': io.BytesIO(request_body),
+            'wsgi.errors': sys.__stderr__,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        for key, value in self.headers.items():
+            name = 'HTTP_' + key.upper().replace('-', '_')
+            if name not in ('HTTP_CONTENT_TYPE', 'HTTP_CONTENT_LENGTH'):
+                environ[name] = value
+
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'], response['headers'] = status, headers
+
+        body = b''.join(self.app(environ, start_response))
+        code, _, reason = response['status'].partition(' ')
+        self.send_response(int(code), reason)
+        headers = dict((name.lower(), (name, value)) for name, value in response['headers'])
+        headers.setdefault('content-length', ('Content-Length', str(len(body))))
+        for name, value in headers.values():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # יומן הבקשות נשמר בצד Node
+        pass
+
+
+def serve(host, port):
+    KeepAliveHandler.app = create_app()
+    server = ThreadingHTTPServer((host, port), KeepAliveHandler)
+    server.daemon_threads = True
+    print(f"Python API app listening on http://{host}:{port}", file=sys.__stderr__, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="אפליקציית ה-API המאוחדת")
+    parser.add_argument('--host', default=os.getenv('PYTHON_APP_HOST', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('PYTHON_APP_PORT', '8001')))
+    args = parser.parse_args()
+    serve(args.host, args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+/**
+ * מאגר תהליכי פייתון קבועים להרצת סקריפטי ה-API
+ * כל תהליך מריץ את python_worker.py, טוען את הסקריפטים פעם אחת
+ * ומקבל בקשות במסגרות JSON (4 בתים של אורך + גוף) על גבי stdin/stdout
+ */
+
+const { spawn } = require('child_process');
+const path = require('path');
+const os = require('os');
+
+const WORKER_SCRIPT = path.join(__dirname, 'python_worker.py');
+
+class PythonWorker {
+  constructor(pool) {
+    this.pool = pool;
+    this.handled = 0;
+    this.current = null;
+    this.buffer = Buffer.alloc(0);
+    this.exited = false;
+
+    this.process = spawn(pool.pythonPath, [WORKER_SCRIPT], {
+      stdio: ['pipe', 'pipe', 'pipe']
+    });
+
+    this.process.stdout.on('data', (data) => this.onData(data));
+    this.process.stderr.on('data', (data) => {
+      console.error(`Python worker stderr: ${data.toString()}`);
+    });
+    this.process.on('exit', (code, signal) => this.onExit(code, signal));
+    this.process.on('error', (err) => {
+      console.error('Python worker error:', err.message);
+      this.onExit(null, null);
+    });
+    this.process.stdin.on('error', (err) => {
+      console.error('Python worker stdin error:', err.message);
+    });
+  }
+
+  /**
+   * שליחת בקשה לתהליך. לכל תהליך יש לכל היותר בקשה אחת פעילה
+   */
+  send(job) {
+    this.current = job;
+    this.handled += 1;
+
+    const body = Buffer.from(JSON.stringify({
+      id: job.id,
+      script: job.scriptPath,
+      args: job.args,
+      input: job.input
+    }), 'utf8');
+    const header = Buffer.alloc(4);
+    header.writeUInt32BE(body.length, 0);
+
+    job.timer = setTimeout(() => {
+      console.error(`Python worker timed out after ${this.pool.timeoutMs}ms: ${job.scriptPath}`);
+      this.kill();
+      this.finish(new Error(`Python script timed out: ${path.basename(job.scriptPath)}`));
+    }, this.pool.timeoutMs);
+
+    this.process.stdin.write(Buffer.concat([header, body]));
+  }
+
+  onData(data) {
+    this.buffer = Buffer.concat([this.buffer, data]);
+    while (this.buffer.length >= 4) {
+      const length = this.buffer.readUInt32BE(0);
+      if (this.buffer.length < 4 + length) {
+        break;
+      }
+      const body = this.buffer.subarray(4, 4 + length).toString('utf8');
+      this.buffer = this.buffer.subarray(4 + length);
+
+      let response;
+      try {
+        response = JSON.parse(body);
+      } catch (e) {
+        this.kill();
+        this.finish(new Error(`Invalid response from Python worker: ${e.message}`));
+        return;
+      }
+      this.finish(null, response);
+    }
+  }
+
+  finish(err, response) {
+    const job = this.current;
+    if (!job) {
+      return;
+    }
+    clearTimeout(job.timer);
+    this.current = null;
+
+    if (err) {
+      job.reject(err);
+    } else {
+      job.resolve({ code: response.code, stdout: response.stdout, stderr: response.stderr });
+    }
+
+    if (!this.exited) {
+      this.pool.release(this);
+    }
+  }
+
+  onExit(code, signal) {
+    this.exited = true;
+    if (this.current) {
+      this.finish(new Error(`Python worker exited unexpectedly (code ${code}, signal ${signal})`));
+    }
+    this.pool.remove(this);
+  }
+
+  /**
+   * סגירה מסודרת - התהליך יוצא כשה-stdin נסגר
+   */
+  retire() {
+    this.exited = true;
+    this.process.stdin.end();
+  }
+
+  kill() {
+    this.exited = true;
+    this.process.kill('SIGKILL');
+  }
+}
+
+class PythonWorkerPool {
+  /**
+   * @param {Object} options
+   * @param {number} options.size - מספר התהליכים במאגר
+   * @param {number} options.timeoutMs - זמן מקסימלי לבקשה בודדת
+   * @param {number} options.maxRequests - מספר בקשות שאחריו תהליך ממוחזר
+   * @param {string} options.pythonPath - פקודת פייתון להרצה
+   */
+  constructor(options = {}) {
+    this.size = options.size || Math.max(2, Math.min(4, os.cpus().length));
+    this.timeoutMs = options.timeoutMs || 120000;
+    this.maxRequests = options.maxRequests || 500;
+    this.pythonPath = options.pythonPath || 'python3';
+
+    this.workers = [];
+    this.idle = [];
+    this.queue = [];
+    this.nextId = 1;
+    this.closed = false;
+  }
+
+  /**
+   * הרצת סקריפט בתהליך פנוי
+   * @returns {Promise<{code: number, stdout: string, stderr: string}>}
+   */
+  run(scriptPath, args = [], inputData = null) {
+    return new Promise((resolve, reject) => {
+      this.queue.push({
+        id: this.nextId++,
+        scriptPath: path.resolve(scriptPath),
+        args: args.map(String),
+        input: inputData ? JSON.stringify(inputData) : '',
+        resolve,
+        reject
+      });
+      this.dispatch();
+    });
+  }
+
+  dispatch() {
+    while (this.queue.length > 0) {
+      let worker = this.idle.pop();
+      if (!worker) {
+        if (this.workers.length >= this.size) {
+          return;
+        }
+        worker = new PythonWorker(this);
+        this.workers.push(worker);
+      }
+      worker.send(this.queue.shift());
+    }
+  }
+
+  /**
+   * החזרת תהליך למאגר אחרי סיום בקשה, או מחזור שלו אם הגיע למכסה
+   */
+  release(worker) {
+    if (worker.handled >= this.maxRequests || this.closed) {
+      worker.retire();
+      this.remove(worker);
+    } else {
+      this.idle.push(worker);
+    }
+    this.dispatch();
+  }
+
+  remove(worker) {
+    this.workers = this.workers.filter((w) => w !== worker);
+    this.idle = this.idle.filter((w) => w !== worker);
+    if (!this.closed) {
+      this.dispatch();
+    }
+  }
+
+  close() {
+    this.closed = true;
+    for (const worker of this.idle) {
+      worker.retire();
+    }
+    this.idle = [];
+  }
+}
+
+module.exports = { PythonWorkerPool };
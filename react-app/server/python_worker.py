@@ -0,0 +1,160 @@
+"""
+תהליך עבודה קבוע (worker) להרצת סקריפטי ה-API של פייתון.
+
+במקום להפעיל מפרש פייתון חדש לכל בקשה, שרת ה-Express מחזיק מאגר של תהליכים
+כאלה. כל תהליך טוען את סקריפטי react-app/api פעם אחת בלבד ומריץ את פונקציית
+main() שלהם שוב ושוב, כך שייבוא pandas/psycopg2/pytz וחיבורי מסד הנתונים
+נשמרים בין בקשות.
+
+הסקריפטים עצמם לא משתנים: עבור כל בקשה מוחלפים sys.stdin, sys.stdout,
+sys.stderr ו-sys.argv, כך ש-main() קורא JSON מ-stdin ומדפיס JSON ל-stdout
+בדיוק כמו בהרצה עצמאית. קריאה ל-sys.exit() נתפסת והופכת לקוד היציאה של הבקשה.
+
+פרוטוקול התקשורת מול Node הוא מסגרות על גבי stdin/stdout של התהליך:
+4 בתים של אורך (big-endian) ואחריהם גוף JSON ב-UTF-8.
+    בקשה:  {"id": ..., "script": "/abs/path.py", "args": [...], "input": "..."}
+    תשובה: {"id": ..., "code": 0, "stdout": "...", "stderr": "..."}
+"""
+
+import io
+import json
+import os
+import struct
+import sys
+import traceback
+import importlib.util
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+API_DIR = os.path.join(os.path.dirname(SERVER_DIR), 'api')
+PROJECT_ROOT = os.path.dirname(os.path.dirname(SERVER_DIR))
+
+# אותם נתיבי חיפוש שהסקריפטים מקבלים בהרצה עצמאית
+for _path in (PROJECT_ROOT, API_DIR):
+    if _path not in sys.path:
+        sys.path.insert(0, _path)
+
+# מטמון המודולים שכבר נטענו, לפי נתיב מלא
+_handlers = {}
+
+
+def _open_channel():
+    """
+    מפריד את ערוץ הפרוטוקול מה-stdout הרגיל.
+    כל כתיבה "חופשית" ל-fd 1 (למשל מספריות C) מנותבת ל-stderr,
+    כדי שלא תשבש את המסגרות שנשלחות ל-Node.
+    """
+    channel_in = os.fdopen(os.dup(0), 'rb', buffering=0)
+    channel_out = os.fdopen(os.dup(1), 'wb', buffering=0)
+    os.dup2(2, 1)
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.close(devnull)
+    return channel_in, channel_out
+
+
+def _read_exact(stream, size):
+    """קורא בדיוק size בתים, או מחזיר None בסוף הקלט"""
+    chunks = []
+    remaining = size
+    while remaining > 0:
+        chunk = stream.read(remaining)
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b''.join(chunks)
+
+
+def read_frame(stream):
+    """קורא מסגרת אחת מהערוץ ומחזיר את ה-JSON שבה"""
+    header = _read_exact(stream, 4)
+    if header is None:
+        return None
+    (length,) = struct.unpack('>I', header)
+    body = _read_exact(stream, length)
+    if body is None:
+        return None
+    return json.loads(body.decode('utf-8'))
+
+
+def write_frame(stream, message):
+    """כותב מסגרת אחת לערוץ"""
+    body = json.dumps(message, ensure_ascii=False).encode('utf-8')
+    stream.write(struct.pack('>I', len(body)) + body)
+
+
+def load_handler(script_path):
+    """טוען את מודול הסקריפט פעם אחת ושומר אותו במטמון"""
+    path = os.path.realpath(script_path)
+    module = _handlers.get(path)
+    if module is None:
+        name = '_api_' + os.path.splitext(os.path.basename(path))[0]
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        try:
+            spec.loader.exec_module(module)
+        except BaseException:
+            sys.modules.pop(name, None)
+            raise
+        if not callable(getattr(module, 'main', None)):
+            raise RuntimeError(f"Script has no main() function: {script_path}")
+        _handlers[path] = module
+    return module
+
+
+def _exit_code(exit_exc):
+    """ממיר SystemExit לקוד יציאה כמו שהמפרש עושה"""
+    code = exit_exc.code
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        return code
+    print(code, file=sys.stderr)
+    return 1
+
+
+def handle_request(request):
+    """מריץ את main() של הסקריפט המבוקש עם stdin/stdout מוחלפים"""
+    script_path = request.get('script')
+    args = request.get('args') or []
+    input_text = request.get('input') or ''
+
+    stdout = io.StringIO()
+    stderr = io.StringIO()
+    stdin = io.TextIOWrapper(io.BytesIO(input_text.encode('utf-8')), encoding='utf-8')
+
+    saved = (sys.stdin, sys.stdout, sys.stderr, sys.argv)
+    sys.stdin, sys.stdout, sys.stderr = stdin, stdout, stderr
+    sys.argv = [script_path] + [str(arg) for arg in args]
+    code = 0
+    try:
+        load_handler(script_path).main()
+    except SystemExit as e:
+        code = _exit_code(e)
+    except Exception:
+        traceback.print_exc()
+        code = 1
+    finally:
+        sys.stdin, sys.stdout, sys.stderr, sys.argv = saved
+
+    return {
+        'id': request.get('id'),
+        'code': code,
+        'stdout': stdout.getvalue(),
+        'stderr': stderr.getvalue()
+    }
+
+
+def main():
+    """לולאת העבודה: קורא בקשות עד לסגירת stdin"""
+    channel_in, channel_out = _open_channel()
+    while True:
+        request = read_frame(channel_in)
+        if request is None:
+            break
+        write_frame(channel_out, handle_request(request))
+
+
+if __name__ == "__main__":
+    main()
@@ -11,6 +11,11 @@ const path = require('path');
 const fs = require('fs');
 const multer = require('multer');
 const os = require('os');
+const http = require('http');
+const zlib = require('zlib');
+const { Readable } = require('stream');
+const { pipeline } = require('stream/promises');
+const { PythonWorkerPool } = require('./pythonPool');
 
 const app = express();
 const PORT = process.env.PORT || 5000;
@@ -34,6 +39,95 @@ app.get('/api/health', (req, res) => {
   });
 });
 
+// אפליקציית הפייתון המאוחדת (server/api_app.py): כשמוגדרת כתובת, כל הסקריפטים
+// רצים בתהליך אחד שמקבל בקשות HTTP על גבי חיבורים קבועים (keep-alive)
+const PYTHON_APP_URL = process.env.PYTHON_APP_URL ? new URL(process.env.PYTHON_APP_URL) : null;
+const pythonAppAgent = PYTHON_APP_URL ? new http.Agent({
+  keepAlive: true,
+  maxSockets: parseInt(process.env.PYTHON_APP_MAX_SOCKETS, 10) || 16
+}) : null;
+
+/**
+ * בקשה לאפליקציית הפייתון המאוחדת
+ * @param {string} method - שיטת HTTP
+ * @param {string} route - הנתיב באפליקציה (למשל /scripts/get_inventory)
+ * @param {Object} body - גוף JSON (אופציונלי)
+ * @param {Object} headers - כותרות נוספות (למשל Authorization)
+ * @returns {Promise<{status: number, data: *}>}
+ */
+function pythonAppRequest(method, route, body = null, headers = {}) {
+  const payload = body === null ? null : Buffer.from(JSON.stringify(body), 'utf8');
+  return new Promise((resolve, reject) => {
+    const request = http.request({
+      hostname: PYTHON_APP_URL.hostname,
+      port: PYTHON_APP_URL.port,
+      path: route,
+      method,
+      agent: pythonAppAgent,
+      headers: {
+        ...headers,
+        ...(payload ? { 'Content-Type': 'application/json', 'Content-Length': payload.length } : {})
+      }
+    }, (response) => {
+      const chunks = [];
+      response.on('data', (chunk) => chunks.push(chunk));
+      response.on('end', () => {
+        try {
+          resolve({ status: response.statusCode, data: JSON.parse(Buffer.concat(chunks).toString('utf8')) });
+        } catch (e) {
+          reject(new Error(`Invalid response from Python app: ${e.message}`));
+        }
+      });
+      response.on('error', reject);
+    });
+    request.on('error', reject);
+    if (payload) {
+      request.write(payload);
+    }
+    request.end();
+  });
+}
+
+// מאגר תהליכי פייתון קבועים - ניתן לכבות עם PYTHON_WORKER_POOL=0
+const pythonPool = PYTHON_APP_URL || process.env.PYTHON_WORKER_POOL === '0' ? null : new PythonWorkerPool({
+  size: parseInt(process.env.PYTHON_POOL_SIZE, 10) || undefined,
+  timeoutMs: parseInt(process.env.PYTHON_REQUEST_TIMEOUT_MS, 10) || undefined,
+  maxRequests: parseInt(process.env.PYTHON_WORKER_MAX_REQUESTS, 10) || undefined
+});
+
+// כמה תווים מהפלט נכתבים ללוג בכל בקשה
+const LOG_PREVIEW_CHARS = 150;
+
+/**
+ * פענוח הפלט של סקריפט פייתון שהסתיים
+ * @param {number} code - קוד היציאה של הסקריפט
+ * @param {string} dataString - כל מה שהסקריפט הדפיס ל-stdout
+ * @param {string} errorString - כל מה שהסקריפט הדפיס ל-stderr
+ * @returns {*} - תוצאת הסקריפט (JSON, מחרוזת או אובייקט הצלחה)
+ */
+function parsePythonOutput(code, dataString, errorString) {
+  console.log(`Python script exited with code ${code}`);
+  if (code !== 0) {
+    console.error(`Python script error (${code}): ${errorString}`);
+    throw new Error(errorString || 'Python script error');
+  }
+
+  try {
+    console.log(`Trying to parse JSON (${dataString.length} chars): ${dataString.substring(0, LOG_PREVIEW_CHARS)}${dataString.length > LOG_PREVIEW_CHARS ? '...' : ''}`);
+    const result = JSON.parse(dataString);
+    console.log(`Successfully parsed JSON. Type: ${Array.isArray(result) ? 'Array' : typeof result}`);
+    return result;
+  } catch (e) {
+    console.error(`Error parsing JSON: ${e.message}`);
+    if (dataString.trim()) {
+      console.log(`Returning raw string (${dataString.length} chars)`);
+      return dataString.trim();
+    }
+    console.log('Returning success object');
+    return { success: true };
+  }
+}
+
 /**
  * פונקציה כללית להפעלת סקריפט פייתון
  * @param {string} scriptPath - נתיב לסקריפט
@@ -43,15 +137,40 @@ app.get('/api/health', (req, res) => {
  */
 function runPythonScript(scriptPath, args = [], inputData = null) {
   console.log("Running Python script:", scriptPath);
-  return new Promise((resolve, reject) => {
-    // נבדוק אם הקובץ קיים
-    try {
-      fs.accessSync(scriptPath, fs.constants.F_OK);
-    } catch (err) {
-      console.error(`Script not found: ${scriptPath}`);
-      return reject(new Error(`Script not found: ${scriptPath}`));
-    }
+  // נבדוק אם הקובץ קיים
+  try {
+    fs.accessSync(scriptPath, fs.constants.F_OK);
+  } catch (err) {
+    console.error(`Script not found: ${scriptPath}`);
+    return Promise.reject(new Error(`Script not found: ${scriptPath}`));
+  }
+
+  if (PYTHON_APP_URL) {
+    const script = path.basename(scriptPath, '.py');
+    return pythonAppRequest('POST', `/scripts/${script}`, {
+      args: args.map(String),
+      input: inputData ? JSON.stringify(inputData) : ''
+    }).then(({ status, data }) => {
+      if (status !== 200) {
+        throw new Error(data.message || `Python app error (${status})`);
+      }
+      if (data.stderr) {
+        console.error(`Python stderr: ${data.stderr}`);
+      }
+      return parsePythonOutput(data.code, data.stdout, data.stderr);
+    });
+  }
 
+  if (pythonPool) {
+    return pythonPool.run(scriptPath, args, inputData).then(({ code, stdout, stderr }) => {
+      if (stderr) {
+        console.error(`Python stderr: ${stderr}`);
+      }
+      return parsePythonOutput(code, stdout, stderr);
+    });
+  }
+
+  return new Promise((resolve, reject) => {
     console.log(`Running Python script: ${scriptPath}`);
     const pythonProcess = spawn('python3', [scriptPath, ...args]);
     let dataString = '';
@@ -64,8 +183,11 @@ function runPythonScript(scriptPath, args = [], inputData = null) {
     }
 
     pythonProcess.stdout.on('data', (data) => {
+      // רק תחילת הפלט נכתבת ללוג, ולא כל chunk של תשובה גדולה
+      if (!dataString) {
+        console.log(`Python stdout: ${data.toString().substring(0, LOG_PREVIEW_CHARS)}${data.length > LOG_PREVIEW_CHARS ? '...' : ''}`);
+      }
       dataString += data.toString();
-      console.log(`Python stdout: ${data.toString().substring(0, 150)}${data.toString().length > 150 ? '...' : ''}`);
     });
 
     pythonProcess.stderr.on('data', (data) => {
@@ -74,29 +196,283 @@ function runPythonScript(scriptPath, args = [], inputData = null) {
     });
 
     pythonProcess.on('close', (code) => {
-      console.log(`Python script exited with code ${code}`);
-      if (code !== 0) {
-        console.error(`Python script error (${code}): ${errorString}`);
-        return reject(new Error(errorString || 'Python script error'));
-      }
-
       try {
-        console.log(`Trying to parse JSON: ${dataString.substring(0, 150)}${dataString.length > 150 ? '...' : ''}`);
-        const result = JSON.parse(dataString);
-        console.log(`Successfully parsed JSON. Type: ${Array.isArray(result) ? 'Array' : typeof result}`);
-        resolve(result);
+        resolve(parsePythonOutput(code, dataString, errorString));
       } catch (e) {
-        console.error(`Error parsing JSON: ${e.message}`);
-        if (dataString.trim()) {
-          console.log(`Returning raw string (${dataString.length} chars)`);
-          resolve(dataString.trim());
-        } else {
-          console.log('Returning success object');
-          resolve({ success: true });
+        reject(e);
+      }
+    });
+  });
+}
+
+// ===== הזרמת פלט גדול ישירות ללקוח =====
+// runPythonScript מפענח את כל הפלט ל-JSON ו-res.json מקודד אותו שוב. לתשובות
+// גדולות (רשימת השאלות, המלאי, תצוגה מקדימה של אקסל) streamPythonScript מעביר
+// את הפלט של הסקריפט כמו שהוא, דחוס ב-brotli או gzip לפי Accept-Encoding.
+
+// פלט עד הסף נאסף במלואו ונבדק מול קוד היציאה, כמו ב-runPythonScript (הודעות
+// שגיאה קטנות תמיד); פלט גדול יותר מתחיל לזרום ללקוח ברגע שעבר את הסף
+const STREAM_THRESHOLD_BYTES = parseInt(process.env.PYTHON_STREAM_THRESHOLD_BYTES, 10) || 64 * 1024;
+// תשובה קטנה מזה נשלחת בלי דחיסה
+const COMPRESS_MIN_BYTES = 1024;
+
+/**
+ * בחירת דחיסה לפי Accept-Encoding של הלקוח: brotli, אחרת gzip, אחרת בלי
+ * @param {Object} req - בקשת Express
+ * @returns {string|null} - 'br', 'gzip' או null
+ */
+function negotiateEncoding(req) {
+  const accepted = (req.get('Accept-Encoding') || '').toLowerCase();
+  const allows = (name) => accepted.split(',').some((part) => {
+    const [token, ...params] = part.trim().split(';');
+    return token.trim() === name && !params.some((param) => /^\s*q=0(\.0*)?\s*$/.test(param));
+  });
+  if (allows('br')) {
+    return 'br';
+  }
+  if (allows('gzip')) {
+    return 'gzip';
+  }
+  return null;
+}
+
+/**
+ * יצירת stream דוחס. brotli באיכות 4 ו-gzip ברמה 6 - מהירים מספיק לתוכן דינמי
+ * @param {string} encoding - 'br' או 'gzip'
+ */
+function createCompressor(encoding) {
+  if (encoding === 'br') {
+    return zlib.createBrotliCompress({
+      params: {
+        [zlib.constants.BROTLI_PARAM_MODE]: zlib.constants.BROTLI_MODE_TEXT,
+        [zlib.constants.BROTLI_PARAM_QUALITY]: 4
+      }
+    });
+  }
+  return zlib.createGzip({ level: 6 });
+}
+
+/**
+ * פתיחת הפלט של סקריפט פייתון כ-stream, בכל אחד משלושת מצבי ההרצה
+ * @returns {Promise<{stream: Readable, exit: Promise<number>, stderr: function(): string}>}
+ */
+function openPythonOutput(scriptPath, args, inputData) {
+  if (PYTHON_APP_URL) {
+    // raw: האפליקציה מחזירה את ה-stdout עצמו, או 500 כשהסקריפט נכשל
+    const payload = Buffer.from(JSON.stringify({
+      args: args.map(String),
+      input: inputData ? JSON.stringify(inputData) : '',
+      raw: true
+    }), 'utf8');
+    return new Promise((resolve, reject) => {
+      const request = http.request({
+        hostname: PYTHON_APP_URL.hostname,
+        port: PYTHON_APP_URL.port,
+        path: `/scripts/${path.basename(scriptPath, '.py')}`,
+        method: 'POST',
+        agent: pythonAppAgent,
+        headers: { 'Content-Type': 'application/json', 'Content-Length': payload.length }
+      }, (response) => {
+        if (response.statusCode === 200) {
+          resolve({ stream: response, exit: Promise.resolve(0), stderr: () => '' });
+          return;
         }
+        const chunks = [];
+        response.on('data', (chunk) => chunks.push(chunk));
+        response.on('end', () => {
+          let message = `Python app error (${response.statusCode})`;
+          try {
+            message = JSON.parse(Buffer.concat(chunks).toString('utf8')).message || message;
+          } catch (e) {
+            // גוף שאינו JSON - נשארת ההודעה הכללית
+          }
+          console.error(`Python script error: ${message}`);
+          reject(new Error(message));
+        });
+        response.on('error', reject);
+      });
+      request.on('error', reject);
+      request.end(payload);
+    });
+  }
+
+  if (pythonPool) {
+    // התהליך הקבוע מחזיר את כל הפלט במסגרת אחת - בלי פענוח, רק העברה הלאה
+    return pythonPool.run(scriptPath, args, inputData).then(({ code, stdout, stderr }) => {
+      if (stderr) {
+        console.error(`Python stderr: ${stderr}`);
       }
+      return { stream: Readable.from([Buffer.from(stdout, 'utf8')]), exit: Promise.resolve(code), stderr: () => stderr };
+    });
+  }
+
+  const pythonProcess = spawn('python3', [scriptPath, ...args]);
+  let errorString = '';
+  pythonProcess.stderr.on('data', (data) => {
+    errorString += data.toString();
+  });
+  const exit = new Promise((resolve) => {
+    pythonProcess.on('close', (code) => {
+      if (errorString) {
+        console.error(`Python stderr: ${errorString.substring(0, LOG_PREVIEW_CHARS * 10)}`);
+      }
+      resolve(code);
+    });
+    pythonProcess.on('error', (err) => {
+      errorString += err.message;
+      resolve(-1);
     });
   });
+  pythonProcess.stdin.end(inputData ? JSON.stringify(inputData) : undefined);
+  return Promise.resolve({ stream: pythonProcess.stdout, exit, stderr: () => errorString });
+}
+
+/**
+ * קריאת תחילת ה-stream עד limit בתים או עד סופו
+ * @returns {Promise<{data: Buffer, ended: boolean}>} - ended: ה-stream נגמר לפני הסף
+ */
+function readHead(stream, limit) {
+  return new Promise((resolve, reject) => {
+    const chunks = [];
+    let size = 0;
+    const finish = (ended) => {
+      stream.off('data', onData);
+      stream.off('end', onEnd);
+      stream.off('error', onError);
+      if (!ended) {
+        stream.pause();
+      }
+      resolve({ data: Buffer.concat(chunks, size), ended });
+    };
+    const onData = (chunk) => {
+      chunks.push(chunk);
+      size += chunk.length;
+      if (size >= limit) {
+        finish(false);
+      }
+    };
+    const onEnd = () => finish(true);
+    const onError = (err) => {
+      stream.off('data', onData);
+      stream.off('end', onEnd);
+      reject(err);
+    };
+    stream.on('data', onData);
+    stream.once('end', onEnd);
+    stream.once('error', onError);
+  });
+}
+
+/**
+ * הרצת סקריפט פייתון והזרמת הפלט שלו ישירות לתשובת HTTP, בלי JSON.parse
+ * ובלי res.json. שגיאה לפני שנשלח משהו ללקוח נזרקת (והנתיב מחזיר הודעה
+ * כרגיל); שגיאה באמצע הזרמה סוגרת את החיבור, כי הכותרות כבר נשלחו.
+ * @param {Object} req - בקשת Express (ל-Accept-Encoding)
+ * @param {Object} res - תשובת Express
+ * @param {string} scriptPath - נתיב לסקריפט
+ * @param {Array} args - פרמטרים לסקריפט
+ * @param {Object} inputData - נתוני קלט JSON לשלוח לסקריפט
+ * @param {Object} options
+ * @param {function(Object): boolean} options.onMeta - הסקריפט מדפיס קודם שורת JSON
+ *   של נתוני מטא (למשל ETag); onMeta מקבל אותה ומחזיר false כשהתשובה כבר נשלחה (304).
+ *   שורה עם error, או חריגה מ-onMeta (למשל כשחסר שדה), נזרקות כשגיאה לפני ששום דבר נשלח
+ * @returns {Promise} - מסתיימת כשהתשובה נשלחה
+ */
+async function streamPythonScript(req, res, scriptPath, args = [], inputData = null, { onMeta } = {}) {
+  const script = path.basename(scriptPath);
+  try {
+    fs.accessSync(scriptPath, fs.constants.F_OK);
+  } catch (err) {
+    console.error(`Script not found: ${scriptPath}`);
+    throw new Error(`Script not found: ${scriptPath}`);
+  }
+
+  const started = process.hrtime.bigint();
+  const { stream, exit, stderr } = await openPythonOutput(scriptPath, args, inputData);
+  let { data, ended } = await readHead(stream, STREAM_THRESHOLD_BYTES);
+
+  if (ended) {
+    const code = await exit;
+    if (code !== 0) {
+      console.error(`Python script error (${code}): ${stderr()}`);
+      throw new Error(stderr() || 'Python script error');
+    }
+  }
+
+  if (onMeta) {
+    const newline = data.indexOf(10);
+    const metaLine = (newline === -1 ? data : data.subarray(0, newline)).toString('utf8');
+    let meta;
+    try {
+      meta = JSON.parse(metaLine);
+    } catch (e) {
+      stream.destroy();
+      throw new Error(`Invalid metadata line from ${script}: ${metaLine.substring(0, LOG_PREVIEW_CHARS)}`);
+    }
+    if (meta === null || typeof meta !== 'object' || meta.error) {
+      // שורת שגיאה במקום מטא: כשל גם אם קוד היציאה עוד לא ידוע
+      stream.destroy();
+      throw new Error((meta && meta.message) || `Invalid metadata line from ${script}: ${metaLine.substring(0, LOG_PREVIEW_CHARS)}`);
+    }
+    data = newline === -1 ? Buffer.alloc(0) : data.subarray(newline + 1);
+    let proceed;
+    try {
+      proceed = onMeta(meta);
+    } catch (err) {
+      stream.destroy();
+      throw err;
+    }
+    if (proceed === false) {
+      stream.destroy();
+      return;
+    }
+  }
+
+  console.log(`Streaming ${script}: ${data.toString('utf8', 0, Math.min(data.length, LOG_PREVIEW_CHARS))}${data.length > LOG_PREVIEW_CHARS ? '...' : ''}`);
+  res.type('application/json');
+  res.vary('Accept-Encoding');
+  const encoding = ended && data.length < COMPRESS_MIN_BYTES ? null : negotiateEncoding(req);
+
+  // הפלט כולו כבר בזיכרון - נשלח בבת אחת עם Content-Length
+  if (ended) {
+    const body = encoding === 'br' ? zlib.brotliCompressSync(data, {
+      params: { [zlib.constants.BROTLI_PARAM_QUALITY]: 4 }
+    }) : encoding === 'gzip' ? zlib.gzipSync(data, { level: 6 }) : data;
+    if (encoding) {
+      res.set('Content-Encoding', encoding);
+    }
+    res.end(body);
+    console.log(`Sent ${script}: ${data.length} bytes${encoding ? ` (${encoding} ${body.length})` : ''} in ${Number(process.hrtime.bigint() - started) / 1e6} ms`);
+    return;
+  }
+
+  // פלט גדול: מה שכבר נקרא נשלח ראשון, ואחריו שאר ה-stream, ב-chunked
+  let total = 0;
+  async function* output() {
+    total += data.length;
+    yield data;
+    for await (const chunk of stream) {
+      total += chunk.length;
+      yield chunk;
+    }
+  }
+  const stages = encoding ? [output, createCompressor(encoding), res] : [output, res];
+  if (encoding) {
+    res.set('Content-Encoding', encoding);
+  }
+  try {
+    await pipeline(...stages);
+  } catch (err) {
+    console.error(`Error streaming ${script}: ${err.message}`);
+    res.destroy(err);
+    return;
+  }
+  const code = await exit;
+  if (code !== 0) {
+    // הכותרות והפלט כבר נשלחו; נשאר רק לתעד
+    console.error(`Python script ${script} exited with code ${code} after streaming: ${stderr()}`);
+  }
+  console.log(`Streamed ${script}: ${total} bytes${encoding ? ` (${encoding})` : ''} in ${Number(process.hrtime.bigint() - started) / 1e6} ms`);
 }
 
 // נתיבי API
@@ -169,6 +545,58 @@ app.post('/api/auth/verify-token', async (req, res) => {
   }
 });
 
+// משתמשים מאומתים נשמרים בזיכרון לזמן קצר, כמו ב-AuthMiddleware של api_app.py
+const AUTH_CACHE_TTL_MS = (parseFloat(process.env.API_AUTH_CACHE_TTL) || 60) * 1000;
+const authCache = new Map();
+
+/**
+ * זיהוי המשתמש מהטוקן בכותרת Authorization (Bearer), כמו /api/auth/me
+ * @param {Object} req - בקשת Express
+ * @returns {Promise<Object|null>} - המשתמש (id, role...) או null כשאין טוקן תקין
+ */
+async function resolveRequestUser(req) {
+  const authHeader = req.headers.authorization;
+  if (!authHeader || !authHeader.startsWith('Bearer ')) {
+    return null;
+  }
+  const token = authHeader.substring('Bearer '.length).trim();
+  const cached = authCache.get(token);
+  if (cached && cached.expires > Date.now()) {
+    return cached.user;
+  }
+  authCache.delete(token);
+
+  let user = null;
+  if (PYTHON_APP_URL) {
+    const { status, data } = await pythonAppRequest('GET', '/auth/me', null, { Authorization: authHeader });
+    user = status === 200 && data.success ? data.user : null;
+  } else {
+    // הטוקן הוא מזהה המשתמש שמחזיר login.py
+    const result = await runPythonScript(path.join(__dirname, '../api/verify_token.py'), [], { user_id: token });
+    user = result && result.success ? result.user : null;
+  }
+  if (user) {
+    authCache.set(token, { user, expires: Date.now() + AUTH_CACHE_TTL_MS });
+  }
+  return user;
+}
+
+/**
+ * middleware לנתיבים מוגנים: המשתמש המאומת נשמר ב-req.user, ובלעדיו מוחזר 401
+ */
+async function requireUser(req, res, next) {
+  try {
+    req.user = await resolveRequestUser(req);
+  } catch (error) {
+    console.error('Error verifying token:', error);
+    req.user = null;
+  }
+  if (!req.user) {
+    return res.status(401).json({ message: 'טוקן לא תקין או פג תוקף' });
+  }
+  next();
+}
+
 app.get('/api/auth/me', async (req, res) => {
   // טוקן נשלח בכותרת Authorization
   const authHeader = req.headers.authorization;
@@ -177,6 +605,15 @@ app.get('/api/auth/me', async (req, res) => {
   }
 
   const token = authHeader.split(' ')[1];
+  if (PYTHON_APP_URL) {
+    // האימות נעשה בשכבת האימות של אפליקציית הפייתון
+    try {
+      const { status, data } = await pythonAppRequest('GET', '/auth/me', null, { Authorization: authHeader });
+      return res.status(status).json(data);
+    } catch (error) {
+      return res.status(401).json({ message: 'טוקן לא תקין או פג תוקף' });
+    }
+  }
   try {
     const result = await runPythonScript(
       path.join(__dirname, '../api/verify_token.py'),
@@ -190,17 +627,56 @@ app.get('/api/auth/me', async (req, res) => {
 });
 
 // ניהול מלאי
+// מלאי עם גרסאות: If-None-Match מחזיר 304 כשלא היה שינוי,
+// ו-since_version מחזיר רק את הפריטים שהשתנו ואת מזהי הפריטים שנמחקו.
+// הסקריפט מדפיס קודם שורת מטא לכותרות, והרשימה עצמה מוזרמת ללקוח בלי פענוח
 app.get('/api/inventory', async (req, res) => {
   try {
     console.log('Received request for inventory data');
+    const sinceVersion = req.query.since_version;
+    // בלי since_version התשובה נשארת רשימת פריטים, כמו קודם
+    await streamPythonScript(req, res, path.join(__dirname, '../api/get_inventory.py'), [], {
+      meta: true,
+      since_version: sinceVersion,
+      etag: req.get('If-None-Match')
+    }, {
+      onMeta: (meta) => {
+        if (!meta.etag) {
+          throw new Error('get_inventory.py did not return an ETag');
+        }
+        res.set('ETag', meta.etag);
+        res.set('X-Inventory-Version', String(meta.version));
+        if (meta.not_modified) {
+          res.status(304).end();
+          return false;
+        }
+        return true;
+      }
+    });
+  } catch (error) {
+    console.error('Error fetching inventory:', error);
+    res.status(500).json({ message: 'שגיאה בקבלת נתוני מלאי: ' + error.message });
+  }
+});
+
+// חיפוש פריטים בצד השרת: ?q=...&limit=&offset=&category=&available_only=
+// (item_search.py - מדורג ובעמודים, על האינדקסים של טבלת item_search)
+app.get('/api/inventory/search', async (req, res) => {
+  try {
     const result = await runPythonScript(
-      path.join(__dirname, '../api/get_inventory.py')
+      path.join(__dirname, '../api/search_items.py'),
+      [],
+      {
+        q: req.query.q || '',
+        limit: req.query.limit,
+        offset: req.query.offset,
+        category: req.query.category,
+        available_only: req.query.available_only
+      }
     );
-    console.log('Inventory API result:', typeof result === 'string' ? 'Text response' : (Array.isArray(result) ? `Array with ${result.length} items` : typeof result));
     res.json(result);
   } catch (error) {
-    console.error('Error fetching inventory:', error);
-    res.status(500).json({ message: 'שגיאה בקבלת נתוני מלאי: ' + error.message });
+    res.status(500).json({ message: 'שגיאה בחיפוש פריטים: ' + error.message });
   }
 });
 
@@ -271,12 +747,10 @@ app.post('/api/inventory/update-permissions', async (req, res) => {
 });
 
 // ניהול השאלות
+// רשימת השאלות בעמודים - מסננים וסמן keyset מועברים כפרמטרי query
 app.get('/api/loans', async (req, res) => {
   try {
-    const result = await runPythonScript(
-      path.join(__dirname, '../api/get_loans.py')
-    );
-    res.json(result);
+    await streamPythonScript(req, res, path.join(__dirname, '../api/get_loans.py'), [], req.query);
   } catch (error) {
     res.status(500).json({ message: 'שגיאה בקבלת נתוני השאלות: ' + error.message });
   }
@@ -411,6 +885,34 @@ app.post('/api/reservations/check-availability', async (req, res) => {
   }
 });
 
+// בדיקת זמינות של מספר פריטים וחלונות זמן בקריאה אחת
+app.post('/api/reservations/check-availability/batch', async (req, res) => {
+  try {
+    const result = await runPythonScript(
+      path.join(__dirname, '../api/check_availability_batch.py'),
+      [],
+      req.body
+    );
+    res.json(result);
+  } catch (error) {
+    res.status(400).json({ message: 'שגיאה בבדיקת זמינות: ' + error.message });
+  }
+});
+
+// בדיקת זמינות של מערך הזמנות שלם (כל פריטי הערכה) בטווח תאריכים
+app.post('/api/templates/check-availability', async (req, res) => {
+  try {
+    const result = await runPythonScript(
+      path.join(__dirname, '../api/check_template_availability.py'),
+      [],
+      req.body
+    );
+    res.json(result);
+  } catch (error) {
+    res.status(400).json({ message: 'שגיאה בבדיקת זמינות מערך: ' + error.message });
+  }
+});
+
 // דשבורד
 app.get('/api/dashboard', async (req, res) => {
   try {
@@ -487,6 +989,18 @@ app.post('/api/advanced-reports', async (req, res) => {
   }
 });
 
+// מוני מטמון הדוחות המתקדמים (ניטור)
+app.get('/api/advanced-reports/cache-stats', async (req, res) => {
+  try {
+    const result = await runPythonScript(
+      path.join(__dirname, '../api/get_report_cache_stats.py')
+    );
+    res.json(result);
+  } catch (error) {
+    res.status(500).json({ message: 'שגיאה בקבלת נתוני מטמון הדוחות: ' + error.message });
+  }
+});
+
 // ייצוא דוחות מתקדמים בפורמטים שונים
 app.post('/api/export-advanced-report', async (req, res) => {
   try {
@@ -585,16 +1099,10 @@ app.post('/api/import/preview', upload.single('file'), async (req, res) => {
 
     console.log('Preview file received:', req.file);
 
-    const result = await runPythonScript(
-      path.join(__dirname, '../api/excel_preview.py'),
-      [],
-      {
-        action: 'preview',
-        file_path: req.file.path
-      }
-    );
-
-    res.json(result);
+    await streamPythonScript(req, res, path.join(__dirname, '../api/excel_preview.py'), [], {
+      action: 'preview',
+      file_path: req.file.path
+    });
   } catch (error) {
     console.error('Error processing import preview:', error);
     res.status(400).json({ message: 'שגיאה בהצגת תצוגה מקדימה: ' + error.message });
@@ -611,6 +1119,8 @@ app.post('/api/import/with-mapping', upload.single('file'), async (req, res) =>
     console.log('Import with mapping file received:', req.file);
     
     const mapping = req.body.mapping ? JSON.parse(req.body.mapping) : {};
+    // dry_run - מחזיר רק כמה פריטים יתווספו/יתעדכנו/לא ישתנו, בלי לכתוב
+    const dryRun = req.body.dry_run === 'true';
     
     const result = await runPythonScript(
       path.join(__dirname, '../api/excel_preview.py'),
@@ -618,7 +1128,8 @@ app.post('/api/import/with-mapping', upload.single('file'), async (req, res) =>
       {
         action: 'import',
         file_path: req.file.path,
-        mapping
+        mapping,
+        dry_run: dryRun
       }
     );
 
@@ -629,12 +1140,20 @@ app.post('/api/import/with-mapping', upload.single('file'), async (req, res) =>
   }
 });
 
-// יצוא כל המלאי לאקסל
+/**
+ * פורמט הייצוא מה-query string (?format=csv); ברירת המחדל היא xlsx
+ */
+const getExportFormat = (req) => (req.query.format === 'csv' ? 'csv' : 'xlsx');
+
+// יצוא כל המלאי לאקסל (או CSV)
 app.get('/api/export', async (req, res) => {
   try {
+    const format = getExportFormat(req);
     // יצירת קובץ הייצוא
     const result = await runPythonScript(
-      path.join(__dirname, '../api/export_excel.py')
+      path.join(__dirname, '../api/export_excel.py'),
+      [],
+      { format }
     );
     
     // בדיקה האם התקבל נתיב לקובץ
@@ -643,7 +1162,7 @@ app.get('/api/export', async (req, res) => {
     }
     
     // שליחת הקובץ
-    res.download(result.file_path, 'inventory_export.xlsx', (err) => {
+    res.download(result.file_path, `inventory_export.${format}`, (err) => {
       if (err) {
         console.error('Error sending export file:', err);
       }
@@ -664,11 +1183,12 @@ app.get('/api/export', async (req, res) => {
 // יצוא אקסל עם פילטרים
 app.post('/api/export/filtered', async (req, res) => {
   try {
+    const format = getExportFormat(req);
     // יצירת קובץ הייצוא עם פילטרים
     const result = await runPythonScript(
       path.join(__dirname, '../api/export_excel.py'),
       [],
-      { filters: req.body }
+      { filters: req.body, format }
     );
     
     // בדיקה האם התקבל נתיב לקובץ
@@ -677,7 +1197,7 @@ app.post('/api/export/filtered', async (req, res) => {
     }
     
     // שליחת הקובץ
-    res.download(result.file_path, 'filtered_inventory_export.xlsx', (err) => {
+    res.download(result.file_path, `filtered_inventory_export.${format}`, (err) => {
       if (err) {
         console.error('Error sending filtered export file:', err);
       }
@@ -695,6 +1215,40 @@ app.post('/api/export/filtered', async (req, res) => {
   }
 });
 
+// יצוא כל היסטוריית ההשאלות (נכתב בזרימה, בלי לטעון את כל השורות לזיכרון)
+app.get('/api/export/loans', async (req, res) => {
+  try {
+    const format = getExportFormat(req);
+    const result = await runPythonScript(
+      path.join(__dirname, '../api/export_excel.py'),
+      [],
+      { loans: true, format }
+    );
+    
+    // בדיקה האם התקבל נתיב לקובץ
+    if (!result || !result.file_path) {
+      return res.status(500).json({ message: 'שגיאה ביצירת קובץ ייצוא' });
+    }
+    
+    // שליחת הקובץ
+    res.download(result.file_path, `loans_history.${format}`, (err) => {
+      if (err) {
+        console.error('Error sending loans export file:', err);
+      }
+      
+      // מחיקת הקובץ הזמני אחרי שליחתו
+      try {
+        fs.unlinkSync(result.file_path);
+      } catch (unlinkErr) {
+        console.error('Error deleting temporary export file:', unlinkErr);
+      }
+    });
+  } catch (error) {
+    console.error('Error exporting loans history:', error);
+    res.status(500).json({ message: 'שגיאה ביצוא היסטוריית ההשאלות: ' + error.message });
+  }
+});
+
 // קבלת תבנית ייצוא אקסל
 app.get('/api/export/template', async (req, res) => {
   try {
@@ -735,13 +1289,17 @@ app.get('/api/export/template', async (req, res) => {
 // הפעלת השרת
 /* נתיבי API למערכת ההתראות */
 
-// נתיב להחזרת כל ההתראות
-app.post('/api/alerts', async (req, res) => {
+// נתיב להחזרת כל ההתראות. המשתמש והתפקיד נלקחים מהטוקן ולא מגוף הבקשה,
+// כך שסטודנט מקבל רק את ההתראות שלו
+app.post('/api/alerts', requireUser, async (req, res) => {
   try {
-    const { days_threshold, stock_threshold } = req.body;
+    const { days_threshold, stock_threshold, maintenance_days_threshold } = req.body;
     const inputData = JSON.stringify({ 
       days_threshold: days_threshold || 3, 
-      stock_threshold: stock_threshold || 20
+      stock_threshold: stock_threshold || 20,
+      maintenance_days_threshold: maintenance_days_threshold || 30,
+      user_id: req.user.id,
+      role: req.user.role
     });
     const result = await runPythonScript(
       path.join(__dirname, '../api/get_alerts.py'),
@@ -754,6 +1312,20 @@ app.post('/api/alerts', async (req, res) => {
   }
 });
 
+// ספירת ההתראות לפי סוג וחומרה, לאייקון ההתראות בכותרת
+app.post('/api/alerts/summary', requireUser, async (req, res) => {
+  try {
+    const result = await runPythonScript(
+      path.join(__dirname, '../api/get_alerts.py'),
+      [JSON.stringify({ summary: true, user_id: req.user.id, role: req.user.role })]
+    );
+    res.json(result);
+  } catch (error) {
+    console.error('Error getting alert summary:', error);
+    res.status(500).json({ error: error.message });
+  }
+});
+
 // נתיב לשליחת התראת אימייל
 app.post('/api/send-email-alert', async (req, res) => {
   try {
@@ -778,6 +1350,45 @@ app.post('/api/send-email-alert', async (req, res) => {
   }
 });
 
+// שליחת מנת התראות אימייל בחיבור SMTP אחד (ההודעות נרשמות קודם בתור email_outbox)
+app.post('/api/send-email-alerts', async (req, res) => {
+  try {
+    const { alerts } = req.body;
+
+    if (!Array.isArray(alerts) || alerts.length === 0) {
+      return res.status(400).json({
+        error: 'Missing required field: alerts',
+        success: false
+      });
+    }
+
+    // מנה גדולה עוברת ב-stdin ולא כפרמטר שורת פקודה
+    const result = await runPythonScript(
+      path.join(__dirname, '../api/send_email_notification.py'),
+      [],
+      { alerts }
+    );
+    res.json(result);
+  } catch (error) {
+    console.error('Error sending email alerts:', error);
+    res.status(500).json({ error: error.message, success: false });
+  }
+});
+
+// ניסיון חוזר להודעות שנכשלו ועדיין ממתינות בתור
+app.post('/api/send-email-alerts/retry', async (req, res) => {
+  try {
+    const result = await runPythonScript(
+      path.join(__dirname, '../api/send_email_notification.py'),
+      [JSON.stringify({ retry: true })]
+    );
+    res.json(result);
+  } catch (error) {
+    console.error('Error retrying email alerts:', error);
+    res.status(500).json({ error: error.message, success: false });
+  }
+});
+
 // ===== נתיבי API למערכת ניהול תחזוקה ותיקונים =====
 
 // קבלת נתוני תחזוקה
@@ -945,6 +1556,37 @@ if (process.env.NODE_ENV === 'production') {
   }));
 }
 
-app.listen(PORT, HOST, () => {
-  console.log(`🚀 Cinema Equipment Management Server running on http://${HOST}:${PORT}`);
+/**
+ * מכין את המסד (migrations.py init - הטבלאות הבסיסיות וכל המיגרציות) לפני
+ * שהשרת מתחיל לקבל בקשות, כי הסקריפטים ב-api קוראים טבלאות שנוצרות רק
+ * במיגרציות (למשל item_stock, email_outbox ו-item_search). הנעילה של
+ * migrations.py מונעת הרצה כפולה כשכמה מופעים עולים יחד. כישלון נרשם ביומן והשרת עולה בכל זאת - הסקריפטים חוזרים
+ * להתנהגות הישנה כשהטבלאות חסרות. ניתן לכבות עם RUN_MIGRATIONS_ON_BOOT=0
+ * @returns {Promise<void>}
+ */
+function runMigrations() {
+  if (process.env.RUN_MIGRATIONS_ON_BOOT === '0') {
+    return Promise.resolve();
+  }
+  return new Promise((resolve) => {
+    const migrationsProcess = spawn('python3', [path.join(__dirname, '../../migrations.py'), 'init'], {
+      stdio: ['ignore', 'inherit', 'inherit']
+    });
+    migrationsProcess.on('error', (error) => {
+      console.error('Failed to run database migrations:', error);
+      resolve();
+    });
+    migrationsProcess.on('close', (code) => {
+      if (code !== 0) {
+        console.error(`Database migrations exited with code ${code}`);
+      }
+      resolve();
+    });
+  });
+}
+
+runMigrations().then(() => {
+  app.listen(PORT, HOST, () => {
+    console.log(`🚀 Cinema Equipment Management Server running on http://${HOST}:${PORT}`);
+  });
 });
\ No newline at end of file
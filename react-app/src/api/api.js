@@ -73,6 +73,35 @@ export const inventoryAPI = {
     }
   },
   
+  // קבלת השינויים במלאי מאז גרסה ידועה (version מהתשובה הקודמת)
+  // מחזיר { version, items, deleted_ids, full } או null אם לא היה שינוי
+  getItemChanges: async (sinceVersion) => {
+    try {
+      const response = await axiosInstance.get('/api/inventory', {
+        params: { since_version: sinceVersion },
+        validateStatus: (status) => (status >= 200 && status < 300) || status === 304
+      });
+      return response.status === 304 ? null : response.data;
+    } catch (error) {
+      console.error('Error fetching inventory changes:', error);
+      throw error;
+    }
+  },
+  
+  // חיפוש פריטים בצד השרת - תוצאות מדורגות בעמודים
+  // מחזיר { items, total, limit, offset, next_offset }; את העמוד הבא מבקשים עם offset: next_offset
+  searchItems: async (query, { limit, offset, category, availableOnly } = {}) => {
+    try {
+      const response = await axiosInstance.get('/api/inventory/search', {
+        params: { q: query, limit, offset, category, available_only: availableOnly }
+      });
+      return response.data;
+    } catch (error) {
+      console.error('Error searching inventory:', error);
+      throw error;
+    }
+  },
+  
   // קבלת כל פריטי המלאי - שם חלופי לאותה פונקציה לתאימות
   getInventory: async () => {
     try {
@@ -163,11 +192,13 @@ export const inventoryAPI = {
 
 // API לניהול השאלות
 export const loansAPI = {
-  // קבלת כל ההשאלות
-  getLoans: async () => {
+  // קבלת עמוד של השאלות
+  // params: status, student_id, category, from_date, to_date, limit, fields
+  // ולעמוד הבא - next_cursor מהתשובה הקודמת (after_returned, after_due_date, after_id)
+  getLoans: async (params = {}) => {
     try {
       console.log('Fetching loans from API...');
-      const response = await axiosInstance.get('/api/loans');
+      const response = await axiosInstance.get('/api/loans', { params });
       console.log('Loans response received:', response.data);
       return response.data;
     } catch (error) {
@@ -193,6 +224,13 @@ export const loansAPI = {
     return response.data;
   },
 
+  // השאלת סל של כמה פריטים בטרנזקציה אחת - כולם או אף אחד
+  // items: [{ item_id, quantity, price_per_unit, total_price }]
+  createLoans: async (items, loanData) => {
+    const response = await axiosInstance.post('/api/loans', { ...loanData, items });
+    return response.data;
+  },
+
   // החזרת פריט מושאל
   returnLoan: async (loanId, returnNotes) => {
     const response = await axiosInstance.put(`/api/loans/${loanId}/return`, { returnNotes });
@@ -241,6 +279,18 @@ export const reservationsAPI = {
     }
   },
 
+  // הזמנת סל של כמה פריטים בטרנזקציה אחת - כולם או אף אחד
+  // items: [{ item_id, quantity, start_date, end_date }]
+  createReservations: async (items, reservationData) => {
+    try {
+      const response = await axiosInstance.post('/api/reservations', { ...reservationData, items });
+      return response.data;
+    } catch (error) {
+      console.error('Error creating reservations:', error);
+      throw error;
+    }
+  },
+
   // עדכון סטטוס הזמנה
   updateReservationStatus: async (reservationId, status) => {
     try {
@@ -281,6 +331,35 @@ export const reservationsAPI = {
     }
   },
   
+  // בדיקת זמינות של מספר פריטים וחלונות זמן בקריאה אחת
+  // requests: [{ item_id, start_date, end_date, quantity }]
+  checkAvailabilityBatch: async (requests) => {
+    try {
+      const response = await axiosInstance.post('/api/reservations/check-availability/batch', { requests });
+      return response.data;
+    } catch (error) {
+      console.error('Error checking batch availability:', error);
+      throw error;
+    }
+  },
+  
+  // בדיקת זמינות של מערך הזמנות שלם, כולל החלון הפנוי הראשון; בלי combinationName
+  // כל הרכב נבדק בנפרד (combinations) והשדות הראשיים הם של ההרכב המומלץ
+  checkTemplateAvailability: async (templateId, startDate, endDate, combinationName = null) => {
+    try {
+      const response = await axiosInstance.post('/api/templates/check-availability', {
+        template_id: templateId,
+        start_date: startDate,
+        end_date: endDate,
+        combination_name: combinationName
+      });
+      return response.data;
+    } catch (error) {
+      console.error('Error checking template availability:', error);
+      throw error;
+    }
+  },
+  
   // קבלת מידע סטטיסטי על הזמנות
   getReservationStats: async () => {
     try {
@@ -416,6 +495,17 @@ export const alertsAPI = {
     }
   },
   
+  // ספירת ההתראות לפי סוג וחומרה (לאייקון ההתראות); המשתמש מזוהה בשרת לפי הטוקן
+  getAlertSummary: async () => {
+    try {
+      const response = await axiosInstance.post('/api/alerts/summary');
+      return response.data;
+    } catch (error) {
+      console.error('Error fetching alert summary:', error);
+      throw error;
+    }
+  },
+  
   // שליחת התראת אימייל
   sendEmailAlert: async (alertType, data, email) => {
     try {
@@ -431,6 +521,28 @@ export const alertsAPI = {
     }
   },
   
+  // שליחת מנת התראות אימייל: alerts הוא מערך של { alert_type, data, email }
+  sendEmailAlerts: async (alerts) => {
+    try {
+      const response = await axiosInstance.post('/api/send-email-alerts', { alerts });
+      return response.data;
+    } catch (error) {
+      console.error('Error sending email alerts:', error);
+      throw error;
+    }
+  },
+  
+  // ניסיון חוזר להודעות אימייל שנכשלו
+  retryEmailAlerts: async () => {
+    try {
+      const response = await axiosInstance.post('/api/send-email-alerts/retry');
+      return response.data;
+    } catch (error) {
+      console.error('Error retrying email alerts:', error);
+      throw error;
+    }
+  },
+  
   // סימון התראה כנצפתה
   markAlertAsRead: async (alertId) => {
     try {
@@ -581,9 +693,15 @@ export const importExportAPI = {
     return response.data;
   },
 
-  // יצוא נתונים לאקסל
-  exportData: async () => {
-    const response = await axiosInstance.get('/api/export', { responseType: 'blob' });
+  // יצוא נתונים לאקסל (format: 'xlsx' או 'csv')
+  exportData: async (format = 'xlsx') => {
+    const response = await axiosInstance.get('/api/export', { params: { format }, responseType: 'blob' });
+    return response.data;
+  },
+
+  // יצוא כל היסטוריית ההשאלות
+  exportLoansHistory: async (format = 'xlsx') => {
+    const response = await axiosInstance.get('/api/export/loans', { params: { format }, responseType: 'blob' });
     return response.data;
   },
   
@@ -595,9 +713,10 @@ export const importExportAPI = {
     return response.data;
   },
   
-  // ייבוא מאקסל עם מיפוי עמודות
-  importWithMapping: async (formData, mapping) => {
+  // ייבוא מאקסל עם מיפוי עמודות; עם dryRun מוחזר רק דוח השינויים
+  importWithMapping: async (formData, mapping, { dryRun = false } = {}) => {
     formData.append('mapping', JSON.stringify(mapping));
+    formData.append('dry_run', dryRun ? 'true' : 'false');
     const response = await axiosInstance.post('/api/import/with-mapping', formData, {
       headers: { 'Content-Type': 'multipart/form-data' },
     });
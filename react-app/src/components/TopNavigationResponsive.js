@@ -91,15 +91,11 @@ function TopNavigationResponsive({ user, onLogout }) {
     setAdminSubmenuOpen(!adminSubmenuOpen);
   };
 
-  // קבלת מספר ההתראות
+  // קבלת מספר ההתראות (ספירה בלבד, מטבלת ההתראות המחושבת מראש)
   const fetchAlertCount = async () => {
     try {
-      const alerts = await alertsAPI.getAlerts();
-      if (Array.isArray(alerts)) {
-        setAlertCount(alerts.length);
-      } else {
-        setAlertCount(0);
-      }
+      const summary = await alertsAPI.getAlertSummary();
+      setAlertCount(summary?.total_alerts || 0);
     } catch (error) {
       console.error('Error fetching alerts:', error);
       setAlertCount(0);
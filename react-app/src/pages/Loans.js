@@ -36,6 +36,8 @@ import { loansAPI, inventoryAPI, studentsAPI } from '../api/api';
 
 function Loans() {
   const [loans, setLoans] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [inventory, setInventory] = useState([]);
   const [students, setStudents] = useState([]);
   const [loading, setLoading] = useState(true);
@@ -77,6 +79,7 @@ function Loans() {
       const response = await loansAPI.getLoans();
       console.log('Loans response:', response);
       setLoans(response.data || []);
+      setNextCursor(response.next_cursor || null);
       setError('');
     } catch (err) {
       console.error('Error fetching loans:', err);
@@ -86,6 +89,22 @@ function Loans() {
     }
   };
 
+  // טעינת העמוד הבא של ההשאלות והוספתו לרשימה
+  const loadMoreLoans = async () => {
+    if (!nextCursor) return;
+    try {
+      setLoadingMore(true);
+      const response = await loansAPI.getLoans(nextCursor);
+      setLoans(prevLoans => [...prevLoans, ...(response.data || [])]);
+      setNextCursor(response.next_cursor || null);
+    } catch (err) {
+      console.error('Error fetching more loans:', err);
+      setError('שגיאה בטעינת נתוני ההשאלות');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const fetchInventory = async () => {
     try {
       console.log('Fetching inventory...');
@@ -469,6 +488,13 @@ function Loans() {
             </TableBody>
           </Table>
         </TableContainer>
+        {nextCursor && (
+          <Box sx={{ display: 'flex', justifyContent: 'center', p: 2 }}>
+            <Button variant="outlined" onClick={loadMoreLoans} disabled={loadingMore}>
+              {loadingMore ? 'טוען...' : 'טען השאלות נוספות'}
+            </Button>
+          </Box>
+        )}
       </Paper>
       
       {/* דיאלוג יצירת השאלה חדשה */}
@@ -0,0 +1,207 @@
+"""
+מטמון מקומי לתוצאות הדו"חות המתקדמים (SQLite).
+
+המפתח הוא סוג הדו"ח, הפרמטרים המנורמלים (JSON ממוין), גרסת הנתונים
+'inventory' - שהטריגרים מקדמים בכל שינוי בפריטים או בהשאלות (מיגרציה 6) -
+והתאריך, כי חלק מהדו"חות מחושבים יחסית ליום הנוכחי. כל עוד אין שינוי
+בנתונים, דו"ח חוזר נקרא מהמטמון במקום להיות מחושב מחדש.
+
+הקובץ משותף לכל תהליכי העבודה (WAL). הרשומות נמחקות לפי LRU כשעוברים את
+REPORT_CACHE_MAX_ENTRIES או את REPORT_CACHE_MAX_BYTES, ובכל מקרה אחרי
+REPORT_CACHE_TTL שניות. מוני hit/miss/eviction לכל סוג דו"ח נשמרים באותו
+קובץ וזמינים דרך cache_stats:
+    python report_cache.py stats
+    python report_cache.py clear
+"""
+
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import time
+
+from database import get_db_connection, data_versions_available
+from serialization import dumps, json_default
+
+REPORT_CACHE_PATH = os.getenv('REPORT_CACHE_PATH', os.path.join(tempfile.gettempdir(), 'advanced_reports_cache.sqlite3'))
+REPORT_CACHE_MAX_ENTRIES = int(os.getenv('REPORT_CACHE_MAX_ENTRIES', '200'))
+REPORT_CACHE_MAX_BYTES = int(os.getenv('REPORT_CACHE_MAX_BYTES', str(50 * 1024 * 1024)))
+REPORT_CACHE_TTL = int(os.getenv('REPORT_CACHE_TTL', '3600'))
+
+SCHEMA_SQL = """
+    CREATE TABLE IF NOT EXISTS entries (
+        key TEXT PRIMARY KEY,
+        report_type TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        created_at REAL NOT NULL,
+        last_used REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_entries_last_used ON entries (last_used);
+    CREATE TABLE IF NOT EXISTS metrics (
+        report_type TEXT NOT NULL,
+        event TEXT NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (report_type, event)
+    );
+"""
+
+METRIC_EVENTS = ('hit', 'miss', 'eviction', 'bypass')
+
+
+def _connect():
+    """פותח את קובץ המטמון ויוצר את הטבלאות אם צריך"""
+    conn = sqlite3.connect(REPORT_CACHE_PATH, timeout=10, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA_SQL)
+    return conn
+
+
+def _count(conn, report_type, event, amount=1):
+    conn.execute("""
+        INSERT INTO metrics (report_type, event, count) VALUES (?, ?, ?)
+        ON CONFLICT (report_type, event) DO UPDATE SET count = count + excluded.count
+    """, (report_type, event, amount))
+
+
+def current_data_version():
+    """גרסת 'inventory' הנוכחית, או None אם אין טבלת גרסאות (מסד שלא עבר מיגרציות)"""
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            if not data_versions_available(cur):
+                return None
+            cur.execute("SELECT COALESCE((SELECT version FROM data_versions WHERE name = 'inventory'), 0)")
+            return cur.fetchone()[0]
+
+
+def cache_key(report_type, params, version):
+    """מפתח יציב: אותם פרמטרים בסדר שונה מקבלים אותו מפתח"""
+    normalized = json.dumps([report_type, params or {}, version, datetime.date.today().isoformat()],
+                            sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=json_default)
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+def _evict(conn):
+    """מוחק רשומות שפג תוקפן, ואז לפי LRU עד שהמטמון בגבולות הגודל"""
+    evicted = conn.execute("SELECT key, report_type FROM entries WHERE created_at < ?",
+                           (time.time() - REPORT_CACHE_TTL,)).fetchall()
+    entries, total_bytes = conn.execute("""
+        SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries WHERE created_at >= ?
+    """, (time.time() - REPORT_CACHE_TTL,)).fetchone()
+    if entries > REPORT_CACHE_MAX_ENTRIES or total_bytes > REPORT_CACHE_MAX_BYTES:
+        for key, report_type, size in conn.execute("""
+                SELECT key, report_type, size FROM entries WHERE created_at >= ? ORDER BY last_used
+                """, (time.time() - REPORT_CACHE_TTL,)).fetchall():
+            if entries <= REPORT_CACHE_MAX_ENTRIES and total_bytes <= REPORT_CACHE_MAX_BYTES:
+                break
+            evicted.append((key, report_type))
+            entries -= 1
+            total_bytes -= size
+    for key, report_type in evicted:
+        conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+        _count(conn, report_type, 'eviction')
+
+
+def cached_report(report_type, params, compute):
+    """
+    מחזיר (תוצאה, cached). compute() נקרא רק כשאין תוצאה שמורה לאותו דו"ח,
+    פרמטרים וגרסת נתונים. תוצאה שמורה מוחזרת אחרי JSON, כלומר תאריכים
+    כמחרוזות ISO - בדיוק כפי שהיו נשלחים ללקוח
+    """
+    version = current_data_version()
+    if version is None:
+        conn = _connect()
+        try:
+            _count(conn, report_type, 'bypass')
+        finally:
+            conn.close()
+        return compute(), False
+
+    key = cache_key(report_type, params, version)
+    conn = _connect()
+    try:
+        row = conn.execute("SELECT payload FROM entries WHERE key = ? AND created_at >= ?",
+                           (key, time.time() - REPORT_CACHE_TTL)).fetchone()
+        if row is not None:
+            conn.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+            _count(conn, report_type, 'hit')
+            return json.loads(row[0]), True
+
+        _count(conn, report_type, 'miss')
+        result = compute()
+        payload = dumps(result)
+        # לא שומרים הודעת שגיאה (סוג דו"ח לא מוכר) ותוצאה גדולה מכל המטמון
+        failed = isinstance(result, dict) and 'error' in result
+        if not failed and len(payload.encode('utf-8')) <= REPORT_CACHE_MAX_BYTES:
+            now = time.time()
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("""
+                INSERT OR REPLACE INTO entries (key, report_type, payload, size, created_at, last_used)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (key, report_type, payload, len(payload.encode('utf-8')), now, now))
+            _evict(conn)
+            conn.execute("COMMIT")
+        return result, False
+    finally:
+        conn.close()
+
+
+def cache_stats():
+    """מוני המטמון לכל סוג דו"ח, יחס הפגיעות והגודל הנוכחי"""
+    conn = _connect()
+    try:
+        reports = {}
+        for report_type, event, count in conn.execute("SELECT report_type, event, count FROM metrics"):
+            reports.setdefault(report_type, dict.fromkeys(METRIC_EVENTS, 0))[event] = count
+        for report_type, entries, size in conn.execute(
+                "SELECT report_type, COUNT(*), SUM(size) FROM entries GROUP BY report_type"):
+            stats = reports.setdefault(report_type, dict.fromkeys(METRIC_EVENTS, 0))
+            stats['entries'], stats['bytes'] = entries, size
+        for stats in reports.values():
+            stats.setdefault('entries', 0)
+            stats.setdefault('bytes', 0)
+            lookups = stats['hit'] + stats['miss']
+            stats['hit_ratio'] = round(stats['hit'] / lookups, 3) if lookups else None
+
+        entries, total_bytes = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        return {
+            'path': REPORT_CACHE_PATH,
+            'entries': entries,
+            'bytes': total_bytes,
+            'max_entries': REPORT_CACHE_MAX_ENTRIES,
+            'max_bytes': REPORT_CACHE_MAX_BYTES,
+            'ttl_seconds': REPORT_CACHE_TTL,
+            'reports': reports
+        }
+    finally:
+        conn.close()
+
+
+def clear_cache():
+    """מוחק את כל הרשומות ואת המונים"""
+    conn = _connect()
+    try:
+        conn.execute("DELETE FROM entries")
+        conn.execute("DELETE FROM metrics")
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="מטמון הדו\"חות המתקדמים")
+    parser.add_argument('command', choices=['stats', 'clear'])
+    args = parser.parse_args()
+
+    if args.command == 'clear':
+        clear_cache()
+        print("Report cache cleared")
+    else:
+        print(json.dumps(cache_stats(), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
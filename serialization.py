@@ -0,0 +1,78 @@
+"""
+סריאליזציית JSON משותפת לתשובות ה-API.
+
+במקום מחלקת DateTimeEncoder נפרדת בכל סקריפט, כל התשובות עוברות דרך dumps.
+כש-orjson מותקן (pip install orjson) הוא משמש לקידוד: תאריכים, מספרים
+ומערכי numpy מקודדים בקוד C, ו-json_default נקרא רק ל-Decimal. בלי orjson
+הקידוד נעשה ב-json של הספרייה הסטנדרטית, עם אותו json_default.
+
+json_default בוחר את ההמרה לפי הטיפוס המדויק (חיפוש אחד במילון) ולא
+בשרשרת isinstance, כך שהעלות לכל Decimal או תאריך קבועה. שורות של psycopg2
+(RealDictRow, DictRow) הן תת-מחלקות של dict/list ומקודדות ישירות.
+
+הפלט זהה בתוכנו לפלט הקודם (תאריכים ב-ISO, Decimal כמספר, עברית כ-UTF-8),
+אבל ב-orjson בלי רווחים אחרי פסיקים ונקודתיים.
+"""
+
+import datetime
+import json
+from decimal import Decimal
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _isoformat(value):
+    return value.isoformat()
+
+
+# המרה לפי טיפוס; טיפוס שלא נמצא נבדק מול הרשימה ב-isinstance (תת-מחלקות)
+CONVERTERS = {
+    Decimal: float,
+    datetime.datetime: _isoformat,
+    datetime.date: _isoformat,
+    datetime.time: _isoformat,
+    set: list,
+    frozenset: list,
+}
+
+if orjson is not None:
+    ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+def json_default(value):
+    """ממיר ערך שאינו JSON (Decimal, תאריך, set) לערך JSON"""
+    converter = CONVERTERS.get(type(value))
+    if converter is None:
+        converter = next((candidate for kind, candidate in list(CONVERTERS.items())
+                          if isinstance(value, kind)), None)
+        if converter is None:
+            raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+        CONVERTERS[type(value)] = converter
+    return converter(value)
+
+
+_encoder = json.JSONEncoder(ensure_ascii=False, default=json_default)
+
+
+def dumps(value):
+    """מקודד ערך למחרוזת JSON"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(value, default=json_default, option=ORJSON_OPTIONS).decode('utf-8')
+        except orjson.JSONEncodeError:
+            # למשל מספר שלם מעבר ל-64 סיביות - json הרגיל מקודד אותו
+            pass
+    return _encoder.encode(value)
+
+
+def dumps_bytes(value):
+    """כמו dumps, כ-UTF-8, לכתיבה ישירה לתשובת HTTP"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(value, default=json_default, option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            pass
+    return _encoder.encode(value).encode('utf-8')
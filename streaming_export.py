@@ -0,0 +1,151 @@
+"""
+מנוע ייצוא בזרימה לאקסל ול-CSV.
+
+השורות נקראות מ-cursor בצד השרת (named cursor) בקבוצות של EXPORT_BATCH_SIZE
+ונכתבות מיד לקובץ: xlsxwriter במצב constant_memory כותב כל שורה לדיסק ברגע
+שעוברים לשורה הבאה, ו-CSV נכתב שורה-שורה. כך גם ייצוא של כל היסטוריית
+ההשאלות לא נטען לזיכרון. כל ייצוא נכתב לקובץ זמני ייחודי (tempfile.mkstemp),
+ולכן ייצואים מקבילים לא דורסים זה את זה.
+
+גיליון מוגדר כ-ExportSheet: שם, שאילתה, פרמטרים, ומיפוי אופציונלי של שמות
+עמודות לכותרות ושל עמודות לפונקציות המרה.
+"""
+
+import csv
+import os
+import tempfile
+import uuid
+from collections import namedtuple
+from datetime import date, datetime
+from decimal import Decimal
+
+from database import get_db_connection
+
+EXPORT_BATCH_SIZE = 2000
+
+EXPORT_FORMATS = ('xlsx', 'csv')
+
+# גיליון לייצוא: headers ממפה שם עמודה לכותרת, converters ממפה שם עמודה לפונקציית המרה
+ExportSheet = namedtuple('ExportSheet', ['name', 'query', 'params', 'headers', 'converters'],
+                         defaults=(None, None, None))
+
+
+def yes_no(value):
+    """ערך בוליאני כ'כן'/'לא', כמו בייצוא הקודם"""
+    return 'כן' if value else 'לא'
+
+
+def stream_rows(conn, query, params=None, batch_size=EXPORT_BATCH_SIZE):
+    """
+    מריץ את השאילתה ב-cursor בצד השרת ומחזיר (columns, rows), כש-rows הוא
+    מחולל שמושך batch_size שורות בכל פעם. החיבור חייב להיות בטרנזקציה
+    (לא autocommit) עד שהמחולל מוצה.
+    """
+    cursor = conn.cursor(name=f"export_{uuid.uuid4().hex}")
+    cursor.itersize = batch_size
+    cursor.execute(query, params)
+    # ב-named cursor התיאור זמין רק אחרי המשיכה הראשונה
+    first = cursor.fetchmany(batch_size)
+    columns = [column[0] for column in cursor.description]
+
+    def rows():
+        try:
+            batch = first
+            while batch:
+                yield from batch
+                batch = cursor.fetchmany(batch_size)
+        finally:
+            cursor.close()
+
+    return columns, rows()
+
+
+def _convert_rows(columns, rows, converters):
+    """מפעיל את פונקציות ההמרה על העמודות שהוגדרו להן"""
+    if not converters:
+        yield from rows
+        return
+    indexed = [(index, converters[column]) for index, column in enumerate(columns) if column in converters]
+    for row in rows:
+        row = list(row)
+        for index, convert in indexed:
+            row[index] = convert(row[index])
+        yield row
+
+
+def _sheet_rows(conn, sheet):
+    """מחזיר (headers, rows) לגיליון, אחרי מיפוי כותרות והמרות"""
+    columns, rows = stream_rows(conn, sheet.query, sheet.params)
+    headers = [(sheet.headers or {}).get(column, column) for column in columns]
+    return headers, _convert_rows(columns, rows, sheet.converters)
+
+
+def _excel_value(value):
+    """xlsxwriter לא כותב תאריכים עם אזור זמן או ערכים לא מוכרים"""
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        return value.replace(tzinfo=None)
+    if value is None or isinstance(value, (str, int, float, Decimal, bool, date)):
+        return value
+    return str(value)
+
+
+def write_xlsx(conn, sheets, path):
+    """כותב את הגיליונות לקובץ xlsx במצב constant_memory"""
+    import xlsxwriter
+
+    workbook = xlsxwriter.Workbook(path, {
+        'constant_memory': True,
+        'default_date_format': 'yyyy-mm-dd hh:mm:ss',
+        'strings_to_numbers': False,
+        'strings_to_formulas': False,
+        'strings_to_urls': False,
+    })
+    try:
+        for sheet in sheets:
+            worksheet = workbook.add_worksheet(sheet.name[:31])
+            headers, rows = _sheet_rows(conn, sheet)
+            worksheet.write_row(0, 0, headers)
+            for row_index, row in enumerate(rows, start=1):
+                for col_index, value in enumerate(row):
+                    value = _excel_value(value)
+                    if value is not None:
+                        worksheet.write(row_index, col_index, value)
+    finally:
+        workbook.close()
+
+
+def write_csv(conn, sheet, stream):
+    """כותב גיליון אחד כ-CSV לזרם טקסט פתוח (קובץ או stdout)"""
+    headers, rows = _sheet_rows(conn, sheet)
+    writer = csv.writer(stream)
+    writer.writerow(headers)
+    for row in rows:
+        writer.writerow(['' if value is None else value for value in row])
+
+
+def export_sheets(sheets, file_format='xlsx', prefix='export_'):
+    """
+    מייצא את הגיליונות לקובץ זמני ייחודי ומחזיר את הנתיב שלו.
+    ב-CSV (גיליון אחד בלבד) הקובץ נכתב ב-UTF-8 עם BOM, כדי שאקסל יזהה עברית.
+    הקורא אחראי למחוק את הקובץ אחרי השליחה.
+    """
+    if file_format not in EXPORT_FORMATS:
+        raise ValueError(f"פורמט ייצוא לא נתמך: {file_format}")
+    if file_format == 'csv' and len(sheets) != 1:
+        raise ValueError("ייצוא CSV תומך בגיליון אחד בלבד")
+
+    fd, path = tempfile.mkstemp(prefix=prefix, suffix=f'.{file_format}')
+    os.close(fd)
+    try:
+        with get_db_connection() as conn:
+            if file_format == 'xlsx':
+                write_xlsx(conn, sheets, path)
+            else:
+                with open(path, 'w', newline='', encoding='utf-8-sig') as stream:
+                    write_csv(conn, sheets[0], stream)
+            # קריאה בלבד - אין מה לשמור
+            conn.rollback()
+    except Exception:
+        os.remove(path)
+        raise
+    return path
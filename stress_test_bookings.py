@@ -0,0 +1,248 @@
+"""
+מבחן עומס להשאלות והזמנות מקבילות.
+
+הסקריפט יוצר סכמה נפרדת (stress_bookings) עם מלאי קטן, ומריץ 50 לקוחות
+במקביל שכל אחד מנסה להשאיל ולהזמין סל של כמה פריטים. בסיום נבדק שאף פריט
+לא הוקצה מעבר לכמות שלו:
+- השאלות: available לא שלילי, quantity - available שווה לסך ההשאלות, וסך
+  ההשאלות של כל פריט שווה לסך הכמויות בסלים שהתקבלו ואינו עולה על הכמות
+- הזמנות: מספר ההזמנות וסך הכמויות של כל פריט שווים לסלים שהתקבלו (סל
+  שנדחה לא השאיר שורות), ושיא ההזמנות החופפות אינו עולה על הכמות
+נתוני הייצור לא נגעים. קוד היציאה הוא 1 אם נמצאה הקצאת יתר.
+
+שימוש:
+    python stress_test_bookings.py [--clients 50] [--rounds 20] [--items 8] [--keep]
+"""
+
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+SCHEMA = 'stress_bookings'
+
+# כל החיבורים של המאגר ייפתחו על סכמת המבחן
+os.environ['PGOPTIONS'] = f"{os.environ.get('PGOPTIONS', '')} -c search_path={SCHEMA}".strip()
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(ROOT, 'react-app', 'api'))
+
+
+def setup_schema(items, quantity):
+    """יוצר את סכמת המבחן עם כל הטבלאות ומלאי התחלתי"""
+    import psycopg2
+    from database import init_db, get_db_connection
+
+    conn = psycopg2.connect(os.getenv('DATABASE_URL'))
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+            cur.execute(f"CREATE SCHEMA {SCHEMA}")
+        conn.commit()
+    finally:
+        conn.close()
+
+    init_db()
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO items (name, category, quantity, available)
+                SELECT 'stress item ' || g, 'stress', %s, %s
+                FROM generate_series(1, %s) g
+            """, (quantity, quantity, items))
+            cur.execute("SELECT id FROM items ORDER BY id")
+            item_ids = [row[0] for row in cur.fetchall()]
+        conn.commit()
+    return item_ids
+
+
+def random_cart(rng, item_ids):
+    """סל אקראי של 2-3 פריטים שונים, בסדר אקראי (כדי לאתגר את סדר הנעילה)"""
+    chosen = rng.sample(item_ids, rng.randint(2, 3))
+    return [{"item_id": item_id, "quantity": rng.randint(1, 2)} for item_id in chosen]
+
+
+def run_clients(clients, rounds, worker):
+    """
+    מריץ את worker במקביל מכל הלקוחות, עם מחסום שמשחרר את כולם יחד.
+    worker מחזיר את הסל אם התקבל, או None אם נדחה
+    """
+    barrier = threading.Barrier(clients)
+    # booked: סך הכמויות לכל פריט בסלים שהתקבלו, lines: מספר השורות שלהם
+    outcomes = {"ok": 0, "rejected": 0, "errors": [], "booked": {}, "lines": 0, "seconds": 0.0}
+    lock = threading.Lock()
+
+    def client(index):
+        rng = random.Random(index)
+        barrier.wait()
+        for _ in range(rounds):
+            try:
+                cart = worker(rng)
+            except Exception as e:
+                with lock:
+                    outcomes["errors"].append(repr(e))
+                continue
+            with lock:
+                if cart is None:
+                    outcomes["rejected"] += 1
+                    continue
+                outcomes["ok"] += 1
+                outcomes["lines"] += len(cart)
+                for line in cart:
+                    outcomes["booked"][line["item_id"]] = (
+                        outcomes["booked"].get(line["item_id"], 0) + line["quantity"])
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        list(executor.map(client, range(clients)))
+    outcomes["seconds"] = time.perf_counter() - started
+    return outcomes
+
+
+def stress_loans(item_ids, clients, rounds):
+    from database import create_loans
+
+    due_date = datetime.now() + timedelta(days=7)
+
+    def worker(rng):
+        cart = random_cart(rng, item_ids)
+        try:
+            create_loans(cart, 'stress', '000000000', due_date)
+        except ValueError:
+            return None
+        return cart
+
+    return run_clients(clients, rounds, worker)
+
+
+def stress_reservations(item_ids, clients, rounds):
+    from create_reservation import create_reservations
+
+    base = datetime.combine(datetime.now().date() + timedelta(days=30), datetime.min.time())
+
+    def worker(rng):
+        lines = []
+        for line in random_cart(rng, item_ids):
+            start = base + timedelta(days=rng.randint(0, 4))
+            line.update(start_date=start, end_date=start + timedelta(days=rng.randint(0, 3)))
+            lines.append(line)
+        return lines if create_reservations(lines, 'stress', '000000000', 1)["success"] else None
+
+    return run_clients(clients, rounds, worker)
+
+
+def verify(item_ids, loans, reservations):
+    """
+    מחזיר רשימת הפרות - פריטים שהוקצו מעבר לכמות שלהם, או שהסיכומים במסד
+    שונים מהסלים שהלקוחות קיבלו עליהם אישור
+    """
+    from database import get_db_connection
+    from availability import check_availability_batch
+
+    violations = []
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT i.id, i.quantity, i.available, COALESCE(SUM(l.quantity), 0)
+                FROM items i
+                LEFT JOIN loans l ON l.item_id = i.id AND l.return_date IS NULL
+                GROUP BY i.id
+                ORDER BY i.id
+            """)
+            for item_id, quantity, available, loaned in cur.fetchall():
+                booked = loans["booked"].get(item_id, 0)
+                if available < 0 or quantity - available != loaned or loaned != booked or loaned > quantity:
+                    violations.append(
+                        f"loans: item {item_id} quantity={quantity} available={available} "
+                        f"loaned={loaned} accepted={booked}"
+                    )
+
+            cur.execute("""
+                SELECT i.id, i.quantity, COUNT(r.id), COALESCE(SUM(r.quantity), 0)
+                FROM items i
+                LEFT JOIN reservations r ON r.item_id = i.id
+                GROUP BY i.id
+                ORDER BY i.id
+            """)
+            reservation_rows = 0
+            for item_id, quantity, count, reserved in cur.fetchall():
+                reservation_rows += count
+                booked = reservations["booked"].get(item_id, 0)
+                if reserved != booked:
+                    violations.append(
+                        f"reservations: item {item_id} reserved={reserved} accepted={booked}"
+                    )
+            if reservation_rows != reservations["lines"]:
+                violations.append(
+                    f"reservations: {reservation_rows} rows, {reservations['lines']} accepted lines"
+                )
+
+            cur.execute("SELECT MIN(start_date), MAX(end_date) FROM reservations")
+            first, last = cur.fetchone()
+            if first is not None:
+                results = check_availability_batch(cur, [
+                    {"item_id": item_id, "start_date": first, "end_date": last}
+                    for item_id in item_ids
+                ])
+                for result in results:
+                    if result["peak_reserved"] > result["total_quantity"]:
+                        violations.append(
+                            f"reservations: item {result['item_id']} peak={result['peak_reserved']} "
+                            f"quantity={result['total_quantity']}"
+                        )
+    return violations
+
+
+def report(label, outcomes):
+    print(f"{label:13s} accepted={outcomes['ok']:5d} rejected={outcomes['rejected']:5d} "
+          f"errors={len(outcomes['errors']):3d} in {outcomes['seconds']:.2f}s")
+    for error in outcomes['errors'][:5]:
+        print(f"    {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="מבחן עומס להשאלות והזמנות מקבילות")
+    parser.add_argument('--clients', type=int, default=50)
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--items', type=int, default=8)
+    parser.add_argument('--quantity', type=int, default=10)
+    parser.add_argument('--keep', action='store_true', help="לא למחוק את סכמת המבחן בסיום")
+    args = parser.parse_args()
+
+    # חיבור לכל לקוח, כדי שהמאגר עצמו לא יסדר את הלקוחות בתור
+    os.environ.setdefault('DB_POOL_MAX', str(args.clients + 2))
+
+    item_ids = setup_schema(args.items, args.quantity)
+    # מבחן שנקטע באמצע נחשב כישלון
+    failed = True
+    try:
+        loans = stress_loans(item_ids, args.clients, args.rounds)
+        report("loans", loans)
+        reservations = stress_reservations(item_ids, args.clients, args.rounds)
+        report("reservations", reservations)
+
+        violations = verify(item_ids, loans, reservations)
+        for violation in violations:
+            print(f"OVER-ALLOCATION {violation}")
+        failed = bool(violations or loans['errors'] or reservations['errors'])
+        print("FAILED" if failed else "OK: no over-allocation")
+    finally:
+        if not args.keep:
+            import psycopg2
+            conn = psycopg2.connect(os.getenv('DATABASE_URL'))
+            try:
+                with conn.cursor() as cur:
+                    cur.execute(f"DROP SCHEMA {SCHEMA} CASCADE")
+                conn.commit()
+            finally:
+                conn.close()
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
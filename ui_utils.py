@@ -0,0 +1,37 @@
+"""
+פונקציות עזר של ממשק Streamlit (main.py ו-components)
+"""
+
+import streamlit as st
+
+def set_page_config():
+    st.set_page_config(
+        page_title="מערכת ניהול מחסן השאלות",
+        page_icon="📦",
+        layout="wide",
+        initial_sidebar_state="expanded"
+    )
+    
+    # Add custom CSS for RTL support
+    st.markdown(
+        """
+        <style>
+        .stApp {
+            direction: rtl;
+            text-align: right;
+        }
+        .stButton>button {
+            float: right;
+        }
+        .streamlit-expanderHeader {
+            direction: rtl;
+            text-align: right;
+        }
+        div[data-testid="stMetricLabel"] {
+            direction: rtl;
+            text-align: right;
+        }
+        </style>
+        """,
+        unsafe_allow_html=True
+    )
@@ -1,4 +1,8 @@
-import streamlit as st
+"""
+פונקציות עזר משותפות ללא תלות בממשק: סקריפטי ה-API מייבאים את המודול הזה,
+ולכן אין בו ייבוא של streamlit. פונקציות התצוגה של Streamlit נמצאות ב-ui_utils.py
+"""
+
 from datetime import datetime
 import pytz
 
@@ -11,39 +15,6 @@ def format_hebrew_date(date):
         return ""
     return date.strftime('%d/%m/%Y %H:%M')
 
-def set_page_config():
-    st.set_page_config(
-        page_title="מערכת ניהול מחסן השאלות",
-        page_icon="📦",
-        layout="wide",
-        initial_sidebar_state="expanded"
-    )
-    
-    # Add custom CSS for RTL support
-    st.markdown(
-        """
-        <style>
-        .stApp {
-            direction: rtl;
-            text-align: right;
-        }
-        .stButton>button {
-            float: right;
-        }
-        .streamlit-expanderHeader {
-            direction: rtl;
-            text-align: right;
-        }
-        div[data-testid="stMetricLabel"] {
-            direction: rtl;
-            text-align: right;
-        }
-        </style>
-        """,
-        unsafe_allow_html=True
-    )
-
-
 def get_overdue_loans():
     from database import get_db_connection
     import pandas as pd